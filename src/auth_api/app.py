@@ -1,26 +1,53 @@
 # First party
-from origin.api import Application, TokenGuard
+from origin.api import Application, ScopedGuard, TokenGuard
 
 # Local
+from .asgi import AsgiApplication
 from .config import (
     INTERNAL_TOKEN_SECRET,
     OIDC_LOGIN_CALLBACK_PATH,
     OIDC_LOGIN_CALLBACK_URL,
     INVALIDATE_PENDING_LOGIN_PATH,
+    METRICS_SCOPE,
+    TOKEN_INTROSPECTION_SCOPE,
 )
+from .controller import invalidation_listener
+from .db import async_db
+from .metrics import instrument_flask
+from .oidc import oidc_backend
+from .terms import terms_registry
+from .token_sync import token_sync
+from .warmup import warmup
 
 from .endpoints import (
+    # Health:
+    HealthCheck,
     # OpenID Connect:
     OpenIdLogin,
     OpenIDCallbackEndpoint,
     OpenIdInvalidateLogin,
     OpenIdLogout,
+    OpenIdLogoutEverywhere,
+    AsyncOpenIDCallbackEndpoint,
+    AsyncOpenIdLogout,
+    AsyncOpenIdLogoutEverywhere,
     # Profiles:
     GetProfile,
+    # Account:
+    GetLoginHistory,
+    GetSessions,
     # Tokens:
     ForwardAuth,
+    AsyncForwardAuth,
     InspectToken,
+    IntrospectTokens,
     CreateTestToken,
+    # Metrics:
+    GetPrometheusMetrics,
+    GetBulkheadMetrics,
+    GetDegradationMetrics,
+    GetWarmupMetrics,
+    GetTokenSyncMetrics,
     # Terms:
     GetTerms,
     AcceptTerms,
@@ -34,10 +61,33 @@ def create_app() -> Application:
     :return: The Application instance.
     :rtype: Application
     """
+    # Warm up caches and connections (including rendering all terms) before
+    # reporting ready, or render all terms up front, so requests are served
+    # from memory
+    if warmup is not None:
+        warmup.start()
+    else:
+        terms_registry.load()
+
+    # Invalidate cached tokens when they are revoked by other processes
+    if invalidation_listener is not None:
+        invalidation_listener.start()
+
+    if token_sync is not None:
+        token_sync.start()
+
     app = Application.create(
         name='Auth API',
         secret=INTERNAL_TOKEN_SECRET,
-        health_check_path='/health',
+    )
+
+    # -- Health --------------------------------------------------------------
+
+    # Reports not ready while warming up
+    app.add_endpoint(
+        method='GET',
+        path='/health',
+        endpoint=HealthCheck(),
     )
 
     # -- OpenID Connect ------------------------------------------------------
@@ -71,6 +121,14 @@ def create_app() -> Application:
         guards=[TokenGuard()],
     )
 
+    # Logout everywhere (all sessions)
+    app.add_endpoint(
+        method='POST',
+        path='/logout/everywhere',
+        endpoint=OpenIdLogoutEverywhere(),
+        guards=[TokenGuard()],
+    )
+
     # -- Profile(s) ----------------------------------------------------------
 
     app.add_endpoint(
@@ -80,6 +138,22 @@ def create_app() -> Application:
         guards=[TokenGuard()],
     )
 
+    # -- Account -------------------------------------------------------------
+
+    app.add_endpoint(
+        method='POST',
+        path='/account/logins',
+        endpoint=GetLoginHistory(),
+        guards=[TokenGuard()],
+    )
+
+    app.add_endpoint(
+        method='POST',
+        path='/account/sessions',
+        endpoint=GetSessions(),
+        guards=[TokenGuard()],
+    )
+
     # -- Træfik integration --------------------------------------------------
 
     app.add_endpoint(
@@ -88,6 +162,50 @@ def create_app() -> Application:
         endpoint=ForwardAuth(),
     )
 
+    # -- Internal services ---------------------------------------------------
+
+    app.add_endpoint(
+        method='POST',
+        path='/token/introspect',
+        endpoint=IntrospectTokens(),
+        guards=[ScopedGuard(TOKEN_INTROSPECTION_SCOPE)],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics',
+        endpoint=GetPrometheusMetrics(),
+        guards=[ScopedGuard(METRICS_SCOPE)],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/bulkheads',
+        endpoint=GetBulkheadMetrics(),
+        guards=[ScopedGuard(METRICS_SCOPE)],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/degradation',
+        endpoint=GetDegradationMetrics(),
+        guards=[ScopedGuard(METRICS_SCOPE)],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/warmup',
+        endpoint=GetWarmupMetrics(),
+        guards=[ScopedGuard(METRICS_SCOPE)],
+    )
+
+    app.add_endpoint(
+        method='GET',
+        path='/metrics/token-sync',
+        endpoint=GetTokenSyncMetrics(),
+        guards=[ScopedGuard(METRICS_SCOPE)],
+    )
+
     # -- Testing/misc --------------------------------------------------------
 
     app.add_endpoint(
@@ -116,4 +234,59 @@ def create_app() -> Application:
         endpoint=AcceptTerms(),
     )
 
+    # Record the latency of all endpoints added above
+    instrument_flask(app.wsgi_app)
+
+    return app
+
+
+def create_asgi_app() -> AsgiApplication:
+    """
+    Create a new instance of the asynchronous (ASGI) application.
+
+    Endpoints which have been migrated to coroutines are served on the
+    event loop. All other requests are passed on to the (WSGI)
+    application created by create_app().
+
+    :return: The AsgiApplication instance.
+    """
+    app = AsgiApplication(
+        secret=INTERNAL_TOKEN_SECRET,
+        fallback=create_app().wsgi_app,
+    )
+
+    app.on_startup(oidc_backend.session.open_async)
+    app.on_shutdown(oidc_backend.session.close_async)
+    app.on_shutdown(async_db.dispose)
+
+    # -- OpenID Connect ------------------------------------------------------
+
+    app.add_endpoint(
+        method='GET',
+        path=OIDC_LOGIN_CALLBACK_PATH,
+        endpoint=AsyncOpenIDCallbackEndpoint(url=OIDC_LOGIN_CALLBACK_URL),
+    )
+
+    app.add_endpoint(
+        method='POST',
+        path='/logout',
+        endpoint=AsyncOpenIdLogout(),
+        guards=[TokenGuard()],
+    )
+
+    app.add_endpoint(
+        method='POST',
+        path='/logout/everywhere',
+        endpoint=AsyncOpenIdLogoutEverywhere(),
+        guards=[TokenGuard()],
+    )
+
+    # -- Træfik integration --------------------------------------------------
+
+    app.add_endpoint(
+        method='GET',
+        path='/token/forward-auth',
+        endpoint=AsyncForwardAuth(),
+    )
+
     return app
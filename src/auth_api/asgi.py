@@ -0,0 +1,407 @@
+"""
+Asynchronous (ASGI) variant of the application.
+
+Endpoints are added like to origin's (Flask) Application, but their
+handle_request() may be a coroutine, in which case it is awaited on the
+event loop. Synchronous endpoints are run in a thread pool, so they do
+not block the event loop.
+
+Requests to paths not added to the application are passed on to a
+fallback WSGI application, so the ASGI application can wrap the
+existing (Flask) application, and endpoints can be migrated to
+coroutines one by one.
+"""
+
+# Standard Library
+import asyncio
+import logging
+import time
+from dataclasses import is_dataclass
+from functools import cached_property, partial
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import parse_qsl
+
+# Third party
+import rapidjson
+import serpyco
+from werkzeug.datastructures import Headers
+from werkzeug.http import dump_cookie, parse_cookie
+from werkzeug.utils import get_content_type
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    # asgiref is only required to fall back to a WSGI application
+    WsgiToAsgi = None
+
+# First party
+from origin.api import BadRequest, Context, Endpoint, HttpResponse
+from origin.api.guards import EndpointGuard, bouncer
+from origin.models.auth import InternalToken
+from origin.serialize import simple_serializer
+from origin.tokens import TokenEncoder
+
+# Local
+from .metrics import EndpointMetrics
+
+logger = logging.getLogger(__name__)
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class AsgiContext(Context):
+    """
+    ASGI-specific context.
+
+    :param scope: ASGI connection scope
+    :param token_encoder: Internal token encoder
+    """
+
+    def __init__(
+            self,
+            scope: Scope,
+            token_encoder: TokenEncoder[InternalToken],
+    ):
+        super(AsgiContext, self).__init__(token_encoder=token_encoder)
+        self.scope = scope
+
+    @cached_property
+    def headers(self) -> Headers:
+        """Return HTTP request headers (case-insensitive)."""
+
+        return Headers([
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in self.scope['headers']
+        ])
+
+    @cached_property
+    def cookies(self) -> Dict[str, str]:
+        """Return HTTP request cookies."""
+
+        return parse_cookie('; '.join(self.headers.getlist('Cookie')))
+
+
+class AsgiApplication(object):
+    """
+    ASGI application of (synchronous or asynchronous) endpoints.
+
+    :param secret: Secret to verify internal tokens with
+    :param fallback: WSGI application handling requests to other paths
+    """
+
+    def __init__(self, secret: str, fallback: Optional[Callable] = None):
+        if fallback is not None and WsgiToAsgi is None:
+            raise RuntimeError('asgiref must be installed to fall back')
+
+        self.secret = secret
+        self.fallback = WsgiToAsgi(fallback) if fallback else None
+        self._endpoints: Dict[Tuple[str, str], 'AsgiOrchestrator'] = {}
+        self._on_startup: List[Callable[[], Awaitable[None]]] = []
+        self._on_shutdown: List[Callable[[], Awaitable[None]]] = []
+
+    @cached_property
+    def token_encoder(self) -> TokenEncoder[InternalToken]:
+        """Return internal token encoder."""
+
+        return TokenEncoder(schema=InternalToken, secret=self.secret)
+
+    def add_endpoint(
+            self,
+            method: str,
+            path: str,
+            endpoint: Endpoint,
+            guards: List[EndpointGuard] = None,
+    ):
+        """
+        Add an endpoint to the application.
+
+        :param method: HTTP method (GET or POST)
+        :param path: URL path
+        :param endpoint: The endpoint
+        :param guards: Guards to validate the request with
+        """
+        if method not in ('GET', 'POST'):
+            raise RuntimeError(
+                'Unsupported HTTP method for endpoints: %s' % method)
+
+        self._endpoints[method, path] = AsgiOrchestrator(
+            endpoint=endpoint,
+            token_encoder=self.token_encoder,
+            guards=guards,
+            metrics=EndpointMetrics(path),
+        )
+
+    def on_startup(self, callback: Callable[[], Awaitable[None]]):
+        """
+        Add a coroutine function to await when the server starts.
+
+        :param callback: The coroutine function
+        """
+        self._on_startup.append(callback)
+
+    def on_shutdown(self, callback: Callable[[], Awaitable[None]]):
+        """
+        Add a coroutine function to await when the server shuts down.
+
+        :param callback: The coroutine function
+        """
+        self._on_shutdown.append(callback)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """
+        Handle an ASGI connection.
+
+        :param scope: Connection scope
+        :param receive: Receives events from the client
+        :param send: Sends events to the client
+        """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+
+        orchestrator = self._endpoints.get((scope['method'], scope['path']))
+
+        if orchestrator is not None:
+            await orchestrator(scope, receive, send)
+        elif self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        else:
+            await send_response(send, HttpResponse(
+                status=404,
+                body='404 Not Found',
+            ))
+
+    async def lifespan(self, receive: Receive, send: Send):
+        """
+        Handle startup and shutdown of the server.
+
+        :param receive: Receives lifespan events from the server
+        :param send: Sends lifespan events to the server
+        """
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                for callback in self._on_startup:
+                    await callback()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for callback in self._on_shutdown:
+                    await callback()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+class AsgiOrchestrator(object):
+    """
+    Orchestrates handling of HTTP requests on behalf of an endpoint.
+
+    Like origin's RequestOrchestrator, but for ASGI.
+
+    :param endpoint: The endpoint
+    :param token_encoder: Internal token encoder
+    :param guards: Guards to validate the request with
+    :param metrics: Metrics to record the latency of requests in
+    """
+
+    def __init__(
+            self,
+            endpoint: Endpoint,
+            token_encoder: TokenEncoder[InternalToken],
+            guards: Optional[List[EndpointGuard]] = None,
+            metrics: Optional[EndpointMetrics] = None,
+    ):
+        self.endpoint = endpoint
+        self.token_encoder = token_encoder
+        self.guards = guards
+        self.metrics = metrics
+        self.is_async = asyncio.iscoroutinefunction(endpoint.handle_request)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """
+        Handle a HTTP request.
+
+        :param scope: Connection scope
+        :param receive: Receives events from the client
+        :param send: Sends events to the client
+        """
+        started = time.perf_counter()
+
+        try:
+            response = await self.invoke_endpoint(scope, receive)
+        except HttpResponse as e:
+            response = HttpResponse(
+                status=e.status,
+                body=e.body,
+                headers=e.headers,
+            )
+        except Exception:
+            logger.exception('Endpoint failed')
+            response = HttpResponse(status=500, body='Internal Server Error')
+
+        await send_response(send, response)
+
+        if self.metrics is not None:
+            self.metrics.observe(
+                time.perf_counter() - started, response.status)
+
+    async def invoke_endpoint(
+            self,
+            scope: Scope,
+            receive: Receive,
+    ) -> HttpResponse:
+        """
+        Validate the request and invoke the endpoint.
+
+        :param scope: Connection scope
+        :param receive: Receives events from the client
+        :returns: The endpoint's response
+        """
+        context = AsgiContext(scope=scope, token_encoder=self.token_encoder)
+
+        if self.guards:
+            bouncer.validate(context, self.guards)
+
+        kwargs = {}
+
+        if self.endpoint.requires_context:
+            kwargs['context'] = context
+
+        if self.endpoint.should_parse_request_data:
+            # Defaulting to an empty dictionary makes it possible to omit
+            # request data for models where all fields are optional
+            data = await self.read_request_data(scope, receive)
+            kwargs['request'] = self.parse_request_data(data or {})
+
+        if self.is_async:
+            return_value = await self.endpoint.handle_request(**kwargs)
+        else:
+            return_value = await asyncio.get_running_loop().run_in_executor(
+                None, partial(self.endpoint.handle_request, **kwargs))
+
+        if isinstance(return_value, HttpResponse):
+            return return_value
+        elif is_dataclass(return_value):
+            return HttpResponse(status=200, model=return_value)
+        elif isinstance(return_value, (str, bytes)):
+            return HttpResponse(status=200, body=return_value)
+        elif isinstance(return_value, dict):
+            return HttpResponse(status=200, json=return_value)
+        elif return_value is None:
+            return HttpResponse(status=200)
+
+        raise RuntimeError('Endpoint returned an invalid response')
+
+    @staticmethod
+    async def read_request_data(
+            scope: Scope,
+            receive: Receive,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Read request data (query string for GET, JSON body for POST).
+
+        :param scope: Connection scope
+        :param receive: Receives events from the client
+        """
+        if scope['method'] == 'GET':
+            return dict(parse_qsl(scope['query_string'].decode('latin-1')))
+
+        body = b''
+
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+
+            if not message.get('more_body'):
+                break
+
+        if not body:
+            return None
+
+        try:
+            return rapidjson.loads(body.decode('utf8'))
+        except (rapidjson.JSONDecodeError, UnicodeDecodeError):
+            raise BadRequest(body='Invalid JSON body provided')
+
+    def parse_request_data(self, data: Dict[str, Any]) -> Any:
+        """
+        Deserialize request data to the endpoint's request schema.
+
+        :param data: Request data
+        """
+        try:
+            return simple_serializer.deserialize(
+                data=data,
+                schema=self.endpoint.request_schema,
+            )
+        except serpyco.exception.ValidationError as e:
+            raise BadRequest(body=str(e))
+
+
+async def send_response(send: Send, response: HttpResponse):
+    """
+    Send a HTTP response, formatted like origin's Flask responses.
+
+    Bodies which are iterables (of bytes) are streamed.
+
+    :param send: Sends events to the client
+    :param response: The response
+    """
+    mimetype = response.actual_mimetype or 'text/html'
+
+    headers = Headers(response.actual_headers)
+    headers.setdefault('Content-Type', get_content_type(mimetype, 'utf-8'))
+
+    for cookie in response.cookies:
+        headers.add('Set-Cookie', dump_cookie(
+            key=cookie.name,
+            value=cookie.value,
+            expires=cookie.expires,
+            path=cookie.path,
+            domain=cookie.domain,
+            secure=cookie.secure,
+            httponly=cookie.http_only,
+            samesite='Strict' if cookie.same_site else 'None',
+        ))
+
+    body = response.actual_body
+
+    if body is None:
+        body = b''
+    elif isinstance(body, str):
+        body = body.encode('utf8')
+
+    if isinstance(body, bytes):
+        headers['Content-Length'] = str(len(body))
+        chunks: Iterable[bytes] = (body,)
+    else:
+        chunks = body
+
+    await send({
+        'type': 'http.response.start',
+        'status': response.status,
+        'headers': [
+            (name.lower().encode('latin-1'), value.encode('latin-1'))
+            for name, value in headers.items()
+        ],
+    })
+
+    for chunk in chunks:
+        await send({
+            'type': 'http.response.body',
+            'body': chunk,
+            'more_body': True,
+        })
+
+    await send({'type': 'http.response.body', 'body': b''})
@@ -0,0 +1,106 @@
+# Standard Library
+from typing import Any, Dict, Optional
+
+# Third party
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from wrapt import decorator
+
+# First party
+from origin.sql import SqlEngine
+
+
+class AsyncSqlEngine(object):
+    """
+    Asynchronous counterpart of origin's SqlEngine.
+
+    Connects to the same database as the (synchronous) engine, using the
+    asyncpg driver, and shares its models. Synchronous code, like the
+    DatabaseController, can be reused from async code using
+    AsyncSession.run_sync().
+
+    :param sync_engine: The synchronous engine to mirror
+    """
+
+    # Shortcut/alias
+    Session = AsyncSession
+
+    DRIVER = 'postgresql+asyncpg'
+
+    def __init__(self, sync_engine: SqlEngine):
+        self.sync_engine = sync_engine
+        self._uri: Optional[str] = None
+        self._engine: Optional[AsyncEngine] = None
+
+    @property
+    def uri(self) -> str:
+        """Return the synchronous engine's URI, using the asyncpg driver."""
+
+        scheme, _, rest = self.sync_engine.uri.partition('://')
+
+        return f'{self.DRIVER}://{rest}'
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """Return engine settings (same as the synchronous engine)."""
+
+        return self.sync_engine.settings
+
+    @property
+    def engine(self) -> AsyncEngine:
+        """Return the engine, (re)creating it if the URI has changed."""
+
+        if self.uri != self._uri:
+            self._uri = self.uri
+            self._engine = create_async_engine(self.uri, **self.settings)
+
+        return self._engine
+
+    def make_session(self) -> AsyncSession:
+        """Create a new database session."""
+
+        return AsyncSession(bind=self.engine, expire_on_commit=False)
+
+    async def dispose(self):
+        """Close all connections (ie. on shutdown)."""
+
+        if self._engine is not None:
+            await self._engine.dispose()
+
+    def session(self):
+        """
+        Coroutine decorator which injects a "session" named parameter.
+
+        Like SqlEngine.session(), but for coroutines.
+        """
+        @decorator
+        async def session_decorator(wrapped, instance, args, kwargs):
+
+            session = kwargs.setdefault('session', self.make_session())
+
+            try:
+                return await wrapped(*args, **kwargs)
+            finally:
+                await session.close()
+
+        return session_decorator
+
+    def atomic(self):
+        """
+        Coroutine decorator which injects a "session" named parameter.
+
+        Like SqlEngine.atomic(), the coroutine is wrapped in a transaction
+        which is committed if it returns and rolled back if it raises.
+        """
+        @decorator
+        async def atomic_wrapper(wrapped, instance, args, kwargs):
+
+            session = kwargs.setdefault('session', self.make_session())
+
+            try:
+                async with session.begin():
+                    return await wrapped(*args, **kwargs)
+            finally:
+                await session.close()
+
+        return atomic_wrapper
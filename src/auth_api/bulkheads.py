@@ -0,0 +1,387 @@
+"""
+Bulkheads isolating database capacity per class of traffic.
+
+Each class of traffic (ie. introspection, login) has a connection pool of
+its own and a budget of workers (threads) allowed to use it concurrently,
+so a burst of slow requests of one class can only exhaust its own pool,
+and not stall requests of other classes.
+
+Bulkheads can also shed load: when too many requests are already waiting
+for a worker, or one can not be had in time, the request is rejected with
+a fast 503 Service Unavailable (and Retry-After), instead of queueing
+until it times out.
+"""
+
+# Standard Library
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+# Third party
+import sqlalchemy as sa
+from sqlalchemy.pool import QueuePool
+from wrapt import decorator
+
+# First party
+from origin.api import HttpError
+from origin.sql import SqlEngine
+
+# Local
+from .metrics import DB_POOL_WAIT
+
+
+class ServiceUnavailable(HttpError):
+    """
+    HTTP 503 Service Unavailable.
+
+    Returned when shedding load. Clients should retry after the number of
+    seconds in the Retry-After header.
+    """
+
+    def __init__(
+            self,
+            retry_after: int,
+            msg: str = 'Service Unavailable',
+            **kwargs,
+    ):
+        kwargs.setdefault('headers', {'Retry-After': str(retry_after)})
+        super(ServiceUnavailable, self).__init__(
+            status=503, msg=msg, **kwargs)
+
+
+@dataclass
+class WaitStatsSnapshot:
+    """Wait times recorded by WaitStats (seconds)."""
+
+    count: int
+    total: float
+    max: float
+
+
+class WaitStats(object):
+    """
+    Thread-safe statistics of time spent waiting.
+
+    :param histogram: Histogram (child) to also observe each wait in
+    """
+
+    def __init__(self, histogram: Optional[Any] = None):
+        self.histogram = histogram
+        self._waiting = 0
+        self._count = 0
+        self._total = 0.0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """
+        Record a single wait.
+
+        :param seconds: Seconds waited
+        """
+        with self._lock:
+            self._count += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+
+        if self.histogram is not None:
+            self.histogram.observe(seconds)
+
+    @property
+    def waiting(self) -> int:
+        """Return the no. of threads currently waiting (see wait())."""
+
+        return self._waiting
+
+    @contextmanager
+    def wait(self) -> Iterator[None]:
+        """Count the thread as waiting while in context."""
+
+        with self._lock:
+            self._waiting += 1
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def snapshot(self) -> WaitStatsSnapshot:
+        """Return the statistics recorded so far."""
+
+        with self._lock:
+            return WaitStatsSnapshot(
+                count=self._count,
+                total=self._total,
+                max=self._max,
+            )
+
+
+@dataclass
+class BulkheadMetrics:
+    """Metrics of a single bulkhead."""
+
+    name: str
+    pool_size: int
+    max_workers: int
+    active_workers: int
+    waiting_workers: int
+    shed: int
+    pool_wait: WaitStatsSnapshot
+    worker_wait: WaitStatsSnapshot
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waits for a connection.
+
+    Subclassed per bulkhead (see BulkheadSqlEngine), so the statistics
+    are a class attribute, which survives the pool being recreated.
+    """
+
+    bulkhead: str
+    wait_stats: WaitStats
+
+    def _do_get(self):
+        """Check out a connection, recording the time spent waiting."""
+
+        started = time.perf_counter()
+
+        try:
+            # Without overflow, the checkout waits if all are checked out
+            if self.checkedout() >= self.size():
+                with self.wait_stats.wait():
+                    return super(TimedQueuePool, self)._do_get()
+            else:
+                return super(TimedQueuePool, self)._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - started)
+
+
+class BulkheadSqlEngine(SqlEngine):
+    """
+    SqlEngine for a single class of traffic.
+
+    Connects to the same database as its parent engine (and shares its
+    models), but has a connection pool of its own, without overflow, so
+    pool_size is both the guaranteed and the max. no. of connections.
+
+    At most max_workers threads may use the engine concurrently (session()
+    and atomic() wait for a worker to finish), so excess requests of the
+    class wait without holding a connection. Nested use by the same thread
+    counts as one worker.
+
+    The bulkhead can shed load, rejecting requests with ServiceUnavailable
+    which can not get a worker or a connection within max_wait seconds,
+    which arrive while max_waiting requests are already waiting for a
+    worker, or which arrive while the bulkhead to yield to (of a class
+    with a higher priority) is saturated, ie. has requests waiting for a
+    worker or a connection. Busy (but not saturated) bulkheads are not
+    yielded to, so only excess traffic is shed. Without these, requests
+    wait for as long as it takes (for classes which must never be
+    rejected).
+
+    :param name: Name of the traffic class
+    :param parent: The engine to mirror
+    :param pool_size: No. of connections
+    :param max_workers: Max. no. of concurrent workers (0 for unlimited)
+    :param max_wait: Max. seconds to wait for a worker or connection
+    :param max_waiting: Max. no. of requests waiting for a worker
+    :param yield_to: Bulkhead of a class with a higher priority
+    :param retry_after: Seconds clients should wait before retrying
+    """
+
+    def __init__(
+            self,
+            name: str,
+            parent: SqlEngine,
+            pool_size: int,
+            max_workers: int = 0,
+            max_wait: Optional[float] = None,
+            max_waiting: Optional[int] = None,
+            yield_to: Optional['BulkheadSqlEngine'] = None,
+            retry_after: int = 1,
+    ):
+        self.name = name
+        self.parent = parent
+        self.pool_size = pool_size
+        self.max_workers = max_workers
+        self.max_wait = max_wait
+        self.max_waiting = max_waiting
+        self.yield_to = yield_to
+        self.retry_after = retry_after
+        self.pool_wait = WaitStats(histogram=DB_POOL_WAIT.labels(pool=name))
+        self.worker_wait = WaitStats()
+        self._uri = None
+        self._engine = None
+        self._workers = threading.BoundedSemaphore(max_workers) \
+            if max_workers > 0 else None
+        self._active_workers = 0
+        self._waiting_workers = 0
+        self._shed = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def uri(self) -> str:
+        """Return the parent engine's URI."""
+
+        return self.parent.uri
+
+    @property
+    def settings(self) -> Dict[str, Any]:
+        """Return engine settings, using a timed pool without overflow."""
+
+        poolclass = type(
+            f'TimedQueuePool_{self.name}',
+            (TimedQueuePool,),
+            {'bulkhead': self.name, 'wait_stats': self.pool_wait},
+        )
+
+        settings = {
+            **super(BulkheadSqlEngine, self).settings,
+            'max_overflow': 0,
+            'poolclass': poolclass,
+        }
+
+        if self.max_wait is not None:
+            settings['pool_timeout'] = self.max_wait
+
+        return settings
+
+    @property
+    def active_workers(self) -> int:
+        """Return the no. of threads currently using the engine."""
+
+        return self._active_workers
+
+    @property
+    def waiting(self) -> int:
+        """Return the no. of threads waiting for a worker or connection."""
+
+        return self._waiting_workers + self.pool_wait.waiting
+
+    @property
+    def saturated(self) -> bool:
+        """Return whether requests are waiting for a worker or connection."""
+
+        return self.waiting > 0
+
+    @contextmanager
+    def worker(self) -> Iterator[None]:
+        """Occupy a worker while in context, waiting for one if necessary."""
+
+        depth = getattr(self._local, 'depth', 0)
+
+        if depth == 0:
+            self._admit()
+
+            with self._lock:
+                self._active_workers += 1
+
+        self._local.depth = depth + 1
+
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+
+            if depth == 0:
+                with self._lock:
+                    self._active_workers -= 1
+
+                if self._workers is not None:
+                    self._workers.release()
+
+    def _admit(self):
+        """Wait for a worker, or shed the request."""
+
+        if self.yield_to is not None and self.yield_to.saturated:
+            self._reject()
+
+        if self._workers is None:
+            return
+
+        if self._workers.acquire(blocking=False):
+            self.worker_wait.record(0.0)
+            return
+
+        with self._lock:
+            queue_full = self.max_waiting is not None \
+                and self._waiting_workers >= self.max_waiting
+
+            if not queue_full:
+                self._waiting_workers += 1
+
+        if queue_full:
+            self._reject()
+
+        started = time.perf_counter()
+
+        try:
+            acquired = self._workers.acquire(timeout=self.max_wait)
+        finally:
+            with self._lock:
+                self._waiting_workers -= 1
+
+        self.worker_wait.record(time.perf_counter() - started)
+
+        if not acquired:
+            self._reject()
+
+    def _reject(self):
+        """Shed the request."""
+
+        with self._lock:
+            self._shed += 1
+
+        raise ServiceUnavailable(retry_after=self.retry_after)
+
+    def session(self):
+        """
+        Inject a "session" named parameter (function decorator).
+
+        Like SqlEngine.session(), but occupies a worker while invoked.
+        """
+        return self._occupy_worker(super(BulkheadSqlEngine, self).session())
+
+    def atomic(self):
+        """
+        Inject a "session" named parameter in a transaction (decorator).
+
+        Like SqlEngine.atomic(), but occupies a worker while invoked.
+        """
+        return self._occupy_worker(super(BulkheadSqlEngine, self).atomic())
+
+    def metrics(self) -> BulkheadMetrics:
+        """Return the bulkhead's metrics."""
+
+        return BulkheadMetrics(
+            name=self.name,
+            pool_size=self.pool_size,
+            max_workers=self.max_workers,
+            active_workers=self._active_workers,
+            waiting_workers=self._waiting_workers,
+            shed=self._shed,
+            pool_wait=self.pool_wait.snapshot(),
+            worker_wait=self.worker_wait.snapshot(),
+        )
+
+    def _occupy_worker(self, inner: Callable) -> Callable:
+        """
+        Wrap a function decorator, occupying a worker while invoked.
+
+        :param inner: The function decorator to wrap
+        """
+        @decorator
+        def worker_decorator(wrapped, instance, args, kwargs):
+            with self.worker():
+                try:
+                    return inner(wrapped)(*args, **kwargs)
+                except sa.exc.TimeoutError:
+                    # Timed out waiting for a connection (pool_timeout)
+                    self._reject()
+
+        return worker_decorator
@@ -0,0 +1,186 @@
+# Standard Library
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Generic, Hashable, Iterable, Optional, Tuple, TypeVar
+
+# Local
+from .metrics import CacheMetrics
+
+TKey = TypeVar('TKey', bound=Hashable)
+TValue = TypeVar('TValue')
+
+
+class LRUCache(Generic[TKey, TValue]):
+    """
+    Thread-safe in-memory cache of a limited size.
+
+    When the cache is full, the least recently used entry is evicted.
+    Each process (worker) has its own cache, so it must only be used
+    for values that can be invalidated locally, or which never change.
+
+    Entries can optionally expire after a number of seconds (ttl), which
+    bounds how long a value can be stale when it is changed elsewhere.
+    Expired entries can be kept for a grace period, during which they are
+    only returned when explicitly asking for stale values (ie. when the
+    source of the values is unavailable).
+
+    :param maxsize: Maximum number of entries (0 disables the cache)
+    :param ttl: Seconds before entries expire (None never expires them)
+    :param grace: Seconds to keep expired entries for stale lookups
+    :param metrics: Metrics to record hits and misses in (stale lookups
+        are not recorded)
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            ttl: Optional[float] = None,
+            grace: float = 0,
+            metrics: Optional[CacheMetrics] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.grace = grace
+        self.metrics = metrics
+        self._entries: 'OrderedDict[TKey, Tuple[TValue, float]]' = \
+            OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of cached entries."""
+
+        return len(self._entries)
+
+    def get(self, key: TKey, stale: bool = False) -> Optional[TValue]:
+        """
+        Return the cached value for a key, if any.
+
+        :param key: The key
+        :param stale: Also return expired values within the grace period
+        :returns: The value, or None if it is not cached
+        """
+        with self._lock:
+            value = self._get(key, time.monotonic(), stale)
+
+        if self.metrics is not None and not stale:
+            if value is not None:
+                self.metrics.hits.inc()
+            else:
+                self.metrics.misses.inc()
+
+        return value
+
+    def get_many(
+            self,
+            keys: Iterable[TKey],
+            stale: bool = False,
+    ) -> Dict[TKey, TValue]:
+        """
+        Return the cached values of many keys, acquiring the lock once.
+
+        :param keys: The keys
+        :param stale: Also return expired values within the grace period
+        :returns: The cached values by key (keys not cached are omitted)
+        """
+        now = time.monotonic()
+        values = {}
+        misses = 0
+
+        with self._lock:
+            for key in keys:
+                value = self._get(key, now, stale)
+
+                if value is not None:
+                    values[key] = value
+                else:
+                    misses += 1
+
+        if self.metrics is not None and not stale:
+            self.metrics.hits.inc(len(values))
+            self.metrics.misses.inc(misses)
+
+        return values
+
+    def set(self, key: TKey, value: TValue, ttl: Optional[float] = None):
+        """
+        Cache a value.
+
+        :param key: The key
+        :param value: The value (must not be None)
+        :param ttl: Seconds before the entry expires, instead of the
+            cache's ttl
+        """
+        if self.maxsize <= 0:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+
+        if ttl is None:
+            expires = float('inf')
+        else:
+            expires = time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: TKey):
+        """
+        Remove a key from the cache, if it is cached.
+
+        :param key: The key
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_many(self, keys: Iterable[TKey]):
+        """
+        Remove many keys from the cache, acquiring the lock once.
+
+        :param keys: The keys
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+
+        with self._lock:
+            self._entries.clear()
+
+    def _get(
+            self,
+            key: TKey,
+            now: float,
+            stale: bool = False,
+    ) -> Optional[TValue]:
+        """
+        Return a cached value, unless it has expired. Lock must be held.
+
+        :param key: The key
+        :param now: Current (monotonic) time
+        :param stale: Also return expired values within the grace period
+        """
+        entry = self._entries.get(key)
+
+        if entry is None:
+            return None
+
+        value, expires = entry
+
+        if expires + self.grace <= now:
+            del self._entries[key]
+            return None
+
+        if expires <= now and not stale:
+            return None
+
+        self._entries.move_to_end(key)
+
+        return value
@@ -24,9 +24,43 @@ SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.join(SOURCE_DIR, '..')
 TERMS_MARKDOWN_FOLDER = config('TERMS_MARKDOWN_FOLDER')
 
+# Language of terms placed directly in TERMS_MARKDOWN_FOLDER, and the
+# language used when the client's preferred language is not available
+TERMS_DEFAULT_LANGUAGE = config('TERMS_DEFAULT_LANGUAGE', default='en')
+
+# Seconds between checking TERMS_MARKDOWN_FOLDER for new or changed terms
+TERMS_POLL_INTERVAL = config('TERMS_POLL_INTERVAL', default=10, cast=float)
+
+# Seconds clients and proxies may cache the terms before revalidating
+TERMS_CACHE_MAX_AGE = config('TERMS_CACHE_MAX_AGE', default=300, cast=int)
+
 # No. of hours used for the timedelta for internal token expiry
 TOKEN_EXPIRY_DELTA = timedelta(days=1)
 
+# -- Login records -----------------------------------------------------------
+
+# Whether to buffer login records in memory and insert them in bulk, instead
+# of inserting each one within the login's transaction
+LOGIN_RECORD_WRITE_BEHIND = config(
+    'LOGIN_RECORD_WRITE_BEHIND', default=False, cast=bool)
+
+# No. of buffered login records which triggers inserting them
+LOGIN_RECORD_BUFFER_SIZE = config(
+    'LOGIN_RECORD_BUFFER_SIZE', default=500, cast=int)
+
+# Max. seconds between inserting buffered login records
+LOGIN_RECORD_FLUSH_INTERVAL = config(
+    'LOGIN_RECORD_FLUSH_INTERVAL', default=5, cast=float)
+
+# Days to keep login records (daily aggregates are kept forever), or 0 to
+# keep login records forever
+LOGIN_RECORD_RETENTION_DAYS = config(
+    'LOGIN_RECORD_RETENTION_DAYS', default=365, cast=int)
+
+# No. of monthly login record partitions to create ahead of time
+LOGIN_RECORD_PARTITIONS_AHEAD = config(
+    'LOGIN_RECORD_PARTITIONS_AHEAD', default=2, cast=int)
+
 # -- Tokens ------------------------------------------------------------------
 
 # The domain to set token cookie on
@@ -49,14 +83,123 @@ TOKEN_DEFAULT_SCOPES = [
 # The path to set token cookie on
 TOKEN_COOKIE_PATH = '/'
 
+# Where to store tokens: "postgres" (the token table), "memory" (in the
+# process, for tests and single-process development) or "lmdb" (an embedded
+# database shared by processes on the host, for edge deployments)
+TOKEN_STORE = config('TOKEN_STORE', default='postgres')
+
+# Path (directory) of the LMDB database, when TOKEN_STORE is "lmdb"
+TOKEN_STORE_LMDB_PATH = config(
+    'TOKEN_STORE_LMDB_PATH', default='/var/lib/auth/tokens.lmdb')
+
+# Max. size (in bytes) of the LMDB database, when TOKEN_STORE is "lmdb"
+TOKEN_STORE_LMDB_MAP_SIZE = config(
+    'TOKEN_STORE_LMDB_MAP_SIZE', default=2 ** 30, cast=int)
+
+# Number of valid tokens to cache (by opaque token), per process
+TOKEN_CACHE_SIZE = config('TOKEN_CACHE_SIZE', default=10000, cast=int)
+
+# Seconds to cache a token; a token revoked by another process may be
+# accepted by this process for up to this long (unless invalidated using
+# CACHE_INVALIDATION_ENABLED)
+TOKEN_CACHE_TTL = config('TOKEN_CACHE_TTL', default=5, cast=float)
+
+# Seconds to keep serving a token from cache after TOKEN_CACHE_TTL while the
+# database is down (never beyond the token's expiry), or 0 to reject tokens
+# not in cache while the database is down
+TOKEN_CACHE_GRACE = config('TOKEN_CACHE_GRACE', default=0, cast=float)
+
+# Seconds between attempts to query the database while it is down (requests
+# in between are served from cache), when TOKEN_CACHE_GRACE is enabled
+TOKEN_DB_PROBE_INTERVAL = config(
+    'TOKEN_DB_PROBE_INTERVAL', default=1, cast=float)
+
+# Max. number of logouts to buffer (per process) while the database is down,
+# which are applied when it is up again, and of recent logouts to remember
+# (see SQL_REPLICA_MAX_LAG)
+REVOCATION_BUFFER_SIZE = config(
+    'REVOCATION_BUFFER_SIZE', default=10000, cast=int)
+
+# Whether to invalidate cached tokens and identities in every process when
+# they change, using PostgreSQL LISTEN/NOTIFY (one connection per process)
+CACHE_INVALIDATION_ENABLED = config(
+    'CACHE_INVALIDATION_ENABLED', default=False, cast=bool)
+
+# PostgreSQL channel to publish (and listen for) cache invalidations on
+CACHE_INVALIDATION_CHANNEL = config(
+    'CACHE_INVALIDATION_CHANNEL', default='auth_cache_invalidation')
+
+# Seconds between attempts to reconnect the cache invalidation listener
+CACHE_INVALIDATION_RECONNECT_INTERVAL = config(
+    'CACHE_INVALIDATION_RECONNECT_INTERVAL', default=1, cast=float)
+
+# Whether to sync new and revoked tokens into the token cache periodically,
+# so revocations by other processes are applied within seconds (and
+# TOKEN_CACHE_TTL can be raised)
+TOKEN_SYNC_ENABLED = config('TOKEN_SYNC_ENABLED', default=False, cast=bool)
+
+# Seconds between syncs of the token cache
+TOKEN_SYNC_INTERVAL = config('TOKEN_SYNC_INTERVAL', default=1, cast=float)
+
+# Seconds each sync looks back before the previous sync, so changes committed
+# late (by slow transactions) are not missed
+TOKEN_SYNC_OVERLAP = config('TOKEN_SYNC_OVERLAP', default=5, cast=float)
+
+# Hours to keep the log of deleted tokens (deleted by maintenance); the token
+# cache is cleared if it has not been synced for this long
+TOKEN_DELETION_RETENTION_HOURS = config(
+    'TOKEN_DELETION_RETENTION_HOURS', default=24, cast=int)
+
+# Scope internal services must be granted to introspect tokens
+TOKEN_INTROSPECTION_SCOPE = 'tokens.introspect'
+
+# Max. number of tokens to introspect in a single request
+TOKEN_INTROSPECTION_MAX_BATCH = config(
+    'TOKEN_INTROSPECTION_MAX_BATCH', default=1000, cast=int)
+
+# -- External authorization --------------------------------------------------
+
+# Number of database connections of the asyncio ForwardAuth service
+# (entrypoint_forward_auth.sh), per process
+FORWARD_AUTH_POOL_SIZE = config('FORWARD_AUTH_POOL_SIZE', default=10, cast=int)
+
+# Port of the Envoy ext_authz gRPC service (entrypoint_ext_authz.sh)
+EXT_AUTHZ_PORT = config('EXT_AUTHZ_PORT', default=9191, cast=int)
+
+# Max. number of requests the ext_authz service serves concurrently
+EXT_AUTHZ_MAX_WORKERS = config('EXT_AUTHZ_MAX_WORKERS', default=10, cast=int)
+
+# Path of the snapshot of valid tokens written by the snapshot writer
+# (entrypoint_snapshot.sh) and read by ForwardAuth sidecars
+# (entrypoint_sidecar.sh, which read it in auth_api.sidecar); the delta log
+# is written next to it
+SNAPSHOT_PATH = config('SNAPSHOT_PATH', default='/var/lib/auth/tokens.snap')
+
+# Seconds between changes appended to the delta log of the snapshot
+SNAPSHOT_INTERVAL = config('SNAPSHOT_INTERVAL', default=1, cast=float)
+
+# Seconds between complete snapshots (which truncate the delta log)
+SNAPSHOT_FULL_INTERVAL = config(
+    'SNAPSHOT_FULL_INTERVAL', default=300, cast=float)
+
+# Seconds each delta looks back before the previous one, so changes committed
+# late (by slow transactions) are not missed
+SNAPSHOT_OVERLAP = config('SNAPSHOT_OVERLAP', default=5, cast=float)
+
+# SNAPSHOT_CHECK_INTERVAL and SNAPSHOT_MAX_AGE are read by sidecars only, see
+# auth_api.sidecar (which does not import this module)
+
 # -- Secrets -----------------------------------------------------------------
 
 # Secret used to sign internal token
 INTERNAL_TOKEN_SECRET = config('INTERNAL_TOKEN_SECRET')
 
-# Secret used to encrypt id_token in state
+# Secret used to encrypt the login state (AuthState)
 STATE_ENCRYPTION_SECRET = config('STATE_ENCRYPTION_SECRET')
 
+# Secret used to key the blind index of social security numbers
+SSN_BLIND_INDEX_SECRET = config('SSN_BLIND_INDEX_SECRET')
+
 
 # -- SQL ---------------------------------------------------------------------
 
@@ -81,6 +224,102 @@ SQL_URI = f'postgresql://{PSQL_USER}:{PSQL_PASSWORD}@{PSQL_HOST}:{PSQL_PORT}/{PS
 # Number of concurrent connection to SQL database
 SQL_POOL_SIZE = config('SQL_POOL_SIZE', default=1, cast=int)
 
+# SqlAlchemy connection string of a read-only replica of the database, used
+# for read-only lookups (tokens, users, login history and sessions), or empty
+# to read from the (primary) database
+SQL_REPLICA_URI = config('SQL_REPLICA_URI', default='')
+
+# Number of concurrent connection to the read-only replica
+SQL_REPLICA_POOL_SIZE = config(
+    'SQL_REPLICA_POOL_SIZE', default=SQL_POOL_SIZE, cast=int)
+
+# Max. seconds the read-only replica may lag behind; tokens revoked within
+# this long (by this process, or by others when CACHE_INVALIDATION_ENABLED)
+# are looked up on the primary, as the replica may still have them
+SQL_REPLICA_MAX_LAG = config('SQL_REPLICA_MAX_LAG', default=30, cast=float)
+
+# Number of external users to cache the (internal) subject of, per process
+IDENTITY_CACHE_SIZE = config('IDENTITY_CACHE_SIZE', default=10000, cast=int)
+
+# -- Bulkheads ---------------------------------------------------------------
+
+# Each class of traffic has a connection pool of its own, and a max. number
+# of workers (threads) which may use it concurrently (0 for unlimited)
+
+# Number of threads serving requests, per process (gunicorn's --threads, set
+# by gunicorn.conf.py). The defaults of the bulkheads are sized against it
+SERVER_THREADS = config('SERVER_THREADS', default=2, cast=int)
+
+# Max. number of concurrent login and onboarding workers, per process. At
+# most half of the threads, so the rest are left for introspection
+BULKHEAD_LOGIN_WORKERS = config(
+    'BULKHEAD_LOGIN_WORKERS', default=max(1, SERVER_THREADS // 2), cast=int)
+
+# Connections for login and onboarding (login callback, accepting terms,
+# logging out and account pages), per process
+BULKHEAD_LOGIN_POOL_SIZE = config(
+    'BULKHEAD_LOGIN_POOL_SIZE', default=BULKHEAD_LOGIN_WORKERS, cast=int)
+
+# Max. seconds login and onboarding requests wait for a worker or connection
+# before being rejected (503 Service Unavailable)
+BULKHEAD_LOGIN_MAX_WAIT = config(
+    'BULKHEAD_LOGIN_MAX_WAIT', default=1, cast=float)
+
+# Max. number of login and onboarding requests waiting for a worker; more
+# are rejected immediately (503 Service Unavailable). Waiting requests hold
+# a thread, so by default at least one thread is always left for
+# introspection
+BULKHEAD_LOGIN_MAX_WAITING = config(
+    'BULKHEAD_LOGIN_MAX_WAITING',
+    default=max(0, SERVER_THREADS - BULKHEAD_LOGIN_WORKERS - 1),
+    cast=int,
+)
+
+# Connections for introspection (ForwardAuth, token introspection and
+# ext_authz), per process. One per thread not used by login workers
+BULKHEAD_INTROSPECTION_POOL_SIZE = config(
+    'BULKHEAD_INTROSPECTION_POOL_SIZE',
+    default=max(1, SERVER_THREADS - BULKHEAD_LOGIN_WORKERS),
+    cast=int,
+)
+
+# Max. number of concurrent introspection workers, per process
+BULKHEAD_INTROSPECTION_WORKERS = config(
+    'BULKHEAD_INTROSPECTION_WORKERS', default=0, cast=int)
+
+# Whether to reject login and onboarding requests while introspection has
+# requests waiting for a worker or connection, so ForwardAuth gets the threads
+BULKHEAD_LOGIN_YIELD_TO_INTROSPECTION = config(
+    'BULKHEAD_LOGIN_YIELD_TO_INTROSPECTION', default=True, cast=bool)
+
+# Seconds clients should wait before retrying rejected requests (Retry-After)
+BULKHEAD_RETRY_AFTER = config('BULKHEAD_RETRY_AFTER', default=1, cast=int)
+
+# Connections for admin and maintenance (inserting buffered login records,
+# applying buffered logouts and periodic maintenance), per process
+BULKHEAD_ADMIN_POOL_SIZE = config(
+    'BULKHEAD_ADMIN_POOL_SIZE', default=2, cast=int)
+
+# Max. number of concurrent admin and maintenance workers, per process
+BULKHEAD_ADMIN_WORKERS = config(
+    'BULKHEAD_ADMIN_WORKERS', default=2, cast=int)
+
+# Scope internal services must be granted to read metrics
+METRICS_SCOPE = 'metrics.read'
+
+# -- Warm-up -----------------------------------------------------------------
+
+# Whether to warm up caches and connections when a process starts; the health
+# check (/health) reports not ready (503) until warm-up has finished
+WARMUP_ENABLED = config('WARMUP_ENABLED', default=False, cast=bool)
+
+# Max. number of valid tokens to load into the token cache when warming up
+# (the most recently issued ones), per process
+WARMUP_TOKENS = config('WARMUP_TOKENS', default=TOKEN_CACHE_SIZE, cast=int)
+
+# Number of tokens to fetch from the database at a time when warming up
+WARMUP_BATCH_SIZE = config('WARMUP_BATCH_SIZE', default=1000, cast=int)
+
 
 # -- URLs --------------------------------------------------------------------
 
@@ -102,7 +341,15 @@ INVALIDATE_PENDING_LOGIN_PATH = '/invalidate'
 OIDC_CLIENT_ID = config('OIDC_CLIENT_ID')
 OIDC_CLIENT_SECRET = config('OIDC_CLIENT_SECRET')
 OIDC_AUTHORITY_URL = config('OIDC_AUTHORITY_URL')
-OIDC_LANGUAGE = 'en'
+OIDC_LANGUAGE = config('OIDC_LANGUAGE', default='en')
+
+# Max. no. of concurrent back-channel logouts when logging out everywhere
+OIDC_LOGOUT_CONCURRENCY = config(
+    'OIDC_LOGOUT_CONCURRENCY', default=10, cast=int)
+
+# Seconds to cache the Identity Provider's keys (JWKS), or 0 to fetch them
+# on every login; keys are fetched again if a token can not be verified
+OIDC_JWKS_CACHE_TTL = config('OIDC_JWKS_CACHE_TTL', default=3600, cast=float)
 
 OIDC_LOGIN_URL = f'{OIDC_AUTHORITY_URL}/connect/authorize'
 OIDC_TOKEN_URL = f'{OIDC_AUTHORITY_URL}/connect/token'
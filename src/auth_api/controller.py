@@ -1,30 +1,62 @@
 # Standard Library
+import atexit
+import hmac
 from datetime import datetime, timezone
-from typing import List, Optional
+from hashlib import sha256
+from typing import Dict, Iterable, List, Optional, Set, Tuple, TypeVar
 from uuid import uuid4
 
+# Third party
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import make_transient_to_detached
+
 # First party
 from origin.encrypt import aes256_encrypt
 from origin.models.auth import InternalToken
 from origin.tokens import TokenEncoder
 
 # Local
+from .cache import LRUCache
 from .config import (
+    CACHE_INVALIDATION_CHANNEL,
+    CACHE_INVALIDATION_ENABLED,
+    CACHE_INVALIDATION_RECONNECT_INTERVAL,
+    IDENTITY_CACHE_SIZE,
     INTERNAL_TOKEN_SECRET,
+    SSN_BLIND_INDEX_SECRET,
     STATE_ENCRYPTION_SECRET,
+    REVOCATION_BUFFER_SIZE,
+    SQL_REPLICA_MAX_LAG,
+    TOKEN_CACHE_GRACE,
+    TOKEN_CACHE_SIZE,
+    TOKEN_CACHE_TTL,
+    TOKEN_DB_PROBE_INTERVAL,
 )
 from .db import db
+from .degradation import (
+    DATABASE_ERRORS,
+    DatabaseHealth,
+    DegradationMetrics,
+    RevocationBuffer,
+)
+from .edge import CachedToken, token_key
+from .invalidation import (
+    Invalidation,
+    InvalidationListener,
+    publish_invalidation,
+)
+from .metrics import CacheMetrics, LOGINS, TOKENS_ISSUED, TOKENS_REVOKED
 from .models import (
     DbExternalUser,
     DbLoginRecord,
     DbToken,
     DbUser,
 )
-from .queries import (
-    ExternalUserQuery,
-    TokenQuery,
-    UserQuery,
-)
+from .queries import UserQuery
+from .token_store import RevokedToken, TokenStore, token_store
+
+TValue = TypeVar('TValue')
 
 # -- Encoders & Encryption ---------------------------------------------------
 
@@ -48,71 +80,224 @@ def encrypt_ssn(ssn: str) -> str:
     )
 
 
+def ssn_blind_index(ssn: str) -> str:
+    """
+    Create a blind index of a social security number.
+
+    The encrypted social security number is randomized (and can not be
+    searched for), so users are looked up by a keyed hash of it instead.
+
+    :param ssn: Social security number, unencrypted
+    :returns: HMAC-SHA256 of the social security number, hex encoded
+    """
+    return hmac.new(
+        key=SSN_BLIND_INDEX_SECRET.encode('utf8'),
+        msg=ssn.encode('utf8'),
+        digestmod=sha256,
+    ).hexdigest()
+
+
 # -- Database controller -----------------------------------------------------
 
 
 class DatabaseController(object):
-    """SQL DB handler."""
+    """
+    SQL DB handler.
+
+    Keeps a cache of which (internal) subject each external user belongs
+    to. External users are never re-attached to other users, so the
+    cache only has to be invalidated if users are merged.
+
+    Also keeps a cache of valid tokens by the key of their opaque token
+    (see auth_api.tokens.token_key). Tokens revoked by this process are
+    invalidated immediately, while tokens revoked by other processes
+    expire from the cache after its TTL.
+
+    If an invalidation channel is provided, invalidations are published
+    to all other processes too, in the transaction making the change
+    (see auth_api.invalidation).
+
+    If the token cache has a grace period, tokens are served from expired
+    cache entries while the database is down (see auth_api.degradation).
+
+    Tokens are stored in the token store (see auth_api.token_store).
+
+    Tokens revoked recently (by this process, or by any process if
+    invalidations are published) are remembered for as long as a
+    read-only replica may lag behind, and are only looked up on the
+    primary until then.
+
+    :param token_store: Stores tokens
+    :param identity_cache: Cache of (identity_provider, external_subject)
+        -> subject
+    :param token_cache: Cache of token key -> valid token
+    :param health: Tracks whether the database is available
+    :param revocations: Revocations made while the database is down
+    :param recent_revocations: Keys of tokens revoked recently, which
+        entries expire after the max. lag of the replica
+    :param invalidation_channel: Channel to publish invalidations on,
+        or None to only invalidate the caches of this process
+    """
+
+    def __init__(
+            self,
+            token_store: TokenStore,
+            identity_cache: LRUCache[Tuple[str, str], str],
+            token_cache: LRUCache[bytes, CachedToken],
+            health: DatabaseHealth,
+            revocations: RevocationBuffer,
+            recent_revocations: LRUCache[bytes, bool],
+            invalidation_channel: Optional[str] = None,
+    ):
+        self.token_store = token_store
+        self.identity_cache = identity_cache
+        self.token_cache = token_cache
+        self.health = health
+        self.revocations = revocations
+        self.recent_revocations = recent_revocations
+        self.invalidation_channel = invalidation_channel
+        self.stale_hits = 0
+
+    @property
+    def degradation_enabled(self) -> bool:
+        """Return whether to serve stale tokens while the database is down."""
+
+        return self.token_cache.grace > 0
 
     def get_user_by_external_subject(
             self,
             session: db.Session,
             identity_provider: str,
             external_subject: str,
+            replica_session: Optional[db.Session] = None,
     ) -> Optional[DbUser]:
         """
         Identify an external subject.
 
+        If a replica session is provided, the user is looked up on the
+        replica first. Users not found on the replica may have been
+        created after the replica last caught up, so they are looked up
+        in the database (primary) too.
+
         :param session: Database session
         :param identity_provider: ID/name of Identity Provider
         :param external_subject: Identity Provider's subject
+        :param replica_session: Session of a read-only replica, if any
         :returns: if the current user exits, in the database, it will be
             returned
         """
-        external_user = ExternalUserQuery(session) \
-            .has_identity_provider(identity_provider) \
-            .has_external_subject(external_subject) \
+        key = (identity_provider, external_subject)
+        subject = self.identity_cache.get(key)
+
+        if subject is None and replica_session is not None:
+            replica_user = UserQuery(replica_session) \
+                .has_external_user(identity_provider, external_subject) \
+                .one_or_none()
+
+            if replica_user is not None:
+                subject = replica_user.subject
+                self.identity_cache.set(key, subject)
+
+        if subject is not None:
+            # Attach the user to the session without querying the database.
+            # Its other attributes are loaded if (and when) accessed.
+            user = DbUser(subject=subject)
+            make_transient_to_detached(user)
+            return session.merge(user, load=False)
+
+        user = UserQuery(session) \
+            .has_external_user(identity_provider, external_subject) \
             .one_or_none()
 
-        if external_user:
-            return external_user.user
+        if user is not None:
+            self.identity_cache.set(key, user.subject)
+
+        return user
 
     def get_or_create_user(
             self,
             session: db.Session,
+            identity_provider: str,
+            external_subject: str,
             ssn: Optional[str] = None,
             tin: Optional[str] = None,
     ) -> DbUser:
         """
-        Identify a subject.
+        Identify a subject, creating the user if it doesn't exist.
 
-        If the user does exist it returns, if not the user will be created.
+        The user is identified by either TIN or SSN (TIN takes precedence),
+        where SSN is looked up by its blind index.
+        If the user doesn't exist, it is created. The external user is
+        attached to the user, unless the external subject is already known.
+
+        Everything happens in a single INSERT ... ON CONFLICT statement,
+        so it takes one round trip to the database, and concurrent logins
+        for the same user can not create duplicate users.
 
         :param session: Database session
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
         :param ssn: Social security number, unencrypted
         :param tin: Tax Identification Number
         :returns: user information
         """
+        if tin is not None:
+            conflict_column = DbUser.tin
+        elif ssn is not None:
+            conflict_column = DbUser.ssn_index
+        else:
+            raise ValueError('Either ssn or tin must be provided')
 
-        ssn_encrypted = encrypt_ssn(ssn) if ssn is not None else None
+        insert_user = insert(DbUser).values(
+            subject=str(uuid4()),
+            ssn=encrypt_ssn(ssn) if ssn is not None else None,
+            ssn_index=ssn_blind_index(ssn) if ssn is not None else None,
+            tin=tin,
+        )
 
-        query = UserQuery(session)
+        # Updating the conflicting column with its own value makes RETURNING
+        # return the existing user, which DO NOTHING does not.
+        insert_user = insert_user.on_conflict_do_update(
+            index_elements=[conflict_column],
+            set_={conflict_column.name: conflict_column},
+        )
 
-        if ssn is not None:
-            query = query.has_ssn(ssn_encrypted)
-        if tin is not None:
-            query = query.has_tin(tin)
+        insert_user = insert_user \
+            .returning(*DbUser.__table__.columns) \
+            .cte('upserted_user')
 
-        user = query.one_or_none()
+        insert_external_user = insert(DbExternalUser).from_select(
+            ['subject', 'identity_provider', 'external_subject'],
+            sa.select(
+                insert_user.c.subject,
+                sa.literal(identity_provider),
+                sa.literal(external_subject),
+            ),
+        )
 
-        if user is None:
-            user = DbUser(
-                subject=str(uuid4()),
-                ssn=ssn_encrypted,
-                tin=tin,
-            )
+        insert_external_user = insert_external_user.on_conflict_do_nothing(
+            index_elements=[
+                DbExternalUser.identity_provider,
+                DbExternalUser.external_subject,
+            ],
+        )
+
+        insert_external_user = insert_external_user \
+            .returning(DbExternalUser.id) \
+            .cte('inserted_external_user')
 
-            session.add(user)
+        # Joining the external user (which is empty if it already existed)
+        # makes sure it is part of the statement
+        select_user = sa.select(insert_user).select_from(
+            insert_user.outerjoin(insert_external_user, sa.true()))
+
+        statement = sa.select(DbUser) \
+            .from_statement(select_user) \
+            .execution_options(populate_existing=True)
+
+        user = session.execute(statement).scalar_one()
+
+        self.invalidate_identity(identity_provider, external_subject, session)
 
         return user
 
@@ -133,21 +318,22 @@ class DatabaseController(object):
         :param identity_provider: ID/name of Identity Provider
         :param external_subject: Identity Provider's subject
         """
-
-        query = ExternalUserQuery(session)
-
-        query = query \
-            .has_external_subject(external_subject) \
-            .has_identity_provider(identity_provider)
-
-        external_user = query.one_or_none()
-
-        if external_user is None:
-            session.add(DbExternalUser(
-                user=user,
+        session.execute(
+            insert(DbExternalUser)
+            .values(
+                subject=user.subject,
                 identity_provider=identity_provider,
-                external_subject=external_subject
-            ))
+                external_subject=external_subject,
+            )
+            .on_conflict_do_nothing(
+                index_elements=[
+                    DbExternalUser.identity_provider,
+                    DbExternalUser.external_subject,
+                ],
+            )
+        )
+
+        self.invalidate_identity(identity_provider, external_subject, session)
 
     def create_user(
             self,
@@ -161,11 +347,10 @@ class DatabaseController(object):
         :param ssn: Social security number, unencrypted
         :returns: user information
         """
-        ssn_encrypted = encrypt_ssn(ssn)
-
         user = DbUser(
             subject=str(uuid4()),
-            ssn=ssn_encrypted,
+            ssn=encrypt_ssn(ssn),
+            ssn_index=ssn_blind_index(ssn),
         )
 
         session.add(user)
@@ -187,6 +372,7 @@ class DatabaseController(object):
             subject=user.subject,
             created=datetime.now(tz=timezone.utc),
         ))
+        LOGINS.inc()
 
     def create_token(
             self,
@@ -214,6 +400,75 @@ class DatabaseController(object):
         :param scope: The scopes to grant
         :returns: Opaque token
         """
+        token = self._build_token(
+            issued=issued,
+            expires=expires,
+            subject=subject,
+            id_token=id_token,
+            scope=scope,
+        )
+
+        self.token_store.add(session, token)
+        TOKENS_ISSUED.inc()
+
+        return token.opaque_token
+
+    def log_in_user(
+            self,
+            session: db.Session,
+            user: DbUser,
+            issued: datetime,
+            expires: datetime,
+            id_token: str,
+            scope: List[str],
+    ) -> str:
+        """
+        Register a user's login and create a token for the user.
+
+        Equivalent to register_user_login() followed by create_token(),
+        but tokens stored in the database are inserted together with the
+        login record, using a single statement (one round trip).
+
+        :param session: Database session
+        :param user: User identified
+        :param issued: Time when token is issued
+        :param expires: Time when token expires
+        :param id_token: ID token from Identity Provider, raw/encoded
+        :param scope: The scopes to grant
+        :returns: Opaque token
+        """
+        token = self._build_token(
+            issued=issued,
+            expires=expires,
+            subject=user.subject,
+            id_token=id_token,
+            scope=scope,
+        )
+
+        self.token_store.add_with_login_record(session, token)
+        LOGINS.inc()
+        TOKENS_ISSUED.inc()
+
+        return token.opaque_token
+
+    def _build_token(
+            self,
+            issued: datetime,
+            expires: datetime,
+            subject: str,
+            id_token: str,
+            scope: List[str],
+    ) -> DbToken:
+        """
+        Create (but not save) a token with a new opaque token.
+
+        :param issued: Time when token is issued
+        :param expires: Time when token expires
+        :param subject: The subject to create token for
+        :param id_token: ID token from Identity Provider, raw/encoded
+        :param scope: The scopes to grant
+        :returns: The token
+        """
         internal_token = InternalToken(
             issued=issued,
             expires=expires,
@@ -225,18 +480,14 @@ class DatabaseController(object):
         internal_token_encoded = internal_token_encoder \
             .encode(internal_token)
 
-        opaque_token = str(uuid4())
-
-        session.add(DbToken(
+        return DbToken(
             subject=subject,
-            opaque_token=opaque_token,
+            opaque_token=str(uuid4()),
             internal_token=internal_token_encoded,
             issued=issued,
             expires=expires,
             id_token=id_token,
-        ))
-
-        return opaque_token
+        )
 
     def get_token(
             self,
@@ -252,16 +503,626 @@ class DatabaseController(object):
         :param only_valid: Set to True to only fetch token if its valid
         :returns: Token or None
         """
-        query = TokenQuery(session) \
-            .has_opaque_token(opaque_token)
+        return self.token_store.get(session, opaque_token, only_valid)
+
+    def get_tokens_of_subject(
+            self,
+            session: db.Session,
+            subject: str,
+            limit: int,
+            before: Optional[Tuple[datetime, str]] = None,
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens (sessions) of a subject, newest first.
+
+        :param session: Database session
+        :param subject: The subject
+        :param limit: Max. no. of tokens to return
+        :param before: Only return tokens before this (issued,
+            opaque_token), ie. the last token of the previous page
+        :returns: The valid tokens
+        """
+        return self.token_store.get_valid_by_subject(
+            session=session,
+            subject=subject,
+            limit=limit,
+            before=before,
+        )
+
+    def get_internal_token(
+            self,
+            session: db.Session,
+            opaque_token: str,
+            replica_session: Optional[db.Session] = None,
+    ) -> Optional[str]:
+        """
+        Look up a valid internal token by opaque token.
+
+        :param session: Database session
+        :param opaque_token: Opaque token
+        :param replica_session: Session of a read-only replica, if any
+        :returns: Internal token, or None if the token is not valid
+        """
+        return self \
+            .get_internal_tokens(session, [opaque_token], replica_session) \
+            .get(opaque_token)
+
+    def get_internal_tokens(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+            replica_session: Optional[db.Session] = None,
+    ) -> Dict[str, str]:
+        """
+        Look up valid internal tokens by opaque tokens.
+
+        Tokens are looked up in the cache first, and the rest are queried
+        from the database using a single query.
+
+        If a replica session is provided, tokens are queried from the
+        replica first. Tokens not found on the replica may have been
+        issued after the replica last caught up, so they are queried from
+        the database (primary) too. Tokens revoked recently may not have
+        been deleted from the replica yet, so they are only queried from
+        the database (primary).
+
+        Tokens whose revocation is buffered (see buffer_revocation()) are
+        never returned, wherever they are found.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :param replica_session: Session of a read-only replica, if any
+        :returns: Internal tokens by opaque token (only valid tokens)
+        """
+        internal_tokens, missing = self.get_cached_internal_tokens(
+            opaque_tokens)
+
+        if missing:
+            internal_tokens.update(self.query_internal_tokens(
+                session, missing, replica_session))
+
+        return internal_tokens
+
+    def get_cached_internal_tokens(
+            self,
+            opaque_tokens: Iterable[str],
+    ) -> Tuple[Dict[str, str], Set[str]]:
+        """
+        Look up valid internal tokens in the cache only.
+
+        Does not use the database, so callers need not hold a database
+        session (or a worker of its bulkhead) unless tokens are missing.
+
+        :param opaque_tokens: Opaque tokens
+        :returns: Internal tokens by opaque token (only valid tokens), and
+            the opaque tokens not cached (to query using
+            query_internal_tokens())
+        """
+        opaque_tokens = set(opaque_tokens)
+        now = datetime.now(tz=timezone.utc)
+
+        internal_tokens = {
+            opaque_token: cached.internal_token
+            for opaque_token, cached
+            in self._get_cached(self.token_cache, opaque_tokens).items()
+            if cached.expires > now
+        }
 
-        if only_valid:
-            query = query.is_valid()
+        missing = opaque_tokens.difference(internal_tokens)
 
-        return query.one_or_none()
+        return self._without_revoked(internal_tokens), missing
+
+    def query_internal_tokens(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+            replica_session: Optional[db.Session] = None,
+    ) -> Dict[str, str]:
+        """
+        Look up valid internal tokens not cached, using the database.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens not cached
+        :param replica_session: Session of a read-only replica, if any
+        :returns: Internal tokens by opaque token (only valid tokens)
+        """
+        missing = set(opaque_tokens)
+        internal_tokens = {}
+
+        if not self.degradation_enabled:
+            internal_tokens.update(
+                self._query(session, missing, replica_session))
+        elif not self.health.should_query():
+            internal_tokens.update(self._get_stale_internal_tokens(missing))
+        else:
+            try:
+                internal_tokens.update(
+                    self._query(session, missing, replica_session))
+            except DATABASE_ERRORS:
+                self.health.failed()
+                internal_tokens.update(
+                    self._get_stale_internal_tokens(missing))
+            else:
+                self.health.succeeded()
+
+        return self._without_revoked(internal_tokens)
+
+    def _without_revoked(
+            self,
+            internal_tokens: Dict[str, str],
+    ) -> Dict[str, str]:
+        """
+        Remove tokens whose revocation is buffered.
+
+        :param internal_tokens: Internal tokens by opaque token
+        :returns: Internal tokens by opaque token, except revoked ones
+        """
+        if not len(self.revocations):
+            return internal_tokens
+
+        return {
+            opaque_token: internal_token
+            for opaque_token, internal_token in internal_tokens.items()
+            if not self._is_revoked(opaque_token, internal_token)
+        }
+
+    def _is_revoked(self, opaque_token: str, internal_token: str) -> bool:
+        """
+        Return whether revocation of a token is buffered.
+
+        :param opaque_token: Opaque token
+        :param internal_token: Internal token, encoded
+        """
+        if self.revocations.is_revoked(opaque_token):
+            return True
+
+        subject = internal_token_encoder.decode(internal_token).subject
+
+        return self.revocations.is_subject_revoked(subject)
+
+    def _query(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+            replica_session: Optional[db.Session] = None,
+    ) -> Dict[str, str]:
+        """
+        Query valid internal tokens, on the replica first (if any).
+
+        Tokens found on the replica are not queried from the database
+        (primary), even if they are expired, as the validity of a token
+        never changes (except by revoking it).
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :param replica_session: Session of a read-only replica, if any
+        :returns: Internal tokens by opaque token (only valid tokens)
+        """
+        missing = set(opaque_tokens)
+
+        if replica_session is None:
+            return self._cache_tokens(
+                missing, self.token_store.get_valid(session, missing))
+
+        on_replica = missing.difference(
+            self._get_cached(self.recent_revocations, missing))
+
+        replica_tokens = self.token_store.get_many(
+            replica_session, on_replica)
+
+        internal_tokens = self._cache_tokens(on_replica, replica_tokens)
+        missing.difference_update(t.opaque_token for t in replica_tokens)
+
+        internal_tokens.update(self._cache_tokens(
+            missing, self.token_store.get_valid(session, missing)))
+
+        return internal_tokens
+
+    def _get_stale_internal_tokens(
+            self,
+            opaque_tokens: Iterable[str],
+    ) -> Dict[str, str]:
+        """
+        Look up internal tokens in (expired) cache entries.
+
+        Used while the database is down. Tokens are never returned after
+        they expire, nor if their revocation is pending.
+
+        :param opaque_tokens: Opaque tokens
+        :returns: Internal tokens by opaque token (only valid tokens)
+        """
+        now = datetime.now(tz=timezone.utc)
+        cached_tokens = self._get_cached(
+            self.token_cache, opaque_tokens, stale=True)
+
+        internal_tokens = self._without_revoked({
+            opaque_token: cached.internal_token
+            for opaque_token, cached in cached_tokens.items()
+            if cached.expires > now
+        })
+
+        self.stale_hits += len(internal_tokens)
+
+        return internal_tokens
+
+    def _cache_tokens(
+            self,
+            opaque_tokens: Iterable[str],
+            tokens: Iterable[DbToken],
+    ) -> Dict[str, str]:
+        """
+        Cache the valid tokens queried by opaque tokens.
+
+        :param opaque_tokens: Opaque tokens queried
+        :param tokens: Tokens found, valid or not
+        :returns: Internal tokens by opaque token (only valid tokens)
+        """
+        now = datetime.now(tz=timezone.utc)
+        tokens = [t for t in tokens if t.issued <= now < t.expires]
+
+        for token in tokens:
+            self.token_cache.set(token_key(token.opaque_token), CachedToken(
+                internal_token=token.internal_token,
+                expires=token.expires,
+            ))
+
+        internal_tokens = {
+            token.opaque_token: token.internal_token for token in tokens
+        }
+
+        # Tokens which are no longer valid must not be served from expired
+        # cache entries if the database goes down
+        if self.degradation_enabled:
+            self.token_cache.invalidate_many(
+                token_key(opaque_token)
+                for opaque_token in set(opaque_tokens)
+                if opaque_token not in internal_tokens
+            )
+
+        return internal_tokens
+
+    @staticmethod
+    def _get_cached(
+            cache: LRUCache[bytes, TValue],
+            opaque_tokens: Iterable[str],
+            stale: bool = False,
+    ) -> Dict[str, TValue]:
+        """
+        Look up opaque tokens in a cache of token keys.
+
+        :param cache: The cache
+        :param opaque_tokens: Opaque tokens
+        :param stale: Also return expired values within the grace period
+        :returns: Cached values by opaque token
+        """
+        keys = {token_key(opaque_token): opaque_token
+                for opaque_token in opaque_tokens}
+
+        return {
+            keys[key]: value
+            for key, value in cache.get_many(keys, stale=stale).items()
+        }
+
+    def warm_token_cache(
+            self,
+            session: db.Session,
+            limit: int,
+            batch_size: int,
+    ) -> int:
+        """
+        Load the most recently issued valid tokens into the cache.
+
+        Tokens are fetched using a server-side cursor, batch_size tokens
+        at a time, so they are never all in memory at once. The most
+        recently issued tokens are cached last, so they are evicted last.
+
+        Tokens are cached until they expire, instead of for the cache's
+        TTL (which would expire most of them before the process is even
+        ready). This is only safe if tokens revoked by other processes
+        are removed from the cache, ie. by cache invalidation or sync.
+
+        :param session: Database session
+        :param limit: Max. no. of tokens to load
+        :param batch_size: No. of tokens to fetch at a time
+        :returns: The number of tokens loaded
+        """
+        now = datetime.now(tz=timezone.utc)
+
+        newest = sa.select(
+            DbToken.opaque_token,
+            DbToken.internal_token,
+            DbToken.issued,
+            DbToken.expires,
+        ) \
+            .where(DbToken.issued <= now) \
+            .where(DbToken.expires > now) \
+            .order_by(DbToken.issued.desc()) \
+            .limit(limit) \
+            .subquery()
+
+        statement = sa.select(
+            newest.c.opaque_token,
+            newest.c.internal_token,
+            newest.c.expires,
+        ) \
+            .order_by(newest.c.issued) \
+            .execution_options(stream_results=True)
+
+        result = session.execute(statement)
+        loaded = 0
+
+        for rows in result.partitions(batch_size):
+            for row in rows:
+                self.token_cache.set(
+                    key=token_key(row.opaque_token),
+                    value=CachedToken(
+                        internal_token=row.internal_token,
+                        expires=row.expires,
+                    ),
+                    ttl=(row.expires - now).total_seconds(),
+                )
+
+            loaded += len(rows)
+
+        return loaded
+
+    def invalidate_tokens(
+            self,
+            opaque_tokens: Iterable[str],
+            session: Optional[db.Session] = None,
+    ):
+        """
+        Remove revoked tokens from the cache.
+
+        The tokens are also remembered as recently revoked, so they are
+        not looked up on a replica which may still have them.
+
+        If a session is provided, the tokens are removed from the caches
+        of all other processes too, once (and if) it is committed.
+
+        :param opaque_tokens: Opaque tokens
+        :param session: Database session revoking the tokens
+        """
+        opaque_tokens = list(opaque_tokens)
+        keys = [token_key(opaque_token) for opaque_token in opaque_tokens]
+
+        self.token_cache.invalidate_many(keys)
+        self._remember_revoked(keys)
+
+        if session is not None:
+            self.publish_invalidation(session, opaque_tokens=opaque_tokens)
+
+    def invalidate_identity(
+            self,
+            identity_provider: str,
+            external_subject: str,
+            session: Optional[db.Session] = None,
+    ):
+        """
+        Remove an external user from the cache.
+
+        If a session is provided, the external user is removed from the
+        caches of all other processes too, once (and if) it is committed.
+
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
+        :param session: Database session changing the external user
+        """
+        key = (identity_provider, external_subject)
+
+        self.identity_cache.invalidate(key)
+
+        if session is not None:
+            self.publish_invalidation(session, identities=[key])
+
+    def publish_invalidation(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str] = (),
+            identities: Iterable[Tuple[str, str]] = (),
+    ):
+        """
+        Publish invalidation of cache entries to all processes.
+
+        Does nothing unless an invalidation channel is configured.
+
+        :param session: Database session to publish in
+        :param opaque_tokens: Opaque tokens
+        :param identities: (identity_provider, external_subject) pairs
+        """
+        invalidation = Invalidation(
+            token_keys=[token_key(t) for t in opaque_tokens],
+            identities=list(identities),
+        )
+
+        if self.invalidation_channel is not None and invalidation:
+            publish_invalidation(
+                session=session,
+                channel=self.invalidation_channel,
+                invalidation=invalidation,
+            )
+
+    def apply_invalidation(self, invalidation: Invalidation):
+        """
+        Remove cache entries invalidated by any process.
+
+        :param invalidation: Cache entries to invalidate
+        """
+        self.token_cache.invalidate_many(invalidation.token_keys)
+        self._remember_revoked(invalidation.token_keys)
+        self.identity_cache.invalidate_many(invalidation.identities)
+
+    def _remember_revoked(self, keys: Iterable[bytes]):
+        """
+        Remember tokens as recently revoked.
+
+        :param keys: Keys of the tokens
+        """
+        for key in keys:
+            self.recent_revocations.set(key, True)
+
+    def clear_caches(self):
+        """Remove all entries from the caches."""
+
+        self.identity_cache.clear()
+        self.token_cache.clear()
+
+    def revoke_token(
+            self,
+            session: db.Session,
+            opaque_token: str,
+    ) -> Optional[RevokedToken]:
+        """
+        Delete a token (session), ie. log out.
+
+        :param session: Database session
+        :param opaque_token: Opaque token to revoke
+        :returns: The deleted token, or None if it does not exist
+        """
+        tokens = self.token_store.delete(session, opaque_tokens=[opaque_token])
+        TOKENS_REVOKED.inc(len(tokens))
+
+        self.invalidate_tokens(
+            opaque_tokens=(token.opaque_token for token in tokens),
+            session=session,
+        )
+
+        return tokens[0] if tokens else None
+
+    def revoke_tokens(self, session: db.Session, subject: str) -> List[str]:
+        """
+        Delete all tokens (sessions) of a subject, ie. log out everywhere.
+
+        Tokens stored in the database are deleted using a single statement
+        (using the index on the token's subject), regardless of how many
+        there are.
+
+        :param session: Database session
+        :param subject: The subject to revoke tokens of
+        :returns: The ID-tokens of the deleted tokens
+        """
+        tokens = self.token_store.delete(session, subjects=[subject])
+        TOKENS_REVOKED.inc(len(tokens))
+
+        self.invalidate_tokens(
+            opaque_tokens=(token.opaque_token for token in tokens),
+            session=session,
+        )
+
+        return [token.id_token for token in tokens]
+
+    def buffer_revocation(
+            self,
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> bool:
+        """
+        Revoke tokens while the database is down.
+
+        The tokens are removed from the cache right away. Neither they nor
+        any token of the subjects are returned by get_internal_tokens()
+        (from the cache or the database) until the revocation is applied
+        by apply_buffered_revocations().
+
+        :param opaque_tokens: Opaque tokens to revoke
+        :param subjects: Subjects to revoke all tokens of
+        :returns: False if revocations can not be buffered
+        """
+        opaque_tokens = list(opaque_tokens)
+
+        if not self.degradation_enabled \
+                or not self.revocations.add(opaque_tokens, subjects):
+            return False
+
+        self.invalidate_tokens(opaque_tokens)
+
+        return True
+
+    def apply_buffered_revocations(
+            self,
+            session: db.Session,
+    ) -> Tuple[Set[str], Set[str], List[str]]:
+        """
+        Delete tokens revoked while the database was down.
+
+        The revocations remain buffered until remove() is invoked on
+        self.revocations, which should be done once session is committed.
+
+        :param session: Database session
+        :returns: The opaque tokens and subjects revoked, and the
+            ID-tokens of the deleted tokens
+        """
+        opaque_tokens, subjects = self.revocations.pending()
+
+        if not opaque_tokens and not subjects:
+            return opaque_tokens, subjects, []
+
+        tokens = self.token_store.delete(
+            session=session,
+            opaque_tokens=opaque_tokens,
+            subjects=subjects,
+        )
+        TOKENS_REVOKED.inc(len(tokens))
+
+        self.invalidate_tokens(
+            opaque_tokens=(token.opaque_token for token in tokens),
+            session=session,
+        )
+
+        return opaque_tokens, subjects, [token.id_token for token in tokens]
+
+    def degradation_metrics(self) -> DegradationMetrics:
+        """Return metrics of the degradation mode."""
+
+        return DegradationMetrics(
+            enabled=self.degradation_enabled,
+            degraded=self.health.degraded,
+            degraded_seconds=self.health.degraded_seconds,
+            outages=self.health.outages,
+            stale_hits=self.stale_hits,
+            pending_revocations=len(self.revocations),
+        )
 
 
 # -- Singletons --------------------------------------------------------------
 
 
-db_controller = DatabaseController()
+db_controller = DatabaseController(
+    token_store=token_store,
+    identity_cache=LRUCache(
+        maxsize=IDENTITY_CACHE_SIZE,
+        metrics=CacheMetrics('identity'),
+    ),
+    token_cache=LRUCache(
+        maxsize=TOKEN_CACHE_SIZE,
+        ttl=TOKEN_CACHE_TTL,
+        grace=TOKEN_CACHE_GRACE,
+        metrics=CacheMetrics('token'),
+    ),
+    health=DatabaseHealth(probe_interval=TOKEN_DB_PROBE_INTERVAL),
+    revocations=RevocationBuffer(max_pending=REVOCATION_BUFFER_SIZE),
+    recent_revocations=LRUCache(
+        maxsize=REVOCATION_BUFFER_SIZE,
+        ttl=SQL_REPLICA_MAX_LAG,
+    ),
+    invalidation_channel=(
+        CACHE_INVALIDATION_CHANNEL if CACHE_INVALIDATION_ENABLED else None
+    ),
+)
+
+invalidation_listener = InvalidationListener(
+    db=db,
+    channel=CACHE_INVALIDATION_CHANNEL,
+    on_invalidation=db_controller.apply_invalidation,
+    on_connect=db_controller.clear_caches,
+    reconnect_interval=CACHE_INVALIDATION_RECONNECT_INTERVAL,
+) if CACHE_INVALIDATION_ENABLED else None
+"""
+Listens for cache invalidations published by all processes.
+
+None if cache invalidation is disabled (the default). Started by each
+(worker) process serving requests.
+"""
+
+if invalidation_listener is not None:
+    atexit.register(invalidation_listener.stop)
@@ -1,6 +1,27 @@
+from typing import Optional
+
+from wrapt import decorator
+
 from origin.sql import SqlEngine
 
-from .config import SQL_URI, SQL_POOL_SIZE
+from .async_sql import AsyncSqlEngine
+from .bulkheads import BulkheadSqlEngine
+from .config import (
+    BULKHEAD_ADMIN_POOL_SIZE,
+    BULKHEAD_ADMIN_WORKERS,
+    BULKHEAD_INTROSPECTION_POOL_SIZE,
+    BULKHEAD_INTROSPECTION_WORKERS,
+    BULKHEAD_LOGIN_MAX_WAIT,
+    BULKHEAD_LOGIN_MAX_WAITING,
+    BULKHEAD_LOGIN_POOL_SIZE,
+    BULKHEAD_LOGIN_WORKERS,
+    BULKHEAD_LOGIN_YIELD_TO_INTROSPECTION,
+    BULKHEAD_RETRY_AFTER,
+    SQL_URI,
+    SQL_POOL_SIZE,
+    SQL_REPLICA_URI,
+    SQL_REPLICA_POOL_SIZE,
+)
 
 db = SqlEngine(
     uri=SQL_URI,
@@ -11,3 +32,96 @@ Database instance.
 
 Used to access database.
 """
+
+introspection_db = BulkheadSqlEngine(
+    name='introspection',
+    parent=db,
+    pool_size=BULKHEAD_INTROSPECTION_POOL_SIZE,
+    max_workers=BULKHEAD_INTROSPECTION_WORKERS,
+)
+"""
+Database instance (same database as db) for introspecting tokens.
+
+Used by ForwardAuth, token introspection, and ext_authz, which gate all
+platform traffic, so they have connections of their own and are never
+rejected.
+"""
+
+login_db = BulkheadSqlEngine(
+    name='login',
+    parent=db,
+    pool_size=BULKHEAD_LOGIN_POOL_SIZE,
+    max_workers=BULKHEAD_LOGIN_WORKERS,
+    max_wait=BULKHEAD_LOGIN_MAX_WAIT,
+    max_waiting=BULKHEAD_LOGIN_MAX_WAITING,
+    yield_to=(
+        introspection_db if BULKHEAD_LOGIN_YIELD_TO_INTROSPECTION else None
+    ),
+    retry_after=BULKHEAD_RETRY_AFTER,
+)
+"""
+Database instance (same database as db) for login and onboarding.
+
+Used by the login callback, accepting terms, logging out, and accounts.
+Sheds load (503 Service Unavailable) when overloaded, or when
+introspection has requests waiting for a worker or connection.
+"""
+
+admin_db = BulkheadSqlEngine(
+    name='admin',
+    parent=db,
+    pool_size=BULKHEAD_ADMIN_POOL_SIZE,
+    max_workers=BULKHEAD_ADMIN_WORKERS,
+)
+"""
+Database instance (same database as db) for admin and maintenance.
+
+Used by background work (inserting buffered login records and applying
+logouts buffered while the database was down) and periodic maintenance.
+"""
+
+bulkheads = (introspection_db, login_db, admin_db)
+
+replica_db: Optional[SqlEngine] = SqlEngine(
+    uri=SQL_REPLICA_URI,
+    pool_size=SQL_REPLICA_POOL_SIZE,
+) if SQL_REPLICA_URI else None
+"""
+Read-only replica of the database, or None if not configured.
+
+Used for read-only lookups. The replica may lag behind the database, so
+lookups not found on the replica are retried on the database.
+"""
+
+async_db = AsyncSqlEngine(sync_engine=db)
+"""
+Asynchronous database instance (same database as db).
+
+Used by asynchronous endpoints (see auth_api.asgi).
+"""
+
+
+def replica_session():
+    """
+    Inject a "replica_session" named parameter (function decorator).
+
+    The session is of the read-only replica, or None if no replica is
+    configured, in which case lookups should use the database (primary).
+    """
+    @decorator
+    def replica_session_decorator(wrapped, instance, args, kwargs):
+
+        if replica_db is None:
+            kwargs.setdefault('replica_session', None)
+            return wrapped(*args, **kwargs)
+
+        session = kwargs.setdefault(
+            'replica_session', replica_db.make_session())
+
+        try:
+            return wrapped(*args, **kwargs)
+        finally:
+            if session is not None:
+                session.close()
+
+    return replica_session_decorator
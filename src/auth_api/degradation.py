@@ -0,0 +1,224 @@
+"""
+Degradation mode, serving tokens from cache while the database is down.
+
+When the database is unavailable (ie. while failing over), tokens which
+have recently been validated are served from the token cache for a grace
+period after their cache entry has expired (but never beyond the token's
+own expiry), instead of rejecting every request.
+
+Tokens revoked (logged out) while the database is down are removed from
+the cache right away, and the revocations are buffered in memory and
+applied once the database is available again.
+
+The mode is opt-in (TOKEN_CACHE_GRACE) and per process. Revocations are
+only known to the process which buffered them until they are applied.
+"""
+
+# Standard Library
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+
+# Third party
+import sqlalchemy as sa
+
+logger = logging.getLogger(__name__)
+
+DATABASE_ERRORS = (sa.exc.DBAPIError, sa.exc.TimeoutError)
+"""Exceptions raised when the database is unavailable."""
+
+
+@dataclass
+class DegradationMetrics:
+    """Metrics of the degradation mode."""
+
+    enabled: bool
+    degraded: bool
+    degraded_seconds: float
+    outages: int
+    stale_hits: int
+    pending_revocations: int
+
+
+class DatabaseHealth(object):
+    """
+    Tracks whether the database is available, based on queries failing.
+
+    Once a query has failed, the database is considered down (degraded)
+    until a query succeeds. While degraded, at most one query is attempted
+    every probe_interval seconds, so requests are not held up waiting for
+    connections to an unavailable database.
+
+    :param probe_interval: Seconds between queries while degraded
+    """
+
+    def __init__(self, probe_interval: float):
+        self.probe_interval = probe_interval
+        self.outages = 0
+        self.recovery: Optional[threading.Thread] = None
+        self._degraded_since: Optional[float] = None
+        self._last_probe = 0.0
+        self._on_recovery: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def degraded(self) -> bool:
+        """Return whether the database is considered down."""
+
+        return self._degraded_since is not None
+
+    @property
+    def degraded_seconds(self) -> float:
+        """Return seconds since the database went down (0 if it is up)."""
+
+        if self._degraded_since is None:
+            return 0.0
+
+        return time.monotonic() - self._degraded_since
+
+    def on_recovery(self, callback: Callable[[], None]):
+        """
+        Add a function to invoke (in a thread) when the database is back.
+
+        :param callback: The function
+        """
+        self._on_recovery.append(callback)
+
+    def should_query(self) -> bool:
+        """Return whether to query the database (or to serve from cache)."""
+
+        if self._degraded_since is None:
+            return True
+
+        with self._lock:
+            now = time.monotonic()
+
+            if now - self._last_probe < self.probe_interval:
+                return False
+
+            self._last_probe = now
+
+        return True
+
+    def failed(self):
+        """Register that a query failed because the database is down."""
+
+        with self._lock:
+            if self._degraded_since is not None:
+                return
+
+            self._degraded_since = self._last_probe = time.monotonic()
+            self.outages += 1
+
+        logger.warning('Database is down, serving tokens from cache')
+
+    def succeeded(self):
+        """Register that a query succeeded, recovering if degraded."""
+
+        if self._degraded_since is None:
+            return
+
+        with self._lock:
+            if self._degraded_since is None:
+                return
+
+            seconds = time.monotonic() - self._degraded_since
+            self._degraded_since = None
+
+        logger.warning('Database is up again after %.1f seconds', seconds)
+
+        self.recovery = threading.Thread(
+            target=self._recover,
+            name='database-recovery',
+            daemon=True,
+        )
+        self.recovery.start()
+
+    def _recover(self):
+        """Invoke the recovery callbacks."""
+
+        for callback in self._on_recovery:
+            try:
+                callback()
+            except Exception:
+                logger.exception('Failed to recover from database outage')
+
+
+class RevocationBuffer(object):
+    """
+    Revocations (logouts) made while the database is down.
+
+    :param max_pending: Max. no. of revocations to buffer
+    """
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._opaque_tokens: Set[str] = set()
+        self._subjects: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Return the number of pending revocations."""
+
+        return len(self._opaque_tokens) + len(self._subjects)
+
+    def add(
+            self,
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> bool:
+        """
+        Buffer revocation of tokens, and of all tokens of subjects.
+
+        :param opaque_tokens: Opaque tokens to revoke
+        :param subjects: Subjects to revoke all tokens of
+        :returns: False if the buffer is full (nothing was buffered)
+        """
+        opaque_tokens = set(opaque_tokens)
+        subjects = set(subjects)
+
+        with self._lock:
+            pending = len(self) + len(opaque_tokens) + len(subjects)
+
+            if pending > self.max_pending:
+                return False
+
+            self._opaque_tokens.update(opaque_tokens)
+            self._subjects.update(subjects)
+
+        return True
+
+    def is_revoked(self, opaque_token: str) -> bool:
+        """
+        Return whether revocation of a token is pending.
+
+        :param opaque_token: Opaque token
+        """
+        return opaque_token in self._opaque_tokens
+
+    def is_subject_revoked(self, subject: str) -> bool:
+        """
+        Return whether revocation of all tokens of a subject is pending.
+
+        :param subject: The subject
+        """
+        return subject in self._subjects
+
+    def pending(self) -> Tuple[Set[str], Set[str]]:
+        """Return copies of the pending opaque tokens and subjects."""
+
+        with self._lock:
+            return set(self._opaque_tokens), set(self._subjects)
+
+    def remove(self, opaque_tokens: Iterable[str], subjects: Iterable[str]):
+        """
+        Remove revocations which have been applied.
+
+        :param opaque_tokens: Opaque tokens revoked
+        :param subjects: Subjects revoked
+        """
+        with self._lock:
+            self._opaque_tokens.difference_update(opaque_tokens)
+            self._subjects.difference_update(subjects)
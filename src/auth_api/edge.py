@@ -0,0 +1,545 @@
+"""
+Dependency-free parts of the ForwardAuth services.
+
+Holds everything the ForwardAuth sidecar (see sidecar.py) needs to serve
+requests from a snapshot: the ASGI application, reading the token cookie,
+and reading snapshots. It must only import the standard library, werkzeug
+and origin's constants, never auth_api.config, the database or any other
+module of auth_api, so the sidecar neither loads SQLAlchemy and database
+drivers nor requires the configuration of the service (database, Identity
+Provider, secrets), only SNAPSHOT_* settings.
+
+The standalone ForwardAuth service (forward_auth.py) and the snapshot
+writer (snapshot.py) build on it.
+
+Snapshot file (little-endian):
+
+    header   magic (8 bytes), generation (uint64), count (uint32)
+    keys     count x key (16 bytes), sorted
+    entries  count x expires (int64, unix time), offset (uint32) and
+             length (uint32) of the internal token in data
+    data     internal tokens (UTF-8), concatenated
+
+Keys are the first 16 bytes of the SHA256 of opaque tokens (see
+token_key()), so the files contain no cookies, and a lookup is a binary
+search of the keys.
+
+Delta log: magic (8 bytes) and generation (uint64), followed by records
+of op (b'A' added or b'D' deleted), key (16 bytes), expires (int64),
+length (uint32), and the internal token (length bytes).
+"""
+
+# Standard Library
+import asyncio
+import mmap
+import os
+import struct
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from hashlib import sha256
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+# Third party
+from werkzeug.http import parse_cookie
+
+# First party
+from origin.auth import TOKEN_COOKIE_NAME, TOKEN_HEADER_NAME
+
+if TYPE_CHECKING:
+    # Local
+    from .cache import LRUCache
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+FORWARD_AUTH_PATH = '/token/forward-auth'
+
+TOKEN_KEY_SIZE = 16
+
+
+# -- Tokens ------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class CachedToken:
+    """A valid token, as cached by its opaque token."""
+
+    internal_token: str
+    expires: datetime
+
+
+def token_key(opaque_token: str) -> bytes:
+    """
+    Return the key of an opaque token.
+
+    Tokens are cached, published in cache invalidations and written to
+    snapshots by key (the first 16 bytes of the SHA256 of the opaque
+    token), so cookies are never kept or sent anywhere as they are.
+
+    :param opaque_token: Opaque token
+    """
+    return sha256(opaque_token.encode()).digest()[:TOKEN_KEY_SIZE]
+
+
+def get_opaque_token(cookie_header: Optional[str]) -> Optional[str]:
+    """
+    Return the opaque token from the token cookie, if any.
+
+    For services reading the token cookie without a request context
+    (which otherwise provides it as context.opaque_token). Parsed like
+    Flask parses cookies, so other (ie. malformed) cookies are ignored
+    the same way.
+
+    :param cookie_header: Value of the HTTP Cookie header
+    :returns: Opaque token or None
+    """
+    return parse_cookie(cookie_header or '').get(TOKEN_COOKIE_NAME) or None
+
+
+# -- Snapshots ---------------------------------------------------------------
+
+
+SNAPSHOT_MAGIC = b'AUTHSNP1'
+DELTA_MAGIC = b'AUTHDLT1'
+
+HEADER = struct.Struct('<8sQI')
+ENTRY = struct.Struct('<qII')
+DELTA_HEADER = struct.Struct('<8sQ')
+RECORD = struct.Struct('<c16sqI')
+
+OP_ADDED = b'A'
+OP_DELETED = b'D'
+
+
+class SnapshotUnavailable(Exception):
+    """Raised when the snapshot is missing, or no longer updated."""
+
+
+def delta_log_path(path: str) -> str:
+    """
+    Return the path of the delta log of a snapshot.
+
+    :param path: Path of the snapshot
+    """
+    return f'{path}.delta'
+
+
+class _Keys(object):
+    """Sorted keys of a snapshot, as a sequence (for bisect)."""
+
+    def __init__(self, buffer: mmap.mmap, count: int):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self) -> int:
+        """Return the number of keys."""
+
+        return self.count
+
+    def __getitem__(self, index: int) -> bytes:
+        """Return the key at an index."""
+
+        start = HEADER.size + index * TOKEN_KEY_SIZE
+        return self.buffer[start:start + TOKEN_KEY_SIZE]
+
+
+class SnapshotReader(object):
+    """
+    Looks up valid tokens in a (memory-mapped) snapshot and its delta log.
+
+    Checks for a new snapshot and new changes at most every
+    check_interval seconds, when looking up tokens.
+
+    :param path: Path of the snapshot
+    :param check_interval: Seconds between checking for changes
+    :param max_age: Max. seconds since the delta log was last updated
+    """
+
+    def __init__(self, path: str, check_interval: float, max_age: float):
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._buffer: Optional[mmap.mmap] = None
+        self._keys: Optional[_Keys] = None
+        self._generation: Optional[int] = None
+        self._snapshot_id: Optional[Tuple[int, int]] = None
+        self._delta_id: Optional[int] = None
+        self._delta_offset = 0
+        self._added: Dict[bytes, Tuple[str, int]] = {}
+        self._deleted: Set[bytes] = set()
+        self._updated: Optional[float] = None
+        self._next_check = 0.0
+
+    def get(self, opaque_token: str) -> Optional[CachedToken]:
+        """
+        Look up a valid token by opaque token.
+
+        :param opaque_token: Opaque token
+        :returns: The token, or None if it is not valid
+        :raises SnapshotUnavailable: If the snapshot can not be used
+        """
+        if time.monotonic() >= self._next_check:
+            self.refresh()
+
+        now = time.time()
+
+        if self._updated is None or now - self._updated > self.max_age:
+            raise SnapshotUnavailable(f'Snapshot {self.path} is not updated')
+
+        key = token_key(opaque_token)
+
+        if key in self._deleted:
+            return None
+
+        token = self._added.get(key) or self._lookup(key)
+
+        if token is None or token[1] <= now:
+            return None
+
+        return CachedToken(
+            internal_token=token[0],
+            expires=datetime.fromtimestamp(token[1], tz=timezone.utc),
+        )
+
+    def refresh(self):
+        """Map a new snapshot, if it has been replaced, and read changes."""
+
+        self._next_check = time.monotonic() + self.check_interval
+
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self.close()
+            return
+
+        if (stat.st_ino, stat.st_mtime_ns) != self._snapshot_id:
+            self._map_snapshot()
+
+        self._read_delta_log()
+
+    def close(self):
+        """Unmap the snapshot."""
+
+        if self._buffer is not None:
+            self._buffer.close()
+
+        self._buffer = None
+        self._keys = None
+        self._generation = None
+        self._snapshot_id = None
+        self._updated = None
+        self._reset_delta_log()
+
+    def _map_snapshot(self):
+        """Map the snapshot (replacing the one currently mapped)."""
+
+        with open(self.path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, generation, count = HEADER.unpack_from(buffer)
+
+        if magic != SNAPSHOT_MAGIC:
+            buffer.close()
+            raise SnapshotUnavailable(f'{self.path} is not a token snapshot')
+
+        self.close()
+        self._buffer = buffer
+        self._keys = _Keys(buffer, count)
+        self._generation = generation
+        self._snapshot_id = (stat.st_ino, stat.st_mtime_ns)
+
+    def _reset_delta_log(self):
+        """Forget changes read from the delta log."""
+
+        self._delta_id = None
+        self._delta_offset = 0
+        self._added.clear()
+        self._deleted.clear()
+
+    def _read_delta_log(self):
+        """Apply records appended to the delta log since last read."""
+
+        try:
+            file = open(delta_log_path(self.path), 'rb')
+        except FileNotFoundError:
+            return
+
+        with file:
+            stat = os.fstat(file.fileno())
+            self._updated = stat.st_mtime
+
+            if stat.st_ino != self._delta_id:
+                header = file.read(DELTA_HEADER.size)
+
+                # Otherwise the delta log of another snapshot, which is
+                # about to be replaced
+                if header != DELTA_HEADER.pack(DELTA_MAGIC, self._generation):
+                    return
+
+                self._reset_delta_log()
+                self._delta_id = stat.st_ino
+                self._delta_offset = DELTA_HEADER.size
+
+            file.seek(self._delta_offset)
+            self._delta_offset += self._apply(file.read())
+
+    def _apply(self, data: bytes) -> int:
+        """
+        Apply complete records of the delta log.
+
+        :param data: Records (the last of which may be partially written)
+        :returns: The number of bytes applied
+        """
+        pos = 0
+
+        while pos + RECORD.size <= len(data):
+            op, key, expires, length = RECORD.unpack_from(data, pos)
+            end = pos + RECORD.size + length
+
+            if end > len(data):
+                break
+
+            if op == OP_DELETED:
+                self._deleted.add(key)
+                self._added.pop(key, None)
+            elif key not in self._deleted:
+                self._added[key] = (
+                    data[pos + RECORD.size:end].decode(), expires)
+
+            pos = end
+
+        return pos
+
+    def _lookup(self, key: bytes) -> Optional[Tuple[str, int]]:
+        """
+        Look up a token in the snapshot.
+
+        :param key: Key of the opaque token
+        :returns: The internal token and its expiry (unix time), if any
+        """
+        if self._keys is None:
+            return None
+
+        count = len(self._keys)
+        index = bisect_left(self._keys, key)
+
+        if index == count or self._keys[index] != key:
+            return None
+
+        entries = HEADER.size + count * TOKEN_KEY_SIZE
+        data = entries + count * ENTRY.size
+
+        expires, offset, length = ENTRY.unpack_from(
+            self._buffer, entries + index * ENTRY.size)
+
+        internal_token = self._buffer[data + offset:data + offset + length]
+
+        return internal_token.decode(), expires
+
+
+# -- ForwardAuth -------------------------------------------------------------
+
+
+class TokenSource(ABC):
+    """Looks up valid tokens for ForwardAuthApp."""
+
+    @abstractmethod
+    async def start(self):
+        """Open the source, when the server starts."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    async def stop(self):
+        """Close the source, when the server stops."""
+
+        raise NotImplementedError
+
+    @abstractmethod
+    async def fetch(self, opaque_token: str) -> Optional[CachedToken]:
+        """
+        Look up a valid token by opaque token.
+
+        :param opaque_token: Opaque token
+        :returns: The token, or None if it is not valid
+        """
+        raise NotImplementedError
+
+
+class ForwardAuthApp(object):
+    """
+    ASGI application serving the ForwardAuth endpoint.
+
+    :param source: Looks up tokens not in the cache
+    :param cache: Cache of token key -> valid token (None to look up
+        every token in the source, ie. if lookups are local)
+    :param on_startup: Invoked when the server starts, after opening the
+        source (ie. to start keeping the cache up to date)
+    """
+
+    def __init__(
+            self,
+            source: TokenSource,
+            cache: Optional['LRUCache[bytes, CachedToken]'],
+            on_startup: Iterable[Callable[[], None]] = (),
+    ):
+        self.source = source
+        self.cache = cache
+        self.on_startup = list(on_startup)
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        """
+        Handle an ASGI connection.
+
+        :param scope: Connection scope
+        :param receive: Receives events from the client
+        :param send: Sends events to the client
+        """
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            status, headers, body = await self.handle_request(scope)
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': headers,
+            })
+            await send({
+                'type': 'http.response.body',
+                'body': body,
+            })
+
+    async def lifespan(self, receive: Receive, send: Send):
+        """
+        Open (and close) the token source with the server.
+
+        :param receive: Receives lifespan events from the server
+        :param send: Sends lifespan events to the server
+        """
+        while True:
+            message = await receive()
+
+            if message['type'] == 'lifespan.startup':
+                await self.source.start()
+
+                for callback in self.on_startup:
+                    callback()
+
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.source.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def handle_request(
+            self,
+            scope: Scope,
+    ) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+        """
+        Handle a HTTP request.
+
+        :param scope: Connection scope
+        :returns: Status, headers, and body
+        """
+        if scope['path'] != FORWARD_AUTH_PATH:
+            return self.response(404, 'Not Found')
+
+        if scope['method'] != 'GET':
+            return self.response(405, 'Method Not Allowed')
+
+        cookie = b'; '.join(
+            value for name, value in scope['headers'] if name == b'cookie'
+        )
+
+        opaque_token = get_opaque_token(cookie.decode('latin-1'))
+
+        if not opaque_token:
+            return self.response(401, 'Unauthorized')
+
+        internal_token = await self.get_internal_token(opaque_token)
+
+        if internal_token is None:
+            return self.response(401, 'Unauthorized')
+
+        return self.response(200, headers={
+            TOKEN_HEADER_NAME: f'Bearer: {internal_token}',
+        })
+
+    async def get_internal_token(self, opaque_token: str) -> Optional[str]:
+        """
+        Return internal token, if the opaque token is valid.
+
+        :param opaque_token: Opaque token
+        """
+        if self.cache is None:
+            token = await self.source.fetch(opaque_token)
+            return token.internal_token if token is not None else None
+
+        key = token_key(opaque_token)
+        cached = self.cache.get(key)
+
+        if cached is not None \
+                and cached.expires > datetime.now(tz=timezone.utc):
+            return cached.internal_token
+
+        future = self._pending.get(opaque_token)
+
+        if future is None:
+            future = asyncio.ensure_future(self.source.fetch(opaque_token))
+            self._pending[opaque_token] = future
+            future.add_done_callback(
+                lambda _: self._pending.pop(opaque_token, None))
+
+        # Shielded, so a client disconnecting does not cancel the query
+        # for other clients waiting for the same token
+        token = await asyncio.shield(future)
+
+        if token is None:
+            return None
+
+        self.cache.set(key, token)
+
+        return token.internal_token
+
+    @staticmethod
+    def response(
+            status: int,
+            message: Optional[str] = None,
+            headers: Optional[Dict[str, str]] = None,
+    ) -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+        """
+        Build a response, formatted like those of the Flask application.
+
+        :param status: HTTP status code
+        :param message: Error message (for error responses)
+        :param headers: Additional headers
+        :returns: Status, headers, and body
+        """
+        body = f'{status} {message}'.encode() if message else b''
+
+        response_headers = [
+            (b'content-type', b'text/html; charset=utf-8'),
+            (b'content-length', str(len(body)).encode()),
+        ]
+
+        for name, value in (headers or {}).items():
+            response_headers.append((name.lower().encode(), value.encode()))
+
+        return status, response_headers, body
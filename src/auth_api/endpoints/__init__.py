@@ -1,8 +1,17 @@
+from .health import HealthCheck
+
 from .profile import GetProfile
 
+from .account import (
+    GetLoginHistory,
+    GetSessions,
+)
+
 from .tokens import (
     ForwardAuth,
+    AsyncForwardAuth,
     InspectToken,
+    IntrospectTokens,
     CreateTestToken,
 )
 
@@ -12,6 +21,18 @@ from .oidc import (
     OpenIDCallbackEndpoint,
     OpenIdInvalidateLogin,
     OpenIdLogout,
+    OpenIdLogoutEverywhere,
+    AsyncOpenIDCallbackEndpoint,
+    AsyncOpenIdLogout,
+    AsyncOpenIdLogoutEverywhere,
+)
+
+from .metrics import (
+    GetPrometheusMetrics,
+    GetBulkheadMetrics,
+    GetDegradationMetrics,
+    GetWarmupMetrics,
+    GetTokenSyncMetrics,
 )
 
 from .terms import (
@@ -0,0 +1,240 @@
+# Standard Library
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional, TypeVar
+
+# First party
+from origin.api import BadRequest, Context, Endpoint
+
+# Local
+from auth_api.config import STATE_ENCRYPTION_SECRET
+from auth_api.controller import db_controller
+from auth_api.db import db, login_db, replica_session
+from auth_api.queries import LoginRecordQuery
+from auth_api.tokens import EncryptedTokenEncoder
+
+# Default and max. no. of items per page
+PAGE_SIZE_DEFAULT = 20
+PAGE_SIZE_MAX = 100
+
+TCursor = TypeVar('TCursor')
+
+
+@dataclass
+class LoginCursor:
+    """
+    Position in the login history, ie. the last login on the previous page.
+
+    Lists are paginated by seeking past the cursor (keyset pagination),
+    never by offset. Each list has a cursor of its own, so cursors of one
+    list can not be decoded by another.
+    """
+
+    time: datetime
+    id: int
+
+
+@dataclass
+class SessionCursor:
+    """
+    Position in the sessions, ie. the last session on the previous page.
+
+    Encrypted (like every cursor), as the opaque token is secret.
+    """
+
+    time: datetime
+    opaque_token: str
+
+
+login_cursor_encoder = EncryptedTokenEncoder(
+    schema=LoginCursor,
+    secret=STATE_ENCRYPTION_SECRET,
+)
+
+session_cursor_encoder = EncryptedTokenEncoder(
+    schema=SessionCursor,
+    secret=STATE_ENCRYPTION_SECRET,
+)
+
+
+@dataclass
+class PageRequest:
+    """Request for a page of a list."""
+
+    limit: int = field(default=PAGE_SIZE_DEFAULT)
+    cursor: Optional[str] = field(default=None)
+
+
+def decode_page_request(
+        request: PageRequest,
+        encoder: EncryptedTokenEncoder[TCursor],
+) -> Optional[TCursor]:
+    """
+    Validate a page request and decode its cursor.
+
+    :param request: The page request
+    :param encoder: Encoder of the list's cursors
+    :returns: The cursor, or None for the first page
+    """
+    if not 1 <= request.limit <= PAGE_SIZE_MAX:
+        raise BadRequest()
+
+    if request.cursor is None:
+        return None
+
+    try:
+        return encoder.decode(request.cursor)
+    except (encoder.DecodeError, TypeError, ValueError):
+        raise BadRequest()
+
+
+# -- Login history -----------------------------------------------------------
+
+
+@dataclass
+class Login:
+    """A single login."""
+
+    created: datetime
+
+
+class GetLoginHistory(Endpoint):
+    """Returns the user's logins, newest first, one page at a time."""
+
+    Request = PageRequest
+
+    @dataclass
+    class Response:
+        """Response containing a page of logins."""
+
+        success: bool
+        logins: List[Login]
+        next_cursor: Optional[str] = field(default=None)
+
+    @login_db.session()
+    @replica_session()
+    def handle_request(
+            self,
+            request: PageRequest,
+            context: Context,
+            session: db.Session,
+            replica_session: Optional[db.Session],
+    ) -> Response:
+        """
+        Handle HTTP request.
+
+        Read from the read-only replica, if any, so the latest
+        login may be missing until it has caught up.
+
+        :param request: Page size and cursor (from previous response)
+        :param context: Context for a single HTTP request.
+        :param session: Database session.
+        :param replica_session: Session of the read-only replica, if any.
+        """
+        cursor = decode_page_request(request, login_cursor_encoder)
+
+        query = LoginRecordQuery(replica_session or session) \
+            .has_subject(context.token.subject)
+
+        if cursor is not None:
+            query = query.is_before(cursor.time, cursor.id)
+
+        records = query \
+            .newest_first() \
+            .limit(request.limit + 1) \
+            .all()
+
+        next_cursor = None
+
+        if len(records) > request.limit:
+            records = records[:request.limit]
+            next_cursor = login_cursor_encoder.encode(LoginCursor(
+                time=records[-1].created,
+                id=records[-1].id,
+            ))
+
+        return self.Response(
+            success=True,
+            logins=[Login(created=record.created) for record in records],
+            next_cursor=next_cursor,
+        )
+
+
+# -- Sessions ----------------------------------------------------------------
+
+
+@dataclass
+class Session:
+    """A single active session (token)."""
+
+    issued: datetime
+    expires: datetime
+    current: bool
+
+
+class GetSessions(Endpoint):
+    """Returns the user's active sessions, newest first, one page at a time."""
+
+    Request = PageRequest
+
+    @dataclass
+    class Response:
+        """Response containing a page of sessions."""
+
+        success: bool
+        sessions: List[Session]
+        next_cursor: Optional[str] = field(default=None)
+
+    @login_db.session()
+    @replica_session()
+    def handle_request(
+            self,
+            request: PageRequest,
+            context: Context,
+            session: db.Session,
+            replica_session: Optional[db.Session],
+    ) -> Response:
+        """
+        Handle HTTP request.
+
+        Read from the read-only replica, if any, so the latest
+        session may be missing until it has caught up.
+
+        :param request: Page size and cursor (from previous response)
+        :param context: Context for a single HTTP request.
+        :param session: Database session.
+        :param replica_session: Session of the read-only replica, if any.
+        """
+        cursor = decode_page_request(request, session_cursor_encoder)
+
+        tokens = db_controller.get_tokens_of_subject(
+            session=replica_session or session,
+            subject=context.token.subject,
+            limit=request.limit + 1,
+            before=(
+                (cursor.time, cursor.opaque_token)
+                if cursor is not None else None
+            ),
+        )
+
+        next_cursor = None
+
+        if len(tokens) > request.limit:
+            tokens = tokens[:request.limit]
+            next_cursor = session_cursor_encoder.encode(SessionCursor(
+                time=tokens[-1].issued,
+                opaque_token=tokens[-1].opaque_token,
+            ))
+
+        return self.Response(
+            success=True,
+            sessions=[
+                Session(
+                    issued=token.issued,
+                    expires=token.expires,
+                    current=token.opaque_token == context.opaque_token,
+                )
+                for token in tokens
+            ],
+            next_cursor=next_cursor,
+        )
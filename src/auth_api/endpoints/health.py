@@ -0,0 +1,26 @@
+# First party
+from origin.api import Endpoint
+
+# Local
+from auth_api.bulkheads import ServiceUnavailable
+from auth_api.config import BULKHEAD_RETRY_AFTER
+from auth_api.warmup import warmup
+
+
+class HealthCheck(Endpoint):
+    """
+    Health check (readiness) endpoint.
+
+    Returns status 200 when the process is ready to serve requests, and
+    503 Service Unavailable while it is still warming up (see
+    auth_api.warmup).
+    """
+
+    def handle_request(self):
+        """Handle HTTP request."""
+
+        if warmup is not None and not warmup.ready:
+            raise ServiceUnavailable(
+                retry_after=BULKHEAD_RETRY_AFTER,
+                msg='Warming up',
+            )
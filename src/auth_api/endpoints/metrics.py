@@ -0,0 +1,142 @@
+# Standard Library
+from dataclasses import dataclass
+from typing import List, Optional
+
+# First party
+from origin.api import Endpoint, HttpResponse
+
+# Local
+from auth_api.bulkheads import BulkheadMetrics
+from auth_api.controller import db_controller
+from auth_api.db import bulkheads
+from auth_api.degradation import DegradationMetrics
+from auth_api.metrics import CONTENT_TYPE, generate_latest
+from auth_api.token_sync import TokenSyncMetrics, token_sync
+from auth_api.warmup import WarmupMetrics, warmup
+
+
+class PrometheusResponse(HttpResponse):
+    """HTTP response with a body of metrics in the Prometheus format."""
+
+    @property
+    def actual_mimetype(self) -> str:
+        """Body is in the Prometheus text format."""
+
+        return CONTENT_TYPE
+
+
+class GetPrometheusMetrics(Endpoint):
+    """
+    Returns the metrics of all processes, for Prometheus to scrape.
+
+    Includes request latencies per endpoint, database pool wait and query
+    latencies, Identity Provider latencies and errors, cache hits and
+    misses, and logins and tokens issued and revoked.
+    """
+
+    def handle_request(self) -> PrometheusResponse:
+        """Handle HTTP request."""
+
+        return PrometheusResponse(status=200, body=generate_latest())
+
+
+class GetBulkheadMetrics(Endpoint):
+    """
+    Returns the metrics of each bulkhead (class of traffic).
+
+    Includes the time spent waiting for a connection (pool wait) and for
+    a worker (worker wait), so an exhausted class can be identified.
+    Metrics are per process, since each process has its own bulkheads.
+    """
+
+    @dataclass
+    class Response:
+        """Response containing the metrics of each bulkhead."""
+
+        success: bool
+        bulkheads: List[BulkheadMetrics]
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        return self.Response(
+            success=True,
+            bulkheads=[bulkhead.metrics() for bulkhead in bulkheads],
+        )
+
+
+class GetDegradationMetrics(Endpoint):
+    """
+    Returns the metrics of the degradation mode.
+
+    Shows whether the database is considered down, how many tokens have
+    been served from expired cache entries, and how many logouts are
+    waiting to be applied. Metrics are per process.
+    """
+
+    @dataclass
+    class Response:
+        """Response containing the metrics of the degradation mode."""
+
+        success: bool
+        degradation: DegradationMetrics
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        return self.Response(
+            success=True,
+            degradation=db_controller.degradation_metrics(),
+        )
+
+
+class GetWarmupMetrics(Endpoint):
+    """
+    Returns the metrics of the warm-up.
+
+    Shows whether the process has finished warming up, how long it took,
+    and how many entries each step loaded. Metrics are per process, and
+    empty if warm-up is disabled.
+    """
+
+    @dataclass
+    class Response:
+        """Response containing the metrics of the warm-up."""
+
+        success: bool
+        warmup: Optional[WarmupMetrics]
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        return self.Response(
+            success=True,
+            warmup=warmup.metrics() if warmup is not None else None,
+        )
+
+
+class GetTokenSyncMetrics(Endpoint):
+    """
+    Returns the metrics of the token cache sync.
+
+    Shows how many syncs have succeeded and failed, how many tokens they
+    have added and removed, and how long since the last sync (lag).
+    Metrics are per process, and empty if the sync is disabled.
+    """
+
+    @dataclass
+    class Response:
+        """Response containing the metrics of the token cache sync."""
+
+        success: bool
+        token_sync: Optional[TokenSyncMetrics]
+
+    def handle_request(self) -> Response:
+        """Handle HTTP request."""
+
+        if token_sync is not None:
+            metrics = token_sync.metrics()
+        else:
+            metrics = None
+
+        return self.Response(success=True, token_sync=metrics)
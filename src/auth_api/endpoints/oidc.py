@@ -1,9 +1,11 @@
+import logging
+import threading
+import time
 from typing import Optional, Union
 from datetime import datetime, timezone
 from dataclasses import dataclass, field
 
 from origin.auth import TOKEN_COOKIE_NAME
-from origin.encrypt import aes256_encrypt
 from origin.api import (
     Endpoint,
     Context,
@@ -13,8 +15,9 @@ from origin.api import (
     BadRequest,
 )
 
-from auth_api.db import db
+from auth_api.db import admin_db, async_db, db, login_db, replica_session
 from auth_api.controller import db_controller
+from auth_api.degradation import DATABASE_ERRORS
 from auth_api.orchestrator import LoginOrchestrator, state_encoder
 from auth_api.state import AuthState, redirect_to_failure
 from auth_api.config import (
@@ -23,13 +26,16 @@ from auth_api.config import (
     TOKEN_COOKIE_HTTP_ONLY,
     TOKEN_COOKIE_PATH,
     OIDC_LOGIN_CALLBACK_URL,
-    STATE_ENCRYPTION_SECRET,
     OIDC_LANGUAGE,
+    OIDC_LOGOUT_CONCURRENCY,
 )
 from auth_api.oidc import (
+    OpenIDConnectToken,
     oidc_backend,
 )
 
+logger = logging.getLogger(__name__)
+
 
 # -- Models ------------------------------------------------------------------
 
@@ -127,24 +133,22 @@ class OpenIDCallbackEndpoint(Endpoint):
     def __init__(self, url: str):
         self.url = url
 
-    @db.atomic()
+    @login_db.atomic()
+    @replica_session()
     def handle_request(
             self,
             request: OidcCallbackParams,
             session: db.Session,
+            replica_session: Optional[db.Session],
     ) -> TemporaryRedirect:
         """
         Handle request.
 
         :param request: Parameters provided by the Identity Provider
         :param session: Database session
+        :param replica_session: Session of the read-only replica, if any
         """
-        # Decode state
-        try:
-            state = state_encoder.decode(request.state)
-        except state_encoder.DecodeError:
-            # TODO Handle...
-            raise BadRequest()
+        state = self.decode_state(request)
 
         # Handle errors from Identity Provider
         if request.error or request.error_description:
@@ -167,20 +171,53 @@ class OpenIDCallbackEndpoint(Endpoint):
                 error_code='E505',
             )
 
+        return self.log_in(
+            session=session,
+            state=state,
+            oidc_token=oidc_token,
+            replica_session=replica_session,
+        )
+
+    @staticmethod
+    def decode_state(request: OidcCallbackParams) -> AuthState:
+        """
+        Decode the state passed on by the Identity Provider.
+
+        :param request: Parameters provided by the Identity Provider
+        """
+        try:
+            return state_encoder.decode(request.state)
+        except state_encoder.DecodeError:
+            # TODO Handle...
+            raise BadRequest()
+
+    @staticmethod
+    def log_in(
+            session: db.Session,
+            state: AuthState,
+            oidc_token: OpenIDConnectToken,
+            replica_session: Optional[db.Session] = None,
+    ) -> TemporaryRedirect:
+        """
+        Log in the user of a token fetched from the Identity Provider.
+
+        :param session: Database session
+        :param state: State object
+        :param oidc_token: Token fetched from the Identity Provider
+        :param replica_session: Session of the read-only replica, if any
+        """
         # Set values for later use
         state.tin = oidc_token.tin
         state.identity_provider = oidc_token.provider
         state.external_subject = oidc_token.subject
-        state.id_token = aes256_encrypt(
-            data=oidc_token.id_token,
-            key=STATE_ENCRYPTION_SECRET,
-        )
+        state.id_token = oidc_token.id_token
 
         # User is unknown when logging in for the first time and may be None
         user = db_controller.get_user_by_external_subject(
             session=session,
             external_subject=oidc_token.subject,
             identity_provider=oidc_token.provider,
+            replica_session=replica_session,
         )
 
         orchestrator = LoginOrchestrator(
@@ -227,9 +264,76 @@ class OpenIDCallbackEndpoint(Endpoint):
         )
 
 
+class AsyncOpenIDCallbackEndpoint(OpenIDCallbackEndpoint):
+    """
+    Asynchronous variant of OpenIDCallbackEndpoint (for the ASGI application).
+
+    The token is fetched from the Identity Provider on the event loop.
+    The user is then logged in by the (synchronous) LoginOrchestrator,
+    using AsyncSession.run_sync(), in the same transaction. Users are
+    looked up on the database (primary), not the read-only replica.
+    """
+
+    @async_db.atomic()
+    async def handle_request(
+            self,
+            request: OidcCallbackParams,
+            session: async_db.Session,
+    ) -> TemporaryRedirect:
+        """
+        Handle request.
+
+        :param request: Parameters provided by the Identity Provider
+        :param session: Database session
+        """
+        state = self.decode_state(request)
+
+        # Handle errors from Identity Provider
+        if request.error or request.error_description:
+            return self.on_oidc_flow_failed(
+                state=state,
+                params=request,
+            )
+
+        # Fetch token from Identity Provider
+        try:
+            oidc_token = await oidc_backend.fetch_token_async(
+                code=request.code,
+                state=request.state,
+                redirect_uri=self.url,
+            )
+        except Exception:
+            # TODO Log this exception
+            return redirect_to_failure(
+                state=state,
+                error_code='E505',
+            )
+
+        return await session.run_sync(
+            self.log_in,
+            state=state,
+            oidc_token=oidc_token,
+        )
+
+
 # -- Logout Endpoints --------------------------------------------------------
 
 
+def expired_token_cookie() -> Cookie:
+    """Return an expired token cookie, which removes it from the client."""
+
+    return Cookie(
+        name=TOKEN_COOKIE_NAME,
+        value='',
+        path=TOKEN_COOKIE_PATH,
+        domain=TOKEN_COOKIE_DOMAIN,
+        http_only=TOKEN_COOKIE_HTTP_ONLY,
+        same_site=TOKEN_COOKIE_SAMESITE,
+        secure=True,
+        expires=datetime.now(tz=timezone.utc),
+    )
+
+
 class OpenIdLogout(Endpoint):
     """
     OpenID Logout endpoint which logs the user out.
@@ -237,6 +341,9 @@ class OpenIdLogout(Endpoint):
     Logs out the user from both our system as well as the used
     OpenId Connect Identity Provider. This is done by calling the OIDC
     logout endpoint as well as deleting the OIDC login session.
+
+    If the database is down (and degradation mode is enabled), the
+    logout is buffered and applied when the database is up again.
     """
 
     @dataclass
@@ -245,47 +352,249 @@ class OpenIdLogout(Endpoint):
 
         success: bool
 
-    @db.atomic()
     def handle_request(
             self,
             context: Context,
-            session: db.Session,
     ) -> HttpResponse:
         """
         Handle HTTP request.
 
         :param context: Context for a single HTTP request.
+        """
+        try:
+            self.log_out(context.opaque_token)
+        except DATABASE_ERRORS:
+            db_controller.health.failed()
+
+            if not db_controller.buffer_revocation(
+                    opaque_tokens=[context.opaque_token]):
+                raise
+
+        return HttpResponse(
+            status=200,
+            cookies=(expired_token_cookie(),),
+            model=self.Response(success=True),
+        )
+
+    @login_db.atomic()
+    def log_out(self, opaque_token: str, session: db.Session):
+        """
+        Delete the token, and log out at the Identity Provider.
+
+        :param opaque_token: Opaque token
         :param session: Database session.
         """
-        token = db_controller.get_token(
+        token = db_controller.revoke_token(
             session=session,
-            opaque_token=context.opaque_token,
-            only_valid=False,
+            opaque_token=opaque_token,
         )
 
         if token is not None:
-            session.delete(token)
             oidc_backend.logout(token.id_token)
             session.commit()
 
-        cookie = Cookie(
-            name=TOKEN_COOKIE_NAME,
-            value='',
-            path=TOKEN_COOKIE_PATH,
-            domain=TOKEN_COOKIE_DOMAIN,
-            http_only=TOKEN_COOKIE_HTTP_ONLY,
-            same_site=TOKEN_COOKIE_SAMESITE,
-            secure=True,
-            expires=datetime.now(tz=timezone.utc),
+
+class OpenIdLogoutEverywhere(Endpoint):
+    """
+    OpenID Logout endpoint which logs the user out of all sessions.
+
+    Deletes all the user's tokens, not only the one in the current cookie,
+    and logs each session out at the OpenId Connect Identity Provider.
+
+    Tokens are deleted (and committed) before logging out at the Identity
+    Provider, so sessions are revoked even if the Identity Provider fails.
+
+    If the database is down (and degradation mode is enabled), the
+    logout is buffered and applied when the database is up again, in
+    which case the number of sessions is not known (and is 0).
+    """
+
+    @dataclass
+    class Response:
+        """The HTTP response body."""
+
+        success: bool
+        sessions: int
+
+    def handle_request(
+            self,
+            context: Context,
+    ) -> HttpResponse:
+        """
+        Handle HTTP request.
+
+        :param context: Context for a single HTTP request.
+        """
+        try:
+            sessions = self.log_out_everywhere(context.token.subject)
+        except DATABASE_ERRORS:
+            db_controller.health.failed()
+
+            if not db_controller.buffer_revocation(
+                    subjects=[context.token.subject]):
+                raise
+
+            sessions = 0
+
+        return HttpResponse(
+            status=200,
+            cookies=(expired_token_cookie(),),
+            model=self.Response(success=True, sessions=sessions),
+        )
+
+    @login_db.session()
+    def log_out_everywhere(self, subject: str, session: db.Session) -> int:
+        """
+        Delete all tokens of the subject, and log them out everywhere.
+
+        :param subject: The subject
+        :param session: Database session.
+        :returns: The number of sessions logged out
+        """
+        id_tokens = db_controller.revoke_tokens(
+            session=session,
+            subject=subject,
         )
 
+        session.commit()
+
+        oidc_backend.logout_many(
+            id_tokens=dict.fromkeys(id_tokens),
+            max_workers=OIDC_LOGOUT_CONCURRENCY,
+        )
+
+        return len(id_tokens)
+
+
+# Held while applying buffered revocations, so they are applied by a
+# single thread at a time (ie. if the database flaps)
+_applying_revocations = threading.Lock()
+
+
+def apply_buffered_revocations():
+    """
+    Apply logouts made while the database was down.
+
+    Invoked when the database is up again (in a thread of its own).
+    Retries every TOKEN_DB_PROBE_INTERVAL seconds until every buffered
+    logout has been applied, as the database may still be unavailable
+    (ie. if it flaps). The revoked tokens are not served meanwhile.
+    """
+    if not _applying_revocations.acquire(blocking=False):
+        return
+
+    try:
+        while len(db_controller.revocations):
+            try:
+                _apply_buffered_revocations()
+            except Exception:
+                logger.exception('Failed to apply buffered logouts')
+                time.sleep(db_controller.health.probe_interval)
+    finally:
+        _applying_revocations.release()
+
+
+@admin_db.atomic()
+def _apply_buffered_revocations(session: db.Session):
+    """
+    Apply logouts made while the database was down, once.
+
+    :param session: Database session.
+    """
+    opaque_tokens, subjects, id_tokens = \
+        db_controller.apply_buffered_revocations(session)
+
+    session.commit()
+
+    db_controller.revocations.remove(opaque_tokens, subjects)
+
+    oidc_backend.logout_many(
+        id_tokens=dict.fromkeys(id_tokens),
+        max_workers=OIDC_LOGOUT_CONCURRENCY,
+    )
+
+
+db_controller.health.on_recovery(apply_buffered_revocations)
+
+
+class AsyncOpenIdLogout(Endpoint):
+    """
+    Asynchronous variant of OpenIdLogout (for the ASGI application).
+
+    Neither the database nor the Identity Provider blocks a thread while
+    the user is logged out.
+    """
+
+    Response = OpenIdLogout.Response
+
+    @async_db.session()
+    async def handle_request(
+            self,
+            context: Context,
+            session: async_db.Session,
+    ) -> HttpResponse:
+        """
+        Handle HTTP request.
+
+        :param context: Context for a single HTTP request.
+        :param session: Database session.
+        """
+        async with session.begin():
+            token = await session.run_sync(
+                db_controller.revoke_token,
+                opaque_token=context.opaque_token,
+            )
+
+            if token is not None:
+                await oidc_backend.logout_async(token.id_token)
+
         return HttpResponse(
             status=200,
-            cookies=(cookie,),
+            cookies=(expired_token_cookie(),),
             model=self.Response(success=True),
         )
 
 
+class AsyncOpenIdLogoutEverywhere(Endpoint):
+    """
+    Asynchronous variant of OpenIdLogoutEverywhere (for the ASGI application).
+
+    Back-channel logouts are made concurrently on the event loop, instead
+    of using a thread per request.
+    """
+
+    Response = OpenIdLogoutEverywhere.Response
+
+    @async_db.session()
+    async def handle_request(
+            self,
+            context: Context,
+            session: async_db.Session,
+    ) -> HttpResponse:
+        """
+        Handle HTTP request.
+
+        :param context: Context for a single HTTP request.
+        :param session: Database session.
+        """
+        async with session.begin():
+            id_tokens = await session.run_sync(
+                db_controller.revoke_tokens,
+                subject=context.token.subject,
+            )
+
+        await oidc_backend.logout_many_async(
+            id_tokens=dict.fromkeys(id_tokens),
+            max_concurrency=OIDC_LOGOUT_CONCURRENCY,
+        )
+
+        return HttpResponse(
+            status=200,
+            cookies=(expired_token_cookie(),),
+            model=self.Response(success=True, sessions=len(id_tokens)),
+        )
+
+
 class OpenIdInvalidateLogin(Endpoint):
     """Returns a URL which invalidates a login."""
 
@@ -1,9 +1,16 @@
 # Standard Library
-import os
-from dataclasses import dataclass
+import gzip
+from dataclasses import dataclass, field
+from functools import lru_cache
+from hashlib import sha256
+from typing import Dict, Optional
 
 # Third party
-import markdown2
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it only gzip is offered
+    brotli = None
 
 # First party
 from origin.api import (
@@ -12,54 +19,162 @@ from origin.api import (
     Endpoint,
     HttpResponse,
 )
+from origin.serialize import json_serializer
 
 # Local
-from auth_api.config import TERMS_MARKDOWN_FOLDER
-from auth_api.db import db
+from auth_api.config import TERMS_CACHE_MAX_AGE
+from auth_api.db import db, login_db
+from auth_api.negotiation import if_none_match, negotiate_encoding
 from auth_api.orchestrator import (
     LoginOrchestrator,
     LoginResponse,
     state_encoder,
 )
 from auth_api.state import build_failure_url
+from auth_api.terms import Terms, terms_registry
+
+
+# -- Models ------------------------------------------------------------------
+
+
+@dataclass
+class TermsResponse:
+    """Class to store the parameters for the response."""
+
+    headline: str
+    terms: str
+    version: str
+    language: str
+
+
+@dataclass(frozen=True)
+class EncodedTerms:
+    """
+    A version of the terms serialized (and compressed) for HTTP responses.
+
+    :param etags: Strong entity tag per content-coding
+    :param bodies: Response body per content-coding
+    """
+
+    etags: Dict[str, str]
+    bodies: Dict[str, bytes]
+
+
+class EncodedJsonResponse(HttpResponse):
+    """HTTP response with an already serialized JSON body."""
+
+    @property
+    def actual_mimetype(self) -> str:
+        """Body is always JSON, even when provided as (compressed) bytes."""
+
+        return 'application/json'
+
+
+# Content-coding used for uncompressed responses
+IDENTITY = 'identity'
+
+# Content-codings offered to clients, preferred first
+COMPRESSIONS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+@lru_cache(maxsize=128)
+def encode_terms(terms: Terms) -> EncodedTerms:
+    """
+    Serialize, compress, and tag a version of the terms.
+
+    Happens once per version and language of the terms (results are
+    cached). The ETag is derived from the version and language as well as
+    the content, in case the file is edited without changing version.
+
+    :param terms: The terms to encode
+    :returns: The encoded terms
+    """
+    body = json_serializer.serialize(TermsResponse(
+        headline=terms.headline,
+        terms=terms.html,
+        version=terms.version,
+        language=terms.language,
+    ))
+
+    bodies = {IDENTITY: body, 'gzip': gzip.compress(body, mtime=0)}
+
+    if brotli is not None:
+        bodies['br'] = brotli.compress(body, mode=brotli.MODE_TEXT)
+
+    tag = f'{terms.version}-{terms.language}-{sha256(body).hexdigest()[:16]}'
+    etags = {
+        encoding: f'"{tag}"' if encoding == IDENTITY
+        else f'"{tag}-{encoding}"'
+        for encoding in bodies
+    }
+
+    return EncodedTerms(etags=etags, bodies=bodies)
+
+
+# -- Endpoints ---------------------------------------------------------------
 
 
 class GetTerms(Endpoint):
-    """An endpoint which returns the terms and conditions."""
+    """
+    An endpoint which returns the terms and conditions.
+
+    Terms are returned in the language requested by the client, either
+    explicitly (the language parameter) or via Accept-Language, falling
+    back to the default language.
+
+    Responses are cacheable and precompressed. Clients (or proxies) that
+    already have the current version, can revalidate using If-None-Match
+    and get a 304 Not Modified without a body.
+    """
 
     @dataclass
-    class Response:
-        """Class to store the parameters for the response."""
+    class Request:
+        """Class to store the parameters for the request."""
 
-        headline: str
-        terms: str
-        version: str
+        language: Optional[str] = field(default=None)
+
+    Response = TermsResponse
 
-    def handle_request(self, context: Context) -> Response:
+    def handle_request(
+            self,
+            request: Request,
+            context: Context,
+    ) -> HttpResponse:
         """Handle HTTP request."""
 
-        file_list = os.listdir(TERMS_MARKDOWN_FOLDER)
+        accept_language = request.language \
+            or context.headers.get('Accept-Language')
 
-        newest_file = sorted(file_list, reverse=True)[0]
+        terms = terms_registry.latest(accept_language=accept_language)
 
-        filepath = f'{TERMS_MARKDOWN_FOLDER}/{newest_file}'
-        version = newest_file.split('.')[0]
+        encoded = encode_terms(terms)
 
-        try:
-            with open(filepath) as file:
-                markdown_content = file.read()
-        except Exception:
-            raise RuntimeError("An error occured reading the markdown file")
+        encoding = negotiate_encoding(
+            accept_encoding=context.headers.get('Accept-Encoding'),
+            available=COMPRESSIONS,
+        ) or IDENTITY
 
-        try:
-            html = markdown2.markdown(markdown_content)
-            return self.Response(
-                headline='Privacy Policy',
-                terms=html,
-                version=version,
-            )
-        except Exception:
-            raise RuntimeError("An error occured converting markdown to html")
+        headers = {
+            'ETag': encoded.etags[encoding],
+            'Cache-Control': f'public, max-age={TERMS_CACHE_MAX_AGE}',
+            'Vary': 'Accept-Encoding, Accept-Language',
+            'Content-Language': terms.language,
+        }
+
+        if if_none_match(
+                context.headers.get('If-None-Match'),
+                encoded.etags.values(),
+        ):
+            return HttpResponse(status=304, headers=headers)
+
+        if encoding != IDENTITY:
+            headers['Content-Encoding'] = encoding
+
+        return EncodedJsonResponse(
+            status=200,
+            body=encoded.bodies[encoding],
+            headers=headers,
+        )
 
 
 class AcceptTerms(Endpoint):
@@ -73,7 +188,7 @@ class AcceptTerms(Endpoint):
         accepted: bool
         version: str
 
-    @db.atomic()
+    @login_db.atomic()
     def handle_request(
         self,
         request: Request,
@@ -87,7 +202,9 @@ class AcceptTerms(Endpoint):
         except state_encoder.DecodeError:
             raise BadRequest()
 
-        # TODO Verify accepted version is valid?
+        if request.accepted \
+                and not terms_registry.has_version(request.version):
+            raise BadRequest()
 
         state.terms_accepted = request.accepted
         state.terms_version = request.version
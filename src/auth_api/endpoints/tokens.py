@@ -1,8 +1,10 @@
 # Standard Library
 from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Set
 
 # First party
 from origin.api import (
+    BadRequest,
     Context,
     Endpoint,
     HttpResponse,
@@ -10,12 +12,16 @@ from origin.api import (
 )
 from origin.auth import TOKEN_HEADER_NAME
 from origin.models.auth import InternalToken
+from origin.serialize import json_serializer
 from origin.tokens import TokenEncoder
 
 # Local
-from auth_api.config import INTERNAL_TOKEN_SECRET
-from auth_api.db import db
-from auth_api.queries import TokenQuery
+from auth_api.config import (
+    INTERNAL_TOKEN_SECRET,
+    TOKEN_INTROSPECTION_MAX_BATCH,
+)
+from auth_api.controller import db_controller
+from auth_api.db import async_db, db, introspection_db, replica_session
 
 
 class ForwardAuth(Endpoint):
@@ -49,27 +55,168 @@ class ForwardAuth(Endpoint):
             },
         )
 
-    @db.session()
-    def get_internal_token(
-            self,
-            opaque_token: str,
-            session: db.Session,
-    ) -> str:
+    def get_internal_token(self, opaque_token: str) -> Optional[str]:
         """
         Return internal token.
 
-        Only if the correct opaque_token is found in the database.
+        Only if the correct opaque_token is found in the cache or the
+        database. Tokens served from the cache do not occupy a worker of
+        the introspection bulkhead.
 
         :param opaque_token: Primary Key Constraint
+        """
+        internal_tokens, missing = \
+            db_controller.get_cached_internal_tokens([opaque_token])
+
+        if missing:
+            internal_tokens = self.query_internal_tokens(missing)
+
+        return internal_tokens.get(opaque_token)
+
+    @introspection_db.session()
+    @replica_session()
+    def query_internal_tokens(
+            self,
+            opaque_tokens: Set[str],
+            session: db.Session,
+            replica_session: Optional[db.Session],
+    ) -> Dict[str, str]:
+        """
+        Return internal tokens not cached, using the database.
+
+        :param opaque_tokens: Opaque tokens not cached
         :param session: Database session
+        :param replica_session: Session of the read-only replica, if any
         """
-        token = TokenQuery(session) \
-            .has_opaque_token(opaque_token) \
-            .is_valid() \
-            .one_or_none()
+        return db_controller.query_internal_tokens(
+            session=session,
+            opaque_tokens=opaque_tokens,
+            replica_session=replica_session,
+        )
+
+
+class AsyncForwardAuth(ForwardAuth):
+    """Asynchronous variant of ForwardAuth (for the ASGI application)."""
+
+    @async_db.session()
+    async def handle_request(
+            self,
+            context: Context,
+            session: async_db.Session,
+    ) -> HttpResponse:
+        """
+        Handle HTTP request.
+
+        :param context: Context for a single HTTP request.
+        :param session: Database session.
+        """
+        if not context.opaque_token:
+            raise Unauthorized()
+
+        internal_token = await session.run_sync(
+            db_controller.get_internal_token,
+            opaque_token=context.opaque_token,
+        )
+
+        if internal_token is None:
+            raise Unauthorized()
+
+        return HttpResponse(
+            status=200,
+            headers={
+                TOKEN_HEADER_NAME: f'Bearer: {internal_token}',
+            },
+        )
+
+
+class NdJsonResponse(HttpResponse):
+    """HTTP response streaming a body of newline-delimited JSON."""
+
+    @property
+    def actual_mimetype(self) -> str:
+        """Body is newline-delimited JSON, one object per line."""
+
+        return 'application/x-ndjson'
+
+
+@dataclass
+class IntrospectedToken:
+    """The result of introspecting a single opaque token."""
+
+    opaque_token: str
+    valid: bool
+    token: Optional[str]
+
+
+class IntrospectTokens(Endpoint):
+    """
+    Resolve many opaque tokens to internal tokens at once.
+
+    For internal services which need to resolve more than a single token,
+    ie. when fanning out to many connected clients. Tokens are resolved
+    using the token cache and (for the rest) a single database query.
+
+    The response is newline-delimited JSON, one line per requested token
+    (in the order requested), and is streamed to the client, so large
+    batches need not be serialized in memory at once.
+    """
+
+    @dataclass
+    class Request:
+        """HTTP request body."""
+
+        opaque_tokens: List[str]
+
+    @introspection_db.session()
+    @replica_session()
+    def handle_request(
+            self,
+            request: Request,
+            session: db.Session,
+            replica_session: Optional[db.Session],
+    ) -> NdJsonResponse:
+        """
+        Handle HTTP request.
+
+        :param request: The opaque tokens to introspect
+        :param session: Database session
+        :param replica_session: Session of the read-only replica, if any
+        """
+        if len(request.opaque_tokens) > TOKEN_INTROSPECTION_MAX_BATCH:
+            raise BadRequest()
+
+        internal_tokens = db_controller.get_internal_tokens(
+            session=session,
+            opaque_tokens=request.opaque_tokens,
+            replica_session=replica_session,
+        )
+
+        return NdJsonResponse(
+            status=200,
+            body=self.serialize(request.opaque_tokens, internal_tokens),
+        )
+
+    @staticmethod
+    def serialize(
+            opaque_tokens: List[str],
+            internal_tokens: Dict[str, str],
+    ) -> Iterator[bytes]:
+        """
+        Serialize the result, one line at a time.
+
+        :param opaque_tokens: The opaque tokens requested
+        :param internal_tokens: Internal tokens by opaque token
+        """
+        for opaque_token in opaque_tokens:
+            internal_token = internal_tokens.get(opaque_token)
+
+            line = json_serializer.serialize(IntrospectedToken(
+                opaque_token=opaque_token,
+                valid=internal_token is not None,
+                token=internal_token,
+            ))
 
-        if token:
-            return token.internal_token
+            yield line + b'\n'
 
 
 class InspectToken(Endpoint):
@@ -0,0 +1,348 @@
+"""
+Envoy external authorization (ext_authz) gRPC service.
+
+An alternative to the ForwardAuth endpoint for gateways supporting
+Envoy's ext_authz protocol (envoy.service.auth.v3.Authorization), which
+are able to reuse persistent, multiplexed HTTP/2 connections instead of
+making a HTTP/1.1 request per API call.
+
+Tokens are resolved exactly like ForwardAuth does: the opaque token is
+read from the token cookie, and if valid, the request is allowed with
+the internal token in the TOKEN_HEADER_NAME header. Otherwise it is
+denied with status 401.
+
+Only the few fields of the protocol's messages needed to do so are
+encoded/decoded, using the protobuf wire format directly, so the
+service requires no generated code (only grpcio). Run it using:
+
+    python -m auth_api.ext_authz
+"""
+
+# Standard Library
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, Optional, Set, Tuple
+
+# Third party
+try:
+    import grpc
+except ImportError:
+    # gRPC is only required when running the service
+    grpc = None
+
+# First party
+from origin.auth import TOKEN_HEADER_NAME
+
+# Local
+from .config import EXT_AUTHZ_MAX_WORKERS, EXT_AUTHZ_PORT
+from .controller import db_controller, invalidation_listener
+from .db import db, introspection_db
+from .edge import get_opaque_token
+from .token_sync import token_sync
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'envoy.service.auth.v3.Authorization'
+
+# google.rpc.Code
+CODE_OK = 0
+CODE_UNAUTHENTICATED = 16
+
+# Protobuf wire types
+WIRE_VARINT = 0
+WIRE_64BIT = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_32BIT = 5
+
+
+# -- Wire format -------------------------------------------------------------
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """
+    Read a varint.
+
+    :param data: Encoded message
+    :param pos: Position of the varint
+    :returns: The value and the position after it
+    """
+    value = 0
+    shift = 0
+
+    while True:
+        if pos >= len(data):
+            raise ValueError('Truncated varint')
+
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+
+        if not byte & 0x80:
+            return value, pos
+
+
+def _iter_fields(data: bytes) -> Iterator[Tuple[int, object]]:
+    """
+    Iterate the fields of an encoded message.
+
+    Length-delimited fields (strings and embedded messages) are returned
+    as bytes, varints as int, and fixed-size fields are skipped.
+
+    :param data: Encoded message
+    :returns: Tuples of (field number, value)
+    """
+    pos = 0
+
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 0x07
+
+        if wire_type == WIRE_VARINT:
+            value, pos = _read_varint(data, pos)
+            yield number, value
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, pos = _read_varint(data, pos)
+            if pos + length > len(data):
+                raise ValueError('Truncated field')
+            yield number, data[pos:pos + length]
+            pos += length
+        elif wire_type == WIRE_64BIT:
+            pos += 8
+        elif wire_type == WIRE_32BIT:
+            pos += 4
+        else:
+            raise ValueError(f'Unsupported wire type {wire_type}')
+
+
+def _get_field(data: bytes, number: int) -> Optional[bytes]:
+    """
+    Return the (last) value of a length-delimited field, if present.
+
+    :param data: Encoded message
+    :param number: Field number
+    """
+    value = None
+
+    for field_number, field_value in _iter_fields(data):
+        if field_number == number and isinstance(field_value, bytes):
+            value = field_value
+
+    return value
+
+
+def _encode_varint(value: int) -> bytes:
+    """
+    Encode a (non-negative) varint.
+
+    :param value: The value
+    """
+    encoded = bytearray()
+
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+
+def _encode_field(number: int, value) -> bytes:
+    """
+    Encode a field (varint if value is an int, otherwise length-delimited).
+
+    :param number: Field number
+    :param value: The value (int, str, or an encoded message)
+    """
+    if isinstance(value, int):
+        return _encode_varint(number << 3 | WIRE_VARINT) \
+            + _encode_varint(value)
+
+    if isinstance(value, str):
+        value = value.encode()
+
+    return _encode_varint(number << 3 | WIRE_LENGTH_DELIMITED) \
+        + _encode_varint(len(value)) \
+        + value
+
+
+# -- Messages ----------------------------------------------------------------
+
+
+def decode_check_request(data: bytes) -> Dict[str, str]:
+    """
+    Decode the HTTP request headers of a CheckRequest.
+
+    Headers are at CheckRequest.attributes (1) -> AttributeContext.request
+    (4) -> Request.http (2) -> HttpRequest.headers (3), which is a map of
+    (lower-cased) header names to values.
+
+    :param data: Encoded CheckRequest
+    :returns: HTTP request headers
+    """
+    http = data
+
+    for number in (1, 4, 2):
+        http = _get_field(http, number) or b''
+
+    headers = {}
+
+    for number, entry in _iter_fields(http):
+        if number == 3 and isinstance(entry, bytes):
+            key = _get_field(entry, 1) or b''
+            value = _get_field(entry, 2) or b''
+            headers[key.decode().lower()] = value.decode()
+
+    return headers
+
+
+def encode_ok_response(headers: Dict[str, str]) -> bytes:
+    """
+    Encode a CheckResponse allowing the request.
+
+    The headers are added to the request (overwriting any existing
+    headers by the same names) before it is forwarded upstream.
+
+    :param headers: Headers to add to the request
+    :returns: Encoded CheckResponse
+    """
+    ok_response = b''.join(
+        _encode_field(2, _encode_field(1, (
+            _encode_field(1, key) + _encode_field(2, value)
+        )))
+        for key, value in headers.items()
+    )
+
+    status = _encode_field(1, CODE_OK)
+
+    return _encode_field(1, status) + _encode_field(3, ok_response)
+
+
+def encode_denied_response(http_status: int) -> bytes:
+    """
+    Encode a CheckResponse denying the request.
+
+    :param http_status: HTTP status code to respond to the client with
+    :returns: Encoded CheckResponse
+    """
+    status = _encode_field(1, CODE_UNAUTHENTICATED)
+    denied_response = _encode_field(1, _encode_field(1, http_status))
+
+    return _encode_field(1, status) + _encode_field(2, denied_response)
+
+
+# -- Service -----------------------------------------------------------------
+
+
+class ExtAuthzService(object):
+    """Implementation of the ext_authz Check method."""
+
+    def check(self, request: bytes, context=None) -> bytes:
+        """
+        Check whether to allow a request.
+
+        :param request: Encoded CheckRequest
+        :param context: gRPC servicer context (unused)
+        :returns: Encoded CheckResponse
+        """
+        try:
+            headers = decode_check_request(request)
+        except (ValueError, UnicodeDecodeError):
+            logger.exception('Failed to decode CheckRequest')
+            return encode_denied_response(400)
+
+        opaque_token = get_opaque_token(headers.get('cookie'))
+
+        if not opaque_token:
+            return encode_denied_response(401)
+
+        internal_token = self.get_internal_token(opaque_token)
+
+        if internal_token is None:
+            return encode_denied_response(401)
+
+        return encode_ok_response({
+            TOKEN_HEADER_NAME: f'Bearer: {internal_token}',
+        })
+
+    def get_internal_token(self, opaque_token: str) -> Optional[str]:
+        """
+        Return internal token, if the opaque token is valid.
+
+        Tokens served from the cache do not occupy a worker of the
+        introspection bulkhead.
+
+        :param opaque_token: Opaque token
+        """
+        internal_tokens, missing = \
+            db_controller.get_cached_internal_tokens([opaque_token])
+
+        if missing:
+            internal_tokens = self.query_internal_tokens(missing)
+
+        return internal_tokens.get(opaque_token)
+
+    @introspection_db.session()
+    def query_internal_tokens(
+            self,
+            opaque_tokens: Set[str],
+            session: db.Session,
+    ) -> Dict[str, str]:
+        """
+        Return internal tokens not cached, using the database.
+
+        :param opaque_tokens: Opaque tokens not cached
+        :param session: Database session
+        """
+        return db_controller.query_internal_tokens(session, opaque_tokens)
+
+
+def create_server(port: int, max_workers: int) -> 'grpc.Server':
+    """
+    Create a gRPC server serving the ext_authz service.
+
+    :param port: Port to listen on
+    :param max_workers: Max. no. of requests served concurrently
+    """
+    if grpc is None:
+        raise RuntimeError('grpcio must be installed to run ext_authz')
+
+    service = ExtAuthzService()
+
+    # Without (de)serializers, messages are passed as raw bytes
+    handler = grpc.method_handlers_generic_handler(SERVICE_NAME, {
+        'Check': grpc.unary_unary_rpc_method_handler(service.check),
+    })
+
+    server = grpc.server(ThreadPoolExecutor(max_workers=max_workers))
+    server.add_generic_rpc_handlers((handler,))
+    server.add_insecure_port(f'[::]:{port}')
+
+    return server
+
+
+def serve():
+    """Run the ext_authz service until terminated."""
+
+    server = create_server(
+        port=EXT_AUTHZ_PORT,
+        max_workers=EXT_AUTHZ_MAX_WORKERS,
+    )
+
+    if invalidation_listener is not None:
+        invalidation_listener.start()
+
+    if token_sync is not None:
+        token_sync.start()
+
+    server.start()
+    logger.info('ext_authz listening on port %d', EXT_AUTHZ_PORT)
+    server.wait_for_termination()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    serve()
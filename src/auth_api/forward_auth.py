@@ -0,0 +1,104 @@
+"""
+Standalone asyncio ForwardAuth service.
+
+Serves only the ForwardAuth endpoint (GET /token/forward-auth) as an ASGI
+application, so a single process can hold thousands of concurrent
+connections, instead of one per thread as the Flask application does.
+Tokens are looked up in the token cache, and otherwise in the database
+using an asynchronous connection pool (asyncpg). Concurrent lookups of
+the same token share a single query.
+
+Responses are identical to those of the ForwardAuth endpoint. The
+application (ForwardAuthApp) is shared with the sidecar (see edge.py).
+
+This process never revokes tokens itself, so tokens revoked elsewhere
+are accepted until they expire from its cache (TOKEN_CACHE_TTL), unless
+cache invalidation (CACHE_INVALIDATION_ENABLED) or token sync
+(TOKEN_SYNC_ENABLED) is enabled.
+Run it using an ASGI server, ie.:
+
+    uvicorn auth_api.forward_auth:app
+"""
+
+# Standard Library
+from typing import Optional
+
+# Third party
+try:
+    import asyncpg
+except ImportError:
+    # asyncpg is only required when running the service
+    asyncpg = None
+
+# Local
+from .config import FORWARD_AUTH_POOL_SIZE, SQL_URI
+from .controller import db_controller, invalidation_listener
+from .edge import CachedToken, ForwardAuthApp, TokenSource
+from .token_sync import token_sync
+
+
+class PostgresTokenSource(TokenSource):
+    """
+    Looks up valid tokens using an asynchronous connection pool.
+
+    :param dsn: PostgreSQL connection string
+    :param pool_size: Max. no. of connections
+    """
+
+    QUERY = (
+        'SELECT internal_token, expires FROM token '
+        'WHERE opaque_token = $1 AND issued <= now() AND expires > now()'
+    )
+
+    def __init__(self, dsn: str, pool_size: int):
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.pool = None
+
+    async def start(self):
+        """Open the connection pool."""
+
+        if asyncpg is None:
+            raise RuntimeError('asyncpg must be installed to run forward_auth')
+
+        self.pool = await asyncpg.create_pool(
+            dsn=self.dsn,
+            min_size=1,
+            max_size=self.pool_size,
+        )
+
+    async def stop(self):
+        """Close the connection pool."""
+
+        if self.pool is not None:
+            await self.pool.close()
+
+    async def fetch(self, opaque_token: str) -> Optional[CachedToken]:
+        """
+        Look up a valid token by opaque token.
+
+        :param opaque_token: Opaque token
+        :returns: The token, or None if it is not valid
+        """
+        row = await self.pool.fetchrow(self.QUERY, opaque_token)
+
+        if row is not None:
+            return CachedToken(
+                internal_token=row['internal_token'],
+                expires=row['expires'],
+            )
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+app = ForwardAuthApp(
+    source=PostgresTokenSource(dsn=SQL_URI, pool_size=FORWARD_AUTH_POOL_SIZE),
+    cache=db_controller.token_cache,
+    # Both only keep the cache up to date
+    on_startup=[
+        service.start for service in (invalidation_listener, token_sync)
+        if service is not None
+    ],
+)
+"""ASGI application."""
@@ -0,0 +1,276 @@
+"""
+Invalidation of the in-process caches across processes and replicas.
+
+Each process (worker) has its own caches of tokens and identities (see
+DatabaseController), so changes made by one process are not seen by the
+others until their cache entries expire. Invalidations are therefore
+also published using PostgreSQL's LISTEN/NOTIFY, so no additional
+infrastructure is required:
+
+- Invalidations are published (pg_notify) in the transaction making the
+  change, so they are delivered if, and only if, it is committed.
+
+- Each process runs a listener thread, which has a connection of its own
+  LISTENing on the channel, and invalidates entries of its caches.
+
+Tokens are published by key (see auth_api.tokens.token_key), hex encoded,
+so opaque tokens (cookies) are never sent to the database, where any
+session LISTENing on the channel (or logging statements) could see them.
+
+Notifications sent while the listener is disconnected are lost, so the
+caches are cleared every time the listener (re)connects. While it is
+disconnected, entries are stale for up to their TTL, as without it.
+"""
+
+# Standard Library
+import json
+import logging
+import select
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Third party
+import sqlalchemy as sa
+from psycopg2 import sql
+from sqlalchemy.pool import NullPool
+
+# First party
+from origin.sql import SqlEngine
+
+logger = logging.getLogger(__name__)
+
+MAX_PAYLOAD_SIZE = 7900
+"""Max. bytes of items in a notification (PostgreSQL's limit is 8000)."""
+
+
+@dataclass
+class Invalidation:
+    """Cache entries to invalidate, tokens by key."""
+
+    token_keys: List[bytes] = field(default_factory=list)
+    identities: List[Tuple[str, str]] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        """Return whether there is anything to invalidate."""
+
+        return bool(self.token_keys or self.identities)
+
+    @classmethod
+    def from_payload(cls, payload: str) -> 'Invalidation':
+        """
+        Parse the payload of a notification.
+
+        :param payload: The payload
+        """
+        data = json.loads(payload)
+
+        return cls(
+            token_keys=[bytes.fromhex(key) for key in data.get('k', [])],
+            identities=[tuple(identity) for identity in data.get('i', [])],
+        )
+
+    def to_payloads(self) -> Iterator[str]:
+        """Return payloads of as few notifications as possible."""
+
+        items = [('k', k.hex()) for k in self.token_keys] \
+            + [('i', list(i)) for i in self.identities]
+
+        data = {'k': [], 'i': []}
+        size = 0
+
+        for key, item in items:
+            # Each item adds itself and a separator to the payload
+            item_size = len(json.dumps(item).encode()) + 1
+
+            if size > 0 and size + item_size > MAX_PAYLOAD_SIZE:
+                yield json.dumps(data, separators=(',', ':'))
+                data = {'k': [], 'i': []}
+                size = 0
+
+            data[key].append(item)
+            size += item_size
+
+        if size > 0:
+            yield json.dumps(data, separators=(',', ':'))
+
+
+def publish_invalidation(
+        session: SqlEngine.Session,
+        channel: str,
+        invalidation: Invalidation,
+):
+    """
+    Publish an invalidation, once (and if) the session is committed.
+
+    :param session: Database session
+    :param channel: Name of the channel to notify
+    :param invalidation: Cache entries to invalidate
+    """
+    for payload in invalidation.to_payloads():
+        session.execute(
+            sa.select(sa.func.pg_notify(channel, payload)))
+
+
+class InvalidationListener(object):
+    """
+    Listens for invalidations published by any process, in a thread.
+
+    The connection is checked every ping_interval seconds while idle, so
+    a connection lost silently is also detected. If the connection is
+    lost, the listener reconnects every reconnect_interval seconds.
+
+    on_connect is invoked every time the listener has (re)connected, and
+    must invalidate everything (notifications might have been missed).
+
+    :param db: The database to listen to (a connection is made for it)
+    :param channel: Name of the channel to listen on
+    :param on_invalidation: Invoked with each invalidation received
+    :param on_connect: Invoked when (re)connected
+    :param reconnect_interval: Seconds between attempts to reconnect
+    :param ping_interval: Seconds between checks of an idle connection
+    """
+
+    def __init__(
+            self,
+            db: SqlEngine,
+            channel: str,
+            on_invalidation: Callable[[Invalidation], None],
+            on_connect: Callable[[], None],
+            reconnect_interval: float,
+            ping_interval: float = 10,
+    ):
+        self.db = db
+        self.channel = channel
+        self.on_invalidation = on_invalidation
+        self.on_connect = on_connect
+        self.reconnect_interval = reconnect_interval
+        self.ping_interval = ping_interval
+        self.connects = 0
+        self.received = 0
+        self._connected = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def connected(self) -> bool:
+        """Return whether the listener is currently listening."""
+
+        return self._connected.is_set()
+
+    def wait_connected(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the listener is listening.
+
+        :param timeout: Max. seconds to wait
+        :returns: Whether the listener is listening
+        """
+        return self._connected.wait(timeout)
+
+    def start(self):
+        """
+        Start listening (in a thread), unless already started.
+
+        Should be invoked in each (forked) worker process, ie. when
+        creating the application, not when importing modules.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='cache-invalidation-listener',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def stop(self):
+        """Stop listening, and wait for the thread to finish."""
+
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        """Listen, reconnecting until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+            except Exception:
+                logger.warning(
+                    'Cache invalidation listener disconnected, '
+                    'reconnecting in %s seconds',
+                    self.reconnect_interval,
+                    exc_info=True,
+                )
+
+            self._stopped.wait(self.reconnect_interval)
+
+    def _listen(self):
+        """Connect and handle notifications until disconnected or stopped."""
+
+        engine = sa.create_engine(self.db.uri, poolclass=NullPool)
+        connection = engine.raw_connection()
+
+        try:
+            dbapi_connection = connection.connection
+            dbapi_connection.autocommit = True
+
+            with dbapi_connection.cursor() as cursor:
+                cursor.execute(sql.SQL('LISTEN {}').format(
+                    sql.Identifier(self.channel)))
+
+            self.connects += 1
+            self.on_connect()
+            self._connected.set()
+
+            self._handle_notifications(dbapi_connection)
+        finally:
+            self._connected.clear()
+            connection.close()
+            engine.dispose()
+
+    def _handle_notifications(self, dbapi_connection):
+        """
+        Handle notifications until the connection is lost or stopped.
+
+        :param dbapi_connection: The (psycopg2) connection listening
+        """
+        last_activity = time.monotonic()
+
+        while not self._stopped.is_set():
+            readable, _, _ = select.select(
+                [dbapi_connection], [], [], min(1.0, self.ping_interval))
+
+            if readable:
+                dbapi_connection.poll()
+                last_activity = time.monotonic()
+            elif time.monotonic() - last_activity >= self.ping_interval:
+                with dbapi_connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+
+                last_activity = time.monotonic()
+
+            while dbapi_connection.notifies:
+                notify = dbapi_connection.notifies.pop(0)
+                self._handle(notify.payload)
+
+    def _handle(self, payload: str):
+        """
+        Handle a single notification.
+
+        :param payload: The payload
+        """
+        self.received += 1
+
+        try:
+            self.on_invalidation(Invalidation.from_payload(payload))
+        except Exception:
+            logger.exception('Failed to handle cache invalidation')
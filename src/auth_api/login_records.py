@@ -0,0 +1,408 @@
+# Standard Library
+import atexit
+import logging
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+# Third party
+import sqlalchemy as sa
+
+# First party
+from origin.sql import SqlEngine
+
+# Local
+from .config import (
+    LOGIN_RECORD_BUFFER_SIZE,
+    LOGIN_RECORD_FLUSH_INTERVAL,
+    LOGIN_RECORD_PARTITIONS_AHEAD,
+    LOGIN_RECORD_RETENTION_DAYS,
+    LOGIN_RECORD_WRITE_BEHIND,
+)
+from .db import admin_db
+from .models import DbLoginRecord
+
+logger = logging.getLogger(__name__)
+
+
+class LoginRecordBuffer(object):
+    """
+    Write-behind buffer of login records.
+
+    Instead of inserting a login record within each login's transaction,
+    records are collected in memory and inserted in bulk (a single
+    multi-row INSERT) by a background thread, whenever buffer_size records
+    are pending or every flush_interval seconds, whichever comes first.
+
+    Records which have not yet been flushed are lost if the process
+    crashes, so the buffer must be flushed on shutdown (see stop()), and
+    it should not be enabled if every login must be recorded.
+
+    If flushing fails, the records are kept and retried on the next flush,
+    but at most max_pending records are kept; the oldest are dropped.
+
+    :param db: Database to insert login records into
+    :param buffer_size: No. of pending records which triggers a flush
+    :param flush_interval: Max. seconds between flushes
+    :param max_pending: Max. no. of records to keep if flushing fails
+    """
+
+    def __init__(
+            self,
+            db: SqlEngine,
+            buffer_size: int,
+            flush_interval: float,
+            max_pending: Optional[int] = None,
+    ):
+        self.db = db
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending or buffer_size * 100
+        self._records: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __len__(self) -> int:
+        """Return the number of records not yet flushed."""
+
+        return len(self._records)
+
+    def add(self, subject: str, created: datetime):
+        """
+        Add a login record to the buffer.
+
+        :param subject: The subject who logged in
+        :param created: Time of login
+        """
+        with self._lock:
+            self._records.append({'subject': subject, 'created': created})
+            full = len(self._records) >= self.buffer_size
+
+            # The thread is started lazily, so it is started in each
+            # (forked) worker process instead of the parent process
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='login-record-buffer',
+                    daemon=True,
+                )
+                self._thread.start()
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self):
+        """Insert all pending login records into the database."""
+
+        with self._flush_lock:
+            with self._lock:
+                records, self._records = self._records, []
+
+            if not records:
+                return
+
+            try:
+                with self.db.engine.begin() as connection:
+                    connection.execute(
+                        sa.insert(DbLoginRecord).values(records))
+            except Exception:
+                logger.exception(
+                    'Failed to flush %d login records', len(records))
+
+                with self._lock:
+                    self._records[:0] = records
+                    del self._records[:-self.max_pending]
+
+    def stop(self):
+        """
+        Stop the background thread and flush pending login records.
+
+        Should be invoked when the process is shutting down.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+
+        if self._thread is not None:
+            self._thread.join()
+
+        self.flush()
+
+    def _run(self):
+        """Flush periodically (or when woken up) until stopped."""
+
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _month_start(time: datetime, months: int = 0) -> datetime:
+    """
+    Return the start of a month (in UTC).
+
+    :param time: Any time within the month
+    :param months: No. of months to add
+    """
+    month = time.astimezone(timezone.utc).month - 1 + months
+    year = time.astimezone(timezone.utc).year + month // 12
+
+    return datetime(year, month % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def _day_start(time: datetime) -> datetime:
+    """
+    Return the start of a day (in UTC).
+
+    :param time: Any time within the day
+    """
+    return time.astimezone(timezone.utc) \
+        .replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class LoginRecordMaintenance(object):
+    """
+    Maintenance of the (partitioned) login record table.
+
+    Intended to run periodically (ie. daily). Each run:
+
+    - Creates monthly partitions for the current month and the next
+      partitions_ahead months (moving any matching records out of the
+      default partition).
+    - Rolls up login records into the daily aggregate (DbLoginDaily),
+      from the latest day aggregated (the watermark), so days are not
+      missed if maintenance has not run for a while. Days are recomputed
+      entirely, so running it more than once (or with late records) is
+      safe.
+    - Drops partitions which have expired entirely, after rolling them up.
+
+    :param db: Database
+    :param retention_days: Days to keep login records (0 keeps them forever)
+    :param partitions_ahead: No. of monthly partitions to create ahead
+    """
+
+    PARTITION_NAME = 'login_record_y{year:04d}m{month:02d}'
+    PARTITION_PATTERN = re.compile(r'^login_record_y(\d{4})m(\d{2})$')
+    DEFAULT_PARTITION = 'login_record_default'
+
+    # Min. no. of days (including today) to roll up on each run
+    ROLLUP_DAYS = 2
+
+    def __init__(
+            self,
+            db: SqlEngine,
+            retention_days: int,
+            partitions_ahead: int,
+    ):
+        self.db = db
+        self.retention_days = retention_days
+        self.partitions_ahead = partitions_ahead
+
+    def run(self, now: Optional[datetime] = None):
+        """
+        Run all maintenance in a single transaction.
+
+        :param now: Current time (defaults to now)
+        """
+        if now is None:
+            now = datetime.now(tz=timezone.utc)
+
+        with self.db.engine.begin() as connection:
+            self.create_partitions(connection, now)
+            self.rollup(
+                connection=connection,
+                start=self.get_rollup_start(connection, now),
+            )
+            self.drop_expired(connection, now)
+
+    def get_rollup_start(
+            self,
+            connection: sa.engine.Connection,
+            now: datetime,
+    ) -> datetime:
+        """
+        Return the time to roll up login records from.
+
+        The latest day aggregated, and every day after it, is rolled up
+        again, but at least the last ROLLUP_DAYS days are (as records may
+        be inserted late, ie. by the write-behind buffer). All records are
+        rolled up if nothing has been aggregated yet.
+
+        :param connection: Database connection
+        :param now: Current time
+        """
+        latest_day = connection.execute(sa.text(
+            'SELECT max(day) FROM login_record_daily')).scalar()
+
+        if latest_day is None:
+            return datetime.min.replace(tzinfo=timezone.utc)
+
+        return min(
+            _day_start(now) - timedelta(days=self.ROLLUP_DAYS - 1),
+            datetime(
+                latest_day.year, latest_day.month, latest_day.day,
+                tzinfo=timezone.utc,
+            ),
+        )
+
+    def create_partitions(
+            self,
+            connection: sa.engine.Connection,
+            now: datetime,
+    ):
+        """
+        Create missing monthly partitions from now and ahead.
+
+        :param connection: Database connection
+        :param now: Current time
+        """
+        for months in range(self.partitions_ahead + 1):
+            self._create_partition(connection, _month_start(now, months))
+
+    def rollup(
+            self,
+            connection: sa.engine.Connection,
+            start: datetime,
+            end: Optional[datetime] = None,
+            table: str = DbLoginRecord.__tablename__,
+    ):
+        """
+        Roll up login records into the daily aggregate.
+
+        Days are recomputed (not added to), so start and end must be at
+        the start of a day, and all records of each day must be included.
+
+        :param connection: Database connection
+        :param start: Roll up records created from this time
+        :param end: Roll up records created before this time (optional)
+        :param table: The table (or partition) to roll up
+        """
+        where = 'created >= :start'
+
+        if end is not None:
+            where += ' AND created < :end'
+
+        connection.execute(sa.text(
+            'INSERT INTO login_record_daily '
+            '(subject, day, logins, last_login) '
+            "SELECT subject, (created AT TIME ZONE 'UTC')::date, "
+            'count(*), max(created) '
+            f'FROM {table} WHERE {where} '
+            'GROUP BY 1, 2 '
+            'ON CONFLICT (subject, day) DO UPDATE '
+            'SET logins = excluded.logins, last_login = excluded.last_login'
+        ), {'start': start, 'end': end})
+
+    def drop_expired(self, connection: sa.engine.Connection, now: datetime):
+        """
+        Roll up and drop login records older than the retention period.
+
+        Monthly partitions are dropped once all their records have expired.
+        Expired records in the default partition are deleted.
+
+        :param connection: Database connection
+        :param now: Current time
+        """
+        if self.retention_days <= 0:
+            return
+
+        cutoff = _day_start(now) - timedelta(days=self.retention_days)
+
+        partitions = connection.execute(sa.text(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            'JOIN pg_class p ON p.oid = i.inhparent '
+            'WHERE p.relname = :table'
+        ), {'table': DbLoginRecord.__tablename__}).scalars().all()
+
+        for partition in partitions:
+            match = self.PARTITION_PATTERN.match(partition)
+            if match is None:
+                continue
+
+            start = datetime(
+                int(match.group(1)), int(match.group(2)), 1,
+                tzinfo=timezone.utc,
+            )
+            end = _month_start(start, 1)
+
+            if end <= cutoff:
+                self.rollup(connection, start=start, end=end, table=partition)
+                connection.execute(sa.text(f'DROP TABLE {partition}'))
+
+        self.rollup(
+            connection=connection,
+            start=datetime.min.replace(tzinfo=timezone.utc),
+            end=cutoff,
+            table=self.DEFAULT_PARTITION,
+        )
+
+        connection.execute(sa.text(
+            f'DELETE FROM {self.DEFAULT_PARTITION} WHERE created < :cutoff'
+        ), {'cutoff': cutoff})
+
+    def _create_partition(
+            self,
+            connection: sa.engine.Connection,
+            start: datetime,
+    ):
+        """
+        Create the partition of a month, if it doesn't exist.
+
+        :param connection: Database connection
+        :param start: Start of the month
+        """
+        name = self.PARTITION_NAME.format(year=start.year, month=start.month)
+        end = _month_start(start, 1)
+
+        exists = connection.execute(
+            sa.text('SELECT to_regclass(:name)'), {'name': name}).scalar()
+
+        if exists is not None:
+            return
+
+        # A partition can not be attached while the default partition has
+        # records belonging to it, so they are moved to the new partition
+        connection.execute(sa.text(
+            f'CREATE TABLE {name} '
+            f'(LIKE {DbLoginRecord.__tablename__} INCLUDING DEFAULTS)'
+        ))
+
+        connection.execute(sa.text(
+            f'WITH moved AS (DELETE FROM {self.DEFAULT_PARTITION} '
+            'WHERE created >= :start AND created < :end RETURNING *) '
+            f'INSERT INTO {name} SELECT * FROM moved'
+        ), {'start': start, 'end': end})
+
+        connection.execute(sa.text(
+            f'ALTER TABLE {DbLoginRecord.__tablename__} '
+            f'ATTACH PARTITION {name} '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+login_record_buffer = LoginRecordBuffer(
+    db=admin_db,
+    buffer_size=LOGIN_RECORD_BUFFER_SIZE,
+    flush_interval=LOGIN_RECORD_FLUSH_INTERVAL,
+) if LOGIN_RECORD_WRITE_BEHIND else None
+"""
+Write-behind buffer of login records.
+
+None if login records are written synchronously (the default).
+"""
+
+if login_record_buffer is not None:
+    atexit.register(login_record_buffer.stop)
+
+login_record_maintenance = LoginRecordMaintenance(
+    db=admin_db,
+    retention_days=LOGIN_RECORD_RETENTION_DAYS,
+    partitions_ahead=LOGIN_RECORD_PARTITIONS_AHEAD,
+)
@@ -0,0 +1,49 @@
+"""
+Periodic database maintenance.
+
+Run daily (ie. as a scheduled job) using entrypoint_maintenance.sh.
+"""
+# Standard Library
+import logging
+
+# Local
+from .config import TOKEN_DELETION_RETENTION_HOURS
+from .db import admin_db
+from .login_records import login_record_maintenance
+from .token_store import token_store
+from .token_sync import purge_token_deletions
+
+logger = logging.getLogger(__name__)
+
+
+def run_maintenance():
+    """Run all periodic maintenance."""
+
+    logger.info('Maintaining login records')
+    login_record_maintenance.run()
+
+    logger.info('Purging expired tokens')
+    purge_expired_tokens()
+
+    logger.info('Purging log of deleted tokens')
+    purge_token_deletions(
+        db=admin_db,
+        retention_hours=TOKEN_DELETION_RETENTION_HOURS,
+    )
+
+
+@admin_db.atomic()
+def purge_expired_tokens(session: admin_db.Session):
+    """
+    Delete expired tokens from the token store.
+
+    :param session: Database session
+    """
+    deleted = token_store.purge_expired(session)
+
+    logger.info('Deleted %d expired tokens', deleted)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    run_maintenance()
@@ -0,0 +1,345 @@
+"""
+Prometheus metrics, exposed at /metrics.
+
+Each process (worker) collects its own metrics. When served by multiple
+processes (ie. gunicorn workers), PROMETHEUS_MULTIPROC_DIR must be set
+to an empty folder before the processes start (see entrypoint_api.sh).
+Each process then writes its metrics to files in the folder, and
+/metrics aggregates the files of all processes, regardless of which
+process serves the request.
+
+Metrics recorded on hot paths (ie. ForwardAuth) use label children
+bound up front, so recording is a single increment or observation,
+without looking up or allocating label values.
+
+Metrics do nothing if prometheus_client is not installed.
+"""
+
+# Standard Library
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Sequence
+
+# Third party
+import sqlalchemy as sa
+from flask import Flask, g, request
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    # prometheus_client is only required to collect and expose metrics
+    prometheus_client = None
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (
+    .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Responses bound up front for each endpoint, other statuses are bound
+# when first returned
+COMMON_STATUSES = (200, 307, 400, 401, 403, 404, 500, 503)
+
+
+class NullMetric(object):
+    """Stands in for a metric when prometheus_client is not installed."""
+
+    def labels(self, *args, **kwargs) -> 'NullMetric':
+        """Return the metric itself, as a child of the labels."""
+
+        return self
+
+    def inc(self, amount: float = 1):
+        """Do nothing."""
+
+    def observe(self, amount: float):
+        """Do nothing."""
+
+
+def _counter(name: str, documentation: str, labelnames: Sequence[str] = ()):
+    """Return a counter, or a NullMetric."""
+
+    if prometheus_client is None:
+        return NullMetric()
+
+    return prometheus_client.Counter(name, documentation, labelnames)
+
+
+def _histogram(
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+):
+    """Return a histogram of latencies (seconds), or a NullMetric."""
+
+    if prometheus_client is None:
+        return NullMetric()
+
+    return prometheus_client.Histogram(
+        name, documentation, labelnames, buckets=LATENCY_BUCKETS)
+
+
+# -- Metrics -----------------------------------------------------------------
+
+
+REQUEST_DURATION = _histogram(
+    'auth_request_duration_seconds',
+    'Time spent handling requests, per endpoint',
+    ['endpoint'],
+)
+
+RESPONSES = _counter(
+    'auth_responses',
+    'Responses returned, per endpoint and status',
+    ['endpoint', 'status'],
+)
+
+DB_POOL_WAIT = _histogram(
+    'auth_db_pool_wait_seconds',
+    'Time spent waiting for a database connection, per bulkhead',
+    ['pool'],
+)
+
+DB_QUERY_DURATION = _histogram(
+    'auth_db_query_duration_seconds',
+    'Time spent executing database queries, per bulkhead',
+    ['pool'],
+)
+
+IDP_REQUEST_DURATION = _histogram(
+    'auth_idp_request_duration_seconds',
+    'Time spent waiting for the Identity Provider, per operation',
+    ['operation'],
+)
+
+IDP_FAILURES = _counter(
+    'auth_idp_failures',
+    'Requests to the Identity Provider which failed, per operation',
+    ['operation'],
+)
+
+OIDC_ERRORS = _counter(
+    'auth_oidc_errors',
+    'Logins failed, per error code (see OIDC_ERROR_CODES)',
+    ['code'],
+)
+
+CACHE_LOOKUPS = _counter(
+    'auth_cache_lookups',
+    'Cache lookups, per cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+
+LOGINS = _counter(
+    'auth_logins',
+    'Users logged in',
+)
+
+TOKENS_ISSUED = _counter(
+    'auth_tokens_issued',
+    'Tokens issued',
+)
+
+TOKENS_REVOKED = _counter(
+    'auth_tokens_revoked',
+    'Tokens revoked (logged out)',
+)
+
+
+# -- Endpoints ---------------------------------------------------------------
+
+
+class EndpointMetrics(object):
+    """
+    Metrics of a single endpoint, with label children bound up front.
+
+    :param endpoint: Name of the endpoint (its path)
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.duration = REQUEST_DURATION.labels(endpoint=endpoint)
+        self.responses: Dict[int, Any] = {
+            status: RESPONSES.labels(endpoint=endpoint, status=str(status))
+            for status in COMMON_STATUSES
+        }
+
+    def observe(self, seconds: float, status: int):
+        """
+        Record a single request.
+
+        :param seconds: Seconds spent handling the request
+        :param status: HTTP status of the response
+        """
+        self.duration.observe(seconds)
+
+        responses = self.responses.get(status)
+
+        if responses is None:
+            responses = self.responses[status] = RESPONSES.labels(
+                endpoint=self.endpoint, status=str(status))
+
+        responses.inc()
+
+
+def instrument_flask(app: Flask):
+    """
+    Record the duration and status of requests to all endpoints.
+
+    Must be invoked after all endpoints are added. Requests to paths
+    without an endpoint are not recorded.
+
+    :param app: The Flask application
+    """
+    endpoints = {
+        rule.endpoint: EndpointMetrics(rule.endpoint)
+        for rule in app.url_map.iter_rules()
+    }
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        metrics = endpoints.get(request.endpoint)
+        started = g.get('metrics_started')
+
+        if metrics is not None and started is not None:
+            metrics.observe(
+                time.perf_counter() - started, response.status_code)
+
+        return response
+
+
+# -- Identity Provider -------------------------------------------------------
+
+
+class IdpOperation(object):
+    """
+    Metrics of a single operation at the Identity Provider.
+
+    :param operation: Name of the operation
+    """
+
+    def __init__(self, operation: str):
+        self.duration = IDP_REQUEST_DURATION.labels(operation=operation)
+        self.failures = IDP_FAILURES.labels(operation=operation)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Record the time spent in context, and failures raised."""
+
+        started = time.perf_counter()
+
+        try:
+            yield
+        except Exception:
+            self.failures.inc()
+            raise
+        finally:
+            self.duration.observe(time.perf_counter() - started)
+
+
+IDP_FETCH_TOKEN = IdpOperation('fetch_token')
+IDP_FETCH_JWKS = IdpOperation('fetch_jwks')
+IDP_LOGOUT = IdpOperation('logout')
+
+
+# -- Caches ------------------------------------------------------------------
+
+
+class CacheMetrics(object):
+    """
+    Metrics of a single cache, with label children bound up front.
+
+    :param cache: Name of the cache
+    """
+
+    def __init__(self, cache: str):
+        self.hits = CACHE_LOOKUPS.labels(cache=cache, result='hit')
+        self.misses = CACHE_LOOKUPS.labels(cache=cache, result='miss')
+
+
+# -- Database ----------------------------------------------------------------
+
+
+_query_durations: Dict[str, Any] = {}
+
+
+def _query_duration(pool: str):
+    """Return the child of DB_QUERY_DURATION of a pool (bulkhead)."""
+
+    duration = _query_durations.get(pool)
+
+    if duration is None:
+        duration = _query_durations[pool] = \
+            DB_QUERY_DURATION.labels(pool=pool)
+
+    return duration
+
+
+def _before_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    """Start timing a query."""
+
+    if context is not None:
+        context.metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(
+        conn, cursor, statement, parameters, context, executemany):
+    """Record the duration of a query, by the bulkhead of its pool."""
+
+    started = getattr(context, 'metrics_started', None)
+
+    if started is not None:
+        pool = getattr(conn.engine.pool, 'bulkhead', 'default')
+        _query_duration(pool).observe(time.perf_counter() - started)
+
+
+if prometheus_client is not None:
+    sa.event.listen(
+        sa.engine.Engine, 'before_cursor_execute', _before_cursor_execute)
+    sa.event.listen(
+        sa.engine.Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+# -- Exposition --------------------------------------------------------------
+
+
+def generate_latest() -> bytes:
+    """
+    Return the metrics of all processes in the Prometheus text format.
+
+    Metrics of all processes are aggregated if PROMETHEUS_MULTIPROC_DIR
+    is set, otherwise only metrics of the current process are returned.
+    """
+    if prometheus_client is None:
+        return b''
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+
+    return prometheus_client.generate_latest(registry)
+
+
+def mark_process_dead(pid: int):
+    """
+    Remove the metrics of a process which has exited.
+
+    Only metrics of live processes (gauges) are removed, counters and
+    histograms are still aggregated. Does nothing unless
+    PROMETHEUS_MULTIPROC_DIR is set.
+
+    :param pid: ID of the process
+    """
+    if prometheus_client is not None \
+            and 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -18,6 +18,8 @@ class DbUser(db.ModelBase):
         sa.PrimaryKeyConstraint('subject'),
         sa.UniqueConstraint('subject'),
         sa.UniqueConstraint('ssn'),
+        sa.UniqueConstraint('ssn_index'),
+        sa.UniqueConstraint('tin'),
         sa.CheckConstraint('ssn != NULL OR tin != null'),
     )
 
@@ -31,7 +33,15 @@ class DbUser(db.ModelBase):
     ssn = sa.Column(sa.String(), index=True)
     """Social security number, encrypted."""
 
-    tin = sa.Column(sa.String(), index=True)
+    ssn_index = sa.Column(sa.String())
+    """
+    Blind index of the social security number.
+
+    A keyed hash (HMAC) of the social security number. The encrypted ssn
+    is randomized, so users are looked up by their blind index instead.
+    """
+
+    tin = sa.Column(sa.String())
     """Tax identification number."""
 
 
@@ -83,17 +93,24 @@ class DbLoginRecord(db.ModelBase):
 
     A database that store the users who logged in a the current time.
     The user is identified by the subject.
+
+    The table is partitioned by month (of created). Partitions are created
+    ahead of time, and dropped when they expire, by the login record
+    maintenance (see login_records.py). Records outside any monthly
+    partition end up in the default partition.
     """
 
     __tablename__ = 'login_record'
     __table_args__ = (
-        sa.PrimaryKeyConstraint('id'),
+        sa.PrimaryKeyConstraint('id', 'created'),
+        sa.Index('ix_login_record_subject_created', 'subject', 'created'),
+        {'postgresql_partition_by': 'RANGE (created)'},
     )
 
-    id = sa.Column(sa.Integer(), index=True)
+    id = sa.Column(sa.Integer(), autoincrement=True)
     """Unique id for the Database record."""
 
-    subject = sa.Column(sa.String(), index=True, nullable=False)
+    subject = sa.Column(sa.String(), nullable=False)
     """The user subject used to identify users."""
 
     created = sa.Column(sa.DateTime(timezone=True),
@@ -101,6 +118,44 @@ class DbLoginRecord(db.ModelBase):
     """Time when the user logged in."""
 
 
+sa.event.listen(
+    DbLoginRecord.__table__,
+    'after_create',
+    sa.DDL(
+        'CREATE TABLE login_record_default '
+        'PARTITION OF login_record DEFAULT'
+    ),
+)
+
+
+class DbLoginDaily(db.ModelBase):
+    """
+    Daily aggregate of login records.
+
+    Login records are rolled up into one row per user per day (in UTC),
+    which is kept after the login records themselves have expired.
+    The latest day is the watermark of the next rollup.
+    """
+
+    __tablename__ = 'login_record_daily'
+    __table_args__ = (
+        sa.PrimaryKeyConstraint('subject', 'day'),
+        sa.Index('ix_login_record_daily_day', 'day'),
+    )
+
+    subject = sa.Column(sa.String(), nullable=False)
+    """The user subject used to identify users."""
+
+    day = sa.Column(sa.Date(), nullable=False)
+    """The day (in UTC)."""
+
+    logins = sa.Column(sa.Integer(), nullable=False)
+    """No. of times the user logged in that day."""
+
+    last_login = sa.Column(sa.DateTime(timezone=True), nullable=False)
+    """Time when the user last logged in that day."""
+
+
 class DbToken(db.ModelBase):
     """
     Contains the user sessions.
@@ -116,6 +171,7 @@ class DbToken(db.ModelBase):
         sa.PrimaryKeyConstraint('opaque_token'),
         sa.UniqueConstraint('opaque_token'),
         sa.CheckConstraint('issued < expires'),
+        sa.Index('ix_token_subject_issued', 'subject', 'issued'),
     )
 
     opaque_token = sa.Column(sa.String(), index=True, nullable=False)
@@ -140,5 +196,61 @@ class DbToken(db.ModelBase):
     expires = sa.Column(sa.DateTime(timezone=True), nullable=False)
     """Time when token expired"""
 
-    subject = sa.Column(sa.String(), index=True, nullable=False)
+    subject = sa.Column(sa.String(), nullable=False)
     """Unique subject which identifies the user"""
+
+
+class DbTokenDeletion(db.ModelBase):
+    """
+    Log of tokens deleted (revoked) before they expired.
+
+    Rows are inserted by a trigger on the token table, so processes
+    syncing their token cache (see token_sync.py) learn about tokens
+    revoked by any process. Old rows are deleted by maintenance.
+    """
+
+    __tablename__ = 'token_deletion'
+    __table_args__ = (
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('ix_token_deletion_deleted', 'deleted'),
+    )
+
+    id = sa.Column(sa.BigInteger(), autoincrement=True)
+    """Unique id for the Database record."""
+
+    opaque_token = sa.Column(sa.String(), nullable=False)
+    """Opaque token of the deleted token."""
+
+    deleted = sa.Column(sa.DateTime(timezone=True), nullable=False,
+                        server_default=sa.func.clock_timestamp())
+    """Time when the token was deleted."""
+
+
+LOG_TOKEN_DELETION_FUNCTION = """
+CREATE FUNCTION log_token_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO token_deletion (opaque_token)
+    SELECT opaque_token FROM deleted_token WHERE expires > now();
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+LOG_TOKEN_DELETION_TRIGGER = """
+CREATE TRIGGER token_deletion_log
+AFTER DELETE ON token
+REFERENCING OLD TABLE AS deleted_token
+FOR EACH STATEMENT EXECUTE FUNCTION log_token_deletion()
+"""
+
+sa.event.listen(
+    DbTokenDeletion.__table__,
+    'after_create',
+    sa.DDL(LOG_TOKEN_DELETION_FUNCTION),
+)
+
+sa.event.listen(
+    DbTokenDeletion.__table__,
+    'after_create',
+    sa.DDL(LOG_TOKEN_DELETION_TRIGGER),
+)
@@ -0,0 +1,155 @@
+# Standard Library
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+
+@lru_cache(maxsize=256)
+def parse_quality_header(value: str) -> Tuple[Tuple[str, float], ...]:
+    """
+    Parse a HTTP header with quality values, ie. Accept-Encoding.
+
+    Returns the values ordered by quality (highest first), preserving
+    the order in which they appear in the header for equal qualities.
+    Values with quality 0 (not acceptable) are included.
+    Results are cached, as clients tend to send identical headers.
+
+    Example: 'gzip;q=0.5, br' -> (('br', 1.0), ('gzip', 0.5))
+
+    :param value: Header value
+    :returns: Tuple of (value, quality), lowercase
+    """
+    parsed = []
+
+    for part in value.split(','):
+        token, *params = part.strip().split(';')
+        token = token.strip().lower()
+
+        if not token:
+            continue
+
+        quality = 1.0
+
+        for param in params:
+            name, _, param_value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+
+        parsed.append((token, quality))
+
+    return tuple(sorted(parsed, key=lambda item: -item[1]))
+
+
+def negotiate_encoding(
+        accept_encoding: Optional[str],
+        available: Iterable[str],
+) -> Optional[str]:
+    """
+    Select a content-coding based on the client's Accept-Encoding header.
+
+    Encodings are preferred in the order they are provided by the server
+    among those the client accepts with the highest quality.
+
+    :param accept_encoding: Value of Accept-Encoding header (or None)
+    :param available: Content-codings the server can provide, preferred
+        first (ie. ('br', 'gzip'))
+    :returns: The selected content-coding, or None for identity
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+
+    for token, quality in parse_quality_header(accept_encoding):
+        qualities.setdefault(token, quality)
+
+    best_encoding = None
+    best_quality = 0.0
+
+    for encoding in available:
+        quality = qualities.get(encoding, qualities.get('*', 0.0))
+        if quality > best_quality:
+            best_encoding = encoding
+            best_quality = quality
+
+    return best_encoding
+
+
+@lru_cache(maxsize=256)
+def parse_etags(value: str) -> FrozenSet[str]:
+    """
+    Parse the entity tags in an If-None-Match header.
+
+    Weak tags are returned as their strong counterpart, as If-None-Match
+    uses weak comparison.
+
+    :param value: Header value
+    :returns: Set of (quoted) entity tags, or {'*'}
+    """
+    tags = set()
+
+    for tag in value.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag:
+            tags.add(tag)
+
+    return frozenset(tags)
+
+
+def if_none_match(
+        if_none_match_header: Optional[str],
+        etags: Iterable[str],
+) -> bool:
+    """
+    Check whether a conditional request matches any of the provided ETags.
+
+    :param if_none_match_header: Value of If-None-Match header (or None)
+    :param etags: Current (quoted) entity tags of the resource
+    :returns: True if the client's copy is current (respond with 304)
+    """
+    if not if_none_match_header:
+        return False
+
+    requested = parse_etags(if_none_match_header)
+
+    return '*' in requested or not requested.isdisjoint(etags)
+
+
+@lru_cache(maxsize=1024)
+def negotiate_language(
+        accept_language: Optional[str],
+        available: FrozenSet[str],
+        default: str,
+) -> str:
+    """
+    Select a language based on the client's Accept-Language header.
+
+    For each language the client accepts (best first), an exact match is
+    tried before its primary language (ie. 'da-dk' falls back to 'da').
+    If nothing matches, the default language is used, or if that is
+    not available either, the first available language alphabetically.
+    Results are cached, so repeated lookups are constant time.
+
+    :param accept_language: Value of Accept-Language header (or None)
+    :param available: Languages available (lowercase)
+    :param default: Default language (lowercase)
+    :returns: The selected language
+    """
+    if accept_language:
+        for tag, quality in parse_quality_header(accept_language):
+            if quality <= 0:
+                continue
+            if tag in available:
+                return tag
+            primary = tag.split('-')[0]
+            if primary in available:
+                return primary
+
+    if default in available or not available:
+        return default
+
+    return min(available)
@@ -4,6 +4,7 @@ from auth_api.config import (
     OIDC_LOGIN_URL,
     OIDC_TOKEN_URL,
     OIDC_JWKS_URL,
+    OIDC_JWKS_CACHE_TTL,
     OIDC_API_LOGOUT_URL,
 )
 
@@ -17,6 +18,7 @@ from .signaturgruppen import SignaturgruppenBackend
 # it for integration testing, without having to mock anything else :-)
 session = OAuth2Session(
     jwk_endpoint=OIDC_JWKS_URL,
+    jwk_cache_ttl=OIDC_JWKS_CACHE_TTL,
     api_logout_url=OIDC_API_LOGOUT_URL,
     client_id=OIDC_CLIENT_ID,
     client_secret=OIDC_CLIENT_SECRET,
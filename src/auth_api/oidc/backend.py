@@ -1,8 +1,14 @@
+import asyncio
+import logging
 from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
 
 from .session import OAuth2Session
 from .models import OpenIDConnectToken
 
+logger = logging.getLogger(__name__)
+
 
 class OpenIDConnectBackend(object):
     """
@@ -48,6 +54,26 @@ class OpenIDConnectBackend(object):
 
         raise NotImplementedError
 
+    @abstractmethod
+    async def fetch_token_async(
+            self,
+            code: str,
+            state: str,
+            redirect_uri: str,
+    ) -> OpenIDConnectToken:
+        """
+        Fetch a token from the Identity Provider, asynchronously.
+
+        Same as fetch_token(), but does not block while waiting for the
+        Identity Provider to respond.
+
+        :param code: Authorization code provided to the callback endpoint
+        :param state: State provided to the callback endpoint
+        :param redirect_uri: URL of the callback endpoint
+        :returns: The token
+        """
+        raise NotImplementedError
+
     def logout(self, id_token: str):
         """
         Call OpenID Connect Identity provider logout endpoint.
@@ -58,3 +84,68 @@ class OpenIDConnectBackend(object):
         redirected to the authorization URL.
         """
         self.session.logout(id_token)
+
+    def logout_many(self, id_tokens: Iterable[str], max_workers: int) -> int:
+        """
+        Call OpenID Connect Identity provider logout endpoint for many tokens.
+
+        Back-channel logouts are invoked concurrently, but with at most
+        max_workers requests in flight at a time. Failing logouts are
+        logged, but does not stop the remaining logouts.
+
+        :param id_tokens: ID-tokens to log out
+        :param max_workers: Max. no. of concurrent logout requests
+        :returns: No. of failed logouts
+        """
+        def _logout(id_token: str) -> bool:
+            try:
+                self.logout(id_token)
+            except Exception:
+                logger.exception('Back-channel logout failed')
+                return False
+            return True
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(_logout, id_tokens))
+
+        return results.count(False)
+
+    async def logout_async(self, id_token: str):
+        """
+        Call OpenID Connect Identity provider logout endpoint, asynchronously.
+
+        :param id_token: ID-token to log out
+        """
+        await self.session.logout_async(id_token)
+
+    async def logout_many_async(
+            self,
+            id_tokens: Iterable[str],
+            max_concurrency: int,
+    ) -> int:
+        """
+        Call OpenID Connect Identity provider logout endpoint for many tokens.
+
+        Same as logout_many(), but asynchronously, with at most
+        max_concurrency requests in flight at a time.
+
+        :param id_tokens: ID-tokens to log out
+        :param max_concurrency: Max. no. of concurrent logout requests
+        :returns: No. of failed logouts
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _logout(id_token: str) -> bool:
+            async with semaphore:
+                try:
+                    await self.logout_async(id_token)
+                except Exception:
+                    logger.exception('Back-channel logout failed')
+                    return False
+                return True
+
+        results = await asyncio.gather(*(
+            _logout(id_token) for id_token in id_tokens
+        ))
+
+        return results.count(False)
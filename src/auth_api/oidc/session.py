@@ -1,32 +1,165 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
 import requests
 from authlib.integrations.requests_client import \
     OAuth2Session as _OAuth2Session
 
+try:
+    from authlib.integrations.httpx_client import AsyncOAuth2Client
+except ImportError:
+    # httpx is only required by asynchronous endpoints
+    AsyncOAuth2Client = None
+
+from ..metrics import IDP_FETCH_JWKS, IDP_FETCH_TOKEN, IDP_LOGOUT
+
 
 class OAuth2Session(_OAuth2Session):
-    """Adds a few useful methods to the default OAuth2Session from authlib."""
+    """
+    Adds a few useful methods to the default OAuth2Session from authlib.
+
+    The Identity Provider's keys (JWKS) are cached for jwk_cache_ttl
+    seconds, so they are not fetched on every login.
+
+    Asynchronous methods share a single client (and its connections),
+    which must be opened using open_async() before, and closed using
+    close_async() after, they are used (ie. on startup and shutdown of
+    the ASGI application).
+    """
 
     def __init__(
             self,
             jwk_endpoint: str,
             api_logout_url: str,
+            jwk_cache_ttl: float = 0,
             **kwargs,
     ):
         """Construct a OAuth 2 client session."""
         self.jwk_endpoint = jwk_endpoint
         self.api_logout_url = api_logout_url
+        self.jwk_cache_ttl = jwk_cache_ttl
+        self._jwk: Optional[str] = None
+        self._jwk_expires = 0.0
+        self._jwk_lock = threading.Lock()
+        self._async_client: Optional[AsyncOAuth2Client] = None
         super(OAuth2Session, self).__init__(**kwargs)
 
-    def get_jwk(self) -> str:
-        """TODO."""
+    async def open_async(self, **kwargs):
+        """
+        Open the client shared by asynchronous methods.
+
+        :param kwargs: Passed on to the client (ie. limits or transport)
+        """
+        if AsyncOAuth2Client is None:
+            raise RuntimeError('httpx must be installed to open async client')
+
+        if self._async_client is None:
+            self._async_client = AsyncOAuth2Client(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+                **kwargs,
+            )
+
+    async def close_async(self):
+        """Close the client shared by asynchronous methods."""
+
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+    @property
+    def async_client(self) -> AsyncOAuth2Client:
+        """Return the client shared by asynchronous methods."""
+
+        if self._async_client is None:
+            raise RuntimeError('Async client is not open (see open_async())')
+
+        return self._async_client
+
+    def fetch_token(self, *args, **kwargs):
+        """Fetch a token from the Identity Provider, recording metrics."""
+
+        with IDP_FETCH_TOKEN.time():
+            return super(OAuth2Session, self).fetch_token(*args, **kwargs)
+
+    async def fetch_token_async(self, **kwargs) -> Dict[str, Any]:
+        """
+        Fetch a token from the Identity Provider, asynchronously.
+
+        Same as fetch_token(), but does not block while waiting for the
+        Identity Provider to respond.
+        """
+        with IDP_FETCH_TOKEN.time():
+            return await self.async_client.fetch_token(**kwargs)
+
+    def _get_cached_jwk(self, refresh: bool) -> Optional[str]:
+        """Return the Identity Provider's keys if cached (and not expired)."""
+
+        if not refresh \
+                and self._jwk is not None \
+                and time.monotonic() < self._jwk_expires:
+            return self._jwk
+
+        return None
 
-        # TODO Cache result in a period
-        jwks_response = requests.get(
-            url=self.jwk_endpoint,
-            verify=True,
-        )
+    def _cache_jwk(self, jwk: str, status_code: int):
+        """Cache the Identity Provider's keys, if fetched successfully."""
 
-        return jwks_response.content.decode()
+        if status_code == 200 and self.jwk_cache_ttl > 0:
+            self._jwk = jwk
+            self._jwk_expires = time.monotonic() + self.jwk_cache_ttl
+
+    def get_jwk(self, refresh: bool = False) -> str:
+        """
+        Return the Identity Provider's keys (JWKS), cached if possible.
+
+        :param refresh: Fetch the keys even if they are cached (ie. if
+            the Identity Provider might have rotated its keys)
+        """
+        with self._jwk_lock:
+            jwk = self._get_cached_jwk(refresh)
+
+            if jwk is not None:
+                return jwk
+
+            with IDP_FETCH_JWKS.time():
+                jwks_response = requests.get(
+                    url=self.jwk_endpoint,
+                    verify=True,
+                )
+
+            jwk = jwks_response.content.decode()
+            self._cache_jwk(jwk, jwks_response.status_code)
+
+            return jwk
+
+    async def get_jwk_async(self, refresh: bool = False) -> str:
+        """
+        Return the Identity Provider's keys (JWKS), asynchronously.
+
+        Same as get_jwk(), and shares its cache. Concurrent requests may
+        fetch the keys at the same time when they are not cached, instead
+        of waiting for each other.
+
+        :param refresh: Fetch the keys even if they are cached
+        """
+        jwk = self._get_cached_jwk(refresh)
+
+        if jwk is not None:
+            return jwk
+
+        with IDP_FETCH_JWKS.time():
+            jwks_response = await self.async_client.request(
+                method='GET',
+                url=self.jwk_endpoint,
+                withhold_token=True,
+            )
+
+        jwk = jwks_response.content.decode()
+        self._cache_jwk(jwk, jwks_response.status_code)
+
+        return jwk
 
     def logout(self, id_token: str):
         """
@@ -38,11 +171,32 @@ class OAuth2Session(_OAuth2Session):
         redirected to the authorization URL.
         """
 
-        response = requests.post(
-            url=self.api_logout_url,
-            json={'id_token': id_token},
-        )
+        with IDP_LOGOUT.time():
+            response = requests.post(
+                url=self.api_logout_url,
+                json={'id_token': id_token},
+            )
+
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f'Logout returned status {response.status_code}')
+
+    async def logout_async(self, id_token: str):
+        """
+        Logout the user from used Identity Provider, asynchronously.
+
+        Same as logout(), but does not block while waiting for the
+        Identity Provider to respond.
+        """
+
+        with IDP_LOGOUT.time():
+            response = await self.async_client.request(
+                method='POST',
+                url=self.api_logout_url,
+                json={'id_token': id_token},
+                withhold_token=True,
+            )
 
-        if response.status_code != 200:
-            raise RuntimeError(
-                f'Logout returned status {response.status_code}')
+            if response.status_code != 200:
+                raise RuntimeError(
+                    f'Logout returned status {response.status_code}')
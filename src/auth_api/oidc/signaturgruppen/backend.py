@@ -1,6 +1,8 @@
 import json
 from typing import Optional
 
+from authlib.jose.errors import JoseError
+
 from ..backend import OpenIDConnectBackend
 
 from .models import SignaturgruppenToken
@@ -83,7 +85,46 @@ class SignaturgruppenBackend(OpenIDConnectBackend):
             verify=True,
         )
 
-        return SignaturgruppenToken.from_raw_token(
-            raw_token=raw_token,
-            jwk=self.session.get_jwk(),
+        try:
+            return SignaturgruppenToken.from_raw_token(
+                raw_token=raw_token,
+                jwk=self.session.get_jwk(),
+            )
+        except (JoseError, ValueError):
+            # The keys may have been rotated since they were cached
+            return SignaturgruppenToken.from_raw_token(
+                raw_token=raw_token,
+                jwk=self.session.get_jwk(refresh=True),
+            )
+
+    async def fetch_token_async(
+            self,
+            code: str,
+            state: str,
+            redirect_uri: str,
+    ) -> SignaturgruppenToken:
+        """
+        Fetch a token from the Identity Provider, asynchronously.
+
+        Same as fetch_token(), but does not block while waiting for the
+        Identity Provider to respond.
+        """
+        raw_token = await self.session.fetch_token_async(
+            url=self.token_endpoint,
+            grant_type='authorization_code',
+            code=code,
+            state=state,
+            redirect_uri=redirect_uri,
         )
+
+        try:
+            return SignaturgruppenToken.from_raw_token(
+                raw_token=raw_token,
+                jwk=await self.session.get_jwk_async(),
+            )
+        except (JoseError, ValueError):
+            # The keys may have been rotated since they were cached
+            return SignaturgruppenToken.from_raw_token(
+                raw_token=raw_token,
+                jwk=await self.session.get_jwk_async(refresh=True),
+            )
@@ -1,6 +1,7 @@
 # Standard Library
 from dataclasses import dataclass, field
 from datetime import datetime, timezone
+from functools import partial
 from typing import Optional
 from xmlrpc.client import Boolean
 
@@ -11,13 +12,10 @@ from origin.api import (
     TemporaryRedirect,
 )
 from origin.auth import TOKEN_COOKIE_NAME
-from origin.encrypt import aes256_decrypt
-from origin.tokens import TokenEncoder
 from origin.tools import url_append
 
 # Local
 from auth_api.config import (
-    INTERNAL_TOKEN_SECRET,
     STATE_ENCRYPTION_SECRET,
     TOKEN_COOKIE_DOMAIN,
     TOKEN_COOKIE_HTTP_ONLY,
@@ -28,9 +26,12 @@ from auth_api.config import (
 )
 from auth_api.controller import db_controller
 from auth_api.db import db
+from auth_api.login_records import login_record_buffer
 from auth_api.models import DbUser
 from auth_api.user import create_or_get_user
 from auth_api.state import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
+from auth_api.transactions import on_commit
 
 from auth_api.oidc import (
     oidc_backend,
@@ -58,9 +59,11 @@ class NextStep:
     cookie: Optional[Cookie] = field(default=None)
 
 
-state_encoder = TokenEncoder(
+# The entire state is encrypted, as it carries the Identity Provider's
+# id_token (among other things) through the client
+state_encoder = EncryptedTokenEncoder(
     schema=AuthState,
-    secret=INTERNAL_TOKEN_SECRET,
+    secret=STATE_ENCRYPTION_SECRET,
 )
 
 
@@ -190,26 +193,35 @@ class LoginOrchestrator:
         Register user login and creates cookie.
 
         Register user login after completed registration and create http only
-        cookie.
+        cookie. If login records are written behind, the login is recorded
+        outside of the transaction, once (and if) it is committed.
         """
-        db_controller.register_user_login(
-            session=self.session,
-            user=self.user,
-        )
-
         issued = datetime.now(tz=timezone.utc)
 
-        opaque_token = db_controller.create_token(
-            session=self.session,
-            issued=issued,
-            expires=issued + TOKEN_EXPIRY_DELTA,
-            subject=self.user.subject,
-            scope=TOKEN_DEFAULT_SCOPES,
-            id_token=aes256_decrypt(
-                self.state.id_token,
-                STATE_ENCRYPTION_SECRET
-            ),
-        )
+        if login_record_buffer is not None:
+            opaque_token = db_controller.create_token(
+                session=self.session,
+                issued=issued,
+                expires=issued + TOKEN_EXPIRY_DELTA,
+                subject=self.user.subject,
+                scope=TOKEN_DEFAULT_SCOPES,
+                id_token=self.state.id_token,
+            )
+
+            on_commit(self.session, partial(
+                login_record_buffer.add,
+                subject=self.user.subject,
+                created=issued,
+            ))
+        else:
+            opaque_token = db_controller.log_in_user(
+                session=self.session,
+                user=self.user,
+                issued=issued,
+                expires=issued + TOKEN_EXPIRY_DELTA,
+                scope=TOKEN_DEFAULT_SCOPES,
+                id_token=self.state.id_token,
+            )
 
         return Cookie(
             name=TOKEN_COOKIE_NAME,
@@ -1,8 +1,19 @@
-from sqlalchemy import orm, func, and_
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import orm, func, and_, any_, literal, tuple_
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import String
 
 from origin.sql import SqlQuery
 
-from .models import DbUser, DbExternalUser, DbToken, DbLoginRecord
+from .models import (
+    DbUser,
+    DbExternalUser,
+    DbToken,
+    DbLoginRecord,
+    DbLoginDaily,
+)
 
 
 class UserQuery(SqlQuery):
@@ -22,6 +33,15 @@ class UserQuery(SqlQuery):
 
         return self.filter(DbUser.ssn == ssn)
 
+    def has_ssn_index(self, ssn_index: str) -> 'UserQuery':
+        """
+        Check if the actor's ssn matches a ssn in the database.
+
+        :param ssn_index: Blind index of social security number
+        """
+
+        return self.filter(DbUser.ssn_index == ssn_index)
+
     def has_tin(self, tin: str) -> 'UserQuery':
         """
         Check if the subject's tin matches a tin in the database.
@@ -30,6 +50,29 @@ class UserQuery(SqlQuery):
         """
         return self.filter(DbUser.tin == tin)
 
+    def has_external_user(
+            self,
+            identity_provider: str,
+            external_subject: str,
+    ) -> 'UserQuery':
+        """
+        Check if the user has the external user attached.
+
+        Joins the external users, so the user is found in a single query.
+
+        :param identity_provider: ID/name of Identity Provider
+        :param external_subject: Identity Provider's subject
+        """
+        query = self.q.join(
+            DbExternalUser,
+            DbExternalUser.subject == DbUser.subject,
+        )
+
+        return self.__class__(self.session, query).filter(
+            DbExternalUser.identity_provider == identity_provider,
+            DbExternalUser.external_subject == external_subject,
+        )
+
 
 class ExternalUserQuery(SqlQuery):
     """Query DbExternalUser."""
@@ -75,6 +118,59 @@ class LoginRecordQuery(SqlQuery):
 
         return self.filter(DbLoginRecord.subject == subject)
 
+    def is_before(self, created: datetime, id: int) -> 'LoginRecordQuery':
+        """
+        Only include records before the provided record (newest first).
+
+        Used for keyset pagination, together with newest_first().
+
+        :param created: Time the record was created
+        :param id: ID of the record
+        """
+
+        columns = tuple_(DbLoginRecord.created, DbLoginRecord.id)
+
+        return self.filter(columns < tuple_(created, id))
+
+    def newest_first(self) -> 'LoginRecordQuery':
+        """Order records by the time they were created, newest first."""
+
+        return self.__class__(self.session, self.q.order_by(
+            DbLoginRecord.created.desc(),
+            DbLoginRecord.id.desc(),
+        ))
+
+
+class LoginDailyQuery(SqlQuery):
+    """
+    Query DbLoginDaily.
+
+    Use this (rather than LoginRecordQuery) to look up when users logged
+    in, as the aggregate is compact and kept after login records expire.
+    The aggregate is only as recent as the last rollup of login records.
+    """
+
+    def _get_base_query(self) -> orm.Query:
+        """Override function used in base class."""
+
+        return self.session.query(DbLoginDaily)
+
+    def has_subject(self, subject: str) -> 'LoginDailyQuery':
+        """
+        Check if the subject exists in the database.
+
+        param subject: ID/Name of the subject
+        """
+
+        return self.filter(DbLoginDaily.subject == subject)
+
+    def last_login(self) -> Optional[datetime]:
+        """Return the time of the latest login, if any."""
+
+        return self.q \
+            .with_entities(func.max(DbLoginDaily.last_login)) \
+            .scalar()
+
 
 class TokenQuery(SqlQuery):
     """Query DbToken."""
@@ -93,6 +189,20 @@ class TokenQuery(SqlQuery):
 
         return self.filter(DbToken.opaque_token == opaque_token)
 
+    def has_any_opaque_token(self, opaque_tokens: List[str]) -> 'TokenQuery':
+        """
+        Check if the token is any of the opaque tokens.
+
+        The tokens are passed as a single array parameter
+        (opaque_token = ANY(...)), regardless of how many there are.
+
+        param opaque_tokens: Primary Key Constraints
+        """
+
+        tokens = literal(opaque_tokens, ARRAY(String))
+
+        return self.filter(DbToken.opaque_token == any_(tokens))
+
     def is_valid(self) -> 'TokenQuery':
         """Check if the token has a correct issued and expires datetime."""
 
@@ -100,3 +210,34 @@ class TokenQuery(SqlQuery):
             DbToken.issued <= func.now(),
             DbToken.expires > func.now(),
         ))
+
+    def has_subject(self, subject: str) -> 'TokenQuery':
+        """
+        Check if the token is issued to the subject.
+
+        param subject: ID/Name of the subject
+        """
+
+        return self.filter(DbToken.subject == subject)
+
+    def is_before(self, issued: datetime, opaque_token: str) -> 'TokenQuery':
+        """
+        Only include tokens before the provided token (newest first).
+
+        Used for keyset pagination, together with newest_first().
+
+        :param issued: Time the token was issued
+        :param opaque_token: The opaque token
+        """
+
+        columns = tuple_(DbToken.issued, DbToken.opaque_token)
+
+        return self.filter(columns < tuple_(issued, opaque_token))
+
+    def newest_first(self) -> 'TokenQuery':
+        """Order tokens by the time they were issued, newest first."""
+
+        return self.__class__(self.session, self.q.order_by(
+            DbToken.issued.desc(),
+            DbToken.opaque_token.desc(),
+        ))
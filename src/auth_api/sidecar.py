@@ -0,0 +1,91 @@
+"""
+ForwardAuth sidecar, looking up tokens in a memory-mapped snapshot.
+
+Serves the ForwardAuth endpoint exactly like the standalone ForwardAuth
+service (see forward_auth.py), but looks up tokens in the snapshot
+written by the snapshot writer (see snapshot.py), so it can run next to
+the gateway without any database connections.
+
+Tokens revoked are rejected once the writer has appended them to the
+delta log, ie. within SNAPSHOT_INTERVAL + SNAPSHOT_CHECK_INTERVAL
+seconds. If the snapshot is missing, or has not been updated for
+SNAPSHOT_MAX_AGE seconds, requests fail (status 500), so the gateway
+denies them instead of accepting revoked tokens.
+
+Only imports edge.py (never auth_api.config, the database or the rest of
+the service), so it only requires the SNAPSHOT_* settings below, and
+neither loads SQLAlchemy nor database drivers. Run it using an ASGI
+server, ie.:
+
+    uvicorn auth_api.sidecar:app
+"""
+
+# Standard Library
+from typing import Optional
+
+# Third party
+from decouple import config
+
+# Local
+from .edge import CachedToken, ForwardAuthApp, SnapshotReader, TokenSource
+
+# -- Configuration -----------------------------------------------------------
+
+# Path of the snapshot of valid tokens written by the snapshot writer, same
+# as (and read here instead of) auth_api.config.SNAPSHOT_PATH
+SNAPSHOT_PATH = config('SNAPSHOT_PATH', default='/var/lib/auth/tokens.snap')
+
+# Seconds between sidecars checking for a new snapshot and changes
+SNAPSHOT_CHECK_INTERVAL = config(
+    'SNAPSHOT_CHECK_INTERVAL', default=1, cast=float)
+
+# Seconds after which sidecars stop serving a snapshot the writer no longer
+# updates, so revoked tokens are not accepted indefinitely
+SNAPSHOT_MAX_AGE = config('SNAPSHOT_MAX_AGE', default=60, cast=float)
+
+
+# -- Token source ------------------------------------------------------------
+
+
+class SnapshotTokenSource(TokenSource):
+    """
+    Looks up valid tokens in a snapshot.
+
+    :param reader: Reader of the snapshot
+    """
+
+    def __init__(self, reader: SnapshotReader):
+        self.reader = reader
+
+    async def start(self):
+        """Map the snapshot, if it has been written."""
+
+        self.reader.refresh()
+
+    async def stop(self):
+        """Unmap the snapshot."""
+
+        self.reader.close()
+
+    async def fetch(self, opaque_token: str) -> Optional[CachedToken]:
+        """
+        Look up a valid token by opaque token.
+
+        :param opaque_token: Opaque token
+        :returns: The token, or None if it is not valid
+        """
+        return self.reader.get(opaque_token)
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+app = ForwardAuthApp(
+    source=SnapshotTokenSource(reader=SnapshotReader(
+        path=SNAPSHOT_PATH,
+        check_interval=SNAPSHOT_CHECK_INTERVAL,
+        max_age=SNAPSHOT_MAX_AGE,
+    )),
+    cache=None,
+)
+"""ASGI application."""
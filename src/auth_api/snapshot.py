@@ -0,0 +1,292 @@
+"""
+Memory-mapped snapshot of valid tokens, for ForwardAuth sidecars.
+
+A single snapshot writer (entrypoint_snapshot.sh) writes all valid tokens
+to a compact file every SNAPSHOT_FULL_INTERVAL seconds, and appends the
+tokens issued and revoked meanwhile to a small delta log every
+SNAPSHOT_INTERVAL seconds. ForwardAuth sidecars next to the gateway
+(see sidecar.py) memory-map the snapshot and look up tokens in it,
+without any database connections.
+
+The format of the snapshot and its delta log, and the reader used by
+sidecars, are in edge.py (which sidecars import without the rest of the
+service).
+
+Both files are replaced atomically (renamed), and a delta log only
+applies to the snapshot of the same generation. Tokens changed while the
+snapshot is written are appended to the delta log afterwards (ie. by
+looking back SNAPSHOT_OVERLAP seconds).
+"""
+
+# Standard Library
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, Iterator, Optional, Tuple
+
+# Third party
+import sqlalchemy as sa
+
+# First party
+from origin.sql import SqlEngine
+
+# Local
+from .config import (
+    SNAPSHOT_FULL_INTERVAL,
+    SNAPSHOT_INTERVAL,
+    SNAPSHOT_OVERLAP,
+    SNAPSHOT_PATH,
+)
+from .db import admin_db
+from .edge import (
+    DELTA_HEADER,
+    DELTA_MAGIC,
+    ENTRY,
+    HEADER,
+    OP_ADDED,
+    OP_DELETED,
+    RECORD,
+    SNAPSHOT_MAGIC,
+    delta_log_path,
+    token_key,
+)
+from .models import DbToken
+from .token_sync import fetch_token_changes
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _atomic_file(path: str) -> Iterator[BinaryIO]:
+    """
+    Yield a temporary file, which replaces the file at path when closed.
+
+    :param path: Path of the file to replace
+    """
+    fd, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.',
+        prefix=f'.{os.path.basename(path)}.',
+    )
+
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            yield file
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_snapshot(
+        path: str,
+        generation: int,
+        tokens: Iterable[Tuple[str, str, datetime]],
+) -> int:
+    """
+    Write (replace) a snapshot, and start a new (empty) delta log.
+
+    :param path: Path of the snapshot
+    :param generation: Generation of the snapshot (unique)
+    :param tokens: Valid tokens (opaque_token, internal_token, expires)
+    :returns: The number of tokens written
+    """
+    entries = sorted(
+        (token_key(opaque_token), internal_token.encode(), expires)
+        for opaque_token, internal_token, expires in tokens
+    )
+
+    with _atomic_file(path) as file:
+        file.write(HEADER.pack(SNAPSHOT_MAGIC, generation, len(entries)))
+
+        for key, _, _ in entries:
+            file.write(key)
+
+        offset = 0
+
+        for _, internal_token, expires in entries:
+            file.write(ENTRY.pack(
+                int(expires.timestamp()), offset, len(internal_token)))
+            offset += len(internal_token)
+
+        for _, internal_token, _ in entries:
+            file.write(internal_token)
+
+    with _atomic_file(delta_log_path(path)) as file:
+        file.write(DELTA_HEADER.pack(DELTA_MAGIC, generation))
+
+    return len(entries)
+
+
+def append_delta(
+        path: str,
+        tokens: Iterable[Tuple[str, str, datetime]],
+        deleted: Iterable[str],
+):
+    """
+    Append tokens issued and deleted to the delta log of a snapshot.
+
+    Also marks the delta log as updated, even if there are no changes,
+    so readers know the snapshot is still maintained.
+
+    :param path: Path of the snapshot
+    :param tokens: Valid tokens (opaque_token, internal_token, expires)
+    :param deleted: Opaque tokens deleted
+    """
+    records = []
+
+    for opaque_token, internal_token, expires in tokens:
+        data = internal_token.encode()
+        records.append(RECORD.pack(
+            OP_ADDED, token_key(opaque_token),
+            int(expires.timestamp()), len(data),
+        ))
+        records.append(data)
+
+    for opaque_token in deleted:
+        records.append(RECORD.pack(OP_DELETED, token_key(opaque_token), 0, 0))
+
+    # Appended using a single write, so readers rarely see partial records
+    with open(delta_log_path(path), 'ab') as file:
+        file.write(b''.join(records))
+
+    os.utime(delta_log_path(path))
+
+
+class SnapshotWriter(object):
+    """
+    Writes snapshots of valid tokens, and appends changes in between.
+
+    :param db: Database
+    :param path: Path of the snapshot
+    :param interval: Seconds between appending changes
+    :param full_interval: Seconds between complete snapshots
+    :param overlap: Seconds to look back before the previous changes
+    """
+
+    def __init__(
+            self,
+            db: SqlEngine,
+            path: str,
+            interval: float,
+            full_interval: float,
+            overlap: float,
+    ):
+        self.db = db
+        self.path = path
+        self.interval = interval
+        self.full_interval = full_interval
+        self.overlap = overlap
+        self.snapshots = 0
+        self.deltas = 0
+        self.failures = 0
+        self.tokens = 0
+        self._watermark: Optional[datetime] = None
+        self._written: Optional[float] = None
+        self._stopped = threading.Event()
+
+    def write(self):
+        """Write a snapshot if one is due, otherwise append changes."""
+
+        if self._written is None \
+                or time.monotonic() - self._written >= self.full_interval:
+            self.write_snapshot()
+        else:
+            self.write_delta()
+
+    def write_snapshot(self) -> int:
+        """
+        Write a snapshot of all valid tokens.
+
+        :returns: The number of tokens written
+        """
+        with self.db.engine.connect() as connection:
+            started = connection.execute(
+                sa.select(sa.func.clock_timestamp())).scalar_one()
+
+            query = (
+                sa.select(
+                    DbToken.opaque_token,
+                    DbToken.internal_token,
+                    DbToken.expires,
+                )
+                .where(DbToken.issued <= sa.func.now())
+                .where(DbToken.expires > sa.func.now())
+            )
+
+            tokens = connection \
+                .execution_options(stream_results=True) \
+                .execute(query)
+
+            count = write_snapshot(self.path, time.time_ns(), tokens)
+
+        self._watermark = started
+        self._written = time.monotonic()
+        self.snapshots += 1
+        self.tokens = count
+
+        logger.info('Wrote snapshot of %d tokens to %s', count, self.path)
+
+        return count
+
+    def write_delta(self) -> Tuple[int, int]:
+        """
+        Append tokens issued and deleted since the previous write.
+
+        :returns: The number of tokens added and deleted
+        """
+        with self.db.engine.connect() as connection:
+            started = connection.execute(
+                sa.select(sa.func.clock_timestamp())).scalar_one()
+
+            tokens, deleted = fetch_token_changes(
+                connection, self._watermark - timedelta(seconds=self.overlap))
+
+        append_delta(self.path, tokens, deleted)
+
+        self._watermark = started
+        self.deltas += 1
+
+        return len(tokens), len(deleted)
+
+    def run(self):
+        """Write every interval (in the current thread) until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                self.write()
+            except Exception:
+                self.failures += 1
+                logger.warning('Failed to write token snapshot', exc_info=True)
+
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        """Stop writing."""
+
+        self._stopped.set()
+
+
+def serve():
+    """Run the snapshot writer until terminated."""
+
+    os.makedirs(os.path.dirname(SNAPSHOT_PATH) or '.', exist_ok=True)
+
+    writer = SnapshotWriter(
+        db=admin_db,
+        path=SNAPSHOT_PATH,
+        interval=SNAPSHOT_INTERVAL,
+        full_interval=SNAPSHOT_FULL_INTERVAL,
+        overlap=SNAPSHOT_OVERLAP,
+    )
+
+    logger.info('Writing token snapshots to %s', SNAPSHOT_PATH)
+    writer.run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    serve()
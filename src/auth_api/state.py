@@ -6,8 +6,14 @@ from typing import Optional
 from origin.api import TemporaryRedirect
 from origin.tools import url_append
 
+from auth_api.metrics import OIDC_ERRORS
 from auth_api.oidc import OIDC_ERROR_CODES
 
+# Children of OIDC_ERRORS, bound up front
+_oidc_errors = {
+    code: OIDC_ERRORS.labels(code=code) for code in OIDC_ERROR_CODES
+}
+
 
 @dataclass
 class AuthState:
@@ -15,7 +21,7 @@ class AuthState:
     AuthState is an intermediate token.
 
     AuthState is an intermediate token generated when the user requests
-    an authorization URL. It encodes to a [JWT] string.
+    an authorization URL. It encodes to an encrypted string.
     The token is included in the authorization URL, and is returned by the
     OIDC Identity Provider when the client is redirected back.
     It provides a way to keep this service stateless.
@@ -40,6 +46,8 @@ def build_failure_url(
 
     Builds the URL used for redirecting.
     """
+    _oidc_errors[error_code].inc()
+
     query = {
         'success': '0',
         'error_code': error_code,
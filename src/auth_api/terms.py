@@ -0,0 +1,329 @@
+# Standard Library
+import logging
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Third party
+import markdown2
+
+# Local
+from .config import (
+    TERMS_DEFAULT_LANGUAGE,
+    TERMS_MARKDOWN_FOLDER,
+    TERMS_POLL_INTERVAL,
+)
+from .negotiation import negotiate_language
+
+logger = logging.getLogger(__name__)
+
+
+Fingerprint = Tuple[Tuple[str, int, int], ...]
+
+
+@dataclass(frozen=True)
+class Terms:
+    """
+    A single version of the terms and conditions, rendered as HTML.
+
+    Each version can exist in multiple languages.
+    """
+
+    version: str
+    language: str
+    headline: str
+    html: str
+
+
+@dataclass(frozen=True)
+class TermsSnapshot:
+    """
+    All versions of the terms loaded from the terms folder at some point.
+
+    Snapshots are immutable, and the registry swaps to a new snapshot
+    when the folder changes, so readers never see a partially loaded set
+    of terms.
+
+    :param versions: Terms per version, per language
+    :param latest: Newest version of the terms per language it is
+        translated to
+    :param latest_languages: Languages the newest version is available in
+    :param fingerprint: The files the snapshot was loaded from
+    """
+
+    versions: Dict[str, Dict[str, Terms]] = field(default_factory=dict)
+    latest: Dict[str, Terms] = field(default_factory=dict)
+    latest_languages: FrozenSet[str] = field(default=frozenset())
+    fingerprint: Fingerprint = field(default=())
+
+
+def _version_sort_key(version: str) -> List:
+    """
+    Natural sort key, so that for instance 'v10' is newer than 'v9'.
+
+    :param version: Terms version (file name without extension)
+    """
+    return [int(part) if part.isdigit() else part
+            for part in re.split(r'(\d+)', version)]
+
+
+class TermsRegistry(object):
+    """
+    In-memory registry of the terms and conditions.
+
+    Reads and renders every version of the terms (markdown files in the
+    terms folder) in every language once, and serves them from memory
+    afterwards. The folder is polled for changes (by file modification
+    times) at most once every poll_interval seconds; if anything changed,
+    all versions are reloaded and swapped in atomically. Terms files
+    should be written atomically (ie. written elsewhere and moved into
+    the folder).
+
+    The folder is structured with a sub-folder per language, each
+    containing a markdown file per version, and optionally a
+    headline.txt file. Files placed directly in the folder are in the
+    default language:
+
+        terms/v1.md
+        terms/v2.md
+        terms/da/headline.txt
+        terms/da/v2.md
+
+    The newest version is the newest across all languages. It is served
+    in the language preferred by the client among the languages it is
+    translated to, falling back to the default language.
+
+    :param folder: Folder containing terms as markdown files
+    :param poll_interval: Seconds between checking the folder for changes
+    :param default_language: Language of files placed directly in folder
+    :param headline: Headline used for languages without a headline.txt
+    """
+
+    FILE_EXTENSION = '.md'
+    HEADLINE_FILE = 'headline.txt'
+
+    def __init__(
+            self,
+            folder: str,
+            poll_interval: float,
+            default_language: str = 'en',
+            headline: str = 'Privacy Policy',
+    ):
+        self.folder = folder
+        self.poll_interval = poll_interval
+        self.default_language = default_language.lower()
+        self.headline = headline
+        self._snapshot: Optional[TermsSnapshot] = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    # -- Public interface ----------------------------------------------------
+
+    def latest(self, accept_language: Optional[str] = None) -> Terms:
+        """
+        Return the newest version of the terms.
+
+        :param accept_language: Languages preferred by the client, in the
+            format of the Accept-Language HTTP header
+        """
+        snapshot = self._get_snapshot()
+
+        if not snapshot.latest:
+            raise RuntimeError(f'No terms found in {self.folder}')
+
+        language = negotiate_language(
+            accept_language=accept_language,
+            available=snapshot.latest_languages,
+            default=self.default_language,
+        )
+
+        return snapshot.latest[language]
+
+    def get(
+            self,
+            version: str,
+            language: Optional[str] = None,
+    ) -> Optional[Terms]:
+        """
+        Return a specific version of the terms, if it exists.
+
+        :param version: Terms version
+        :param language: Language (defaults to the default language)
+        """
+        return self._get_snapshot().versions \
+            .get(version, {}) \
+            .get(language or self.default_language)
+
+    def has_version(self, version: str) -> bool:
+        """
+        Check whether a version of the terms exists (in any language).
+
+        :param version: Terms version
+        """
+        return version in self._get_snapshot().versions
+
+    def load(self) -> int:
+        """
+        Load and render all terms from the folder (unconditionally).
+
+        Raises RuntimeError if the terms can not be loaded.
+
+        :returns: Number of terms rendered (all versions and languages)
+        """
+        with self._lock:
+            self._snapshot = self._build_snapshot(self._fingerprint())
+            self._next_poll = time.monotonic() + self.poll_interval
+
+            return sum(map(len, self._snapshot.versions.values()))
+
+    # -- Internals -----------------------------------------------------------
+
+    def _get_snapshot(self) -> TermsSnapshot:
+        """Return current snapshot, reloading it first if necessary."""
+
+        if self._snapshot is None:
+            self.load()
+        elif time.monotonic() >= self._next_poll:
+            self._poll()
+
+        return self._snapshot
+
+    def _poll(self):
+        """
+        Reload terms if files have changed since last time.
+
+        Only one thread polls at a time; others keep serving the current
+        snapshot meanwhile. If reloading fails, the current snapshot is
+        kept and loading is retried next time.
+        """
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            self._next_poll = time.monotonic() + self.poll_interval
+            fingerprint = self._fingerprint()
+
+            if fingerprint != self._snapshot.fingerprint:
+                self._snapshot = self._build_snapshot(fingerprint)
+        except Exception:
+            logger.exception('Failed to reload terms from %s', self.folder)
+        finally:
+            self._lock.release()
+
+    def _fingerprint(self) -> Fingerprint:
+        """
+        Return path, modification time, and size of each relevant file.
+
+        Paths are relative to the folder, using '/' as separator.
+        """
+        fingerprint = []
+
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    with os.scandir(entry.path) as sub_entries:
+                        for sub_entry in sub_entries:
+                            if self._is_terms_file(sub_entry):
+                                stat = sub_entry.stat()
+                                fingerprint.append((
+                                    f'{entry.name}/{sub_entry.name}',
+                                    stat.st_mtime_ns,
+                                    stat.st_size,
+                                ))
+                elif self._is_terms_file(entry):
+                    stat = entry.stat()
+                    fingerprint.append(
+                        (entry.name, stat.st_mtime_ns, stat.st_size))
+
+        return tuple(sorted(fingerprint))
+
+    def _is_terms_file(self, entry: os.DirEntry) -> bool:
+        """Check whether a directory entry is relevant for the registry."""
+
+        if not entry.is_file():
+            return False
+
+        return entry.name == self.HEADLINE_FILE \
+            or entry.name.endswith(self.FILE_EXTENSION)
+
+    def _build_snapshot(self, fingerprint: Fingerprint) -> TermsSnapshot:
+        """
+        Read and render all terms files in the fingerprint.
+
+        :param fingerprint: Files to load
+        """
+        headlines = {}
+        files = []
+
+        for path, _, _ in fingerprint:
+            if '/' in path:
+                language, file_name = path.split('/')
+                language = language.lower()
+            else:
+                language, file_name = self.default_language, path
+
+            if file_name == self.HEADLINE_FILE:
+                headlines[language] = self._read(path).strip()
+            else:
+                files.append((language, file_name, path))
+
+        versions = {}
+
+        for language, file_name, path in files:
+            version = file_name[:-len(self.FILE_EXTENSION)]
+            versions.setdefault(version, {})[language] = Terms(
+                version=version,
+                language=language,
+                headline=headlines.get(language, self.headline),
+                html=self._render(path),
+            )
+
+        if versions:
+            latest = versions[max(versions, key=_version_sort_key)]
+        else:
+            latest = {}
+
+        return TermsSnapshot(
+            versions=versions,
+            latest=latest,
+            latest_languages=frozenset(latest),
+            fingerprint=fingerprint,
+        )
+
+    def _read(self, path: str) -> str:
+        """
+        Read a file in the folder.
+
+        :param path: Path relative to the folder
+        """
+        try:
+            with open(os.path.join(self.folder, path)) as file:
+                return file.read()
+        except Exception:
+            raise RuntimeError(f"An error occured reading the file {path}")
+
+    def _render(self, path: str) -> str:
+        """
+        Read a markdown file and render it as HTML.
+
+        :param path: Path to markdown file, relative to the folder
+        """
+        markdown_content = self._read(path)
+
+        try:
+            return markdown2.markdown(markdown_content)
+        except Exception:
+            raise RuntimeError("An error occured converting markdown to html")
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+terms_registry = TermsRegistry(
+    folder=TERMS_MARKDOWN_FOLDER,
+    poll_interval=TERMS_POLL_INTERVAL,
+    default_language=TERMS_DEFAULT_LANGUAGE,
+)
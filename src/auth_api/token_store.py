@@ -0,0 +1,862 @@
+"""
+Pluggable storage of tokens.
+
+Tokens are stored in PostgreSQL (the token table) by default. Other
+stores keep tokens outside of the database:
+
+- MemoryTokenStore keeps tokens in the process, for tests and
+  single-process development.
+- LmdbTokenStore keeps tokens in an embedded, memory-mapped LMDB
+  database shared by processes on the host, for edge deployments.
+
+Every operation takes the caller's database session, so tokens stored
+in PostgreSQL are changed in the caller's transaction. Other stores can
+not take part in the transaction, so they apply changes once (and if)
+it is committed, and discard them if it is rolled back (see on_commit()).
+Unlike PostgreSQL, changes are therefore not visible to the transaction
+making them, and changes made within a savepoint are applied with the
+transaction enclosing it.
+
+Expired tokens are never valid, and are deleted by purge_expired(),
+which the periodic maintenance invokes (see maintenance.py).
+
+Token sync, snapshots, warm-up of tokens, and the standalone ForwardAuth
+service read the token table directly, so they require PostgresTokenStore.
+"""
+
+# Standard Library
+import json
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+)
+
+# Third party
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert
+
+try:
+    import lmdb
+except ImportError:
+    # LMDB is only required by LmdbTokenStore
+    lmdb = None
+
+# Local
+from .config import (
+    TOKEN_STORE,
+    TOKEN_STORE_LMDB_MAP_SIZE,
+    TOKEN_STORE_LMDB_PATH,
+)
+from .db import db
+from .models import DbLoginRecord, DbToken
+from .queries import TokenQuery
+from .transactions import on_commit
+
+
+class RevokedToken(NamedTuple):
+    """A token deleted from a store."""
+
+    opaque_token: str
+    id_token: str
+
+
+class TokenStore(ABC):
+    """Stores tokens by opaque token."""
+
+    @abstractmethod
+    def add(self, session: db.Session, token: DbToken):
+        """
+        Store a new token.
+
+        :param session: Database session
+        :param token: The token
+        """
+        raise NotImplementedError
+
+    def add_with_login_record(self, session: db.Session, token: DbToken):
+        """
+        Store a new token, and record the login of its subject.
+
+        :param session: Database session
+        :param token: The token
+        """
+        session.add(DbLoginRecord(
+            subject=token.subject,
+            created=token.issued,
+        ))
+
+        self.add(session, token)
+
+    @abstractmethod
+    def get(
+            self,
+            session: db.Session,
+            opaque_token: str,
+            only_valid: bool = False,
+    ) -> Optional[DbToken]:
+        """
+        Look up a token by opaque token.
+
+        :param session: Database session
+        :param opaque_token: Opaque token
+        :param only_valid: Set to True to only return the token if valid
+        :returns: Token or None
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_many(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up tokens by opaque tokens, valid or not.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :returns: The tokens found (in no particular order)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_valid(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens by opaque tokens.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :returns: The valid tokens (in no particular order)
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_valid_by_subject(
+            self,
+            session: db.Session,
+            subject: str,
+            limit: int,
+            before: Optional[Tuple[datetime, str]] = None,
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens of a subject, newest first.
+
+        :param session: Database session
+        :param subject: The subject
+        :param limit: Max. no. of tokens to return
+        :param before: Only return tokens before this (issued,
+            opaque_token), ie. the last token of the previous page
+        :returns: The valid tokens
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> List[RevokedToken]:
+        """
+        Delete tokens, and all tokens of subjects.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens to delete
+        :param subjects: Subjects to delete all tokens of
+        :returns: The tokens deleted
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def purge_expired(self, session: db.Session) -> int:
+        """
+        Delete expired tokens.
+
+        :param session: Database session
+        :returns: The number of tokens deleted
+        """
+        raise NotImplementedError
+
+
+class PostgresTokenStore(TokenStore):
+    """Stores tokens in the token table, in the caller's transaction."""
+
+    def add(self, session: db.Session, token: DbToken):
+        """
+        Store a new token.
+
+        :param session: Database session
+        :param token: The token
+        """
+        session.add(token)
+
+    def add_with_login_record(self, session: db.Session, token: DbToken):
+        """
+        Store a new token, and record the login of its subject.
+
+        Inserts both the login record and the token in a single
+        statement (one round trip to the database).
+
+        :param session: Database session
+        :param token: The token
+        """
+        insert_login_record = insert(DbLoginRecord) \
+            .values(subject=token.subject, created=token.issued) \
+            .returning(DbLoginRecord.id) \
+            .cte('inserted_login_record')
+
+        insert_token = insert(DbToken).values(
+            opaque_token=token.opaque_token,
+            internal_token=token.internal_token,
+            id_token=token.id_token,
+            issued=token.issued,
+            expires=token.expires,
+            subject=token.subject,
+        )
+
+        insert_token = insert_token \
+            .add_cte(insert_login_record) \
+            .returning(DbToken.opaque_token)
+
+        session.execute(insert_token)
+
+    def get(
+            self,
+            session: db.Session,
+            opaque_token: str,
+            only_valid: bool = False,
+    ) -> Optional[DbToken]:
+        """
+        Look up a token by opaque token.
+
+        :param session: Database session
+        :param opaque_token: Opaque token
+        :param only_valid: Set to True to only return the token if valid
+        :returns: Token or None
+        """
+        query = TokenQuery(session) \
+            .has_opaque_token(opaque_token)
+
+        if only_valid:
+            query = query.is_valid()
+
+        return query.one_or_none()
+
+    def get_many(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up tokens by opaque tokens, valid or not, using a single query.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :returns: The tokens found (in no particular order)
+        """
+        opaque_tokens = list(opaque_tokens)
+
+        if not opaque_tokens:
+            return []
+
+        return TokenQuery(session) \
+            .has_any_opaque_token(opaque_tokens) \
+            .all()
+
+    def get_valid(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens by opaque tokens, using a single query.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens
+        :returns: The valid tokens (in no particular order)
+        """
+        opaque_tokens = list(opaque_tokens)
+
+        if not opaque_tokens:
+            return []
+
+        return TokenQuery(session) \
+            .has_any_opaque_token(opaque_tokens) \
+            .is_valid() \
+            .all()
+
+    def get_valid_by_subject(
+            self,
+            session: db.Session,
+            subject: str,
+            limit: int,
+            before: Optional[Tuple[datetime, str]] = None,
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens of a subject, newest first.
+
+        :param session: Database session
+        :param subject: The subject
+        :param limit: Max. no. of tokens to return
+        :param before: Only return tokens before this (issued,
+            opaque_token), ie. the last token of the previous page
+        :returns: The valid tokens
+        """
+        query = TokenQuery(session) \
+            .has_subject(subject) \
+            .is_valid()
+
+        if before is not None:
+            query = query.is_before(*before)
+
+        return query \
+            .newest_first() \
+            .limit(limit) \
+            .all()
+
+    def delete(
+            self,
+            session: db.Session,
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> List[RevokedToken]:
+        """
+        Delete tokens, and all tokens of subjects, using a single statement.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens to delete
+        :param subjects: Subjects to delete all tokens of
+        :returns: The tokens deleted
+        """
+        opaque_tokens = list(opaque_tokens)
+        subjects = list(subjects)
+        conditions = []
+
+        if opaque_tokens:
+            conditions.append(DbToken.opaque_token.in_(opaque_tokens))
+
+        if subjects:
+            conditions.append(DbToken.subject.in_(subjects))
+
+        if not conditions:
+            return []
+
+        statement = sa.delete(DbToken) \
+            .where(sa.or_(*conditions)) \
+            .returning(DbToken.opaque_token, DbToken.id_token) \
+            .execution_options(synchronize_session=False)
+
+        return [RevokedToken(*row) for row in session.execute(statement)]
+
+    def purge_expired(self, session: db.Session) -> int:
+        """
+        Delete expired tokens, using a single statement.
+
+        :param session: Database session
+        :returns: The number of tokens deleted
+        """
+        statement = sa.delete(DbToken) \
+            .where(DbToken.expires <= sa.func.now()) \
+            .execution_options(synchronize_session=False)
+
+        return session.execute(statement).rowcount
+
+
+def _copy(token: DbToken) -> DbToken:
+    """Return a (transient) copy of a token."""
+
+    return DbToken(
+        opaque_token=token.opaque_token,
+        internal_token=token.internal_token,
+        id_token=token.id_token,
+        issued=token.issued,
+        expires=token.expires,
+        subject=token.subject,
+    )
+
+
+def _is_valid(token: DbToken, now: datetime) -> bool:
+    """Return whether a token is valid at a point in time."""
+
+    return token.issued <= now < token.expires
+
+
+def _newest_first(
+        tokens: Iterable[DbToken],
+        limit: int,
+        before: Optional[Tuple[datetime, str]],
+) -> List[DbToken]:
+    """
+    Return the newest valid tokens, newest first (like TokenQuery).
+
+    :param tokens: The tokens
+    :param limit: Max. no. of tokens to return
+    :param before: Only return tokens before this (issued, opaque_token)
+    """
+    now = datetime.now(tz=timezone.utc)
+
+    tokens = [
+        token for token in tokens
+        if _is_valid(token, now) and (
+            before is None or (token.issued, token.opaque_token) < before)
+    ]
+
+    tokens.sort(key=lambda t: (t.issued, t.opaque_token), reverse=True)
+
+    return tokens[:limit]
+
+
+class MemoryTokenStore(TokenStore):
+    """
+    Stores tokens in the process (lost when it exits).
+
+    Tokens are only visible to the process storing them, so it must only
+    be used for tests and single-process development.
+    """
+
+    def __init__(self):
+        self._tokens: Dict[str, DbToken] = {}
+        self._subjects: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, session: Optional[db.Session], token: DbToken):
+        """
+        Store a new token, once the session is committed.
+
+        :param session: Database session
+        :param token: The token
+        """
+        token = _copy(token)
+
+        on_commit(session, lambda: self._add(token))
+
+    def _add(self, token: DbToken):
+        """Store a new token right away."""
+
+        with self._lock:
+            self._tokens[token.opaque_token] = token
+            self._subjects \
+                .setdefault(token.subject, set()) \
+                .add(token.opaque_token)
+
+    def get(
+            self,
+            session: Optional[db.Session],
+            opaque_token: str,
+            only_valid: bool = False,
+    ) -> Optional[DbToken]:
+        """
+        Look up a token by opaque token.
+
+        :param session: Database session (not used)
+        :param opaque_token: Opaque token
+        :param only_valid: Set to True to only return the token if valid
+        :returns: Token or None
+        """
+        token = self._tokens.get(opaque_token)
+
+        if token is None:
+            return None
+
+        if only_valid and not _is_valid(token, datetime.now(tz=timezone.utc)):
+            return None
+
+        return _copy(token)
+
+    def get_many(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up tokens by opaque tokens, valid or not.
+
+        :param session: Database session (not used)
+        :param opaque_tokens: Opaque tokens
+        :returns: The tokens found (in no particular order)
+        """
+        return [
+            token for token in (
+                self.get(session, opaque_token)
+                for opaque_token in set(opaque_tokens)
+            )
+            if token is not None
+        ]
+
+    def get_valid(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens by opaque tokens.
+
+        :param session: Database session (not used)
+        :param opaque_tokens: Opaque tokens
+        :returns: The valid tokens (in no particular order)
+        """
+        return [
+            token for token in (
+                self.get(session, opaque_token, only_valid=True)
+                for opaque_token in set(opaque_tokens)
+            )
+            if token is not None
+        ]
+
+    def get_valid_by_subject(
+            self,
+            session: Optional[db.Session],
+            subject: str,
+            limit: int,
+            before: Optional[Tuple[datetime, str]] = None,
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens of a subject, newest first.
+
+        :param session: Database session (not used)
+        :param subject: The subject
+        :param limit: Max. no. of tokens to return
+        :param before: Only return tokens before this (issued,
+            opaque_token), ie. the last token of the previous page
+        :returns: The valid tokens
+        """
+        with self._lock:
+            tokens = [
+                _copy(self._tokens[opaque_token])
+                for opaque_token in self._subjects.get(subject, ())
+            ]
+
+        return _newest_first(tokens, limit, before)
+
+    def delete(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> List[RevokedToken]:
+        """
+        Delete tokens, and all tokens of subjects, on commit.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens to delete
+        :param subjects: Subjects to delete all tokens of
+        :returns: The tokens deleted
+        """
+        with self._lock:
+            opaque_tokens = set(opaque_tokens)
+
+            for subject in subjects:
+                opaque_tokens.update(self._subjects.get(subject, ()))
+
+            tokens = [
+                self._tokens[opaque_token] for opaque_token in opaque_tokens
+                if opaque_token in self._tokens
+            ]
+
+        on_commit(session, lambda: self._remove(tokens))
+
+        return [RevokedToken(t.opaque_token, t.id_token) for t in tokens]
+
+    def purge_expired(self, session: Optional[db.Session]) -> int:
+        """
+        Delete expired tokens, right away.
+
+        :param session: Database session (not used)
+        :returns: The number of tokens deleted
+        """
+        now = datetime.now(tz=timezone.utc)
+
+        with self._lock:
+            tokens = [t for t in self._tokens.values() if t.expires <= now]
+
+        self._remove(tokens)
+
+        return len(tokens)
+
+    def _remove(self, tokens: Iterable[DbToken]):
+        """Delete tokens right away."""
+
+        with self._lock:
+            for token in tokens:
+                if self._tokens.pop(token.opaque_token, None) is not None:
+                    self._subjects[token.subject].discard(token.opaque_token)
+
+
+class LmdbTokenStore(TokenStore):
+    """
+    Stores tokens in an LMDB database (memory-mapped, embedded).
+
+    The database can be shared by all processes on the host. Tokens are
+    stored (as JSON) by opaque token, and indexed by subject.
+
+    :param path: Path (directory) of the database
+    :param map_size: Max. size of the database, in bytes
+    """
+
+    def __init__(self, path: str, map_size: int):
+        if lmdb is None:
+            raise RuntimeError('lmdb must be installed to use LmdbTokenStore')
+
+        self.env = lmdb.open(path, map_size=map_size, max_dbs=2)
+        self.tokens = self.env.open_db(b'tokens')
+        self.subjects = self.env.open_db(b'subjects', dupsort=True)
+
+    def close(self):
+        """Close the database."""
+
+        self.env.close()
+
+    @staticmethod
+    def _encode(token: DbToken) -> bytes:
+        """Encode a token as JSON."""
+
+        return json.dumps({
+            'opaque_token': token.opaque_token,
+            'internal_token': token.internal_token,
+            'id_token': token.id_token,
+            'issued': token.issued.isoformat(),
+            'expires': token.expires.isoformat(),
+            'subject': token.subject,
+        }).encode()
+
+    @staticmethod
+    def _decode(value: bytes) -> DbToken:
+        """Decode a token encoded as JSON."""
+
+        fields = json.loads(value)
+        fields['issued'] = datetime.fromisoformat(fields['issued'])
+        fields['expires'] = datetime.fromisoformat(fields['expires'])
+
+        return DbToken(**fields)
+
+    def add(self, session: Optional[db.Session], token: DbToken):
+        """
+        Store a new token, once the session is committed.
+
+        If the database is full, expired tokens are purged first.
+
+        :param session: Database session
+        :param token: The token
+        """
+        key = token.opaque_token.encode()
+        subject = token.subject.encode()
+        value = self._encode(token)
+
+        def add():
+            try:
+                self._put(key, subject, value)
+            except lmdb.MapFullError:
+                self.purge_expired(None)
+                self._put(key, subject, value)
+
+        on_commit(session, add)
+
+    def _put(self, key: bytes, subject: bytes, value: bytes):
+        """Store a new (encoded) token right away."""
+
+        with self.env.begin(write=True) as txn:
+            txn.put(key, value, db=self.tokens)
+            txn.put(subject, key, db=self.subjects)
+
+    def get(
+            self,
+            session: Optional[db.Session],
+            opaque_token: str,
+            only_valid: bool = False,
+    ) -> Optional[DbToken]:
+        """
+        Look up a token by opaque token.
+
+        :param session: Database session (not used)
+        :param opaque_token: Opaque token
+        :param only_valid: Set to True to only return the token if valid
+        :returns: Token or None
+        """
+        with self.env.begin() as txn:
+            value = txn.get(opaque_token.encode(), db=self.tokens)
+
+        if value is None:
+            return None
+
+        token = self._decode(value)
+
+        if only_valid and not _is_valid(token, datetime.now(tz=timezone.utc)):
+            return None
+
+        return token
+
+    def get_many(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up tokens by opaque tokens, valid or not (one transaction).
+
+        :param session: Database session (not used)
+        :param opaque_tokens: Opaque tokens
+        :returns: The tokens found (in no particular order)
+        """
+        with self.env.begin() as txn:
+            values = [
+                txn.get(opaque_token.encode(), db=self.tokens)
+                for opaque_token in set(opaque_tokens)
+            ]
+
+        return [self._decode(value) for value in values if value]
+
+    def get_valid(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str],
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens by opaque tokens, in a single transaction.
+
+        :param session: Database session (not used)
+        :param opaque_tokens: Opaque tokens
+        :returns: The valid tokens (in no particular order)
+        """
+        now = datetime.now(tz=timezone.utc)
+
+        return [
+            token for token in self.get_many(session, opaque_tokens)
+            if _is_valid(token, now)
+        ]
+
+    def get_valid_by_subject(
+            self,
+            session: Optional[db.Session],
+            subject: str,
+            limit: int,
+            before: Optional[Tuple[datetime, str]] = None,
+    ) -> List[DbToken]:
+        """
+        Look up valid tokens of a subject, newest first.
+
+        :param session: Database session (not used)
+        :param subject: The subject
+        :param limit: Max. no. of tokens to return
+        :param before: Only return tokens before this (issued,
+            opaque_token), ie. the last token of the previous page
+        :returns: The valid tokens
+        """
+        with self.env.begin() as txn:
+            cursor = txn.cursor(db=self.subjects)
+            values = []
+
+            if cursor.set_key(subject.encode()):
+                for opaque_token in cursor.iternext_dup():
+                    values.append(txn.get(opaque_token, db=self.tokens))
+
+        tokens = (self._decode(value) for value in values if value)
+
+        return _newest_first(tokens, limit, before)
+
+    def delete(
+            self,
+            session: Optional[db.Session],
+            opaque_tokens: Iterable[str] = (),
+            subjects: Iterable[str] = (),
+    ) -> List[RevokedToken]:
+        """
+        Delete tokens, and all tokens of subjects, on commit.
+
+        Tokens are deleted in a single LMDB transaction.
+
+        :param session: Database session
+        :param opaque_tokens: Opaque tokens to delete
+        :param subjects: Subjects to delete all tokens of
+        :returns: The tokens deleted
+        """
+        keys = {opaque_token.encode() for opaque_token in opaque_tokens}
+
+        with self.env.begin() as txn:
+            cursor = txn.cursor(db=self.subjects)
+
+            for subject in subjects:
+                if cursor.set_key(subject.encode()):
+                    keys.update(cursor.iternext_dup())
+
+            values = [txn.get(key, db=self.tokens) for key in keys]
+
+        tokens = [self._decode(value) for value in values if value]
+
+        on_commit(session, lambda: self._remove(tokens))
+
+        return [RevokedToken(t.opaque_token, t.id_token) for t in tokens]
+
+    def purge_expired(self, session: Optional[db.Session]) -> int:
+        """
+        Delete expired tokens, right away (in a single LMDB transaction).
+
+        The database is never shrunk, but the space of the tokens deleted
+        is reused for new tokens.
+
+        :param session: Database session (not used)
+        :returns: The number of tokens deleted
+        """
+        now = datetime.now(tz=timezone.utc)
+
+        with self.env.begin() as txn:
+            tokens = [
+                token for token in (
+                    self._decode(value)
+                    for value in txn.cursor(db=self.tokens).iternext(
+                        keys=False)
+                )
+                if token.expires <= now
+            ]
+
+        self._remove(tokens)
+
+        return len(tokens)
+
+    def _remove(self, tokens: Iterable[DbToken]):
+        """Delete tokens right away (in a single LMDB transaction)."""
+
+        with self.env.begin(write=True) as txn:
+            for token in tokens:
+                key = token.opaque_token.encode()
+
+                if txn.delete(key, db=self.tokens):
+                    txn.delete(token.subject.encode(), key, db=self.subjects)
+
+
+def create_token_store(name: str) -> TokenStore:
+    """
+    Create a token store by name.
+
+    :param name: "postgres", "memory" or "lmdb"
+    :returns: The token store
+    """
+    if name == 'postgres':
+        return PostgresTokenStore()
+    elif name == 'memory':
+        return MemoryTokenStore()
+    elif name == 'lmdb':
+        return LmdbTokenStore(
+            path=TOKEN_STORE_LMDB_PATH,
+            map_size=TOKEN_STORE_LMDB_MAP_SIZE,
+        )
+
+    raise ValueError(f'Unknown token store: {name}')
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+token_store = create_token_store(TOKEN_STORE)
+"""Stores the tokens (see TOKEN_STORE)."""
@@ -0,0 +1,275 @@
+"""
+Incremental sync of the token table into the token cache.
+
+Instead of only caching tokens when they are looked up, each process
+periodically pulls the changes since its previous sync (its watermark)
+and applies them to its token cache:
+
+- Tokens issued since the watermark are added.
+- Tokens deleted (revoked) since the watermark are removed. Deletions
+  are logged by a trigger on the token table (see DbTokenDeletion).
+
+So new tokens are usually cached before they are first used, and tokens
+revoked by any process are removed within a few seconds. The database
+sees two small queries per process per interval, instead of a query per
+request, and TOKEN_CACHE_TTL can be raised accordingly.
+
+The watermark is the database's time of the previous sync, and each sync
+looks back an additional overlap, so changes committed late (by slow
+transactions, or issued by a skewed clock) are still picked up. Changes
+are idempotent, so applying some of them twice is harmless.
+"""
+
+# Standard Library
+import atexit
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+# Third party
+import sqlalchemy as sa
+
+# First party
+from origin.sql import SqlEngine
+
+# Local
+from .cache import LRUCache
+from .config import (
+    TOKEN_DELETION_RETENTION_HOURS,
+    TOKEN_SYNC_ENABLED,
+    TOKEN_SYNC_INTERVAL,
+    TOKEN_SYNC_OVERLAP,
+)
+from .controller import db_controller
+from .db import admin_db
+from .edge import CachedToken, token_key
+from .models import DbToken, DbTokenDeletion
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenSyncMetrics:
+    """Metrics of the token cache sync."""
+
+    syncs: int
+    failures: int
+    flushes: int
+    added: int
+    removed: int
+    lag_seconds: float
+
+
+class TokenSync(object):
+    """
+    Syncs new and deleted tokens into a token cache, in a thread.
+
+    If the cache has not been synced for max_lag seconds (ie. the
+    database has been unavailable), deletions may have been purged from
+    the log meanwhile, so the cache is cleared before syncing again.
+
+    :param db: Database
+    :param cache: Cache of opaque token -> valid token
+    :param interval: Seconds between syncs
+    :param overlap: Seconds to look back before the previous sync
+    :param max_lag: Max. seconds between syncs before clearing the cache
+    """
+
+    def __init__(
+            self,
+            db: SqlEngine,
+            cache: LRUCache[bytes, CachedToken],
+            interval: float,
+            overlap: float,
+            max_lag: float,
+    ):
+        self.db = db
+        self.cache = cache
+        self.interval = interval
+        self.overlap = overlap
+        self.max_lag = max_lag
+        self.syncs = 0
+        self.failures = 0
+        self.flushes = 0
+        self.added = 0
+        self.removed = 0
+        self._watermark: Optional[datetime] = None
+        self._last_synced: Optional[float] = None
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """
+        Start syncing (in a thread), unless already started.
+
+        Should be invoked in each (forked) worker process, ie. when
+        creating the application, not when importing modules.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._stopped.clear()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='token-sync',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def stop(self):
+        """Stop syncing, and wait for the thread to finish."""
+
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        self._stopped.set()
+
+        if thread is not None:
+            thread.join()
+
+    def sync(self) -> Tuple[int, int]:
+        """
+        Apply tokens issued and deleted since the previous sync.
+
+        :returns: The number of tokens added and removed
+        """
+        if self._last_synced is not None \
+                and time.monotonic() - self._last_synced > self.max_lag:
+            logger.warning(
+                'Token cache not synced for %d seconds, clearing it',
+                time.monotonic() - self._last_synced,
+            )
+            self.cache.clear()
+            self._watermark = None
+            self.flushes += 1
+
+        with self.db.engine.connect() as connection:
+            started = connection.execute(
+                sa.select(sa.func.clock_timestamp())).scalar_one()
+
+            since = (self._watermark or started) \
+                - timedelta(seconds=self.overlap)
+
+            tokens, deleted = fetch_token_changes(connection, since)
+
+        for token in tokens:
+            self.cache.set(token_key(token.opaque_token), CachedToken(
+                internal_token=token.internal_token,
+                expires=token.expires,
+            ))
+
+        self.cache.invalidate_many(token_key(t) for t in deleted)
+
+        self._watermark = started
+        self._last_synced = time.monotonic()
+        self.syncs += 1
+        self.added += len(tokens)
+        self.removed += len(deleted)
+
+        return len(tokens), len(deleted)
+
+    def metrics(self) -> TokenSyncMetrics:
+        """Return metrics of the token cache sync."""
+
+        if self._last_synced is None:
+            lag_seconds = 0.0
+        else:
+            lag_seconds = time.monotonic() - self._last_synced
+
+        return TokenSyncMetrics(
+            syncs=self.syncs,
+            failures=self.failures,
+            flushes=self.flushes,
+            added=self.added,
+            removed=self.removed,
+            lag_seconds=lag_seconds,
+        )
+
+    def _run(self):
+        """Sync every interval until stopped."""
+
+        while not self._stopped.is_set():
+            try:
+                self.sync()
+            except Exception:
+                self.failures += 1
+                logger.warning('Failed to sync token cache', exc_info=True)
+
+            self._stopped.wait(self.interval)
+
+
+def fetch_token_changes(
+        connection: sa.engine.Connection,
+        since: datetime,
+) -> Tuple[List[sa.engine.Row], List[str]]:
+    """
+    Return tokens issued and deleted since a point in time.
+
+    Deletions are queried last, so tokens deleted after being queried
+    are (also) returned as deleted, and must be applied last.
+
+    :param connection: Database connection
+    :param since: Return changes after this point in time
+    :returns: Valid tokens (opaque_token, internal_token, expires)
+        issued, and opaque tokens deleted
+    """
+    tokens = connection.execute(
+        sa.select(
+            DbToken.opaque_token,
+            DbToken.internal_token,
+            DbToken.expires,
+        )
+        .where(DbToken.issued > since)
+        .where(DbToken.issued <= sa.func.now())
+        .where(DbToken.expires > sa.func.now())
+    ).all()
+
+    deleted = connection.execute(
+        sa.select(DbTokenDeletion.opaque_token)
+        .where(DbTokenDeletion.deleted > since)
+    ).scalars().all()
+
+    return tokens, deleted
+
+
+def purge_token_deletions(db: SqlEngine, retention_hours: int) -> int:
+    """
+    Delete old entries of the log of deleted tokens.
+
+    :param db: Database
+    :param retention_hours: Hours to keep entries
+    :returns: The number of entries deleted
+    """
+    oldest = sa.func.now() - timedelta(hours=retention_hours)
+
+    with db.engine.begin() as connection:
+        result = connection.execute(
+            sa.delete(DbTokenDeletion)
+            .where(DbTokenDeletion.deleted < oldest)
+        )
+
+    return result.rowcount
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+token_sync = TokenSync(
+    db=admin_db,
+    cache=db_controller.token_cache,
+    interval=TOKEN_SYNC_INTERVAL,
+    overlap=TOKEN_SYNC_OVERLAP,
+    max_lag=TOKEN_DELETION_RETENTION_HOURS * 3600,
+) if TOKEN_SYNC_ENABLED else None
+"""
+Syncs the token cache of the process.
+
+None if the token cache is not synced (the default). Started by each
+(worker) process serving requests.
+"""
+
+if token_sync is not None:
+    atexit.register(token_sync.stop)
@@ -0,0 +1,109 @@
+# Standard Library
+import os
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from hashlib import sha256
+from typing import Generic, Type, TypeVar
+
+# Third party
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# First party
+from origin.serialize import json_serializer
+
+TToken = TypeVar('TToken')
+
+
+class EncryptedTokenEncoder(Generic[TToken]):
+    """
+    Encode and decode dataclasses to and from encrypted tokens.
+
+    Works as a drop-in replacement for origin's TokenEncoder, but instead
+    of signing a JWT it encrypts and authenticates the entire serialized
+    object in a single pass using AES-256-GCM. The resulting token is
+    both confidential and tamper-proof, so fields (like the Identity
+    Provider's id_token) no longer need to be encrypted separately.
+
+    The key is derived from the secret once, and the cipher is reused for
+    every encode/decode.
+
+    Tokens are formatted as url-safe base64 (without padding) of
+    nonce + ciphertext + tag. The schema name is bound to the token as
+    associated data, so tokens can not be decoded as a different schema.
+
+    :param schema: The dataclass to encode/decode
+    :param secret: Secret to derive the encryption key from
+    """
+
+    class EncodeError(Exception):
+        """Raised when encoding fails."""
+
+        pass
+
+    class DecodeError(Exception):
+        """Raised when decoding fails."""
+
+        pass
+
+    # Length of the random nonce prepended to each token (96 bits)
+    NONCE_SIZE = 12
+
+    def __init__(self, schema: Type[TToken], secret: str):
+        self.schema = schema
+        self._aad = schema.__name__.encode('utf8')
+        self._cipher = AESGCM(sha256(secret.encode('utf8')).digest())
+
+    def encode(self, obj: TToken) -> str:
+        """
+        Serialize and encrypt an object.
+
+        :param obj: The object to encode
+        :returns: Encrypted token
+        """
+        try:
+            payload = json_serializer.serialize(obj=obj, schema=self.schema)
+        except Exception as e:
+            raise self.EncodeError(str(e))
+
+        nonce = os.urandom(self.NONCE_SIZE)
+        ciphertext = self._cipher.encrypt(nonce, payload, self._aad)
+
+        return urlsafe_b64encode(nonce + ciphertext) \
+            .rstrip(b'=') \
+            .decode('ascii')
+
+    def decode(self, encoded: str) -> TToken:
+        """
+        Decrypt and deserialize an encrypted token.
+
+        :param encoded: Encrypted token
+        :returns: The decoded object
+        """
+        if not encoded:
+            raise self.DecodeError('No token provided')
+
+        try:
+            raw = urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        except (BinasciiError, ValueError) as e:
+            raise self.DecodeError(str(e))
+
+        if len(raw) <= self.NONCE_SIZE:
+            raise self.DecodeError('Token is too short')
+
+        try:
+            payload = self._cipher.decrypt(
+                raw[:self.NONCE_SIZE],
+                raw[self.NONCE_SIZE:],
+                self._aad,
+            )
+        except InvalidTag:
+            raise self.DecodeError('Token could not be authenticated')
+
+        try:
+            return json_serializer.deserialize(
+                data=payload,
+                schema=self.schema,
+            )
+        except Exception as e:
+            raise self.DecodeError(str(e))
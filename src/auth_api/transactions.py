@@ -0,0 +1,93 @@
+"""
+Callbacks invoked when a database transaction is committed.
+
+Used for side effects outside of the database (ie. tokens stored in
+memory, or login records written behind), which must only happen if
+the changes in the database are committed.
+"""
+
+# Standard Library
+from typing import Callable, Optional
+
+# Third party
+import sqlalchemy as sa
+from sqlalchemy.orm import Session, SessionTransaction
+
+# Key of callbacks waiting for commit in Session.info
+CALLBACKS = 'on_commit_callbacks'
+
+
+def on_commit(session: Optional[Session], callback: Callable[[], None]):
+    """
+    Invoke a callback once (and if) the session's transaction is committed.
+
+    Callbacks are discarded if the transaction (or the savepoint they are
+    added within) is rolled back, or if the session is closed without
+    committing. Without a session, or outside of a transaction, callbacks
+    are invoked right away.
+
+    :param session: Database session
+    :param callback: The callback
+    """
+    if session is None or not session.in_transaction():
+        callback()
+    else:
+        transaction = session.get_nested_transaction() \
+            or session.get_transaction()
+
+        session.info \
+            .setdefault(CALLBACKS, []) \
+            .append((transaction, callback))
+
+
+def _is_within(
+        transaction: SessionTransaction,
+        ancestor: SessionTransaction,
+) -> bool:
+    """Return whether a transaction is (or is nested within) another."""
+
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+
+    return False
+
+
+@sa.event.listens_for(Session, 'after_commit')
+def _invoke_callbacks(session: Session):
+    """Invoke callbacks waiting for the (outermost) transaction to commit."""
+
+    # Releasing a savepoint does not commit its changes yet
+    if session.get_nested_transaction() is not None:
+        return
+
+    for _, callback in session.info.pop(CALLBACKS, ()):
+        callback()
+
+
+@sa.event.listens_for(Session, 'after_soft_rollback')
+def _discard_rolled_back_callbacks(
+        session: Session,
+        previous_transaction: SessionTransaction,
+):
+    """Discard callbacks added within a transaction rolled back."""
+
+    callbacks = session.info.get(CALLBACKS)
+
+    if callbacks:
+        session.info[CALLBACKS] = [
+            (transaction, callback) for transaction, callback in callbacks
+            if not _is_within(transaction, previous_transaction)
+        ]
+
+
+@sa.event.listens_for(Session, 'after_transaction_end')
+def _discard_uncommitted_callbacks(
+        session: Session,
+        transaction: SessionTransaction,
+):
+    """Discard callbacks left when the session is closed without commit."""
+
+    if transaction.parent is None:
+        session.info.pop(CALLBACKS, None)
@@ -22,16 +22,9 @@ def create_or_get_user(
     if not state.terms_accepted:
         raise RuntimeError("User has not accepted terms")
 
-    user = db_controller.get_or_create_user(
+    return db_controller.get_or_create_user(
         session=session,
         tin=state.tin,
-    )
-
-    db_controller.attach_external_user(
-        session=session,
-        user=user,
         external_subject=state.external_subject,
         identity_provider=state.identity_provider,
     )
-
-    return user
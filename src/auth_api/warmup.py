@@ -0,0 +1,235 @@
+"""
+Warm-up of caches and connections when a process starts.
+
+After a deploy (or restart) every cache is cold, so the first requests
+all hit the database and the Identity Provider. Instead, each process
+warms up in a thread when the application is created:
+
+- Database connections of every pool are opened.
+- The terms are rendered.
+- The Identity Provider's keys (JWKS) are fetched.
+- The most recently issued valid tokens are loaded into the token cache,
+  if tokens revoked by other processes are removed from the cache (by
+  cache invalidation or token sync), as they are cached until they expire.
+
+The health check reports the process as not ready until warm-up has
+finished, so no traffic is routed to it meanwhile. A step which fails
+is logged and skipped, so the process becomes ready regardless (with
+colder caches), instead of never becoming ready.
+"""
+
+# Standard Library
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional, Sequence, Tuple
+
+# First party
+from origin.sql import SqlEngine
+
+# Local
+from .config import (
+    CACHE_INVALIDATION_ENABLED,
+    TOKEN_SYNC_ENABLED,
+    WARMUP_BATCH_SIZE,
+    WARMUP_ENABLED,
+    WARMUP_TOKENS,
+)
+from .controller import db_controller
+from .db import admin_db, bulkheads, db, replica_db
+from .oidc import OAuth2Session, session as oidc_session
+from .terms import terms_registry
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WarmupStep:
+    """Outcome of a single warm-up step."""
+
+    name: str
+    loaded: int
+    seconds: float
+    failed: bool
+
+
+@dataclass
+class WarmupMetrics:
+    """Metrics of the warm-up."""
+
+    ready: bool
+    seconds: float
+    steps: List[WarmupStep]
+
+
+class Warmup(object):
+    """
+    Runs warm-up steps (in order) in a thread, until all have finished.
+
+    Each step is a function returning the number of entries it loaded.
+
+    :param steps: (name, function) of each step
+    """
+
+    def __init__(self, steps: Sequence[Tuple[str, Callable[[], int]]]):
+        self.steps = steps
+        self.results: List[WarmupStep] = []
+        self._started: Optional[float] = None
+        self._finished: Optional[float] = None
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        """Return whether warm-up has finished."""
+
+        return self._done.is_set()
+
+    def start(self):
+        """
+        Start warming up (in a thread), unless already started.
+
+        Should be invoked in each (forked) worker process, ie. when
+        creating the application, not when importing modules.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run,
+                    name='warmup',
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until warm-up has finished.
+
+        :param timeout: Max. seconds to wait
+        :returns: Whether warm-up has finished
+        """
+        return self._done.wait(timeout)
+
+    def run(self):
+        """Run all warm-up steps (in the current thread)."""
+
+        self._started = time.perf_counter()
+
+        for name, step in self.steps:
+            started = time.perf_counter()
+
+            try:
+                loaded = step()
+                failed = False
+            except Exception:
+                logger.exception('Warm-up step "%s" failed', name)
+                loaded = 0
+                failed = True
+
+            result = WarmupStep(
+                name=name,
+                loaded=loaded,
+                seconds=time.perf_counter() - started,
+                failed=failed,
+            )
+
+            self.results.append(result)
+
+            logger.info(
+                'Warm-up step "%s" loaded %d entries in %.3f seconds',
+                result.name, result.loaded, result.seconds,
+            )
+
+        self._finished = time.perf_counter()
+        self._done.set()
+
+        logger.info(
+            'Warm-up finished in %.3f seconds', self._finished - self._started)
+
+    def metrics(self) -> WarmupMetrics:
+        """Return metrics of the warm-up."""
+
+        if self._started is None:
+            seconds = 0.0
+        else:
+            seconds = (self._finished or time.perf_counter()) - self._started
+
+        return WarmupMetrics(
+            ready=self.ready,
+            seconds=seconds,
+            steps=list(self.results),
+        )
+
+
+def open_connections(engines: Iterable[SqlEngine]) -> int:
+    """
+    Open all connections of the connection pools.
+
+    :param engines: Engines to open connections of
+    :returns: The number of connections opened
+    """
+    opened = 0
+
+    for engine in engines:
+        connections = [
+            engine.engine.connect() for _ in range(engine.pool_size)]
+
+        for connection in connections:
+            connection.close()
+
+        opened += len(connections)
+
+    return opened
+
+
+def fetch_jwks(session: OAuth2Session) -> int:
+    """
+    Fetch (and cache) the Identity Provider's keys.
+
+    :param session: The OAuth2 session
+    :returns: The number of keys fetched
+    """
+    return len(json.loads(session.get_jwk(refresh=True)).get('keys', []))
+
+
+@admin_db.session()
+def load_tokens(session: db.Session) -> int:
+    """
+    Load the most recently issued valid tokens into the token cache.
+
+    Tokens are cached until they expire, so they are only loaded if
+    tokens revoked by other processes are removed from the cache (by
+    cache invalidation or token sync).
+
+    :param session: Database session
+    :returns: The number of tokens loaded
+    """
+    if not CACHE_INVALIDATION_ENABLED and not TOKEN_SYNC_ENABLED:
+        return 0
+
+    return db_controller.warm_token_cache(
+        session=session,
+        limit=WARMUP_TOKENS,
+        batch_size=WARMUP_BATCH_SIZE,
+    )
+
+
+# -- Singletons --------------------------------------------------------------
+
+
+warmup = Warmup(steps=(
+    ('connections', lambda: open_connections(
+        (db, *bulkheads) + ((replica_db,) if replica_db else ()))),
+    ('terms', terms_registry.load),
+    ('jwks', lambda: fetch_jwks(oidc_session)),
+    ('tokens', load_tokens),
+)) if WARMUP_ENABLED else None
+"""
+Warm-up of the process.
+
+None if warm-up is disabled (the default), in which case the process is
+ready right away.
+"""
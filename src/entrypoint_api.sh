@@ -4,5 +4,10 @@ set -e
 # Apply database migrations
 alembic --config=migrations/alembic.ini upgrade head
 
+# Collect metrics of all workers, starting from scratch
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+rm -f "$PROMETHEUS_MULTIPROC_DIR"/*.db
+
 # Run API
-gunicorn 'auth_api.app:create_app()' -w 2 --threads 2 -b 0.0.0.0:80
+gunicorn 'auth_api.app:create_app()' -w 2 -b 0.0.0.0:80
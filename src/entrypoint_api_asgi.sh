@@ -0,0 +1,13 @@
+#!/bin/bash
+set -e
+
+# Apply database migrations
+alembic --config=migrations/alembic.ini upgrade head
+
+# Collect metrics of all workers, starting from scratch
+export PROMETHEUS_MULTIPROC_DIR=${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+rm -f "$PROMETHEUS_MULTIPROC_DIR"/*.db
+
+# Run API (asynchronous variant)
+uvicorn 'auth_api.app:create_asgi_app' --factory -w 2 --host 0.0.0.0 --port 80
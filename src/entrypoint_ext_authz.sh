@@ -0,0 +1,8 @@
+#!/bin/bash
+set -e
+
+# Apply database migrations
+alembic --config=migrations/alembic.ini upgrade head
+
+# Run Envoy ext_authz gRPC service
+python -m auth_api.ext_authz
@@ -0,0 +1,8 @@
+#!/bin/bash
+set -e
+
+# Apply database migrations
+alembic --config=migrations/alembic.ini upgrade head
+
+# Run standalone asyncio ForwardAuth
+uvicorn auth_api.forward_auth:app --host 0.0.0.0 --port 80 --no-access-log
@@ -0,0 +1,8 @@
+#!/bin/bash
+set -e
+
+# Apply database migrations
+alembic --config=migrations/alembic.ini upgrade head
+
+# Run periodic maintenance (partitions, rollups, and retention)
+python -m auth_api.maintenance
@@ -0,0 +1,5 @@
+#!/bin/bash
+set -e
+
+# Run ForwardAuth sidecar (no database connections, reads SNAPSHOT_PATH)
+uvicorn auth_api.sidecar:app --host 0.0.0.0 --port 80 --no-access-log
@@ -0,0 +1,8 @@
+#!/bin/bash
+set -e
+
+# Apply database migrations
+alembic --config=migrations/alembic.ini upgrade head
+
+# Write token snapshots for ForwardAuth sidecars (a single instance)
+python -m auth_api.snapshot
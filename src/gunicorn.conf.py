@@ -0,0 +1,27 @@
+"""
+Gunicorn configuration.
+
+Gunicorn reads this file automatically when started from this folder.
+"""
+
+from auth_api.config import SERVER_THREADS
+
+# Bulkheads are sized against the number of threads (see config.py)
+threads = SERVER_THREADS
+
+
+def worker_exit(server, worker):
+    """Flush buffered login records before the worker exits."""
+
+    from auth_api.login_records import login_record_buffer
+
+    if login_record_buffer is not None:
+        login_record_buffer.stop()
+
+
+def child_exit(server, worker):
+    """Remove metrics of the worker which are only valid while it lives."""
+
+    from auth_api.metrics import mark_process_dead
+
+    mark_process_dead(worker.pid)
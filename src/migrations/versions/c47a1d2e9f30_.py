@@ -0,0 +1,124 @@
+"""Partition login records by month and add daily aggregate
+
+Revision ID: c47a1d2e9f30
+Revises: 8b0e4d9a6c21
+Create Date: 2022-03-21 13:05:44.920417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c47a1d2e9f30'
+down_revision = '8b0e4d9a6c21'
+branch_labels = None
+depends_on = None
+
+
+# Creates a monthly partition for each month with existing login records
+# and for the next two months (later months are created by the maintenance
+# job), before the existing login records are copied
+CREATE_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month timestamptz;
+BEGIN
+    FOR month IN
+        SELECT generate_series(
+            date_trunc('month', least(
+                (SELECT min(created) FROM login_record_old), now()
+            ) AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+            date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC'
+                + interval '2 months',
+            interval '1 month'
+        )
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF login_record '
+            'FOR VALUES FROM (%L) TO (%L)',
+            to_char(month AT TIME ZONE 'UTC', '"login_record_y"YYYY"m"MM'),
+            month,
+            month + interval '1 month'
+        );
+    END LOOP;
+END
+$$
+"""
+
+
+def upgrade():
+    # -- Move existing table out of the way ----------------------------------
+
+    op.rename_table('login_record', 'login_record_old')
+    op.execute('ALTER SEQUENCE login_record_id_seq '
+               'RENAME TO login_record_old_id_seq')
+    op.execute('ALTER TABLE login_record_old '
+               'RENAME CONSTRAINT login_record_pkey TO login_record_old_pkey')
+    op.drop_index('ix_login_record_id', table_name='login_record_old')
+    op.drop_index('ix_login_record_subject', table_name='login_record_old')
+
+    # -- Partitioned table ---------------------------------------------------
+
+    op.create_table('login_record',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'created'),
+    postgresql_partition_by='RANGE (created)'
+    )
+    op.create_index(op.f('ix_login_record_subject'), 'login_record', ['subject'], unique=False)
+    op.execute('CREATE TABLE login_record_default '
+               'PARTITION OF login_record DEFAULT')
+    op.execute(CREATE_MONTHLY_PARTITIONS)
+
+    # -- Copy existing login records -----------------------------------------
+
+    op.execute('INSERT INTO login_record (id, subject, created) '
+               'SELECT id, subject, created FROM login_record_old')
+    op.execute("SELECT setval('login_record_id_seq', "
+               'coalesce((SELECT max(id) FROM login_record), 0) + 1, false)')
+    op.drop_table('login_record_old')
+
+    # -- Daily aggregate -----------------------------------------------------
+
+    op.create_table('login_record_daily',
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('logins', sa.Integer(), nullable=False),
+    sa.Column('last_login', sa.DateTime(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('subject', 'day')
+    )
+    op.execute(
+        'INSERT INTO login_record_daily (subject, day, logins, last_login) '
+        "SELECT subject, (created AT TIME ZONE 'UTC')::date, "
+        'count(*), max(created) '
+        'FROM login_record GROUP BY 1, 2'
+    )
+
+
+def downgrade():
+    op.drop_table('login_record_daily')
+
+    op.rename_table('login_record', 'login_record_partitioned')
+    op.execute('ALTER SEQUENCE login_record_id_seq '
+               'RENAME TO login_record_partitioned_id_seq')
+    op.execute('ALTER TABLE login_record_partitioned RENAME CONSTRAINT '
+               'login_record_pkey TO login_record_partitioned_pkey')
+    op.drop_index('ix_login_record_subject',
+                  table_name='login_record_partitioned')
+
+    op.create_table('login_record',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('created', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_login_record_id'), 'login_record', ['id'], unique=False)
+    op.create_index(op.f('ix_login_record_subject'), 'login_record', ['subject'], unique=False)
+
+    op.execute('INSERT INTO login_record (id, subject, created) '
+               'SELECT id, subject, created FROM login_record_partitioned')
+    op.execute("SELECT setval('login_record_id_seq', "
+               'coalesce((SELECT max(id) FROM login_record), 0) + 1, false)')
+    op.drop_table('login_record_partitioned')
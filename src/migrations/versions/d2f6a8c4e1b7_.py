@@ -0,0 +1,54 @@
+"""Log of deleted tokens, for syncing token caches
+
+Revision ID: d2f6a8c4e1b7
+Revises: 5e9b3f7a1c68
+Create Date: 2022-03-29 09:12:45.207318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f6a8c4e1b7'
+down_revision = '5e9b3f7a1c68'
+branch_labels = None
+depends_on = None
+
+
+# Logs tokens deleted before they expired (ie. revoked)
+LOG_TOKEN_DELETION_FUNCTION = """
+CREATE FUNCTION log_token_deletion() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO token_deletion (opaque_token)
+    SELECT opaque_token FROM deleted_token WHERE expires > now();
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+LOG_TOKEN_DELETION_TRIGGER = """
+CREATE TRIGGER token_deletion_log
+AFTER DELETE ON token
+REFERENCING OLD TABLE AS deleted_token
+FOR EACH STATEMENT EXECUTE FUNCTION log_token_deletion()
+"""
+
+
+def upgrade():
+    op.create_table('token_deletion',
+    sa.Column('id', sa.BigInteger(), autoincrement=True, nullable=False),
+    sa.Column('opaque_token', sa.String(), nullable=False),
+    sa.Column('deleted', sa.DateTime(timezone=True), server_default=sa.text('clock_timestamp()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_token_deletion_deleted', 'token_deletion', ['deleted'], unique=False)
+    op.execute(LOG_TOKEN_DELETION_FUNCTION)
+    op.execute(LOG_TOKEN_DELETION_TRIGGER)
+
+
+def downgrade():
+    op.execute('DROP TRIGGER token_deletion_log ON token')
+    op.execute('DROP FUNCTION log_token_deletion()')
+    op.drop_index('ix_token_deletion_deleted', table_name='token_deletion')
+    op.drop_table('token_deletion')
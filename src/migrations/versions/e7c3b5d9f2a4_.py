@@ -0,0 +1,24 @@
+"""Index login record daily aggregate by day
+
+Revision ID: e7c3b5d9f2a4
+Revises: d2f6a8c4e1b7
+Create Date: 2022-04-04 10:21:37.118052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c3b5d9f2a4'
+down_revision = 'd2f6a8c4e1b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_login_record_daily_day', 'login_record_daily', ['day'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_login_record_daily_day', table_name='login_record_daily')
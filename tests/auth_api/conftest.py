@@ -16,10 +16,11 @@ from testcontainers.postgres import PostgresContainer
 from origin.tokens import TokenEncoder
 from origin.sql import SqlEngine, POSTGRES_VERSION
 from origin.models.auth import InternalToken
-from origin.encrypt import aes256_encrypt
 
 from auth_api.app import create_app
+from auth_api.controller import db_controller
 from auth_api.state import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
 from auth_api.db import db as _db
 from auth_api.config import (
     OIDC_API_LOGOUT_URL,
@@ -40,6 +41,18 @@ def client() -> FlaskClient:
     return create_app().test_client
 
 
+# -- Caches ------------------------------------------------------------------
+
+
+@pytest.fixture(scope='function', autouse=True)
+def clear_caches():
+    """Clear the caches of users and tokens, as each test has its own DB."""
+
+    db_controller.identity_cache.clear()
+    db_controller.token_cache.clear()
+    db_controller.recent_revocations.clear()
+
+
 # -- OAuth2 session methods --------------------------------------------------
 
 
@@ -60,12 +73,12 @@ def mock_fetch_token():
 
 
 @pytest.fixture(scope='function')
-def state_encoder() -> TokenEncoder[AuthState]:
+def state_encoder() -> EncryptedTokenEncoder[AuthState]:
     """Return AuthState encoder with correct secret embedded."""
 
-    return TokenEncoder(
+    return EncryptedTokenEncoder(
         schema=AuthState,
-        secret=INTERNAL_TOKEN_SECRET,
+        secret=STATE_ENCRYPTION_SECRET,
     )
 
 
@@ -225,18 +238,6 @@ def id_token_encoded(
     return token.decode()
 
 
-@pytest.fixture(scope='function')
-def id_token_encrypted(
-        id_token_encoded: str,
-) -> str:
-    """Make a mocked ID-token from Identity Provider (encoded)."""
-
-    return aes256_encrypt(
-        id_token_encoded,
-        STATE_ENCRYPTION_SECRET,
-    )
-
-
 @pytest.fixture(scope='function')
 def userinfo_token(
         token_subject: str,
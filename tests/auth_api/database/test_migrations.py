@@ -2,7 +2,9 @@
 import os
 import pytest
 import alembic.config
+import sqlalchemy as sa
 
+from auth_api.controller import encrypt_ssn, ssn_blind_index
 from auth_api.db import db as _db
 from origin.sql import SqlEngine, POSTGRES_VERSION
 from testcontainers.postgres import PostgresContainer
@@ -64,3 +66,254 @@ class TestRunMigrations(object):
         # -- Clean up --------------------------------------------------------
 
         os.chdir('..')
+
+    @pytest.mark.unittest
+    def test__unique_tin_migration__should_merge_users_with_same_tin(
+            self,
+            db: SqlEngine
+    ):
+        """
+        Test that users with the same TIN are merged onto the oldest user.
+
+        :param db: SqlEngine (required for getting a running PSQL instance)
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        os.chdir(os.getcwd() + '/src')
+        alembic_args = [
+            '--raiseerr',
+            '--config=migrations/alembic.ini',
+        ]
+
+        alembic.config.main(argv=alembic_args + ['upgrade', '9720f2c9aba2'])
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                sa.text('INSERT INTO "user" (subject, ssn, tin, created) '
+                        'VALUES (:subject, :ssn, :tin, :created)'),
+                [
+                    {
+                        'subject': 's1',
+                        'ssn': None,
+                        'tin': '1',
+                        'created': '2021-01-01T00:00:00Z',
+                    },
+                    # Duplicates created (later) by logging in again
+                    {
+                        'subject': 's0',
+                        'ssn': 'ssn',
+                        'tin': '1',
+                        'created': '2022-01-01T00:00:00Z',
+                    },
+                    {
+                        'subject': 's2',
+                        'ssn': None,
+                        'tin': '1',
+                        'created': '2022-01-01T00:00:00Z',
+                    },
+                    {
+                        'subject': 's3',
+                        'ssn': None,
+                        'tin': '3',
+                        'created': '2022-01-01T00:00:00Z',
+                    },
+                ],
+            )
+
+            connection.execute(
+                sa.text('INSERT INTO user_external '
+                        '(subject, identity_provider, external_subject) '
+                        'VALUES (:subject, :idp, :external)'),
+                [
+                    {'subject': 's1', 'idp': 'mitid', 'external': 'e1'},
+                    {'subject': 's0', 'idp': 'nemid', 'external': 'e0'},
+                    {'subject': 's3', 'idp': 'mitid', 'external': 'e3'},
+                ],
+            )
+
+            connection.execute(
+                sa.text('INSERT INTO token (opaque_token, internal_token, '
+                        'id_token, issued, expires, subject) '
+                        "VALUES (:opaque_token, '', '', "
+                        "'2022-01-01T00:00:00Z', '2022-01-02T00:00:00Z', "
+                        ':subject)'),
+                [
+                    {'opaque_token': 't0', 'subject': 's0'},
+                    {'opaque_token': 't2', 'subject': 's2'},
+                ],
+            )
+
+            connection.execute(
+                sa.text('INSERT INTO login_record (id, subject) '
+                        'VALUES (:id, :subject)'),
+                [{'id': 1, 'subject': 's0'}, {'id': 2, 'subject': 's3'}],
+            )
+
+        # -- Act -------------------------------------------------------------
+
+        alembic.config.main(argv=alembic_args + ['upgrade', '3f1c8e2b7d54'])
+
+        # -- Assert ----------------------------------------------------------
+
+        with db.engine.begin() as connection:
+            users = connection.execute(sa.text(
+                'SELECT subject, ssn FROM "user" ORDER BY subject')).fetchall()
+
+            external_users = dict(connection.execute(sa.text(
+                'SELECT external_subject, subject FROM user_external'
+            )).fetchall())
+
+            tokens = dict(connection.execute(sa.text(
+                'SELECT opaque_token, subject FROM token')).fetchall())
+
+            login_records = dict(connection.execute(sa.text(
+                'SELECT id, subject FROM login_record')).fetchall())
+
+            indexes = connection.execute(sa.text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'user'"
+            )).scalars().all()
+
+        assert [tuple(user) for user in users] == [
+            ('s1', 'ssn'),
+            ('s3', None),
+        ]
+        assert external_users == {'e1': 's1', 'e0': 's1', 'e3': 's3'}
+        assert tokens == {'t0': 's1', 't2': 's1'}
+        assert login_records == {1: 's1', 2: 's3'}
+        assert 'user_tin_key' in indexes
+        assert 'ix_user_tin' not in indexes
+
+        # -- Clean up --------------------------------------------------------
+
+        os.chdir('..')
+
+    @pytest.mark.unittest
+    def test__ssn_index_migration__should_backfill_existing_users(
+            self,
+            db: SqlEngine
+    ):
+        """
+        Test that existing users get a blind index of their SSN.
+
+        Only the oldest of users with the same SSN gets the blind index.
+
+        :param db: SqlEngine (required for getting a running PSQL instance)
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        os.chdir(os.getcwd() + '/src')
+        alembic_args = [
+            '--raiseerr',
+            '--config=migrations/alembic.ini',
+        ]
+
+        alembic.config.main(argv=alembic_args + ['upgrade', '3f1c8e2b7d54'])
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                sa.text('INSERT INTO "user" (subject, ssn, tin) '
+                        'VALUES (:subject, :ssn, :tin)'),
+                [
+                    {'subject': 's1', 'ssn': encrypt_ssn('1'), 'tin': None},
+                    {'subject': 's2', 'ssn': None, 'tin': '2'},
+                ],
+            )
+
+            # Duplicate created (later) by logging in again with the SSN
+            connection.execute(
+                sa.text('INSERT INTO "user" (subject, ssn, created) '
+                        'VALUES (:subject, :ssn, :created)'),
+                {
+                    'subject': 's0',
+                    'ssn': encrypt_ssn('1'),
+                    'created': '2100-01-01T00:00:00Z',
+                },
+            )
+
+        # -- Act -------------------------------------------------------------
+
+        alembic.config.main(argv=alembic_args + ['upgrade', 'head'])
+
+        # -- Assert ----------------------------------------------------------
+
+        with db.engine.begin() as connection:
+            ssn_indexes = dict(connection.execute(sa.text(
+                'SELECT subject, ssn_index FROM "user"')).fetchall())
+
+        assert ssn_indexes == {
+            's0': None,
+            's1': ssn_blind_index('1'),
+            's2': None,
+        }
+
+        # -- Clean up --------------------------------------------------------
+
+        os.chdir('..')
+
+    @pytest.mark.unittest
+    def test__partition_login_record_migration__should_keep_login_records(
+            self,
+            db: SqlEngine
+    ):
+        """
+        Test that login records are kept when partitioning the table.
+
+        :param db: SqlEngine (required for getting a running PSQL instance)
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        os.chdir(os.getcwd() + '/src')
+        alembic_args = [
+            '--raiseerr',
+            '--config=migrations/alembic.ini',
+        ]
+
+        alembic.config.main(argv=alembic_args + ['upgrade', '8b0e4d9a6c21'])
+
+        with db.engine.begin() as connection:
+            connection.execute(
+                sa.text('INSERT INTO login_record (subject, created) '
+                        'VALUES (:subject, :created)'),
+                [
+                    {'subject': 's1', 'created': '2021-06-01T12:00:00Z'},
+                    {'subject': 's1', 'created': '2021-06-01T13:00:00Z'},
+                    {'subject': 's2', 'created': '2022-03-01T12:00:00Z'},
+                ],
+            )
+
+        # -- Act -------------------------------------------------------------
+
+        alembic.config.main(argv=alembic_args + ['upgrade', 'head'])
+
+        # -- Assert ----------------------------------------------------------
+
+        with db.engine.begin() as connection:
+            partition_count = connection.execute(sa.text(
+                'SELECT count(*) FROM login_record_y2021m06')).scalar()
+
+            daily = connection.execute(sa.text(
+                'SELECT subject, logins FROM login_record_daily '
+                'ORDER BY subject')).fetchall()
+
+            # New records continue the sequence
+            new_id = connection.execute(sa.text(
+                "INSERT INTO login_record (subject) VALUES ('s3') "
+                'RETURNING id')).scalar()
+
+        assert partition_count == 2
+        assert [tuple(row) for row in daily] == [('s1', 2), ('s2', 1)]
+        assert new_id == 4
+
+        # Downgrading should keep the login records as well
+        alembic.config.main(argv=alembic_args + ['downgrade', '8b0e4d9a6c21'])
+
+        with db.engine.begin() as connection:
+            assert connection.execute(sa.text(
+                'SELECT count(*) FROM login_record')).scalar() == 4
+
+        # -- Clean up --------------------------------------------------------
+
+        os.chdir('..')
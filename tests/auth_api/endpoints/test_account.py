@@ -0,0 +1,257 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+import pytest
+from flask.testing import FlaskClient
+from origin.auth import TOKEN_COOKIE_NAME, TOKEN_HEADER_NAME
+from origin.models.auth import InternalToken
+from origin.tokens import TokenEncoder
+
+from auth_api.config import TOKEN_COOKIE_DOMAIN
+from auth_api.db import db
+from auth_api.models import DbLoginRecord, DbToken
+
+SUBJECT = 'SUBJECT_1'
+OTHER_SUBJECT = 'SUBJECT_2'
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def now() -> datetime:
+    """Return current time, without microseconds."""
+
+    return datetime.now(tz=timezone.utc).replace(microsecond=0)
+
+
+@pytest.fixture(scope='function')
+def headers(
+        token_encoder: TokenEncoder[InternalToken],
+        now: datetime,
+) -> Dict[str, str]:
+    """HTTP headers with an internal token for SUBJECT."""
+
+    token = InternalToken(
+        issued=now,
+        expires=now + timedelta(hours=1),
+        actor=SUBJECT,
+        subject=SUBJECT,
+        scope=[],
+    )
+
+    return {TOKEN_HEADER_NAME: f'Bearer: {token_encoder.encode(token)}'}
+
+
+@pytest.fixture(scope='function')
+def seeded_session(mock_session: db.Session, now: datetime) -> db.Session:
+    """
+    Insert login records and tokens.
+
+    SUBJECT has logged in five times (one hour apart) and has three valid
+    tokens and one expired token. OTHER_SUBJECT has one of each.
+    """
+
+    for hours in range(5):
+        mock_session.add(DbLoginRecord(
+            subject=SUBJECT,
+            created=now - timedelta(hours=hours),
+        ))
+
+    for hours in range(3):
+        mock_session.add(DbToken(
+            subject=SUBJECT,
+            opaque_token=f'OPAQUE_TOKEN_{hours}',
+            internal_token='INTERNAL_TOKEN',
+            id_token='ID_TOKEN',
+            issued=now - timedelta(hours=hours),
+            expires=now + timedelta(hours=1),
+        ))
+
+    mock_session.add(DbToken(
+        subject=SUBJECT,
+        opaque_token='OPAQUE_TOKEN_EXPIRED',
+        internal_token='INTERNAL_TOKEN',
+        id_token='ID_TOKEN',
+        issued=now - timedelta(days=2),
+        expires=now - timedelta(days=1),
+    ))
+
+    mock_session.add(DbLoginRecord(subject=OTHER_SUBJECT, created=now))
+
+    mock_session.add(DbToken(
+        subject=OTHER_SUBJECT,
+        opaque_token='OPAQUE_TOKEN_OTHER',
+        internal_token='INTERNAL_TOKEN',
+        id_token='ID_TOKEN',
+        issued=now - timedelta(hours=1),
+        expires=now + timedelta(hours=1),
+    ))
+
+    mock_session.commit()
+
+    return mock_session
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestGetLoginHistory:
+    """Tests for listing the user's logins."""
+
+    @pytest.mark.integrationtest
+    def test__should_return_all_logins_newest_first_one_page_at_a_time(
+            self,
+            client: FlaskClient,
+            seeded_session: db.Session,
+            headers: Dict[str, str],
+            now: datetime,
+    ):
+        """Following next_cursor should list every login exactly once."""
+
+        # -- Act -------------------------------------------------------------
+
+        pages = []
+        cursor = None
+
+        while True:
+            res = client.post(
+                path='/account/logins',
+                json={'limit': 2, 'cursor': cursor},
+                headers=headers,
+            )
+
+            assert res.status_code == 200
+
+            pages.append(res.json['logins'])
+            cursor = res.json['next_cursor']
+
+            if cursor is None:
+                break
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [len(page) for page in pages] == [2, 2, 1]
+
+        assert [
+            datetime.fromisoformat(login['created'])
+            for page in pages for login in page
+        ] == [now - timedelta(hours=hours) for hours in range(5)]
+
+    @pytest.mark.parametrize('body', [
+        {'limit': 0},
+        {'limit': 1000},
+        {'cursor': 'not-a-valid-cursor'},
+    ])
+    @pytest.mark.integrationtest
+    def test__invalid_page_request__should_return_status_400(
+            self,
+            client: FlaskClient,
+            seeded_session: db.Session,
+            headers: Dict[str, str],
+            body: dict,
+    ):
+        """Invalid limits and cursors should be rejected."""
+
+        res = client.post(
+            path='/account/logins',
+            json=body,
+            headers=headers,
+        )
+
+        assert res.status_code == 400
+
+    @pytest.mark.integrationtest
+    def test__cursor_of_sessions__should_return_status_400(
+            self,
+            client: FlaskClient,
+            seeded_session: db.Session,
+            headers: Dict[str, str],
+    ):
+        """Cursors of one list can not be used for another."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        sessions = client.post(
+            path='/account/sessions',
+            json={'limit': 1},
+            headers=headers,
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.post(
+            path='/account/logins',
+            json={'limit': 1, 'cursor': sessions.json['next_cursor']},
+            headers=headers,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert sessions.json['next_cursor'] is not None
+        assert res.status_code == 400
+
+    @pytest.mark.unittest
+    def test__not_logged_in__should_return_status_401(
+            self,
+            client: FlaskClient,
+    ):
+        """The endpoint requires a token."""
+
+        res = client.post(path='/account/logins', json={})
+
+        assert res.status_code == 401
+
+
+class TestGetSessions:
+    """Tests for listing the user's active sessions."""
+
+    @pytest.mark.integrationtest
+    def test__should_return_active_sessions_newest_first(
+            self,
+            client: FlaskClient,
+            seeded_session: db.Session,
+            headers: Dict[str, str],
+            now: datetime,
+    ):
+        """Only the user's valid tokens are listed, without the tokens."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        client.set_cookie(
+            server_name=TOKEN_COOKIE_DOMAIN,
+            key=TOKEN_COOKIE_NAME,
+            value='OPAQUE_TOKEN_1',
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        res1 = client.post(
+            path='/account/sessions',
+            json={'limit': 2},
+            headers=headers,
+        )
+
+        res2 = client.post(
+            path='/account/sessions',
+            json={'limit': 2, 'cursor': res1.json['next_cursor']},
+            headers=headers,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res1.status_code == 200
+        assert res2.status_code == 200
+        assert res2.json['next_cursor'] is None
+
+        sessions = res1.json['sessions'] + res2.json['sessions']
+
+        assert [
+            datetime.fromisoformat(session['issued'])
+            for session in sessions
+        ] == [now - timedelta(hours=hours) for hours in range(3)]
+
+        assert [session['current'] for session in sessions] == \
+            [False, True, False]
+
+        assert 'OPAQUE_TOKEN' not in res1.get_data(as_text=True)
@@ -3,11 +3,10 @@ from uuid import uuid4
 from typing import Dict, Any
 from unittest.mock import MagicMock
 
-from origin.tokens import TokenEncoder
-
 from auth_api.db import db
 from auth_api.endpoints import AuthState
 from auth_api.models import DbUser, DbExternalUser
+from auth_api.tokens import EncryptedTokenEncoder
 
 
 class OidcCallbackEndpointsSubjectKnownBase:
@@ -40,7 +39,7 @@ class OidcCallbackEndpointsSubjectKnownBase:
     @pytest.fixture(scope='function')
     def state_encoded(
             self,
-            state_encoder: TokenEncoder[AuthState],
+            state_encoder: EncryptedTokenEncoder[AuthState],
             return_url: str,
             fe_url: str
     ) -> str:
@@ -9,12 +9,12 @@ Thus, tests in this file are generic across all OIDC callback endpoints,
 and are therefore tested on all of those endpoints.
 """
 import pytest
-from typing import Dict, Any
+import sqlalchemy as sa
+from typing import Dict, Any, List
 from unittest.mock import MagicMock
 from flask.testing import FlaskClient
 from datetime import datetime, timezone
 
-from origin.tokens import TokenEncoder
 from origin.auth import TOKEN_COOKIE_NAME, TOKEN_HEADER_NAME
 from origin.api.testing import (
     CookieTester,
@@ -22,7 +22,7 @@ from origin.api.testing import (
     assert_query_parameter,
 )
 
-from auth_api.db import db
+from auth_api.db import db, login_db
 from auth_api.endpoints import AuthState
 from auth_api.queries import LoginRecordQuery
 from auth_api.config import (
@@ -31,6 +31,7 @@ from auth_api.config import (
     TOKEN_COOKIE_SAMESITE,
     OIDC_LOGIN_CALLBACK_PATH,
 )
+from auth_api.tokens import EncryptedTokenEncoder
 
 from .bases import OidcCallbackEndpointsSubjectKnownBase
 
@@ -95,6 +96,21 @@ def callback_endpoint_path(request) -> str:
     return request.param
 
 
+@pytest.fixture(scope='function')
+def sql_statements(mock_session: db.Session) -> List[str]:
+    """Yield the SQL statements logging in executed (until end of test)."""
+
+    statements = []
+    engine = login_db.engine
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    yield statements
+    sa.event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
 # -- Tests -------------------------------------------------------------------
 
 
@@ -145,7 +161,7 @@ class TestOidcCallbackEndpoints(object):
     def test__provide_oidc_errors__should_redirect_to_return_url_with_internal_error_code(  # noqa 501
             self,
             client: FlaskClient,
-            state_encoder: TokenEncoder[AuthState],
+            state_encoder: EncryptedTokenEncoder[AuthState],
             callback_endpoint_path: str,
             ip_error_description: str,
             error_code_expected: str,
@@ -203,7 +219,7 @@ class TestOidcCallbackEndpoints(object):
             self,
             client: FlaskClient,
             mock_fetch_token: MagicMock,
-            state_encoder: TokenEncoder[AuthState],
+            state_encoder: EncryptedTokenEncoder[AuthState],
             callback_endpoint_path: str,
     ):
         """
@@ -414,3 +430,74 @@ class TestOidcCallbackEndpointsSubjectKnown(OidcCallbackEndpointsSubjectKnownBas
         LoginRecordQuery(mock_session) \
             .has_subject(internal_subject) \
             .one()
+
+    @pytest.mark.integrationtest
+    def test__should_resolve_user_and_log_in_using_two_sql_statements(
+            self,
+            client: FlaskClient,
+            callback_endpoint_path: str,
+            state_encoded: str,
+            sql_statements: List[str],
+    ):
+        """
+        A returning user should be logged in using a bounded no. of queries.
+
+        One query to resolve the user (joining the external user), and one
+        to register the login and create the token.
+
+        :param client: API client
+        :param callback_endpoint_path: Endpoint path
+        :param state_encoded: AuthState, encoded
+        :param sql_statements: SQL statements executed
+        """
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.get(
+            path=callback_endpoint_path,
+            query_string={'state': state_encoded},
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 307
+        assert len(sql_statements) == 2
+
+    @pytest.mark.integrationtest
+    def test__logging_in_again__should_resolve_user_from_cache(
+            self,
+            client: FlaskClient,
+            callback_endpoint_path: str,
+            state_encoded: str,
+            sql_statements: List[str],
+    ):
+        """
+        The user should not be queried when it has been resolved before.
+
+        :param client: API client
+        :param callback_endpoint_path: Endpoint path
+        :param state_encoded: AuthState, encoded
+        :param sql_statements: SQL statements executed
+        """
+
+        # -- Arrange ---------------------------------------------------------
+
+        client.get(
+            path=callback_endpoint_path,
+            query_string={'state': state_encoded},
+        )
+
+        sql_statements.clear()
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.get(
+            path=callback_endpoint_path,
+            query_string={'state': state_encoded},
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 307
+        assert len(sql_statements) == 1
+        assert sql_statements[0].lstrip().startswith('WITH')
@@ -6,18 +6,16 @@ from urllib.parse import parse_qs, urlsplit
 import pytest
 from flask.testing import FlaskClient
 
-# First party
-from origin.tokens import TokenEncoder
-
 # Local
 from auth_api.endpoints import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
 
 # -- Helpers -----------------------------------------------------------------
 
 
 def get_auth_state_from_redirect_url(
         auth_url: str,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
 ) -> AuthState:
     """
     Get auth state from redirect url.
@@ -46,7 +44,7 @@ class TestOidcLogin:
     def test__should_return_auth_url_as_json_with_correct_state(
             self,
             client: FlaskClient,
-            state_encoder: TokenEncoder[AuthState],
+            state_encoder: EncryptedTokenEncoder[AuthState],
     ):
         """
         Should return auth_url as json with correct state.
@@ -1,20 +1,22 @@
+import asyncio
 import pytest
 
 from typing import Dict, Any
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from flask.testing import FlaskClient
-from urllib.parse import parse_qs, urlsplit
+from urllib.parse import parse_qs, urlencode, urlsplit
 
-from origin.encrypt import aes256_decrypt
-from origin.tokens import TokenEncoder
 from origin.api.testing import assert_base_url
 
-from auth_api.db import db
-from auth_api.endpoints import AuthState
+from auth_api.asgi import AsgiApplication
+from auth_api.db import async_db, db
+from auth_api.endpoints import AsyncOpenIDCallbackEndpoint, AuthState
 from auth_api.config import (
+    INTERNAL_TOKEN_SECRET,
     OIDC_LOGIN_CALLBACK_PATH,
-    STATE_ENCRYPTION_SECRET,
+    OIDC_LOGIN_CALLBACK_URL,
 )
+from auth_api.tokens import EncryptedTokenEncoder
 
 
 class TestOidcLoginCallbackSubjectUnknown:
@@ -32,13 +34,13 @@ class TestOidcLoginCallbackSubjectUnknown:
         mock_session: db.Session,
         mock_get_jwk: MagicMock,
         mock_fetch_token: MagicMock,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         jwk_public: str,
         ip_token: Dict[str, Any],
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
     ):
         """
         User does not exists and should redirect to verify ssn.
@@ -102,9 +104,76 @@ class TestOidcLoginCallbackSubjectUnknown:
         query = parse_qs(url.query)
         state_decoded = state_encoder.decode(query['state'][0])
 
-        state_decoded.id_token = aes256_decrypt(
-            state_decoded.id_token,
-            STATE_ENCRYPTION_SECRET
+        assert expected_state == state_decoded
+
+    @pytest.mark.integrationtest
+    def test__async__user_does_not_exist__should_redirect_to_terms(
+        self,
+        mock_session: db.Session,
+        state_encoder: EncryptedTokenEncoder[AuthState],
+        jwk_public: str,
+        ip_token: Dict[str, Any],
+    ):
+        """
+        The asynchronous callback logs in the same way.
+
+        The token is fetched from the Identity Provider without blocking
+        the event loop.
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        pytest.importorskip('asyncpg')
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
         )
 
-        assert expected_state == state_decoded
+        app = AsgiApplication(secret=INTERNAL_TOKEN_SECRET)
+        app.add_endpoint(
+            method='GET',
+            path=OIDC_LOGIN_CALLBACK_PATH,
+            endpoint=AsyncOpenIDCallbackEndpoint(url=OIDC_LOGIN_CALLBACK_URL),
+        )
+
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        async def request():
+            try:
+                await app({
+                    'type': 'http',
+                    'method': 'GET',
+                    'path': OIDC_LOGIN_CALLBACK_PATH,
+                    'query_string': urlencode({
+                        'state': state_encoder.encode(state),
+                    }).encode(),
+                    'headers': [],
+                }, receive, send)
+            finally:
+                await async_db.dispose()
+
+        # -- Act --------------------------------------------------------------
+
+        with patch('auth_api.oidc.session.fetch_token_async',
+                   new=AsyncMock(return_value=ip_token)), \
+                patch('auth_api.oidc.session.get_jwk_async',
+                      new=AsyncMock(return_value=jwk_public)):
+            asyncio.run(request())
+
+        # -- Assert -----------------------------------------------------------
+
+        headers = dict(messages[0]['headers'])
+
+        assert messages[0]['status'] == 307
+        assert_base_url(
+            url=headers[b'location'].decode(),
+            expected_base_url='https://foobar.com/terms',
+            check_path=True,
+        )
@@ -27,6 +27,7 @@ from auth_api.db import db
 from auth_api.models import DbToken
 from auth_api.queries import TokenQuery
 from auth_api.state import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
 
 
 # -- Fixtures ----------------------------------------------------------------
@@ -429,7 +430,7 @@ class TestHTTPResponse:
         client: FlaskClient,
         id_token: str,
         an_url: str,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         oidc_adapter: requests_mock.Adapter,
     ):
         """When invalidating a login, test that the response status is okay."""
@@ -461,7 +462,7 @@ class TestHTTPResponse:
         self,
         client: FlaskClient,
         an_url: str,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         oidc_adapter: requests_mock.Adapter,
     ):
         """
@@ -517,3 +518,97 @@ class TestHTTPResponse:
         assert oidc_adapter.call_count == 0
 
         assert response.status_code == 400
+
+
+class TestLogoutEverywhere:
+    """Tests logging out of all sessions at once."""
+
+    @pytest.fixture(scope='function')
+    def other_sessions(
+            self,
+            seeded_session: db.Session,
+            subject: str,
+            issued_datetime: datetime,
+            expires_datetime: datetime,
+    ) -> db.Session:
+        """Seed the database with more sessions, also of another subject."""
+
+        for i, token_subject in enumerate((subject, subject, 'other')):
+            seeded_session.add(DbToken(
+                subject=token_subject,
+                opaque_token=f'opaque-token-{i}',
+                internal_token='internal-token',
+                issued=issued_datetime,
+                expires=expires_datetime,
+                id_token=f'id-token-{i}',
+            ))
+
+        seeded_session.commit()
+        return seeded_session
+
+    @pytest.mark.integrationtest
+    def test__logout_everywhere__deletes_all_sessions_of_subject(
+            self,
+            client: FlaskClient,
+            other_sessions: db.Session,
+            oidc_adapter: requests_mock.Adapter,
+            internal_token_encoded: str,
+            subject: str,
+    ):
+        """All the subject's sessions are deleted and logged out."""
+
+        # -- Act -------------------------------------------------------------
+
+        response = client.post(
+            path='/logout/everywhere',
+            headers={
+                'Authorization': 'Bearer: ' + internal_token_encoded
+            }
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert response.status_code == 200
+        assert response.json == {'success': True, 'sessions': 3}
+
+        assert not TokenQuery(other_sessions).has_subject(subject).exists()
+        assert TokenQuery(other_sessions).has_subject('other').count() == 1
+
+        history = oidc_adapter.request_history
+        id_tokens = {request.json()['id_token'] for request in history}
+
+        assert id_tokens == {'id-token', 'id-token-0', 'id-token-1'}
+
+        cookies = CookieTester(response.headers) \
+            .assert_has_cookies(TOKEN_COOKIE_NAME)
+
+        assert cookies.cookies[TOKEN_COOKIE_NAME].value == ''
+
+    @pytest.mark.integrationtest
+    def test__logout_everywhere_when_oidc_fails__still_deletes_sessions(
+            self,
+            client: FlaskClient,
+            other_sessions: db.Session,
+            request_mocker: requests_mock,
+            internal_token_encoded: str,
+            subject: str,
+    ):
+        """Sessions are revoked even if the Identity Provider fails."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        request_mocker.post(OIDC_API_LOGOUT_URL, status_code=500)
+
+        # -- Act -------------------------------------------------------------
+
+        response = client.post(
+            path='/logout/everywhere',
+            headers={
+                'Authorization': 'Bearer: ' + internal_token_encoded
+            }
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert response.status_code == 200
+        assert not TokenQuery(other_sessions).has_subject(subject).exists()
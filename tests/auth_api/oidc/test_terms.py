@@ -1,3 +1,6 @@
+import gzip
+import json
+
 import pytest
 import requests_mock
 
@@ -5,7 +8,6 @@ from typing import Dict, Any
 from unittest.mock import MagicMock
 from flask.testing import FlaskClient
 
-from origin.tokens import TokenEncoder
 from origin.api.testing import (
     assert_base_url,
     assert_query_parameter,
@@ -13,6 +15,7 @@ from origin.api.testing import (
 
 from auth_api.db import db
 from auth_api.state import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
 
 
 @pytest.fixture(scope='function')
@@ -36,13 +39,13 @@ class TestTermsAccept:
         mock_session: db.Session,
         mock_get_jwk: MagicMock,
         mock_fetch_token: MagicMock,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         jwk_public: str,
         ip_token: Dict[str, Any],
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
         terms_accept_url: str,
     ):
         """Tests if the user accepts terms and gets redirected with success."""
@@ -52,11 +55,11 @@ class TestTermsAccept:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             identity_provider=token_idp,
             external_subject=token_subject,
             terms_accepted=True,
-            terms_version='0.1',
+            terms_version='v2',
         )
 
         state_encoded = state_encoder.encode(state)
@@ -69,7 +72,7 @@ class TestTermsAccept:
             path=terms_accept_url,
             json={
                 'state': state_encoded,
-                'version': '0.1',
+                'version': 'v2',
                 'accepted': True
             }
         )
@@ -96,7 +99,7 @@ class TestTermsAccept:
         mock_session: db.Session,
         mock_get_jwk: MagicMock,
         mock_fetch_token: MagicMock,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         jwk_public: str,
         ip_token: Dict[str, Any],
         token_tin: str,
@@ -112,7 +115,7 @@ class TestTermsAccept:
             tin=token_tin,
             id_token=ip_token['id_token'],
             terms_accepted=True,
-            terms_version='0.1',
+            terms_version='v2',
         )
 
         state_encoded = state_encoder.encode(state)
@@ -125,7 +128,7 @@ class TestTermsAccept:
             path=terms_accept_url,
             json={
                 'state': state_encoded,
-                'version': '0.1',
+                'version': 'v2',
                 'accepted': True
             }
         )
@@ -134,19 +137,58 @@ class TestTermsAccept:
 
         assert res.status_code == 500
 
+    def test__user_accepts_terms__with_unknown_version__should_return_status_400(  # noqa: E501
+        self,
+        client: FlaskClient,
+        mock_session: db.Session,
+        state_encoder: EncryptedTokenEncoder[AuthState],
+        token_tin: str,
+        token_idp: str,
+        token_subject: str,
+        id_token_encoded: str,
+        terms_accept_url: str,
+    ):
+        """Tests if the user accepts a version of terms that doesn't exist."""
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encoded,
+            identity_provider=token_idp,
+            external_subject=token_subject,
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        res = client.post(
+            path=terms_accept_url,
+            json={
+                'state': state_encoder.encode(state),
+                'version': 'v0',
+                'accepted': True
+            }
+        )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert res.status_code == 400
+
     def test__user_accepts_terms__should_redirect_with_httponly_cookie(
         self,
         client: FlaskClient,
         mock_session: db.Session,
         mock_get_jwk: MagicMock,
         mock_fetch_token: MagicMock,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         jwk_public: str,
         ip_token: Dict[str, Any],
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
         terms_accept_url: str,
     ):
         """Tests if the users accepts terms and gets a HttpOnly cookie."""
@@ -156,11 +198,11 @@ class TestTermsAccept:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             identity_provider=token_idp,
             external_subject=token_subject,
             terms_accepted=True,
-            terms_version='0.1',
+            terms_version='v2',
         )
 
         state_encoded = state_encoder.encode(state)
@@ -173,7 +215,7 @@ class TestTermsAccept:
             path=terms_accept_url,
             json={
                 'state': state_encoded,
-                'version': '0.1',
+                'version': 'v2',
                 'accepted': True
             }
         )
@@ -199,13 +241,13 @@ class TestTermsDecline:
         mock_session: db.Session,
         mock_get_jwk: MagicMock,
         mock_fetch_token: MagicMock,
-        state_encoder: TokenEncoder[AuthState],
+        state_encoder: EncryptedTokenEncoder[AuthState],
         jwk_public: str,
         ip_token: Dict[str, Any],
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
         oidc_adapter: requests_mock.Adapter,
         terms_accept_url: str,
     ):
@@ -216,11 +258,11 @@ class TestTermsDecline:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             identity_provider=token_idp,
             external_subject=token_subject,
             terms_accepted=False,
-            terms_version='0.1',
+            terms_version='v2',
         )
 
         state_encoded = state_encoder.encode(state)
@@ -233,7 +275,7 @@ class TestTermsDecline:
             path=terms_accept_url,
             json={
                 'state': state_encoded,
-                'version': '0.1',
+                'version': 'v2',
                 'accepted': False
             }
         )
@@ -281,3 +323,107 @@ class TestTermsGet:
         assert res.json['terms'] == expected_content
 
         assert res.json['version'] == expected_version
+
+    def test__user_gets_terms__should_return_etag_and_cache_headers(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """Terms should be cacheable by clients and proxies."""
+
+        res = client.get(
+            path=terms_url
+        )
+
+        assert res.status_code == 200
+        assert res.headers['ETag'].startswith('"v2-')
+        assert res.headers['Cache-Control'].startswith('public, max-age=')
+        assert res.headers['Vary'] == 'Accept-Encoding, Accept-Language'
+        assert 'Content-Encoding' not in res.headers
+
+    def test__user_gets_terms_with_current_etag__should_return_304(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """Revalidating with the current ETag should not return a body."""
+
+        etag = client.get(path=terms_url).headers['ETag']
+
+        res = client.get(
+            path=terms_url,
+            headers={'If-None-Match': etag},
+        )
+
+        assert res.status_code == 304
+        assert res.headers['ETag'] == etag
+        assert res.data == b''
+
+    def test__user_gets_terms_with_outdated_etag__should_return_terms(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """Revalidating with an outdated ETag should return the terms."""
+
+        res = client.get(
+            path=terms_url,
+            headers={'If-None-Match': '"v1-0000000000000000"'},
+        )
+
+        assert res.status_code == 200
+        assert res.json['version'] == 'v2'
+
+    def test__user_gets_terms_accepting_gzip__should_return_gzipped_terms(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """Clients accepting gzip should get precompressed terms."""
+
+        res = client.get(
+            path=terms_url,
+            headers={'Accept-Encoding': 'gzip;q=1.0, identity;q=0.5'},
+        )
+
+        assert res.status_code == 200
+        assert res.headers['Content-Encoding'] == 'gzip'
+        assert res.headers['Content-Type'] == 'application/json'
+        assert res.headers['ETag'].endswith('-gzip"')
+        assert json.loads(gzip.decompress(res.data))['version'] == 'v2'
+
+    def test__user_gets_terms_in_danish__should_return_danish_terms(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """Terms should be returned in the client's preferred language."""
+
+        res = client.get(
+            path=terms_url,
+            headers={'Accept-Language': 'da-DK,da;q=0.9,en;q=0.8'},
+        )
+
+        assert res.status_code == 200
+        assert res.headers['Content-Language'] == 'da'
+        assert res.json['headline'] == 'Privatlivspolitik'
+        assert res.json['terms'] == '<h1>Testfil 2</h1>\n'
+        assert res.json['version'] == 'v2'
+        assert res.json['language'] == 'da'
+
+    def test__user_gets_terms_with_language_parameter__should_override_header(
+        self,
+        client: FlaskClient,
+        terms_url,
+    ):
+        """The language parameter takes precedence over Accept-Language."""
+
+        res = client.get(
+            path=terms_url,
+            query_string={'language': 'en'},
+            headers={'Accept-Language': 'da'},
+        )
+
+        assert res.status_code == 200
+        assert res.json['language'] == 'en'
+        assert res.json['headline'] == 'Privacy Policy'
@@ -7,10 +7,11 @@ from uuid import uuid4
 import pytest
 
 # Local
+from auth_api.controller import db_controller, ssn_blind_index
 from auth_api.db import db
 from auth_api.endpoints import AuthState
 from auth_api.models import DbExternalUser, DbUser
-from auth_api.queries import UserQuery
+from auth_api.queries import ExternalUserQuery, UserQuery
 from auth_api.user import create_or_get_user
 
 # -- Tests --------------------------------------------------------------------
@@ -84,7 +85,7 @@ class TestCreateUser:
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
     ):
         """Tests if a user exists and creates the user if not."""
 
@@ -93,7 +94,7 @@ class TestCreateUser:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             terms_accepted=True,
             terms_version='0.1',
             identity_provider=token_idp,
@@ -120,7 +121,7 @@ class TestCreateUser:
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
     ):
         """
         Attempts to add a user with the same tin as an existing user.
@@ -134,7 +135,7 @@ class TestCreateUser:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             terms_accepted=True,
             terms_version='0.1',
             identity_provider=token_idp,
@@ -164,7 +165,7 @@ class TestCreateUser:
         token_tin: str,
         token_idp: str,
         token_subject: str,
-        id_token_encrypted: str,
+        id_token_encoded: str,
     ):
         """
         When terms have not been accepted, we cannot create a user.
@@ -176,7 +177,7 @@ class TestCreateUser:
             fe_url='https://foobar.com',
             return_url='https://redirect-here.com/foobar',
             tin=token_tin,
-            id_token=id_token_encrypted,
+            id_token=id_token_encoded,
             terms_accepted=False,
             terms_version='0.1',
             identity_provider=token_idp,
@@ -199,3 +200,126 @@ class TestCreateUser:
         assert UserQuery(mock_session) \
             .has_tin(token_tin) \
             .count() == 0
+
+    @pytest.mark.integrationtest
+    def test__create_user__when_called_twice__it_should_return_the_same_user(
+        self,
+        mock_session: db.Session,
+        token_tin: str,
+        token_idp: str,
+        token_subject: str,
+        id_token_encoded: str,
+    ):
+        """
+        Creating the same user twice should be idempotent.
+
+        The user should be created and the external user attached only once.
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encoded,
+            terms_accepted=True,
+            terms_version='0.1',
+            identity_provider=token_idp,
+            external_subject=token_subject,
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        user1 = create_or_get_user(session=mock_session, state=state)
+        user2 = create_or_get_user(session=mock_session, state=state)
+
+        # -- Assert -----------------------------------------------------------
+
+        assert user1.subject == user2.subject
+
+        assert UserQuery(mock_session) \
+            .has_tin(token_tin) \
+            .count() == 1
+
+        assert ExternalUserQuery(mock_session) \
+            .has_identity_provider(token_idp) \
+            .has_external_subject(token_subject) \
+            .one().subject == user1.subject
+
+    @pytest.mark.integrationtest
+    def test__create_user__when_user_exists__it_should_attach_new_external_user(  # noqa: E501
+        self,
+        seeded_session: db.Session,
+        token_tin: str,
+        token_idp: str,
+        internal_subject: str,
+        id_token_encoded: str,
+    ):
+        """
+        Logging in via another Identity Provider should reuse the user.
+
+        The new external user should be attached to the existing user.
+        """
+
+        # -- Arrange ----------------------------------------------------------
+
+        state = AuthState(
+            fe_url='https://foobar.com',
+            return_url='https://redirect-here.com/foobar',
+            tin=token_tin,
+            id_token=id_token_encoded,
+            terms_accepted=True,
+            terms_version='0.1',
+            identity_provider=token_idp,
+            external_subject='another-external-subject',
+        )
+
+        # -- Act --------------------------------------------------------------
+
+        user = create_or_get_user(session=seeded_session, state=state)
+
+        # -- Assert -----------------------------------------------------------
+
+        assert user.subject == internal_subject
+
+        assert ExternalUserQuery(seeded_session) \
+            .has_external_subject('another-external-subject') \
+            .one().subject == internal_subject
+
+    @pytest.mark.integrationtest
+    def test__get_or_create_user__by_ssn__it_should_find_user_by_blind_index(  # noqa: E501
+        self,
+        mock_session: db.Session,
+        token_idp: str,
+        token_subject: str,
+    ):
+        """
+        Users identified by SSN should be found by its blind index.
+
+        The encrypted SSN is randomized, so it differs between logins.
+        """
+
+        # -- Act --------------------------------------------------------------
+
+        user1 = db_controller.get_or_create_user(
+            session=mock_session,
+            identity_provider=token_idp,
+            external_subject=token_subject,
+            ssn='0101011234',
+        )
+
+        user2 = db_controller.get_or_create_user(
+            session=mock_session,
+            identity_provider=token_idp,
+            external_subject=token_subject,
+            ssn='0101011234',
+        )
+
+        # -- Assert -----------------------------------------------------------
+
+        assert user1.subject == user2.subject
+
+        assert UserQuery(mock_session) \
+            .has_ssn_index(ssn_blind_index('0101011234')) \
+            .one().subject == user1.subject
@@ -0,0 +1,192 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from auth_api.terms import TermsRegistry
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def terms_folder(tmp_path: Path) -> Path:
+    """Folder with two versions of the terms."""
+
+    (tmp_path / 'v1.md').write_text('# Version 1')
+    (tmp_path / 'v2.md').write_text('# Version 2')
+
+    return tmp_path
+
+
+@pytest.fixture(scope='function')
+def registry(terms_folder: Path) -> TermsRegistry:
+    """Registry which checks the folder for changes on every access."""
+
+    registry = TermsRegistry(folder=str(terms_folder), poll_interval=0)
+    registry.load()
+
+    return registry
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestTermsRegistry:
+    """Tests for the in-memory terms registry."""
+
+    @pytest.mark.unittest
+    def test__latest__should_return_newest_version_rendered(
+            self,
+            registry: TermsRegistry,
+    ):
+        """The newest version should be returned rendered as HTML."""
+
+        assert registry.latest().version == 'v2'
+        assert registry.latest().html == '<h1>Version 2</h1>\n'
+        assert registry.latest().headline == 'Privacy Policy'
+
+    @pytest.mark.unittest
+    def test__latest__versions_sort_naturally(
+            self,
+            registry: TermsRegistry,
+            terms_folder: Path,
+    ):
+        """Version 'v10' is newer than 'v2'."""
+
+        (terms_folder / 'v10.md').write_text('# Version 10')
+
+        assert registry.latest().version == 'v10'
+
+    @pytest.mark.unittest
+    def test__has_version__should_only_return_true_for_existing_versions(
+            self,
+            registry: TermsRegistry,
+    ):
+        """Only versions in the folder exists."""
+
+        assert registry.has_version('v1')
+        assert registry.has_version('v2')
+        assert not registry.has_version('v3')
+        assert registry.get('v3') is None
+
+    @pytest.mark.unittest
+    def test__file_added__should_be_picked_up_when_polling(
+            self,
+            registry: TermsRegistry,
+            terms_folder: Path,
+    ):
+        """New files are loaded next time the folder is polled."""
+
+        (terms_folder / 'v3.md').write_text('# Version 3')
+
+        assert registry.has_version('v3')
+        assert registry.latest().html == '<h1>Version 3</h1>\n'
+
+    @pytest.mark.unittest
+    def test__file_changed__should_be_rendered_again_when_polling(
+            self,
+            registry: TermsRegistry,
+            terms_folder: Path,
+    ):
+        """Changed files are reloaded next time the folder is polled."""
+
+        file_path = terms_folder / 'v2.md'
+        file_path.write_text('# Version 2, changed')
+        stat = file_path.stat()
+        os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        assert registry.latest().html == '<h1>Version 2, changed</h1>\n'
+
+    @pytest.mark.unittest
+    def test__not_polling__should_not_touch_the_file_system(
+            self,
+            terms_folder: Path,
+    ):
+        """Within the poll interval, terms are served from memory."""
+
+        registry = TermsRegistry(folder=str(terms_folder), poll_interval=60)
+        registry.load()
+
+        (terms_folder / 'v3.md').write_text('# Version 3')
+
+        assert registry.latest().version == 'v2'
+        assert not registry.has_version('v3')
+
+    @pytest.mark.unittest
+    def test__no_terms__should_raise_runtime_error(
+            self,
+            tmp_path: Path,
+    ):
+        """An empty folder has no latest version."""
+
+        registry = TermsRegistry(folder=str(tmp_path), poll_interval=60)
+
+        with pytest.raises(RuntimeError):
+            registry.latest()
+
+
+class TestTermsRegistryLanguages:
+    """Tests for terms in multiple languages."""
+
+    @pytest.fixture(scope='function')
+    def registry(self, terms_folder: Path) -> TermsRegistry:
+        """Registry with terms in english (default) and danish."""
+
+        (terms_folder / 'da').mkdir()
+        (terms_folder / 'da' / 'headline.txt').write_text('Privatliv\n')
+        (terms_folder / 'da' / 'v1.md').write_text('# Version 1 (da)')
+        (terms_folder / 'da' / 'v2.md').write_text('# Version 2 (da)')
+        (terms_folder / 'de').mkdir()
+        (terms_folder / 'de' / 'v1.md').write_text('# Version 1 (de)')
+
+        registry = TermsRegistry(folder=str(terms_folder), poll_interval=60)
+        registry.load()
+
+        return registry
+
+    @pytest.mark.parametrize('accept_language, expected_language', [
+        (None, 'en'),
+        ('da', 'da'),
+        ('da-DK, en;q=0.5', 'da'),
+        ('fr, da;q=0.8', 'da'),
+        ('fr', 'en'),
+        ('da;q=0, en', 'en'),
+    ])
+    @pytest.mark.unittest
+    def test__latest__should_return_preferred_language(
+            self,
+            registry: TermsRegistry,
+            accept_language: str,
+            expected_language: str,
+    ):
+        """The client's preferred language is used, if available."""
+
+        terms = registry.latest(accept_language)
+
+        assert terms.version == 'v2'
+        assert terms.language == expected_language
+
+    @pytest.mark.unittest
+    def test__latest__should_not_return_outdated_translations(
+            self,
+            registry: TermsRegistry,
+    ):
+        """A language without the newest version falls back to default."""
+
+        terms = registry.latest('de')
+
+        assert terms.version == 'v2'
+        assert terms.language == 'en'
+
+    @pytest.mark.unittest
+    def test__headline__should_be_read_per_language(
+            self,
+            registry: TermsRegistry,
+    ):
+        """Languages have their own headlines, with a default fallback."""
+
+        assert registry.get('v2', 'da').headline == 'Privatliv'
+        assert registry.get('v2', 'en').headline == 'Privacy Policy'
+        assert registry.get('v1', 'de').headline == 'Privacy Policy'
+        assert registry.get('v2', 'de') is None
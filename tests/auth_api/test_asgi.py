@@ -0,0 +1,354 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from origin.api import Context, Cookie, Endpoint, HttpResponse, TokenGuard
+from origin.models.auth import InternalToken
+from origin.tokens import TokenEncoder
+
+from auth_api.asgi import AsgiApplication
+from auth_api.config import INTERNAL_TOKEN_SECRET
+from auth_api.oidc import OAuth2Session
+
+
+class AsyncEcho(Endpoint):
+    """Asynchronous endpoint returning the request and subject."""
+
+    @dataclass
+    class Request:
+        """Request."""
+
+        text: str
+
+    @dataclass
+    class Response:
+        """Response."""
+
+        text: str
+        subject: Optional[str]
+        cookie: Optional[str]
+
+    async def handle_request(self, request: Request, context: Context):
+        """Echo the request, yielding to the event loop first."""
+
+        await asyncio.sleep(0)
+
+        return self.Response(
+            text=request.text,
+            subject=context.token.subject if context.token else None,
+            cookie=context.cookies.get('a'),
+        )
+
+
+class SyncCookie(Endpoint):
+    """Synchronous endpoint setting a cookie."""
+
+    def handle_request(self) -> HttpResponse:
+        """Set a cookie."""
+
+        return HttpResponse(
+            status=200,
+            cookies=(Cookie(
+                name='a',
+                value='b',
+                path='/',
+                domain='example.com',
+                http_only=True,
+                same_site=True,
+                secure=True,
+            ),),
+        )
+
+
+async def _request(
+        app: AsgiApplication,
+        method: str,
+        path: str,
+        query_string: bytes = b'',
+        body: bytes = b'',
+        headers: Optional[List[Tuple[bytes, bytes]]] = None,
+) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Make a request to the ASGI application."""
+
+    messages: List[Dict[str, Any]] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': query_string,
+        'headers': headers or [],
+    }, receive, send)
+
+    start, *bodies = messages
+
+    return (
+        start['status'],
+        [(k.decode(), v.decode()) for k, v in start['headers']],
+        b''.join(message['body'] for message in bodies),
+    )
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def app() -> AsgiApplication:
+    """ASGI application (without fallback) with a few endpoints."""
+
+    app = AsgiApplication(secret=INTERNAL_TOKEN_SECRET)
+    app.add_endpoint('GET', '/echo', AsyncEcho())
+    app.add_endpoint('POST', '/echo', AsyncEcho())
+    app.add_endpoint('POST', '/guarded', AsyncEcho(), guards=[TokenGuard()])
+    app.add_endpoint('GET', '/cookie', SyncCookie())
+
+    return app
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestAsgiApplication:
+    """Tests for the ASGI application."""
+
+    @pytest.mark.unittest
+    def test__async_endpoint__should_parse_json_body_and_context(
+            self,
+            app: AsgiApplication,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Request data, token, and cookies are passed to coroutines."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        token = internal_token_encoder.encode(InternalToken(
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+            actor='actor',
+            subject='subject',
+            scope=[],
+        ))
+
+        # -- Act -------------------------------------------------------------
+
+        status, headers, body = asyncio.run(_request(
+            app=app,
+            method='POST',
+            path='/guarded',
+            body=b'{"text": "hello"}',
+            headers=[
+                (b'authorization', f'Bearer: {token}'.encode()),
+                (b'cookie', b'a=1'),
+            ],
+        ))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert status == 200
+        assert ('content-type', 'application/json') in headers
+        assert body == b'{"text":"hello","subject":"subject","cookie":"1"}'
+
+    @pytest.mark.unittest
+    def test__get__should_parse_query_string(self, app: AsgiApplication):
+        """Request data of GET endpoints is read from the query string."""
+
+        status, _, body = asyncio.run(_request(
+            app=app,
+            method='GET',
+            path='/echo',
+            query_string=b'text=hi',
+        ))
+
+        assert status == 200
+        assert body == b'{"text":"hi","subject":null,"cookie":null}'
+
+    @pytest.mark.parametrize('body, expected_status', [
+        (b'{"text": 1}', 400),
+        (b'not json', 400),
+    ])
+    @pytest.mark.unittest
+    def test__invalid_request__should_return_status_400(
+            self,
+            app: AsgiApplication,
+            body: bytes,
+            expected_status: int,
+    ):
+        """Invalid request data is rejected."""
+
+        status, _, _ = asyncio.run(_request(
+            app=app,
+            method='POST',
+            path='/echo',
+            body=body,
+        ))
+
+        assert status == expected_status
+
+    @pytest.mark.unittest
+    def test__guard_fails__should_return_status_401(
+            self,
+            app: AsgiApplication,
+    ):
+        """Guards are validated before the endpoint is invoked."""
+
+        status, _, body = asyncio.run(_request(
+            app=app,
+            method='POST',
+            path='/guarded',
+            body=b'{"text": "hello"}',
+        ))
+
+        assert status == 401
+        assert body == b'401 Unauthorized'
+
+    @pytest.mark.unittest
+    def test__sync_endpoint__should_set_cookies(self, app: AsgiApplication):
+        """Synchronous endpoints are supported too."""
+
+        status, headers, _ = asyncio.run(_request(
+            app=app,
+            method='GET',
+            path='/cookie',
+        ))
+
+        cookie = dict(headers)['set-cookie']
+
+        assert status == 200
+        assert cookie.startswith('a=b; Domain=example.com; Secure; HttpOnly')
+        assert 'SameSite=Strict' in cookie
+
+    @pytest.mark.unittest
+    def test__unknown_path_without_fallback__should_return_status_404(
+            self,
+            app: AsgiApplication,
+    ):
+        """Only added endpoints are served."""
+
+        status, _, _ = asyncio.run(_request(
+            app=app,
+            method='GET',
+            path='/unknown',
+        ))
+
+        assert status == 404
+
+    @pytest.mark.unittest
+    def test__lifespan__should_await_startup_and_shutdown_callbacks(
+            self,
+            app: AsgiApplication,
+    ):
+        """Callbacks are awaited in the order they are added."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        events = []
+
+        async def callback(event: str):
+            events.append(event)
+
+        app.on_startup(lambda: callback('startup'))
+        app.on_shutdown(lambda: callback('shutdown'))
+
+        messages = [
+            {'type': 'lifespan.startup'},
+            {'type': 'lifespan.shutdown'},
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        # -- Act -------------------------------------------------------------
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert events == ['startup', 'shutdown']
+        assert sent == [
+            'lifespan.startup.complete',
+            'lifespan.shutdown.complete',
+        ]
+
+
+class TestAsyncOAuth2Session:
+    """Tests for the asynchronous methods of OAuth2Session."""
+
+    @pytest.mark.unittest
+    def test__async_methods__should_share_one_client(self):
+        """Requests to the Identity Provider reuse the client opened."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        httpx = pytest.importorskip('httpx')
+        requests = []
+
+        def handle(request):
+            requests.append(request.url.path)
+
+            if request.url.path == '/token':
+                return httpx.Response(200, json={
+                    'access_token': 'access-token',
+                    'token_type': 'Bearer',
+                })
+
+            return httpx.Response(200, text='{"keys": []}')
+
+        session = OAuth2Session(
+            jwk_endpoint='http://idp.com/jwks',
+            api_logout_url='http://idp.com/logout',
+            jwk_cache_ttl=60,
+            client_id='client-id',
+            client_secret='client-secret',
+        )
+
+        async def use_session():
+            await session.open_async(transport=httpx.MockTransport(handle))
+            client = session.async_client
+
+            token = await session.fetch_token_async(
+                url='http://idp.com/token',
+                grant_type='authorization_code',
+                code='code',
+            )
+            await session.get_jwk_async()
+            await session.get_jwk_async()
+            await session.logout_async('id-token-1')
+            await session.logout_async('id-token-2')
+
+            assert session.async_client is client
+
+            await session.close_async()
+
+            return token, client
+
+        # -- Act -------------------------------------------------------------
+
+        token, client = asyncio.run(use_session())
+
+        # -- Assert ----------------------------------------------------------
+
+        assert token['access_token'] == 'access-token'
+        assert requests == ['/token', '/jwks', '/logout', '/logout']
+        assert client.is_closed
+
+    @pytest.mark.unittest
+    def test__async_client_not_open__should_raise_runtime_error(self):
+        """The client must be opened (on startup) before it is used."""
+
+        session = OAuth2Session(jwk_endpoint='', api_logout_url='')
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(session.logout_async('id-token'))
@@ -0,0 +1,533 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlalchemy as sa
+from flask.testing import FlaskClient
+
+from origin.models.auth import InternalToken
+from origin.sql import SqlEngine
+from origin.tokens import TokenEncoder
+
+from auth_api.bulkheads import BulkheadSqlEngine, ServiceUnavailable
+from auth_api.config import (
+    BULKHEAD_RETRY_AFTER,
+    METRICS_SCOPE,
+    SERVER_THREADS,
+)
+from auth_api.controller import db_controller
+from auth_api.db import introspection_db, login_db
+from auth_api.edge import CachedToken, token_key
+from auth_api.endpoints import ForwardAuth
+
+
+def _hold_worker(bulkhead: BulkheadSqlEngine) -> Callable[[], None]:
+    """Occupy a worker in another thread until release is invoked."""
+
+    started = threading.Event()
+    released = threading.Event()
+
+    def hold():
+        with bulkhead.worker():
+            started.set()
+            released.wait(5)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+    started.wait(5)
+
+    def release():
+        released.set()
+        thread.join(5)
+
+    return release
+
+
+def _hold_connection(
+        bulkhead: BulkheadSqlEngine,
+        block: bool = True,
+) -> Callable[[], None]:
+    """
+    Query in another thread, holding a connection until released.
+
+    :param bulkhead: The bulkhead to hold a connection of
+    :param block: Whether to block until the connection is checked out
+    """
+
+    started = threading.Event()
+    released = threading.Event()
+
+    @bulkhead.session()
+    def hold(session: SqlEngine.Session):
+        session.execute(sa.text('SELECT 1'))
+        started.set()
+        released.wait(5)
+
+    thread = threading.Thread(target=hold, daemon=True)
+    thread.start()
+
+    if block:
+        started.wait(5)
+
+    def release():
+        released.set()
+        thread.join(5)
+
+    return release
+
+
+def _wait_until(condition: Callable[[], bool]):
+    """Wait (at most 5 seconds) until a condition is true."""
+
+    for _ in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+
+    raise AssertionError('Condition not met in time')
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def bulkhead(db: SqlEngine) -> BulkheadSqlEngine:
+    """Bulkhead with a single connection and a single worker."""
+
+    return BulkheadSqlEngine(
+        name='test',
+        parent=db,
+        pool_size=1,
+        max_workers=1,
+    )
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestBulkheadSqlEngine:
+    """Tests for BulkheadSqlEngine."""
+
+    @pytest.mark.integrationtest
+    def test__session__should_use_own_pool_and_record_pool_wait(
+            self,
+            db: SqlEngine,
+            bulkhead: BulkheadSqlEngine,
+    ):
+        """Connections come from a pool (without overflow) of its own."""
+
+        # -- Act -------------------------------------------------------------
+
+        @bulkhead.session()
+        def query(session: SqlEngine.Session) -> int:
+            return session.execute(sa.text('SELECT 1')).scalar()
+
+        result = query()
+
+        # -- Assert ----------------------------------------------------------
+
+        metrics = bulkhead.metrics()
+
+        assert result == 1
+        assert bulkhead.uri == db.uri
+        assert bulkhead.engine is not db.engine
+        assert bulkhead.engine.pool.size() == 1
+        assert bulkhead.engine.pool._max_overflow == 0
+        assert metrics.pool_wait.count == 1
+        assert metrics.worker_wait.count == 1
+        assert metrics.active_workers == 0
+
+    @pytest.mark.unittest
+    def test__no_worker_available__should_wait_for_one(
+            self,
+            bulkhead: BulkheadSqlEngine,
+    ):
+        """A second thread waits until the first one has finished."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        started = threading.Event()
+        release = threading.Event()
+        events = []
+
+        def first():
+            with bulkhead.worker():
+                started.set()
+                release.wait(5)
+                events.append('first done')
+
+        def second():
+            with bulkhead.worker():
+                events.append('second started')
+
+        thread1 = threading.Thread(target=first)
+        thread2 = threading.Thread(target=second)
+
+        # -- Act -------------------------------------------------------------
+
+        thread1.start()
+        started.wait(5)
+        thread2.start()
+        thread2.join(0.1)
+
+        active_while_waiting = bulkhead.active_workers
+
+        release.set()
+        thread1.join(5)
+        thread2.join(5)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert active_while_waiting == 1
+        assert events == ['first done', 'second started']
+        assert bulkhead.metrics().worker_wait.max > 0.05
+
+    @pytest.mark.unittest
+    def test__nested_use__should_count_as_one_worker(
+            self,
+            bulkhead: BulkheadSqlEngine,
+    ):
+        """Nested use by the same thread does not wait for itself."""
+
+        with bulkhead.worker():
+            with bulkhead.worker():
+                assert bulkhead.active_workers == 1
+
+        assert bulkhead.active_workers == 0
+        assert bulkhead.metrics().worker_wait.count == 1
+
+
+class TestLoadShedding:
+    """Tests for shedding load when a bulkhead is overloaded."""
+
+    @pytest.mark.unittest
+    def test__too_many_waiting__should_reject_immediately(self, db):
+        """Requests arriving while the queue is full are rejected."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        bulkhead = BulkheadSqlEngine(
+            name='test',
+            parent=db,
+            pool_size=1,
+            max_workers=1,
+            max_wait=5,
+            max_waiting=0,
+            retry_after=3,
+        )
+
+        release = _hold_worker(bulkhead)
+
+        # -- Act -------------------------------------------------------------
+
+        with pytest.raises(ServiceUnavailable) as e:
+            with bulkhead.worker():
+                pass
+
+        release()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert e.value.status == 503
+        assert e.value.headers == {'Retry-After': '3'}
+        assert bulkhead.metrics().shed == 1
+        assert bulkhead.metrics().worker_wait.count == 1
+
+    @pytest.mark.unittest
+    def test__no_worker_within_max_wait__should_reject(self, db):
+        """Requests waiting longer than max_wait for a worker are rejected."""
+
+        bulkhead = BulkheadSqlEngine(
+            name='test',
+            parent=db,
+            pool_size=1,
+            max_workers=1,
+            max_wait=0.05,
+        )
+
+        release = _hold_worker(bulkhead)
+
+        with pytest.raises(ServiceUnavailable):
+            with bulkhead.worker():
+                pass
+
+        release()
+
+        assert bulkhead.metrics().shed == 1
+        assert bulkhead.metrics().waiting_workers == 0
+
+    @pytest.mark.unittest
+    def test__higher_priority_saturated__should_reject(self, db):
+        """Requests yield to a bulkhead of a higher priority with waiters."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        priority = BulkheadSqlEngine(
+            name='priority',
+            parent=db,
+            pool_size=1,
+            max_workers=1,
+        )
+        bulkhead = BulkheadSqlEngine(
+            name='test',
+            parent=db,
+            pool_size=1,
+            yield_to=priority,
+        )
+
+        release_busy = _hold_worker(priority)
+
+        # -- Act -------------------------------------------------------------
+
+        # Busy, but nobody waiting
+        with bulkhead.worker():
+            busy_saturated = priority.saturated
+
+        release_waiting = _hold_worker(priority)
+        _wait_until(lambda: priority.metrics().waiting_workers == 1)
+
+        with pytest.raises(ServiceUnavailable):
+            with bulkhead.worker():
+                pass
+
+        release_busy()
+        release_waiting()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert not busy_saturated
+        assert not priority.saturated
+        assert bulkhead.metrics().shed == 1
+
+    @pytest.mark.integrationtest
+    def test__waiting_for_connection__should_be_saturated(self, db):
+        """Requests waiting for a connection (not a worker) count too."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        bulkhead = BulkheadSqlEngine(name='test', parent=db, pool_size=1)
+        release_first = _hold_connection(bulkhead)
+
+        # -- Act -------------------------------------------------------------
+
+        busy_saturated = bulkhead.saturated
+
+        release_second = _hold_connection(bulkhead, block=False)
+        _wait_until(lambda: bulkhead.saturated)
+
+        release_first()
+        release_second()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert not busy_saturated
+        assert not bulkhead.saturated
+
+    @pytest.mark.integrationtest
+    def test__no_connection_within_max_wait__should_reject(self, db):
+        """Requests waiting longer than max_wait for a connection are too."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        bulkhead = BulkheadSqlEngine(
+            name='test',
+            parent=db,
+            pool_size=1,
+            max_wait=0.05,
+        )
+
+        @bulkhead.session()
+        def query(session: SqlEngine.Session) -> int:
+            return session.execute(sa.text('SELECT 1')).scalar()
+
+        # -- Act -------------------------------------------------------------
+
+        # Holds the only connection while querying using another session
+        @bulkhead.session()
+        def query_twice(session: SqlEngine.Session) -> int:
+            session.execute(sa.text('SELECT 1'))
+            return query()
+
+        with pytest.raises(ServiceUnavailable):
+            query_twice()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert bulkhead.metrics().shed == 1
+        assert query() == 1
+
+    @pytest.mark.integrationtest
+    def test__default_sizes__should_shed_at_server_thread_count(self, db):
+        """
+        With the default sizes, the server's threads are enough to shed.
+
+        Every server thread but one is busy, and the last thread must not
+        be occupied by login while the others are.
+        """
+        busy = SERVER_THREADS - 1
+
+        # Every login worker busy (leaving threads for introspection), so
+        # another login is rejected
+        assert login_db.max_workers + login_db.max_waiting <= busy
+
+        releases = [
+            _hold_worker(login_db) for _ in range(login_db.max_workers)]
+
+        try:
+            with pytest.raises(ServiceUnavailable):
+                with login_db.worker():
+                    pass
+
+            # ...while introspection is still served
+            with introspection_db.worker():
+                pass
+        finally:
+            for release in releases:
+                release()
+
+        # Introspection with requests waiting for a connection, so login
+        # yields to it
+        releases = [
+            _hold_connection(introspection_db)
+            for _ in range(introspection_db.pool_size)
+        ]
+        releases.append(_hold_connection(introspection_db, block=False))
+
+        try:
+            _wait_until(lambda: introspection_db.saturated)
+
+            with pytest.raises(ServiceUnavailable):
+                with login_db.worker():
+                    pass
+        finally:
+            for release in releases:
+                release()
+
+        with login_db.worker():
+            pass
+
+    @pytest.mark.integrationtest
+    def test__login_during_forward_auth__should_not_shed_login(self, db):
+        """A single in-flight ForwardAuth does not make login yield."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        shed = login_db.metrics().shed
+        release = _hold_connection(introspection_db)
+
+        # -- Act -------------------------------------------------------------
+
+        try:
+            with login_db.worker():
+                saturated = introspection_db.saturated
+        finally:
+            release()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert not saturated
+        assert login_db.metrics().shed == shed
+
+    @pytest.mark.unittest
+    def test__forward_auth_cache_hit__should_not_query_database(self):
+        """Cached tokens are resolved without the introspection bulkhead."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        db_controller.token_cache.set(token_key('opaque-token'), CachedToken(
+            internal_token='internal-token',
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+        ))
+
+        # -- Act -------------------------------------------------------------
+
+        with patch.object(ForwardAuth, 'query_internal_tokens') as query:
+            internal_token = ForwardAuth().get_internal_token('opaque-token')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert internal_token == 'internal-token'
+        query.assert_not_called()
+
+    @pytest.mark.integrationtest
+    def test__login_endpoint_shedding__should_return_status_503(
+            self,
+            client: FlaskClient,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Rejected requests get a fast 503 with Retry-After."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        token = internal_token_encoder.encode(InternalToken(
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+            actor='actor',
+            subject='subject',
+            scope=[],
+        ))
+
+        # -- Act -------------------------------------------------------------
+
+        with patch.object(login_db, 'yield_to', MagicMock(saturated=True)):
+            res = client.post(
+                '/account/logins',
+                json={},
+                headers={'Authorization': f'Bearer: {token}'},
+            )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 503
+        assert res.headers['Retry-After'] == str(BULKHEAD_RETRY_AFTER)
+
+
+class TestGetBulkheadMetrics:
+    """Tests for the bulkhead metrics endpoint."""
+
+    @pytest.mark.integrationtest
+    def test__with_scope__should_return_metrics_of_each_bulkhead(
+            self,
+            client: FlaskClient,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Metrics of every class of traffic are returned."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        token = internal_token_encoder.encode(InternalToken(
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+            actor='service',
+            subject='service',
+            scope=[METRICS_SCOPE],
+        ))
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.get(
+            '/metrics/bulkheads',
+            headers={'Authorization': f'Bearer: {token}'},
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 200
+        assert [b['name'] for b in res.json['bulkheads']] == \
+            ['introspection', 'login', 'admin']
+        assert set(res.json['bulkheads'][0]['pool_wait']) == \
+            {'count', 'total', 'max'}
+
+    @pytest.mark.integrationtest
+    def test__without_scope__should_return_status_401(
+            self,
+            client: FlaskClient,
+    ):
+        """Metrics are only available to internal services."""
+
+        res = client.get('/metrics/bulkheads')
+
+        assert res.status_code == 401
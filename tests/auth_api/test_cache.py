@@ -0,0 +1,113 @@
+from unittest.mock import patch
+
+import pytest
+
+from auth_api.cache import LRUCache
+
+
+class TestLRUCache:
+    """Tests for the in-memory LRU cache."""
+
+    @pytest.mark.unittest
+    def test__set_and_get__should_return_cached_value(self):
+        """Cached values are returned, others are not."""
+
+        cache = LRUCache(maxsize=10)
+        cache.set('a', 1)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+
+    @pytest.mark.unittest
+    def test__full__should_evict_least_recently_used(self):
+        """When full, the entry used longest ago is evicted."""
+
+        cache = LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert len(cache) == 2
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+
+    @pytest.mark.unittest
+    def test__invalidate__should_remove_entry(self):
+        """Invalidated entries are no longer cached."""
+
+        cache = LRUCache(maxsize=10)
+        cache.set('a', 1)
+        cache.invalidate('a')
+        cache.invalidate('b')
+
+        assert cache.get('a') is None
+
+    @pytest.mark.unittest
+    def test__maxsize_zero__should_not_cache(self):
+        """A cache with maxsize 0 is disabled."""
+
+        cache = LRUCache(maxsize=0)
+        cache.set('a', 1)
+
+        assert cache.get('a') is None
+
+    @pytest.mark.unittest
+    def test__get_many__should_return_only_cached_values(self):
+        """Keys which are not cached are omitted."""
+
+        cache = LRUCache(maxsize=10)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        assert cache.get_many(['a', 'b', 'c']) == {'a': 1, 'b': 2}
+
+        cache.invalidate_many(['a', 'c'])
+
+        assert cache.get_many(['a', 'b', 'c']) == {'b': 2}
+
+    @pytest.mark.unittest
+    def test__ttl_elapsed__should_expire_entry(self):
+        """Entries older than the TTL are no longer cached."""
+
+        cache = LRUCache(maxsize=10, ttl=60)
+        cache.set('a', 1)
+
+        with patch('auth_api.cache.time.monotonic', return_value=1e12):
+            assert cache.get('a') is None
+            assert cache.get_many(['a']) == {}
+
+        assert len(cache) == 0
+
+    @pytest.mark.unittest
+    def test__ttl_of_entry__should_override_ttl_of_cache(self):
+        """Entries can be cached for longer (or shorter) than the TTL."""
+
+        with patch('auth_api.cache.time.monotonic', return_value=0):
+            cache = LRUCache(maxsize=10, ttl=60)
+            cache.set('a', 1, ttl=3600)
+
+        with patch('auth_api.cache.time.monotonic', return_value=90):
+            assert cache.get('a') == 1
+
+        with patch('auth_api.cache.time.monotonic', return_value=3600):
+            assert cache.get('a') is None
+
+    @pytest.mark.unittest
+    def test__grace__should_keep_expired_entry_for_stale_reads(self):
+        """Expired entries are only returned when stale ones are allowed."""
+
+        with patch('auth_api.cache.time.monotonic', return_value=0):
+            cache = LRUCache(maxsize=10, ttl=60, grace=60)
+            cache.set('a', 1)
+
+        with patch('auth_api.cache.time.monotonic', return_value=90):
+            assert cache.get('a') is None
+            assert cache.get('a', stale=True) == 1
+            assert cache.get_many(['a'], stale=True) == {'a': 1}
+
+        with patch('auth_api.cache.time.monotonic', return_value=120):
+            assert cache.get('a', stale=True) is None
+
+        assert len(cache) == 0
@@ -0,0 +1,131 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict
+
+import pytest
+
+from origin.auth import TOKEN_COOKIE_NAME
+from origin.sql import SqlEngine
+
+from auth_api.ext_authz import (
+    CODE_OK,
+    CODE_UNAUTHENTICATED,
+    ExtAuthzService,
+    _encode_field,
+    _get_field,
+    _iter_fields,
+    decode_check_request,
+)
+from auth_api.models import DbToken
+
+
+def _check_request(headers: Dict[str, str]) -> bytes:
+    """Encode a CheckRequest with the provided HTTP headers."""
+
+    http = b''.join(
+        _encode_field(3, _encode_field(1, key) + _encode_field(2, value))
+        for key, value in headers.items()
+    )
+
+    # CheckRequest.attributes.request.http
+    request = _encode_field(2, _encode_field(5, 'GET') + http)
+    attributes = _encode_field(4, request)
+
+    return _encode_field(1, attributes)
+
+
+def _status_code(response: bytes) -> int:
+    """Return the google.rpc.Code of a CheckResponse."""
+
+    return dict(_iter_fields(_get_field(response, 1))).get(1, CODE_OK)
+
+
+class TestWireFormat:
+    """Tests for encoding/decoding ext_authz messages."""
+
+    @pytest.mark.unittest
+    def test__decode_check_request__should_return_headers(self):
+        """Headers are decoded from the nested HTTP request attributes."""
+
+        request = _check_request({
+            'cookie': 'a=b',
+            'x-long-header': 'x' * 300,
+        })
+
+        assert decode_check_request(request) == {
+            'cookie': 'a=b',
+            'x-long-header': 'x' * 300,
+        }
+
+    @pytest.mark.unittest
+    def test__decode_truncated_check_request__should_raise_value_error(self):
+        """Malformed messages are rejected."""
+
+        with pytest.raises(ValueError):
+            decode_check_request(_check_request({'cookie': 'a=b'})[:-1])
+
+
+class TestExtAuthzService:
+    """Tests for the ext_authz Check method."""
+
+    @pytest.fixture(scope='function')
+    def opaque_token(self, mock_session: SqlEngine.Session) -> str:
+        """Seed the database with a valid token."""
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token='12345',
+            internal_token='54321',
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        return '12345'
+
+    @pytest.mark.integrationtest
+    def test__valid_token__should_allow_with_authorization_header(
+            self,
+            opaque_token: str,
+    ):
+        """The internal token is added to the request, like ForwardAuth."""
+
+        # -- Act -------------------------------------------------------------
+
+        response = ExtAuthzService().check(_check_request({
+            'cookie': f'other=1; {TOKEN_COOKIE_NAME}={opaque_token}',
+        }))
+
+        # -- Assert ----------------------------------------------------------
+
+        ok_response = _get_field(response, 3)
+        header = _get_field(_get_field(ok_response, 2), 1)
+
+        assert _status_code(response) == CODE_OK
+        assert _get_field(header, 1) == b'Authorization'
+        assert _get_field(header, 2) == b'Bearer: 54321'
+
+    @pytest.mark.parametrize('headers', [
+        {},
+        {'cookie': f'{TOKEN_COOKIE_NAME}=INVALID-TOKEN'},
+    ])
+    @pytest.mark.integrationtest
+    def test__no_or_invalid_token__should_deny_with_status_401(
+            self,
+            headers: Dict[str, str],
+            opaque_token: str,
+    ):
+        """Requests without a valid token are denied, like ForwardAuth."""
+
+        # -- Act -------------------------------------------------------------
+
+        response = ExtAuthzService().check(_check_request(headers))
+
+        # -- Assert ----------------------------------------------------------
+
+        http_status = _get_field(_get_field(response, 2), 1)
+
+        assert _status_code(response) == CODE_UNAUTHENTICATED
+        assert dict(_iter_fields(http_status)) == {1: 401}
+        assert _get_field(response, 3) is None
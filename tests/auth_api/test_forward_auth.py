@@ -0,0 +1,200 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from origin.auth import TOKEN_COOKIE_NAME
+
+from auth_api.cache import LRUCache
+from auth_api.edge import (
+    FORWARD_AUTH_PATH,
+    CachedToken,
+    ForwardAuthApp,
+    TokenSource,
+)
+
+
+class InMemoryTokenSource(TokenSource):
+    """Token source serving tokens from a dict, counting lookups."""
+
+    def __init__(self, tokens: Dict[str, CachedToken]):
+        self.tokens = tokens
+        self.fetches = 0
+
+    async def start(self):
+        """Nothing to start."""
+
+    async def stop(self):
+        """Nothing to stop."""
+
+    async def fetch(self, opaque_token: str) -> Optional[CachedToken]:
+        """Return the token, yielding to other tasks first."""
+
+        self.fetches += 1
+        await asyncio.sleep(0)
+        return self.tokens.get(opaque_token)
+
+
+def _request(
+        app: ForwardAuthApp,
+        cookie: Optional[str] = None,
+        path: str = FORWARD_AUTH_PATH,
+) -> Tuple[int, Dict[str, str], bytes]:
+    """Make a request to the ASGI application."""
+
+    return asyncio.run(_async_request(app, cookie, path))
+
+
+async def _async_request(
+        app: ForwardAuthApp,
+        cookie: Optional[str] = None,
+        path: str = FORWARD_AUTH_PATH,
+) -> Tuple[int, Dict[str, str], bytes]:
+    """Make a request to the ASGI application."""
+
+    messages: List[Dict[str, Any]] = []
+    headers = [(b'cookie', cookie.encode())] if cookie else []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b''}
+
+    async def send(message):
+        messages.append(message)
+
+    await app({
+        'type': 'http',
+        'method': 'GET',
+        'path': path,
+        'headers': headers,
+    }, receive, send)
+
+    start, body = messages
+
+    return (
+        start['status'],
+        {k.decode(): v.decode() for k, v in start['headers']},
+        body['body'],
+    )
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def source() -> InMemoryTokenSource:
+    """Token source with a single valid token."""
+
+    return InMemoryTokenSource({
+        '12345': CachedToken(
+            internal_token='54321',
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+        ),
+    })
+
+
+@pytest.fixture(scope='function')
+def app(source: InMemoryTokenSource) -> ForwardAuthApp:
+    """Application with a cache of its own."""
+
+    return ForwardAuthApp(source=source, cache=LRUCache(maxsize=10))
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestForwardAuthApp:
+    """Tests for the asyncio ForwardAuth application."""
+
+    @pytest.mark.unittest
+    def test__token_exists__should_return_authorization_header(
+            self,
+            app: ForwardAuthApp,
+    ):
+        """Valid token should return the internal token and status 200."""
+
+        status, headers, body = _request(app, f'{TOKEN_COOKIE_NAME}=12345')
+
+        assert status == 200
+        assert headers['authorization'] == 'Bearer: 54321'
+        assert headers['content-type'] == 'text/html; charset=utf-8'
+        assert body == b''
+
+    @pytest.mark.parametrize('cookie', [
+        f'x={{"a":1}}; {TOKEN_COOKIE_NAME}=12345',
+        f'x="unterminated; {TOKEN_COOKIE_NAME}=12345',
+        f'x=with space; {TOKEN_COOKIE_NAME}=12345',
+    ])
+    @pytest.mark.unittest
+    def test__malformed_sibling_cookie__should_return_token(
+            self,
+            app: ForwardAuthApp,
+            cookie: str,
+    ):
+        """Other cookies are ignored like the Flask application does."""
+
+        status, headers, _ = _request(app, cookie)
+
+        assert status == 200
+        assert headers['authorization'] == 'Bearer: 54321'
+
+    @pytest.mark.parametrize('cookie', [
+        None,
+        f'{TOKEN_COOKIE_NAME}=INVALID-TOKEN',
+    ])
+    @pytest.mark.unittest
+    def test__no_or_invalid_token__should_return_status_401(
+            self,
+            app: ForwardAuthApp,
+            cookie: Optional[str],
+    ):
+        """Same response as the Flask application's ForwardAuth."""
+
+        status, headers, body = _request(app, cookie)
+
+        assert status == 401
+        assert 'authorization' not in headers
+        assert body == b'401 Unauthorized'
+
+    @pytest.mark.unittest
+    def test__other_path__should_return_status_404(
+            self,
+            app: ForwardAuthApp,
+    ):
+        """Only ForwardAuth is served."""
+
+        status, _, _ = _request(app, path='/token/inspect')
+
+        assert status == 404
+
+    @pytest.mark.unittest
+    def test__token_cached__should_not_be_fetched_again(
+            self,
+            app: ForwardAuthApp,
+            source: InMemoryTokenSource,
+    ):
+        """Valid tokens are cached."""
+
+        _request(app, f'{TOKEN_COOKIE_NAME}=12345')
+        _request(app, f'{TOKEN_COOKIE_NAME}=12345')
+
+        assert source.fetches == 1
+
+    @pytest.mark.unittest
+    def test__concurrent_requests__should_share_a_single_fetch(
+            self,
+            app: ForwardAuthApp,
+            source: InMemoryTokenSource,
+    ):
+        """Concurrent lookups of the same token are coalesced."""
+
+        async def make_requests():
+            return await asyncio.gather(*(
+                _async_request(app, f'{TOKEN_COOKIE_NAME}=12345')
+                for _ in range(10)
+            ))
+
+        responses = asyncio.run(make_requests())
+
+        assert [status for status, _, _ in responses] == [200] * 10
+        assert source.fetches == 1
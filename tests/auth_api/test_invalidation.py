@@ -0,0 +1,251 @@
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlalchemy as sa
+
+from origin.sql import SqlEngine
+
+from auth_api.controller import CachedToken, db_controller
+from auth_api.edge import token_key
+from auth_api.invalidation import (
+    MAX_PAYLOAD_SIZE,
+    Invalidation,
+    InvalidationListener,
+)
+from auth_api.models import DbToken
+
+CHANNEL = 'test_cache_invalidation'
+
+
+def _wait_for(condition: Callable[[], bool], timeout: float = 5) -> bool:
+    """Wait until condition() is true, returning whether it became so."""
+
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+
+    return True
+
+
+def _cache_token(opaque_token: str):
+    """Cache a valid token, as if it had been looked up."""
+
+    db_controller.token_cache.set(token_key(opaque_token), CachedToken(
+        internal_token=f'internal-{opaque_token}',
+        expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+    ))
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def listener(
+        db: SqlEngine,
+        mock_session: SqlEngine.Session,
+) -> Iterator[InvalidationListener]:
+    """Yield a listener (started) invalidating the caches of the process."""
+
+    listener = InvalidationListener(
+        db=db,
+        channel=CHANNEL,
+        on_invalidation=MagicMock(wraps=db_controller.apply_invalidation),
+        on_connect=MagicMock(wraps=db_controller.clear_caches),
+        reconnect_interval=0.05,
+    )
+
+    listener.start()
+
+    assert listener.wait_connected(5)
+
+    with patch.object(db_controller, 'invalidation_channel', CHANNEL):
+        yield listener
+
+    listener.stop()
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestInvalidation:
+    """Tests for Invalidation payloads."""
+
+    @pytest.mark.unittest
+    def test__to_payloads__should_split_into_notifications_within_limit(self):
+        """Large invalidations are published as multiple notifications."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        invalidation = Invalidation(
+            token_keys=[token_key(f'token-{i}') for i in range(1000)],
+            identities=[('idp', 'external-subject')],
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        payloads = list(invalidation.to_payloads())
+        parsed = [Invalidation.from_payload(p) for p in payloads]
+
+        # -- Assert ----------------------------------------------------------
+
+        assert len(payloads) > 1
+        assert all(len(p.encode()) <= MAX_PAYLOAD_SIZE + 20 for p in payloads)
+        assert [k for p in parsed for k in p.token_keys] == \
+            invalidation.token_keys
+        assert [i for p in parsed for i in p.identities] == \
+            [('idp', 'external-subject')]
+
+    @pytest.mark.unittest
+    def test__empty__should_not_have_payloads(self):
+        """Nothing is published when there is nothing to invalidate."""
+
+        assert not Invalidation()
+        assert list(Invalidation().to_payloads()) == []
+        assert json.loads(next(Invalidation([b'\x01' * 16]).to_payloads())) \
+            == {'k': ['01' * 16], 'i': []}
+
+    @pytest.mark.unittest
+    def test__to_payloads__should_not_contain_opaque_tokens(self):
+        """Tokens are published by key, as opaque tokens are secrets."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        invalidation = Invalidation(token_keys=[token_key('secret-token')])
+
+        # -- Act -------------------------------------------------------------
+
+        payload = next(invalidation.to_payloads())
+
+        # -- Assert ----------------------------------------------------------
+
+        assert 'secret-token' not in payload
+        assert Invalidation.from_payload(payload) == invalidation
+
+
+class TestInvalidationListener:
+    """Tests for invalidating caches using LISTEN/NOTIFY."""
+
+    @pytest.mark.integrationtest
+    def test__revoked_in_other_process__should_invalidate_cache(
+            self,
+            listener: InvalidationListener,
+            mock_session: SqlEngine.Session,
+    ):
+        """Tokens revoked by any process are removed from the cache."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token='token1',
+            internal_token='internal-token1',
+            id_token='',
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        mock_session.begin()
+        db_controller.revoke_tokens(mock_session, 'subject')
+
+        # Cached (again) by this process after revoking, as another
+        # process would have, which only the notification invalidates
+        _cache_token('token1')
+
+        received_before_commit = listener.received
+
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert received_before_commit == 0
+        assert _wait_for(
+            lambda: db_controller.token_cache.get(token_key('token1')) is None)
+        listener.on_invalidation.assert_called_once_with(
+            Invalidation(token_keys=[token_key('token1')]))
+
+    @pytest.mark.integrationtest
+    def test__rolled_back__should_not_publish(
+            self,
+            listener: InvalidationListener,
+            mock_session: SqlEngine.Session,
+    ):
+        """Invalidations are only published when committed."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        _cache_token('token1')
+
+        # -- Act -------------------------------------------------------------
+
+        mock_session.begin()
+        db_controller.publish_invalidation(
+            mock_session, identities=[('idp', 'external-subject')])
+        mock_session.rollback()
+
+        mock_session.begin()
+        db_controller.publish_invalidation(
+            mock_session, opaque_tokens=['token1'])
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _wait_for(lambda: listener.received == 1)
+        assert db_controller.token_cache.get(token_key('token1')) is None
+        listener.on_invalidation.assert_called_once_with(
+            Invalidation(token_keys=[token_key('token1')]))
+
+    @pytest.mark.integrationtest
+    def test__connection_lost__should_reconnect_and_clear_caches(
+            self,
+            listener: InvalidationListener,
+            mock_session: SqlEngine.Session,
+    ):
+        """Caches are cleared when reconnecting, as notifications are lost."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        _cache_token('token1')
+        db_controller.identity_cache.set(('idp', 'external'), 'subject')
+
+        # -- Act -------------------------------------------------------------
+
+        mock_session.execute(sa.text(
+            'SELECT pg_terminate_backend(pid) FROM pg_stat_activity '
+            "WHERE query LIKE 'LISTEN%'"
+        ))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _wait_for(lambda: listener.connects == 2)
+        assert listener.wait_connected(5)
+        assert listener.on_connect.call_count == 2
+        assert db_controller.token_cache.get(token_key('token1')) is None
+        assert db_controller.identity_cache.get(('idp', 'external')) is None
+
+    @pytest.mark.integrationtest
+    def test__channel_not_configured__should_not_publish(
+            self,
+            listener: InvalidationListener,
+            mock_session: SqlEngine.Session,
+    ):
+        """Caches are only invalidated locally when disabled."""
+
+        with patch.object(db_controller, 'invalidation_channel', None):
+            mock_session.begin()
+            db_controller.invalidate_tokens(['token1'], session=mock_session)
+            mock_session.commit()
+
+        time.sleep(0.2)
+
+        assert listener.received == 0
@@ -0,0 +1,324 @@
+import time
+from datetime import datetime, timezone
+from typing import List
+from unittest.mock import MagicMock, patch
+
+import pytest
+import sqlalchemy as sa
+from origin.sql import SqlEngine
+
+from auth_api.db import db
+from auth_api.login_records import LoginRecordBuffer, LoginRecordMaintenance
+from auth_api.models import DbLoginDaily, DbLoginRecord, DbUser
+from auth_api.orchestrator import LoginOrchestrator
+from auth_api.queries import LoginDailyQuery, LoginRecordQuery
+from auth_api.state import AuthState
+
+
+class TestLoginRecordBuffer:
+    """Tests for the write-behind buffer of login records."""
+
+    @pytest.mark.integrationtest
+    def test__stop__should_insert_pending_records(
+            self,
+            db: SqlEngine,
+            mock_session: db.Session,
+    ):
+        """Pending records are inserted when the buffer is stopped."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        buffer = LoginRecordBuffer(db=db, buffer_size=100, flush_interval=60)
+
+        # -- Act -------------------------------------------------------------
+
+        buffer.add('subject1', datetime.now(tz=timezone.utc))
+        buffer.add('subject1', datetime.now(tz=timezone.utc))
+        buffer.add('subject2', datetime.now(tz=timezone.utc))
+
+        assert LoginRecordQuery(mock_session).count() == 0
+
+        buffer.stop()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert len(buffer) == 0
+
+        assert LoginRecordQuery(mock_session) \
+            .has_subject('subject1') \
+            .count() == 2
+
+        assert LoginRecordQuery(mock_session) \
+            .has_subject('subject2') \
+            .count() == 1
+
+    @pytest.mark.integrationtest
+    def test__buffer_full__should_insert_records_in_background(
+            self,
+            db: SqlEngine,
+            mock_session: db.Session,
+    ):
+        """A full buffer is flushed without waiting for the interval."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        buffer = LoginRecordBuffer(db=db, buffer_size=2, flush_interval=60)
+
+        # -- Act -------------------------------------------------------------
+
+        buffer.add('subject1', datetime.now(tz=timezone.utc))
+        buffer.add('subject1', datetime.now(tz=timezone.utc))
+
+        query = LoginRecordQuery(mock_session).has_subject('subject1')
+
+        for _ in range(100):
+            if query.count() == 2:
+                break
+            time.sleep(0.02)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert query.count() == 2
+
+        buffer.stop()
+
+    @pytest.mark.unittest
+    def test__flush_fails__should_keep_records_for_next_flush(self):
+        """Records are not lost if the database is unavailable."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        failing_db = MagicMock()
+        failing_db.engine.begin.side_effect = Exception('Unavailable')
+
+        buffer = LoginRecordBuffer(
+            db=failing_db,
+            buffer_size=100,
+            flush_interval=60,
+            max_pending=2,
+        )
+
+        buffer.add('subject1', datetime.now(tz=timezone.utc))
+        buffer.add('subject2', datetime.now(tz=timezone.utc))
+        buffer.add('subject3', datetime.now(tz=timezone.utc))
+
+        # -- Act -------------------------------------------------------------
+
+        buffer.stop()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [r['subject'] for r in buffer._records] == \
+            ['subject2', 'subject3']
+
+    @pytest.mark.parametrize('commit, expected_records', [
+        (True, 1),
+        (False, 0),
+    ])
+    @pytest.mark.integrationtest
+    def test__log_in__should_buffer_record_only_if_committed(
+            self,
+            mock_session: db.Session,
+            commit: bool,
+            expected_records: int,
+    ):
+        """Logins rolled back are not recorded."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        buffer = MagicMock()
+
+        orchestrator = LoginOrchestrator(
+            session=mock_session,
+            state=AuthState(
+                fe_url='http://fe',
+                return_url='http://fe',
+                id_token='id-token',
+            ),
+            user=DbUser(subject='subject1'),
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        with patch('auth_api.orchestrator.login_record_buffer', new=buffer):
+            mock_session.begin()
+            orchestrator._log_in_user_and_create_cookie()
+            buffered_before_commit = buffer.add.call_count
+
+            if commit:
+                mock_session.commit()
+            else:
+                mock_session.rollback()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert buffered_before_commit == 0
+        assert buffer.add.call_count == expected_records
+
+
+class TestLoginRecordMaintenance:
+    """Tests for partitioning, rollup, and retention of login records."""
+
+    @pytest.fixture(scope='function')
+    def maintenance(
+            self,
+            db: SqlEngine,
+            mock_session: db.Session,
+    ) -> LoginRecordMaintenance:
+        """Maintenance keeping login records for 30 days."""
+
+        return LoginRecordMaintenance(
+            db=db,
+            retention_days=30,
+            partitions_ahead=1,
+        )
+
+    def partitions(self, mock_session: db.Session) -> List[str]:
+        """Return names of all login record partitions."""
+
+        return sorted(mock_session.execute(sa.text(
+            'SELECT c.relname FROM pg_inherits i '
+            'JOIN pg_class c ON c.oid = i.inhrelid '
+            "WHERE i.inhparent = 'login_record'::regclass"
+        )).scalars())
+
+    @pytest.mark.integrationtest
+    def test__run__should_create_partitions_and_move_records(
+            self,
+            maintenance: LoginRecordMaintenance,
+            mock_session: db.Session,
+    ):
+        """Records in the default partition are moved to a new partition."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.add(DbLoginRecord(
+            subject='subject1',
+            created=datetime(2022, 3, 15, 12, tzinfo=timezone.utc),
+        ))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        maintenance.run(now=datetime(2022, 3, 16, tzinfo=timezone.utc))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert self.partitions(mock_session) == [
+            'login_record_default',
+            'login_record_y2022m03',
+            'login_record_y2022m04',
+        ]
+
+        assert mock_session.execute(sa.text(
+            'SELECT count(*) FROM login_record_y2022m03')).scalar() == 1
+
+        assert LoginRecordQuery(mock_session).count() == 1
+
+    @pytest.mark.integrationtest
+    def test__run__should_roll_up_recent_days(
+            self,
+            maintenance: LoginRecordMaintenance,
+            mock_session: db.Session,
+    ):
+        """Logins are counted per user per day, idempotently."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        for hour in (8, 10, 12):
+            mock_session.add(DbLoginRecord(
+                subject='subject1',
+                created=datetime(2022, 3, 15, hour, tzinfo=timezone.utc),
+            ))
+        mock_session.add(DbLoginRecord(
+            subject='subject1',
+            created=datetime(2022, 3, 16, 9, tzinfo=timezone.utc),
+        ))
+        mock_session.commit()
+
+        now = datetime(2022, 3, 16, 10, tzinfo=timezone.utc)
+
+        # -- Act -------------------------------------------------------------
+
+        maintenance.run(now=now)
+        maintenance.run(now=now)
+
+        # -- Assert ----------------------------------------------------------
+
+        days = LoginDailyQuery(mock_session) \
+            .has_subject('subject1') \
+            .order_by(DbLoginDaily.day) \
+            .all()
+
+        assert [(d.day.day, d.logins) for d in days] == [(15, 3), (16, 1)]
+
+        assert LoginDailyQuery(mock_session) \
+            .has_subject('subject1') \
+            .last_login() == datetime(2022, 3, 16, 9, tzinfo=timezone.utc)
+
+    @pytest.mark.integrationtest
+    def test__run__should_roll_up_days_since_latest_day_aggregated(
+            self,
+            maintenance: LoginRecordMaintenance,
+            mock_session: db.Session,
+    ):
+        """Days are not missed if maintenance has not run for a while."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        def log_in(day: int):
+            mock_session.add(DbLoginRecord(
+                subject='subject1',
+                created=datetime(2022, 3, day, 12, tzinfo=timezone.utc),
+            ))
+            mock_session.commit()
+
+        log_in(10)
+        maintenance.run(now=datetime(2022, 3, 10, 13, tzinfo=timezone.utc))
+
+        # Maintenance does not run on the following days
+        log_in(12)
+        log_in(13)
+
+        # -- Act -------------------------------------------------------------
+
+        maintenance.run(now=datetime(2022, 3, 16, tzinfo=timezone.utc))
+
+        # -- Assert ----------------------------------------------------------
+
+        days = LoginDailyQuery(mock_session) \
+            .has_subject('subject1') \
+            .order_by(DbLoginDaily.day) \
+            .all()
+
+        assert [d.day.day for d in days] == [10, 12, 13]
+
+    @pytest.mark.integrationtest
+    def test__run__should_drop_expired_partitions_after_rolling_them_up(
+            self,
+            maintenance: LoginRecordMaintenance,
+            mock_session: db.Session,
+    ):
+        """Expired records are dropped, but their aggregate is kept."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        created = datetime(2022, 1, 10, tzinfo=timezone.utc)
+
+        maintenance.run(now=created)
+
+        mock_session.add(DbLoginRecord(subject='subject1', created=created))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        maintenance.run(now=datetime(2022, 3, 16, tzinfo=timezone.utc))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert 'login_record_y2022m01' not in self.partitions(mock_session)
+        assert LoginRecordQuery(mock_session).count() == 0
+
+        assert LoginDailyQuery(mock_session) \
+            .has_subject('subject1') \
+            .last_login() == created
@@ -0,0 +1,193 @@
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+import pytest
+from flask.testing import FlaskClient
+
+from origin.models.auth import InternalToken
+from origin.tokens import TokenEncoder
+
+from auth_api.cache import LRUCache
+from auth_api.config import METRICS_SCOPE
+from auth_api.metrics import (
+    CacheMetrics,
+    EndpointMetrics,
+    IdpOperation,
+    NullMetric,
+)
+from auth_api.state import AuthState, build_failure_url
+
+
+def _sample(name: str, labels: Dict[str, str]) -> Optional[float]:
+    """Return the current value of a sample (of this process)."""
+
+    prometheus_client = pytest.importorskip('prometheus_client')
+
+    return prometheus_client.REGISTRY.get_sample_value(name, labels)
+
+
+class TestMetrics:
+    """Tests for recording metrics."""
+
+    @pytest.mark.unittest
+    def test__endpoint_metrics__should_record_latency_and_status(self):
+        """Statuses not bound up front are bound when first returned."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        metrics = EndpointMetrics('/test/endpoint')
+
+        # -- Act -------------------------------------------------------------
+
+        metrics.observe(0.002, 200)
+        metrics.observe(0.2, 200)
+        metrics.observe(0.002, 418)
+
+        # -- Assert ----------------------------------------------------------
+
+        def responses(status: str) -> float:
+            return _sample('auth_responses_total', {
+                'endpoint': '/test/endpoint',
+                'status': status,
+            })
+
+        assert responses('200') == 2
+        assert responses('418') == 1
+        assert _sample('auth_request_duration_seconds_count', {
+            'endpoint': '/test/endpoint',
+        }) == 3
+        assert _sample('auth_request_duration_seconds_bucket', {
+            'endpoint': '/test/endpoint',
+            'le': '0.01',
+        }) == 2
+
+    @pytest.mark.unittest
+    def test__cache_metrics__should_record_hits_and_misses(self):
+        """Stale lookups are not recorded."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        cache = LRUCache(maxsize=10, metrics=CacheMetrics('test'))
+        cache.set('key1', 'value1')
+
+        # -- Act -------------------------------------------------------------
+
+        cache.get('key1')
+        cache.get('key2')
+        cache.get_many(['key1', 'key2', 'key3'])
+        cache.get_many(['key1', 'key2'], stale=True)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _sample('auth_cache_lookups_total', {
+            'cache': 'test',
+            'result': 'hit',
+        }) == 2
+        assert _sample('auth_cache_lookups_total', {
+            'cache': 'test',
+            'result': 'miss',
+        }) == 3
+
+    @pytest.mark.unittest
+    def test__idp_operation__should_record_latency_and_failures(self):
+        """Exceptions are counted as failures, and raised."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        operation = IdpOperation('test')
+
+        # -- Act -------------------------------------------------------------
+
+        with operation.time():
+            pass
+
+        with pytest.raises(RuntimeError):
+            with operation.time():
+                raise RuntimeError('Identity Provider is down')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _sample('auth_idp_request_duration_seconds_count', {
+            'operation': 'test',
+        }) == 2
+        assert _sample('auth_idp_failures_total', {
+            'operation': 'test',
+        }) == 1
+
+    @pytest.mark.unittest
+    def test__build_failure_url__should_count_error_code(self):
+        """Failed logins are counted per error code."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        state = AuthState(fe_url='http://fe', return_url='http://fe/return')
+        labels = {'code': 'E3'}
+        before = _sample('auth_oidc_errors_total', labels)
+
+        # -- Act -------------------------------------------------------------
+
+        build_failure_url(state=state, error_code='E3')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _sample('auth_oidc_errors_total', labels) == before + 1
+
+    @pytest.mark.unittest
+    def test__null_metric__should_do_nothing(self):
+        """Metrics can be recorded without prometheus_client installed."""
+
+        metric = NullMetric()
+
+        metric.labels(endpoint='/test').inc()
+        metric.labels('/test').observe(0.1)
+
+
+class TestGetPrometheusMetrics:
+    """Tests for the /metrics endpoint."""
+
+    @pytest.mark.integrationtest
+    def test__with_scope__should_return_metrics_in_text_format(
+            self,
+            client: FlaskClient,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Latencies of requests served are exposed."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        pytest.importorskip('prometheus_client')
+
+        token = internal_token_encoder.encode(InternalToken(
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+            actor='service',
+            subject='service',
+            scope=[METRICS_SCOPE],
+        ))
+
+        client.get('/health')
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.get(
+            '/metrics',
+            headers={'Authorization': f'Bearer: {token}'},
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 200
+        assert res.content_type.startswith('text/plain; version=0.0.4')
+        assert 'auth_request_duration_seconds_count{endpoint="/health"}' \
+            in res.get_data(as_text=True)
+
+    @pytest.mark.integrationtest
+    def test__without_scope__should_return_status_401(
+            self,
+            client: FlaskClient,
+    ):
+        """Metrics are only available to internal services."""
+
+        res = client.get('/metrics')
+
+        assert res.status_code == 401
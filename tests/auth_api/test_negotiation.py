@@ -0,0 +1,57 @@
+import pytest
+
+from auth_api.negotiation import (
+    if_none_match,
+    negotiate_encoding,
+    parse_quality_header,
+)
+
+
+@pytest.mark.unittest
+def test__parse_quality_header__should_order_by_quality():
+    """Values are ordered by quality, keeping header order for ties."""
+
+    assert parse_quality_header('gzip;q=0.5, br, deflate') == (
+        ('br', 1.0),
+        ('deflate', 1.0),
+        ('gzip', 0.5),
+    )
+
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, None),
+    ('', None),
+    ('gzip', 'gzip'),
+    ('gzip, br', 'br'),
+    ('br;q=0.5, gzip', 'gzip'),
+    ('br;q=0, gzip;q=0', None),
+    ('*', 'br'),
+    ('*, br;q=0', 'gzip'),
+    ('identity', None),
+])
+@pytest.mark.unittest
+def test__negotiate_encoding__should_select_best_accepted_encoding(
+        accept_encoding: str,
+        expected: str,
+):
+    """The server's preferred encoding among the best accepted is chosen."""
+
+    assert negotiate_encoding(accept_encoding, ('br', 'gzip')) == expected
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('"a"', True),
+    ('W/"a"', True),
+    ('"b", "c"', False),
+    ('"b", "a"', True),
+    ('*', True),
+])
+@pytest.mark.unittest
+def test__if_none_match__should_use_weak_comparison(
+        header: str,
+        expected: bool,
+):
+    """Any matching tag (weak or strong), or '*', matches."""
+
+    assert if_none_match(header, ('"a"', '"a-gzip"')) is expected
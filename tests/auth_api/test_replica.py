@@ -0,0 +1,240 @@
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from origin.sql import SqlEngine
+
+from auth_api.controller import db_controller
+from auth_api.db import replica_session
+from auth_api.edge import token_key
+from auth_api.models import DbExternalUser, DbToken, DbUser
+
+
+def _token(opaque_token: str, expires: float = 86400) -> DbToken:
+    """Return a token, valid unless it expires in the past."""
+
+    return DbToken(
+        opaque_token=opaque_token,
+        internal_token=f'internal-{opaque_token}',
+        id_token='',  # Irrelevant
+        issued=datetime.now(tz=timezone.utc) - timedelta(days=1),
+        expires=datetime.now(tz=timezone.utc) + timedelta(seconds=expires),
+        subject='subject',
+    )
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def replica(mock_session: SqlEngine.Session, db: SqlEngine):
+    """
+    Yield a session acting as the read-only replica.
+
+    It is a separate connection to the same database, so changes not yet
+    committed by mock_session are not visible to it, like changes not yet
+    replicated are not visible on a replica.
+    """
+    with db.make_session() as session:
+        yield session
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestReplicaLookups:
+    """Tests for read-only lookups using a read replica."""
+
+    @pytest.mark.integrationtest
+    def test__token_on_replica__should_not_query_primary(
+            self,
+            mock_session: SqlEngine.Session,
+            replica: SqlEngine.Session,
+    ):
+        """Tokens found on the replica are not looked up on the primary."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('12345'))
+        mock_session.commit()
+
+        primary = MagicMock()
+
+        # -- Act -------------------------------------------------------------
+
+        internal_token = db_controller.get_internal_token(
+            session=primary,
+            opaque_token='12345',
+            replica_session=replica,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert internal_token == 'internal-12345'
+        assert not primary.method_calls
+
+    @pytest.mark.integrationtest
+    def test__token_not_replicated_yet__should_fall_back_to_primary(
+            self,
+            mock_session: SqlEngine.Session,
+            replica: SqlEngine.Session,
+    ):
+        """Tokens missing on the replica are looked up on the primary."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('replicated'))
+        mock_session.commit()
+
+        mock_session.begin()
+        mock_session.add(_token('not-replicated'))
+        mock_session.flush()
+
+        # -- Act -------------------------------------------------------------
+
+        internal_tokens = db_controller.get_internal_tokens(
+            session=mock_session,
+            opaque_tokens=['replicated', 'not-replicated', 'unknown'],
+            replica_session=replica,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert internal_tokens == {
+            'replicated': 'internal-replicated',
+            'not-replicated': 'internal-not-replicated',
+        }
+
+    @pytest.mark.integrationtest
+    def test__expired_token_on_replica__should_not_query_primary(
+            self,
+            mock_session: SqlEngine.Session,
+            replica: SqlEngine.Session,
+    ):
+        """Tokens which are invalid on the replica are invalid anywhere."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('expired', expires=-1))
+        mock_session.commit()
+
+        primary = MagicMock()
+
+        # -- Act -------------------------------------------------------------
+
+        internal_token = db_controller.get_internal_token(
+            session=primary,
+            opaque_token='expired',
+            replica_session=replica,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert internal_token is None
+        assert not primary.method_calls
+
+    @pytest.mark.integrationtest
+    def test__token_revoked_not_replicated_yet__should_not_be_returned(
+            self,
+            mock_session: SqlEngine.Session,
+            replica: SqlEngine.Session,
+    ):
+        """Recently revoked tokens are looked up on the primary only."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('revoked'))
+        mock_session.add(_token('not-revoked'))
+        mock_session.commit()
+
+        mock_session.begin()
+        db_controller.revoke_token(mock_session, 'revoked')
+        mock_session.flush()
+
+        # -- Act -------------------------------------------------------------
+
+        internal_tokens = db_controller.get_internal_tokens(
+            session=mock_session,
+            opaque_tokens=['revoked', 'not-revoked'],
+            replica_session=replica,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert internal_tokens == {'not-revoked': 'internal-not-revoked'}
+        assert db_controller.token_cache.get(token_key('revoked')) is None
+
+    @pytest.mark.parametrize('commit', [True, False])
+    @pytest.mark.integrationtest
+    def test__get_user_by_external_subject__should_find_user_on_either(
+            self,
+            mock_session: SqlEngine.Session,
+            replica: SqlEngine.Session,
+            commit: bool,
+    ):
+        """Users are found on the replica, or else on the primary."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(DbUser(subject='subject', tin='12345678'))
+        mock_session.add(DbExternalUser(
+            subject='subject',
+            identity_provider='idp',
+            external_subject='external-subject',
+        ))
+
+        if commit:
+            mock_session.commit()
+        else:
+            mock_session.flush()
+
+        # -- Act -------------------------------------------------------------
+
+        user = db_controller.get_user_by_external_subject(
+            session=mock_session,
+            identity_provider='idp',
+            external_subject='external-subject',
+            replica_session=replica,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert user is not None
+        assert user.subject == 'subject'
+        assert user.tin == '12345678'
+
+
+class TestReplicaSessionDecorator:
+    """Tests for the replica_session() decorator."""
+
+    @replica_session()
+    def lookup(self, replica_session: Optional[SqlEngine.Session]):
+        """Return the injected session."""
+
+        return replica_session
+
+    @pytest.mark.unittest
+    def test__no_replica_configured__should_inject_none(self):
+        """Without a replica, lookups should use the primary."""
+
+        with patch('auth_api.db.replica_db', new=None):
+            assert self.lookup() is None
+
+    @pytest.mark.unittest
+    def test__replica_configured__should_inject_and_close_session(self):
+        """Sessions of the replica are closed afterwards."""
+
+        replica_db = MagicMock()
+
+        with patch('auth_api.db.replica_db', new=replica_db):
+            session = self.lookup()
+
+        assert session is replica_db.make_session.return_value
+        session.close.assert_called_once()
@@ -0,0 +1,353 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+import sqlalchemy as sa
+
+from origin.auth import TOKEN_COOKIE_NAME
+from origin.sql import SqlEngine
+
+from auth_api.edge import (
+    FORWARD_AUTH_PATH,
+    RECORD,
+    ForwardAuthApp,
+    SnapshotReader,
+    SnapshotUnavailable,
+    delta_log_path,
+)
+from auth_api.models import DbToken
+from auth_api.sidecar import SnapshotTokenSource
+from auth_api.snapshot import SnapshotWriter, append_delta, write_snapshot
+
+
+def _expires(minutes: int) -> datetime:
+    """Return a point in time relative to now."""
+
+    return datetime.now(tz=timezone.utc) + timedelta(minutes=minutes)
+
+
+def _internal_token(reader: SnapshotReader, opaque_token: str):
+    """Return the internal token of a valid token, if any."""
+
+    token = reader.get(opaque_token)
+
+    return token.internal_token if token is not None else None
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def path(tmp_path: Path) -> str:
+    """Return the path of a snapshot with a valid and an expired token."""
+
+    path = str(tmp_path / 'tokens.snap')
+
+    write_snapshot(path, generation=1, tokens=[
+        ('valid', 'internal-valid', _expires(60)),
+        ('expired', 'internal-expired', _expires(-1)),
+    ] + [
+        (f'token{i}', f'internal-token{i}', _expires(60)) for i in range(100)
+    ])
+
+    return path
+
+
+@pytest.fixture(scope='function')
+def reader(path: str) -> SnapshotReader:
+    """Return a reader checking for changes on every lookup."""
+
+    return SnapshotReader(path=path, check_interval=0, max_age=60)
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestSnapshotReader:
+    """Tests for looking up tokens in snapshots."""
+
+    @pytest.mark.unittest
+    def test__should_return_only_valid_tokens(self, reader: SnapshotReader):
+        """Tokens are looked up in the snapshot, unless expired."""
+
+        assert _internal_token(reader, 'valid') == 'internal-valid'
+        assert _internal_token(reader, 'token42') == 'internal-token42'
+        assert _internal_token(reader, 'expired') is None
+        assert _internal_token(reader, 'unknown') is None
+
+    @pytest.mark.unittest
+    def test__delta_appended__should_apply_changes(
+            self,
+            path: str,
+            reader: SnapshotReader,
+    ):
+        """Tokens issued and deleted after the snapshot are applied."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        reader.get('valid')
+
+        # -- Act -------------------------------------------------------------
+
+        append_delta(
+            path,
+            tokens=[('new', 'internal-new', _expires(60))],
+            deleted=['valid', 'token42'],
+        )
+
+        # Repeated (by the overlap) after being deleted
+        append_delta(
+            path,
+            tokens=[('valid', 'internal-valid', _expires(60))],
+            deleted=[],
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _internal_token(reader, 'new') == 'internal-new'
+        assert _internal_token(reader, 'valid') is None
+        assert _internal_token(reader, 'token42') is None
+        assert _internal_token(reader, 'token43') == 'internal-token43'
+
+    @pytest.mark.unittest
+    def test__record_partially_written__should_apply_once_complete(
+            self,
+            path: str,
+            reader: SnapshotReader,
+    ):
+        """Records are only applied once written completely."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        append_delta(path, tokens=[], deleted=['valid'])
+
+        with open(delta_log_path(path), 'rb') as file:
+            log = file.read()
+
+        record = log[-RECORD.size:]
+
+        with open(delta_log_path(path), 'wb') as file:
+            file.write(log[:-RECORD.size] + record[:10])
+
+        # -- Act -------------------------------------------------------------
+
+        partial = _internal_token(reader, 'valid')
+
+        with open(delta_log_path(path), 'ab') as file:
+            file.write(record[10:])
+
+        complete = _internal_token(reader, 'valid')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert partial == 'internal-valid'
+        assert complete is None
+
+    @pytest.mark.unittest
+    def test__snapshot_replaced__should_map_new_snapshot(
+            self,
+            path: str,
+            reader: SnapshotReader,
+    ):
+        """Changes of the previous snapshot are forgotten."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        append_delta(path, tokens=[], deleted=['valid'])
+        reader.get('valid')
+
+        # -- Act -------------------------------------------------------------
+
+        write_snapshot(path, generation=2, tokens=[
+            ('new', 'internal-new', _expires(60)),
+        ])
+
+        # -- Assert ----------------------------------------------------------
+
+        assert _internal_token(reader, 'new') == 'internal-new'
+        assert _internal_token(reader, 'valid') is None
+        assert _internal_token(reader, 'token42') is None
+
+    @pytest.mark.unittest
+    def test__not_updated__should_be_unavailable(
+            self,
+            path: str,
+            reader: SnapshotReader,
+    ):
+        """Snapshots no longer maintained by the writer are not used."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        updated = time.time() - 61
+        os.utime(delta_log_path(path), (updated, updated))
+
+        # -- Act + Assert ----------------------------------------------------
+
+        with pytest.raises(SnapshotUnavailable):
+            reader.get('valid')
+
+    @pytest.mark.unittest
+    def test__missing__should_be_unavailable(self, tmp_path: Path):
+        """Tokens can not be looked up before a snapshot is written."""
+
+        reader = SnapshotReader(
+            path=str(tmp_path / 'missing.snap'),
+            check_interval=0,
+            max_age=60,
+        )
+
+        with pytest.raises(SnapshotUnavailable):
+            reader.get('valid')
+
+
+class TestSnapshotWriter:
+    """Tests for writing snapshots of the token table."""
+
+    @pytest.mark.integrationtest
+    def test__should_write_snapshot_and_changes(
+            self,
+            tmp_path: Path,
+            db: SqlEngine,
+            mock_session: SqlEngine.Session,
+    ):
+        """Valid tokens are written, and changes appended afterwards."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        now = datetime.now(tz=timezone.utc)
+
+        mock_session.begin()
+
+        for opaque_token, expires in (('token1', 60), ('expired', -1)):
+            mock_session.add(DbToken(
+                opaque_token=opaque_token,
+                internal_token=f'internal-{opaque_token}',
+                id_token='',  # Irrelevant
+                issued=now - timedelta(minutes=120),
+                expires=now + timedelta(minutes=expires),
+                subject='subject',
+            ))
+
+        mock_session.commit()
+
+        path = str(tmp_path / 'tokens.snap')
+        reader = SnapshotReader(path=path, check_interval=0, max_age=60)
+        writer = SnapshotWriter(
+            db=db,
+            path=path,
+            interval=1,
+            full_interval=3600,
+            overlap=5,
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        writer.write()
+        written = _internal_token(reader, 'token1')
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token='token2',
+            internal_token='internal-token2',
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=now + timedelta(minutes=60),
+            subject='subject',
+        ))
+        mock_session.execute(
+            sa.delete(DbToken).where(DbToken.opaque_token == 'token1'))
+        mock_session.commit()
+
+        writer.write()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert written == 'internal-token1'
+        assert (writer.snapshots, writer.deltas, writer.tokens) == (1, 1, 1)
+        assert _internal_token(reader, 'token1') is None
+        assert _internal_token(reader, 'token2') == 'internal-token2'
+        assert _internal_token(reader, 'expired') is None
+
+
+class TestSidecar:
+    """Tests for the ForwardAuth sidecar."""
+
+    @pytest.mark.unittest
+    def test__should_serve_forward_auth_from_snapshot(
+            self,
+            reader: SnapshotReader,
+    ):
+        """Responses are identical to those of ForwardAuth."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        app = ForwardAuthApp(source=SnapshotTokenSource(reader), cache=None)
+        responses = []
+
+        async def request(opaque_token: str):
+            messages = []
+            cookie = f'{TOKEN_COOKIE_NAME}={opaque_token}'
+
+            async def send(message):
+                messages.append(message)
+
+            await app({
+                'type': 'http',
+                'method': 'GET',
+                'path': FORWARD_AUTH_PATH,
+                'headers': [(b'cookie', cookie.encode())],
+            }, None, send)
+
+            responses.append(messages[0])
+
+        # -- Act -------------------------------------------------------------
+
+        asyncio.run(request('valid'))
+        asyncio.run(request('expired'))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [r['status'] for r in responses] == [200, 401]
+        assert (b'authorization', b'Bearer: internal-valid') in \
+            responses[0]['headers']
+
+    @pytest.mark.unittest
+    def test__import__should_not_load_service_or_database(self):
+        """The sidecar neither requires the service nor database drivers."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        forbidden = (
+            'asyncpg',
+            'auth_api.config',
+            'auth_api.controller',
+            'auth_api.db',
+            'sqlalchemy',
+        )
+
+        code = (
+            'import sys, auth_api.sidecar; '
+            f'print(sorted(set({forbidden!r}).intersection(sys.modules)))'
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            env={
+                **os.environ,
+                'PYTHONPATH': os.pathsep.join(sys.path),
+            },
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert result.stdout.strip() == '[]'
@@ -0,0 +1,301 @@
+"""
+Conformance tests which every token store must pass.
+
+Each test runs against every store. PostgreSQL requires a database (as
+integration tests), and LMDB is skipped unless lmdb is installed. Other
+stores are passed a session of an (empty) SQLite database, so changes
+are applied on commit.
+"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from origin.sql import SqlEngine
+
+from auth_api.models import DbToken
+from auth_api.token_store import (
+    LmdbTokenStore,
+    MemoryTokenStore,
+    PostgresTokenStore,
+    RevokedToken,
+    TokenStore,
+)
+
+
+class Store(NamedTuple):
+    """A token store, and the session to pass to it."""
+
+    store: TokenStore
+    session: SqlEngine.Session
+
+    @contextmanager
+    def transaction(self) -> Iterator[SqlEngine.Session]:
+        """Yield the session in a transaction, which is committed."""
+
+        self.session.begin()
+        yield self.session
+        self.session.commit()
+
+
+def _token(
+        opaque_token: str,
+        issued: int,
+        expires: int,
+        subject: str = 'subject',
+) -> DbToken:
+    """Return a token issued and expiring (minutes) relative to now."""
+
+    now = datetime.now(tz=timezone.utc).replace(microsecond=0)
+
+    return DbToken(
+        opaque_token=opaque_token,
+        internal_token=f'internal-{opaque_token}',
+        id_token=f'id-{opaque_token}',
+        issued=now + timedelta(minutes=issued),
+        expires=now + timedelta(minutes=expires),
+        subject=subject,
+    )
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function', params=[
+    pytest.param('postgres', marks=pytest.mark.integrationtest),
+    pytest.param('memory', marks=pytest.mark.unittest),
+    pytest.param('lmdb', marks=pytest.mark.unittest),
+])
+def store(request, tmp_path: Path) -> Iterator[Store]:
+    """Yield each token store, with tokens of two subjects."""
+
+    if request.param == 'postgres':
+        store = Store(
+            store=PostgresTokenStore(),
+            session=request.getfixturevalue('mock_session'),
+        )
+    elif request.param == 'memory':
+        store = Store(
+            store=MemoryTokenStore(),
+            session=Session(sa.create_engine('sqlite://')),
+        )
+    else:
+        pytest.importorskip('lmdb')
+        store = Store(
+            store=LmdbTokenStore(path=str(tmp_path), map_size=2 ** 24),
+            session=Session(sa.create_engine('sqlite://')),
+        )
+
+    with store.transaction() as session:
+        for token in (
+                _token('token1', issued=-30, expires=60),
+                _token('token2', issued=-20, expires=60),
+                _token('token3', issued=-10, expires=60),
+                _token('expired', issued=-60, expires=-1),
+                _token('future', issued=10, expires=60),
+                _token('other', issued=-10, expires=60, subject='other'),
+        ):
+            store.store.add(session, token)
+
+    yield store
+
+    if isinstance(store.store, LmdbTokenStore):
+        store.store.close()
+
+    if request.param != 'postgres':
+        store.session.close()
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestTokenStore:
+    """Tests every token store must pass."""
+
+    def test__get__should_return_token(self, store: Store):
+        """Tokens are returned with all fields, valid or not."""
+
+        token = store.store.get(store.session, 'token1')
+        expired = store.store.get(store.session, 'expired')
+
+        assert token.opaque_token == 'token1'
+        assert token.internal_token == 'internal-token1'
+        assert token.id_token == 'id-token1'
+        assert token.subject == 'subject'
+        assert token.expires - token.issued == timedelta(minutes=90)
+        assert expired is not None
+        assert store.store.get(store.session, 'unknown') is None
+
+    def test__get_only_valid__should_not_return_invalid_tokens(
+            self,
+            store: Store,
+    ):
+        """Tokens expired or not yet issued are not valid."""
+
+        assert store.store.get(store.session, 'token1', only_valid=True)
+        assert not store.store.get(store.session, 'expired', only_valid=True)
+        assert not store.store.get(store.session, 'future', only_valid=True)
+
+    def test__get_valid__should_return_only_valid_tokens(self, store: Store):
+        """Many tokens can be looked up at once."""
+
+        tokens = store.store.get_valid(
+            store.session, ['token1', 'token2', 'expired', 'unknown'])
+
+        assert sorted(t.opaque_token for t in tokens) == ['token1', 'token2']
+        assert store.store.get_valid(store.session, []) == []
+
+    def test__get_many__should_return_tokens_valid_or_not(self, store: Store):
+        """Unknown tokens are left out."""
+
+        tokens = store.store.get_many(
+            store.session, ['token1', 'expired', 'future', 'unknown'])
+
+        assert sorted(t.opaque_token for t in tokens) == \
+            ['expired', 'future', 'token1']
+        assert store.store.get_many(store.session, []) == []
+
+    def test__get_valid_by_subject__should_return_pages_newest_first(
+            self,
+            store: Store,
+    ):
+        """Tokens of a subject are paginated using the previous token."""
+
+        # -- Act -------------------------------------------------------------
+
+        first_page = store.store.get_valid_by_subject(
+            store.session, 'subject', limit=2)
+
+        second_page = store.store.get_valid_by_subject(
+            store.session, 'subject', limit=2, before=(
+                first_page[-1].issued,
+                first_page[-1].opaque_token,
+            ))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [t.opaque_token for t in first_page] == ['token3', 'token2']
+        assert [t.opaque_token for t in second_page] == ['token1']
+
+    def test__delete__should_delete_tokens_and_tokens_of_subjects(
+            self,
+            store: Store,
+    ):
+        """Deleted tokens are returned, and can no longer be looked up."""
+
+        # -- Act -------------------------------------------------------------
+
+        with store.transaction() as session:
+            deleted = store.store.delete(
+                session,
+                opaque_tokens=['other', 'unknown'],
+                subjects=['subject'],
+            )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert sorted(deleted) == [
+            RevokedToken(opaque_token=t, id_token=f'id-{t}') for t in (
+                'expired', 'future', 'other', 'token1', 'token2', 'token3')
+        ]
+
+        for opaque_token in ('token1', 'other'):
+            assert store.store.get(store.session, opaque_token) is None
+
+        assert store.store.get_valid_by_subject(
+            store.session, 'subject', limit=10) == []
+
+    def test__delete_nothing__should_delete_nothing(self, store: Store):
+        """Deleting no tokens and no subjects is allowed."""
+
+        with store.transaction() as session:
+            assert store.store.delete(session) == []
+
+        assert store.store.get(store.session, 'token1') is not None
+
+    def test__rollback__should_discard_changes(self, store: Store):
+        """Changes are only applied if the transaction is committed."""
+
+        # -- Act -------------------------------------------------------------
+
+        store.session.begin()
+        store.store.add(
+            store.session, _token('new', issued=-10, expires=60))
+        deleted = store.store.delete(store.session, opaque_tokens=['token1'])
+        store.session.rollback()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert [t.opaque_token for t in deleted] == ['token1']
+        assert store.store.get(store.session, 'new') is None
+        assert store.store.get(store.session, 'token1') is not None
+
+    def test__rollback_savepoint__should_discard_changes_of_savepoint(
+            self,
+            store: Store,
+    ):
+        """Changes made before the savepoint are still committed."""
+
+        # -- Act -------------------------------------------------------------
+
+        with store.transaction() as session:
+            store.store.add(session, _token('new', issued=-10, expires=60))
+            savepoint = session.begin_nested()
+            store.store.delete(session, opaque_tokens=['token1'])
+            savepoint.rollback()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert store.store.get(store.session, 'new') is not None
+        assert store.store.get(store.session, 'token1') is not None
+
+    def test__purge_expired__should_delete_only_expired_tokens(
+            self,
+            store: Store,
+    ):
+        """Tokens not yet issued are kept."""
+
+        # -- Act -------------------------------------------------------------
+
+        with store.transaction() as session:
+            deleted = store.store.purge_expired(session)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert deleted == 1
+        assert store.store.get(store.session, 'expired') is None
+        assert store.store.get(store.session, 'future') is not None
+        assert store.store.get(store.session, 'token1') is not None
+
+
+class TestLmdbTokenStore:
+    """Tests specific to LmdbTokenStore."""
+
+    @pytest.mark.unittest
+    def test__add_when_full__should_purge_expired_tokens(
+            self,
+            tmp_path: Path,
+    ):
+        """Space of expired tokens is reused, instead of failing."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        pytest.importorskip('lmdb')
+        store = LmdbTokenStore(path=str(tmp_path), map_size=2 ** 16)
+
+        # -- Act -------------------------------------------------------------
+
+        for i in range(1000):
+            store.add(None, _token(f'token{i}', issued=-60, expires=-1))
+
+        store.add(None, _token('valid', issued=-10, expires=60))
+
+        # -- Assert ----------------------------------------------------------
+
+        assert store.get(None, 'valid', only_valid=True) is not None
+
+        store.close()
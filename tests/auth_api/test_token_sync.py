@@ -0,0 +1,219 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+
+from origin.sql import SqlEngine
+
+from auth_api.controller import CachedToken, db_controller
+from auth_api.edge import token_key
+from auth_api.models import DbToken, DbTokenDeletion
+from auth_api.token_sync import TokenSync, purge_token_deletions
+
+
+def _token(opaque_token: str, issued: int, expires: int) -> DbToken:
+    """Return a token issued and expiring (minutes) relative to now."""
+
+    now = datetime.now(tz=timezone.utc)
+
+    return DbToken(
+        opaque_token=opaque_token,
+        internal_token=f'internal-{opaque_token}',
+        id_token='',  # Irrelevant
+        issued=now + timedelta(minutes=issued),
+        expires=now + timedelta(minutes=expires),
+        subject='subject',
+    )
+
+
+def _cached(opaque_token: str) -> bool:
+    """Return whether a token is cached."""
+
+    return db_controller.token_cache.get(token_key(opaque_token)) is not None
+
+
+# -- Fixtures ----------------------------------------------------------------
+
+
+@pytest.fixture(scope='function')
+def token_sync(db: SqlEngine, mock_session: SqlEngine.Session) -> TokenSync:
+    """Return a token sync of the token cache, looking back 60 seconds."""
+
+    return TokenSync(
+        db=db,
+        cache=db_controller.token_cache,
+        interval=1,
+        overlap=60,
+        max_lag=3600,
+    )
+
+
+# -- Tests -------------------------------------------------------------------
+
+
+class TestTokenSync:
+    """Tests for syncing the token cache."""
+
+    @pytest.mark.integrationtest
+    def test__tokens_issued__should_be_added_to_cache(
+            self,
+            token_sync: TokenSync,
+            mock_session: SqlEngine.Session,
+    ):
+        """Valid tokens issued since the previous sync are cached."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('before-watermark', issued=-120, expires=60))
+        mock_session.commit()
+
+        token_sync.sync()
+
+        mock_session.begin()
+        mock_session.add(_token('new', issued=0, expires=60))
+        mock_session.add(_token('expired', issued=-1, expires=0))
+        mock_session.add(_token('not-yet-valid', issued=10, expires=60))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        added, removed = token_sync.sync()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert (added, removed) == (1, 0)
+        assert _cached('new')
+        assert not _cached('before-watermark')
+        assert not _cached('expired')
+        assert not _cached('not-yet-valid')
+
+    @pytest.mark.integrationtest
+    def test__tokens_deleted__should_be_removed_from_cache(
+            self,
+            token_sync: TokenSync,
+            mock_session: SqlEngine.Session,
+    ):
+        """Tokens deleted by any process are removed from the cache."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('token1', issued=-120, expires=60))
+        mock_session.add(_token('token2', issued=-120, expires=60))
+        mock_session.commit()
+
+        token_sync.sync()
+
+        for opaque_token in ('token1', 'token2'):
+            db_controller.token_cache.set(token_key(opaque_token), CachedToken(
+                internal_token=f'internal-{opaque_token}',
+                expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+            ))
+
+        # Deleted without invalidating the cache (as by another process)
+        mock_session.begin()
+        mock_session.execute(
+            sa.delete(DbToken).where(DbToken.opaque_token == 'token1'))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        added, removed = token_sync.sync()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert (added, removed) == (0, 1)
+        assert not _cached('token1')
+        assert _cached('token2')
+        assert token_sync.metrics().syncs == 2
+
+    @pytest.mark.integrationtest
+    def test__expired_tokens_deleted__should_not_be_logged(
+            self,
+            mock_session: SqlEngine.Session,
+    ):
+        """Only tokens revoked before they expired are logged."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('valid', issued=-120, expires=60))
+        mock_session.add(_token('expired', issued=-120, expires=-60))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.execute(sa.delete(DbToken))
+        mock_session.commit()
+
+        # -- Assert ----------------------------------------------------------
+
+        logged = mock_session.execute(
+            sa.select(DbTokenDeletion.opaque_token)).scalars().all()
+
+        assert logged == ['valid']
+
+    @pytest.mark.integrationtest
+    def test__not_synced_for_too_long__should_clear_cache(
+            self,
+            token_sync: TokenSync,
+    ):
+        """Deletions may have been purged meanwhile, so nothing is kept."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        token_sync.sync()
+
+        db_controller.token_cache.set(token_key('token1'), CachedToken(
+            internal_token='internal-token1',
+            expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+        ))
+
+        token_sync._last_synced = time.monotonic() - 3601
+
+        # -- Act -------------------------------------------------------------
+
+        token_sync.sync()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert not _cached('token1')
+        assert token_sync.metrics().flushes == 1
+
+
+class TestPurgeTokenDeletions:
+    """Tests for purging the log of deleted tokens."""
+
+    @pytest.mark.integrationtest
+    def test__should_delete_entries_older_than_retention(
+            self,
+            db: SqlEngine,
+            mock_session: SqlEngine.Session,
+    ):
+        """Only entries older than the retention are deleted."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        now = datetime.now(tz=timezone.utc)
+
+        mock_session.begin()
+        mock_session.add(DbTokenDeletion(
+            opaque_token='old', deleted=now - timedelta(hours=25)))
+        mock_session.add(DbTokenDeletion(
+            opaque_token='new', deleted=now - timedelta(hours=23)))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        purged = purge_token_deletions(db=db, retention_hours=24)
+
+        # -- Assert ----------------------------------------------------------
+
+        remaining = mock_session.execute(
+            sa.select(DbTokenDeletion.opaque_token)).scalars().all()
+
+        assert purged == 1
+        assert remaining == ['new']
@@ -0,0 +1,90 @@
+import pytest
+
+from auth_api.state import AuthState
+from auth_api.tokens import EncryptedTokenEncoder
+
+
+@pytest.fixture(scope='module')
+def encoder() -> EncryptedTokenEncoder[AuthState]:
+    """Return an AuthState encoder."""
+
+    return EncryptedTokenEncoder(schema=AuthState, secret='secret')
+
+
+@pytest.fixture(scope='module')
+def state() -> AuthState:
+    """Return an AuthState with an id_token embedded."""
+
+    return AuthState(
+        fe_url='https://foobar.com',
+        return_url='https://redirect-here.com/foobar',
+        id_token='raw-id-token',
+    )
+
+
+class TestEncryptedTokenEncoder:
+    """Tests for EncryptedTokenEncoder."""
+
+    @pytest.mark.unittest
+    def test__encode_then_decode__should_return_equal_object(
+            self,
+            encoder: EncryptedTokenEncoder[AuthState],
+            state: AuthState,
+    ):
+        """Encoding and decoding should result in the same object."""
+
+        assert encoder.decode(encoder.encode(state)) == state
+
+    @pytest.mark.unittest
+    def test__encode__should_not_leak_plaintext(
+            self,
+            encoder: EncryptedTokenEncoder[AuthState],
+            state: AuthState,
+    ):
+        """Neither the encoded token nor its parts contains the id_token."""
+
+        encoded = encoder.encode(state)
+
+        assert 'raw-id-token' not in encoded
+        assert '.' not in encoded
+        assert encoded != encoder.encode(state)
+
+    @pytest.mark.unittest
+    def test__decode_tampered_token__should_raise_decode_error(
+            self,
+            encoder: EncryptedTokenEncoder[AuthState],
+            state: AuthState,
+    ):
+        """Modifying a single character should fail authentication."""
+
+        encoded = encoder.encode(state)
+        tampered = encoded[:-2] + ('A' if encoded[-2] != 'A' else 'B') \
+            + encoded[-1]
+
+        with pytest.raises(encoder.DecodeError):
+            encoder.decode(tampered)
+
+    @pytest.mark.unittest
+    def test__decode_with_wrong_secret__should_raise_decode_error(
+            self,
+            encoder: EncryptedTokenEncoder[AuthState],
+            state: AuthState,
+    ):
+        """Tokens encrypted with another secret can not be decoded."""
+
+        other = EncryptedTokenEncoder(schema=AuthState, secret='other')
+
+        with pytest.raises(encoder.DecodeError):
+            encoder.decode(other.encode(state))
+
+    @pytest.mark.parametrize('encoded', [None, '', 'invalid-state', '!!'])
+    @pytest.mark.unittest
+    def test__decode_garbage__should_raise_decode_error(
+            self,
+            encoder: EncryptedTokenEncoder[AuthState],
+            encoded: str,
+    ):
+        """Invalid input should raise DecodeError."""
+
+        with pytest.raises(encoder.DecodeError):
+            encoder.decode(encoded)
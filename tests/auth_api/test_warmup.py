@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+import pytest
+import requests_mock
+from flask.testing import FlaskClient
+
+from origin.sql import SqlEngine
+
+from auth_api.controller import db_controller
+from auth_api.edge import token_key
+from auth_api.models import DbToken
+from auth_api.oidc import OAuth2Session
+from auth_api.warmup import Warmup, load_tokens, open_connections
+
+JWKS_URL = 'http://idp.com/jwks'
+
+
+def _token(opaque_token: str, issued: int, expires: int) -> DbToken:
+    """Return a token issued and expiring (minutes) relative to now."""
+
+    now = datetime.now(tz=timezone.utc)
+
+    return DbToken(
+        opaque_token=opaque_token,
+        internal_token=f'internal-{opaque_token}',
+        id_token='',  # Irrelevant
+        issued=now + timedelta(minutes=issued),
+        expires=now + timedelta(minutes=expires),
+        subject='subject',
+    )
+
+
+class TestWarmup:
+    """Tests for Warmup."""
+
+    @pytest.mark.unittest
+    def test__step_fails__should_still_become_ready(self):
+        """Failing steps are skipped, so the process becomes ready."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        warmup = Warmup(steps=(
+            ('first', MagicMock(side_effect=RuntimeError)),
+            ('second', MagicMock(return_value=10)),
+        ))
+
+        # -- Act -------------------------------------------------------------
+
+        ready_before = warmup.ready
+        warmup.start()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert warmup.wait(5)
+        assert not ready_before
+
+        metrics = warmup.metrics()
+
+        assert metrics.ready
+        assert metrics.seconds >= 0
+        assert [(s.name, s.loaded, s.failed) for s in metrics.steps] == [
+            ('first', 0, True),
+            ('second', 10, False),
+        ]
+
+
+class TestWarmupSteps:
+    """Tests for the individual warm-up steps."""
+
+    @pytest.mark.integrationtest
+    def test__load_tokens__should_cache_newest_valid_tokens(
+            self,
+            mock_session: SqlEngine.Session,
+    ):
+        """Only valid tokens are loaded, most recently issued first."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('old', issued=-180, expires=60))
+        mock_session.add(_token('newer', issued=-120, expires=60))
+        mock_session.add(_token('newest', issued=-60, expires=60))
+        mock_session.add(_token('expired', issued=-30, expires=-1))
+        mock_session.add(_token('future', issued=60, expires=120))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        with patch('auth_api.warmup.WARMUP_TOKENS', new=2), \
+                patch('auth_api.warmup.WARMUP_BATCH_SIZE', new=1), \
+                patch('auth_api.warmup.TOKEN_SYNC_ENABLED', new=True):
+            loaded = load_tokens()
+
+        # -- Assert ----------------------------------------------------------
+
+        keys = {
+            token_key(opaque_token): opaque_token
+            for opaque_token in ['old', 'newer', 'newest', 'expired', 'future']
+        }
+        cached = db_controller.token_cache.get_many(keys)
+
+        assert loaded == 2
+        assert {keys[k]: v.internal_token for k, v in cached.items()} == {
+            'newer': 'internal-newer',
+            'newest': 'internal-newest',
+        }
+
+        # Cached until the tokens expire, not for the cache's TTL
+        later = time.monotonic() + 30 * 60
+
+        with patch('auth_api.cache.time.monotonic', return_value=later):
+            assert db_controller.token_cache.get(token_key('newest'))
+
+    @pytest.mark.integrationtest
+    def test__load_tokens_without_invalidation__should_load_nothing(
+            self,
+            mock_session: SqlEngine.Session,
+    ):
+        """Revoked tokens would be served until they expire."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        mock_session.begin()
+        mock_session.add(_token('token', issued=-60, expires=60))
+        mock_session.commit()
+
+        # -- Act -------------------------------------------------------------
+
+        with patch('auth_api.warmup.TOKEN_SYNC_ENABLED', new=False), \
+                patch('auth_api.warmup.CACHE_INVALIDATION_ENABLED', new=False):
+            loaded = load_tokens()
+
+        # -- Assert ----------------------------------------------------------
+
+        assert loaded == 0
+        assert db_controller.token_cache.get(token_key('token')) is None
+
+    @pytest.mark.integrationtest
+    def test__open_connections__should_fill_connection_pool(
+            self,
+            db: SqlEngine,
+    ):
+        """All connections of the pool are opened up front."""
+
+        with patch.object(db, 'pool_size', 3):
+            opened = open_connections([db])
+
+            assert opened == 3
+            assert db.engine.pool.checkedin() == 3
+
+    @pytest.mark.unittest
+    def test__get_jwk__should_cache_keys(
+            self,
+            request_mocker: requests_mock,
+    ):
+        """Keys are fetched once, unless refreshed."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        adapter = request_mocker.get(JWKS_URL, text='{"keys": []}')
+
+        session = OAuth2Session(
+            jwk_endpoint=JWKS_URL,
+            api_logout_url='',
+            jwk_cache_ttl=60,
+        )
+
+        # -- Act -------------------------------------------------------------
+
+        session.get_jwk()
+        session.get_jwk()
+        calls_cached = adapter.call_count
+        session.get_jwk(refresh=True)
+
+        # -- Assert ----------------------------------------------------------
+
+        assert calls_cached == 1
+        assert adapter.call_count == 2
+
+
+class TestHealthCheck:
+    """Tests for the health check (readiness) endpoint."""
+
+    @pytest.mark.unittest
+    def test__warming_up__should_not_be_ready(self, client: FlaskClient):
+        """The process is not ready until warm-up has finished."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        release = threading.Event()
+        warmup = Warmup(steps=(('slow', lambda: int(release.wait(5))),))
+
+        # -- Act -------------------------------------------------------------
+
+        with patch('auth_api.endpoints.health.warmup', new=warmup):
+            warmup.start()
+            res_warming_up = client.get('/health')
+
+            release.set()
+            warmup.wait(5)
+            res_ready = client.get('/health')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res_warming_up.status_code == 503
+        assert res_warming_up.headers['Retry-After'] == '1'
+        assert res_ready.status_code == 200
+
+    @pytest.mark.unittest
+    def test__warmup_disabled__should_be_ready(self, client: FlaskClient):
+        """Without warm-up, the process is ready right away."""
+
+        with patch('auth_api.endpoints.health.warmup', new=None):
+            assert client.get('/health').status_code == 200
@@ -1,13 +1,35 @@
+import json
+from typing import List
+
 import pytest
 from origin.auth import TOKEN_COOKIE_NAME
 from flask.testing import FlaskClient
 from datetime import datetime, timedelta, timezone
 
+from origin.models.auth import InternalToken
 from origin.sql import SqlEngine
+from origin.tokens import TokenEncoder
 
+from auth_api.config import TOKEN_INTROSPECTION_SCOPE
+from auth_api.controller import db_controller
 from auth_api.models import DbToken
 
 
+def _introspection_token(
+        encoder: TokenEncoder[InternalToken],
+        scope: List[str],
+) -> str:
+    """Return an encoded internal token of an internal service."""
+
+    return encoder.encode(InternalToken(
+        issued=datetime.now(tz=timezone.utc),
+        expires=datetime.now(tz=timezone.utc) + timedelta(hours=1),
+        actor='service',
+        subject='service',
+        scope=scope,
+    ))
+
+
 class TestForwardAuth:
     """Test tokens."""
 
@@ -138,3 +160,138 @@ class TestForwardAuth:
 
         assert res.status_code == 200
         assert res.headers['Authorization'] == f'Bearer: {internal_token}'
+
+    @pytest.mark.integrationtest
+    def test__token_cached_and_revoked__should_return_status_401(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+    ):
+        """Tokens revoked by this process are removed from the cache."""
+
+        opaque_token = '12345'
+
+        mock_session.begin()
+        mock_session.add(DbToken(
+            opaque_token=opaque_token,
+            internal_token='54321',
+            id_token='',  # Irrelevant
+            issued=datetime.now(tz=timezone.utc),
+            expires=datetime.now(tz=timezone.utc) + timedelta(days=1),
+            subject='subject',
+        ))
+        mock_session.commit()
+
+        client.set_cookie(
+            server_name='domain.com',  # TODO
+            key=TOKEN_COOKIE_NAME,
+            value=opaque_token,
+        )
+
+        assert client.get('/token/forward-auth').status_code == 200
+
+        # -- Act -------------------------------------------------------------
+
+        db_controller.revoke_tokens(mock_session, 'subject')
+        mock_session.commit()
+
+        res = client.get('/token/forward-auth')
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 401
+
+
+class TestIntrospectTokens:
+    """Test introspecting many tokens at once."""
+
+    @pytest.mark.integrationtest
+    def test__many_tokens__should_stream_result_of_each_in_order(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Each requested token is returned as a line, valid or not."""
+
+        # -- Arrange ---------------------------------------------------------
+
+        now = datetime.now(tz=timezone.utc)
+
+        mock_session.begin()
+
+        for i, expires in enumerate((now + timedelta(days=1), now)):
+            mock_session.add(DbToken(
+                opaque_token=f'opaque-{i}',
+                internal_token=f'internal-{i}',
+                id_token='',  # Irrelevant
+                issued=now - timedelta(days=1),
+                expires=expires,
+                subject='subject',
+            ))
+
+        mock_session.commit()
+
+        token = _introspection_token(
+            internal_token_encoder, [TOKEN_INTROSPECTION_SCOPE])
+
+        # -- Act -------------------------------------------------------------
+
+        res = client.post(
+            path='/token/introspect',
+            json={'opaque_tokens': ['unknown', 'opaque-1', 'opaque-0']},
+            headers={'Authorization': f'Bearer: {token}'},
+        )
+
+        # -- Assert ----------------------------------------------------------
+
+        assert res.status_code == 200
+        assert res.mimetype == 'application/x-ndjson'
+        assert res.is_streamed
+
+        lines = [json.loads(line) for line in res.data.splitlines()]
+
+        assert lines == [
+            {'opaque_token': 'unknown', 'valid': False, 'token': None},
+            {'opaque_token': 'opaque-1', 'valid': False, 'token': None},
+            {'opaque_token': 'opaque-0', 'valid': True, 'token': 'internal-0'},
+        ]
+
+    @pytest.mark.integrationtest
+    def test__without_scope__should_return_status_401(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Only internal services granted the scope may introspect."""
+
+        token = _introspection_token(internal_token_encoder, ['other'])
+
+        res = client.post(
+            path='/token/introspect',
+            json={'opaque_tokens': ['opaque-0']},
+            headers={'Authorization': f'Bearer: {token}'},
+        )
+
+        assert res.status_code == 401
+
+    @pytest.mark.integrationtest
+    def test__too_many_tokens__should_return_status_400(
+            self,
+            client: FlaskClient,
+            mock_session: SqlEngine.Session,
+            internal_token_encoder: TokenEncoder[InternalToken],
+    ):
+        """Batches are limited in size."""
+
+        token = _introspection_token(
+            internal_token_encoder, [TOKEN_INTROSPECTION_SCOPE])
+
+        res = client.post(
+            path='/token/introspect',
+            json={'opaque_tokens': [str(i) for i in range(1001)]},
+            headers={'Authorization': f'Bearer: {token}'},
+        )
+
+        assert res.status_code == 400